@@ -25,6 +25,8 @@ class SearchRequest(BaseModel):
     page_size: int = 10
     sort_field: str = "title"
     sort_order: str = "asc"
+    # fiscal year of a page other than the current year's, e.g. "2023"
+    fiscal_year: Optional[str] = None
 
 class Program(BaseModel):
     cfda: str
@@ -10,6 +10,8 @@ router = APIRouter(
 )
 
 # Constants
+# alias of the live version of the programs index, which the indexer swaps
+# atomically after each full rebuild
 INDEX_NAME = "programs"
 SEARCH_FIELDS = {
     "title": {"boost": 2},
@@ -275,6 +277,7 @@ def search_programs(
     page_size = request.page_size
     sort_field = request.sort_field
     sort_order = request.sort_order
+    fiscal_year = request.fiscal_year
 
     try:
         # Validate sort field
@@ -284,6 +287,14 @@ def search_programs(
                 detail=f"Invalid sort field. Valid options are: {list(VALID_SORT_FIELDS.keys())}"
             )
 
+        # Other fiscal years are indexed behind aliases of their own
+        # (e.g., programs_fy2023)
+        index_name = INDEX_NAME
+        if fiscal_year:
+            if not fiscal_year.isdigit():
+                raise HTTPException(status_code=400, detail="Invalid fiscal year")
+            index_name = f"{INDEX_NAME}_fy{fiscal_year}"
+
         # Build base query
         search_query = {
             "bool": {
@@ -322,7 +333,7 @@ def search_programs(
 
         # Execute search
         try:
-            response = es.search(index=INDEX_NAME, body=es_query)
+            response = es.search(index=index_name, body=es_query)
         except Exception as es_error:
             raise HTTPException(
                 status_code=500,
@@ -0,0 +1,104 @@
+"""
+Compares the time load.py takes to build the program data and to generate the
+category and sub-category pages over a default read-write connection to the
+transformed database and over the read-optimized connection it now uses (see
+data_processing/connections.py), and checks that both build the same program
+data.
+
+Run from the root of the repository, against a transformed database:
+
+    python benchmarks/bench_connections.py --db data_processing/transformed/transformed_data.db
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import constants  # noqa: E402
+import load  # noqa: E402
+import rollup  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "..", "data_processing",
+                          "transformed", "transformed_data.db")
+
+
+def default_connection(path):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+CONNECTIONS = {
+    "default": default_connection,
+    "read-optimized": load.connect_read_only,
+}
+
+
+def program_data(conn):
+    return load.generate_program_data(conn.cursor(), load.FISCAL_YEARS)
+
+
+def category_pages(conn, output_dir, fiscal_year):
+    cube = rollup.RollupCube.from_database(conn.cursor(), [fiscal_year])
+    load.generate_category_markdown_files(
+        conn.cursor(), os.path.join(output_dir, "_category"), fiscal_year, cube)
+    load.generate_subcategory_markdown_files(
+        conn.cursor(), os.path.join(output_dir, "_subcategory"), fiscal_year,
+        cube)
+
+
+def timed(function):
+    # the generators print their progress
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = function()
+        return time.perf_counter() - start, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default=DEFAULT_DB,
+                        help="transformed database to read")
+    parser.add_argument("--fiscal-year", default=constants.FISCAL_YEAR)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args(argv)
+
+    output_dir = tempfile.mkdtemp()
+    for directory in ("_category", "_subcategory", "assets/data/category",
+                      "assets/data/subcategory"):
+        os.makedirs(os.path.join(output_dir, directory), exist_ok=True)
+
+    best = {name: [None, None] for name in CONNECTIONS}
+    programs = {}
+    # connections are measured in turns, so that both see the same state of
+    # the OS cache
+    for _ in range(args.repeat):
+        for name, connect in CONNECTIONS.items():
+            conn = connect(args.db)
+            data_time, programs[name] = timed(lambda: program_data(conn))
+            pages_time, _ = timed(
+                lambda: category_pages(conn, output_dir, args.fiscal_year))
+            conn.close()
+            times = best[name]
+            times[0] = data_time if times[0] is None else min(times[0], data_time)
+            times[1] = pages_time if times[1] is None else min(times[1], pages_time)
+
+    default_times = best["default"]
+    for name, (data_time, pages_time) in best.items():
+        print(f"{name + ':':16s}program data {data_time:.3f}s "
+              f"({default_times[0] / data_time:.2f}x), category pages "
+              f"{pages_time:.3f}s ({default_times[1] / pages_time:.2f}x)")
+    same = programs["default"] == programs["read-optimized"]
+    print(f"same program data: {same}")
+    return 0 if same else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+"""
+Compares frontmatter.dump, and the pure-Python emitter it falls back to
+without libyaml (frontmatter.emit), against yaml.dump on the front matter of
+every generated program page, and checks that their output is identical.
+
+Run from the root of the repository:
+
+    python benchmarks/bench_frontmatter.py
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import frontmatter  # noqa: E402
+
+PROGRAM_PAGES_GLOB = os.path.join(os.path.dirname(__file__), "..", "website",
+                                  "_program", "*.md")
+
+
+def load_front_matter(pattern):
+    """Returns the parsed front matter of each markdown file matching the
+    pattern."""
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    documents = []
+    for path in sorted(glob.glob(pattern)):
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        end = text.index("\n---\n", 4)
+        documents.append(yaml.load(text[4:end + 1], Loader=loader))
+    return documents
+
+
+def time_dump(dump, documents, repeat):
+    """Returns the best time, in seconds, to dump every document."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for document in documents:
+            dump(document)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", default=PROGRAM_PAGES_GLOB,
+                        help="glob of markdown files to load front matter "
+                             "from (default: all program pages)")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    documents = load_front_matter(args.pages)
+    expected = [yaml.dump(d, allow_unicode=True) for d in documents]
+    mismatches = sum(frontmatter.dump(d) != e
+                     for d, e in zip(documents, expected))
+    mismatches += sum(frontmatter.emit(d) != e
+                      for d, e in zip(documents, expected))
+
+    baseline = time_dump(lambda d: yaml.dump(d, allow_unicode=True),
+                         documents, args.repeat)
+    fast = time_dump(frontmatter.dump, documents, args.repeat)
+    fallback = time_dump(frontmatter.emit, documents, args.repeat)
+
+    print(f"documents:          {len(documents)}")
+    print(f"libyaml available:  {frontmatter.CDumper is not None}")
+    print(f"yaml.dump:          {baseline:.3f}s")
+    print(f"frontmatter.dump:   {fast:.3f}s ({baseline / fast:.1f}x)")
+    print(f"frontmatter.emit:   {fallback:.3f}s ({baseline / fallback:.1f}x)")
+    print(f"mismatched outputs: {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
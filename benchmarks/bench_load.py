@@ -0,0 +1,169 @@
+"""
+Times each generator of load.py, and generate_program_data, against synthetic
+transformed databases at several multiples of the size of the current catalog
+(see synthetic_db.py), and records their SQL statement counts and peak memory.
+
+The measurements of each scale are written as a run manifest of
+instrumentation.py to benchmarks/results (e.g., bench_load-10x-<time>.json),
+and compared with the previous results of the same scale, so that a change
+that makes load.py slower, or run more queries, shows up before a production
+build. With --check-plans, the query plans of each database are also audited
+(see data_processing/queryplans.py), and flags that are not in the baseline
+fail the benchmark. Run from the root of the repository:
+
+    python benchmarks/bench_load.py --scale 1 --scale 10
+"""
+
+import argparse
+import contextlib
+import glob
+import io
+import json
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import instrumentation  # noqa: E402
+import load  # noqa: E402
+import queryplans  # noqa: E402
+import synthetic_db  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+OUTPUT_DIRECTORIES = ["website/_program", "website/program", "website/pages",
+                      "website/_category", "website/_subcategory",
+                      "website/_data", "website/assets/files",
+                      "website/assets/data/program",
+                      "website/assets/data/category",
+                      "website/assets/data/subcategory", "indexer"]
+
+
+def database_path(scale, directory):
+    """Returns the synthetic database of a scale in directory, which is
+    generated unless an earlier run did."""
+    path = os.path.join(directory, f"synthetic-{scale:g}x.db")
+    if not os.path.isfile(path):
+        print(f"Generating {path}")
+        synthetic_db.generate(path + ".tmp", scale)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+def run_generators(db_path, output_dir, fiscal_year):
+    """Runs generate_program_data and each generator of load.py once, as
+    stages of the active instrumentation run."""
+    website = os.path.join(output_dir, "website")
+    indexer = os.path.join(output_dir, "indexer")
+    conn = instrumentation.watch(load.connect_read_only(db_path))
+    cursor = conn.cursor()
+    try:
+        programs_data = load.generate_program_data(cursor, load.FISCAL_YEARS)
+        shared_data = load.generate_shared_data(cursor)
+        load.generate_program_markdown_files(os.path.join(website, "_program"),
+                                             programs_data, load.FISCAL_YEARS)
+        load.generate_program_html_files(os.path.join(website, "_program"),
+                                         programs_data, load.FISCAL_YEARS)
+        load.generate_program_csv(os.path.join(website, "assets", "files", "all-program-data.csv"),
+                                  programs_data, load.FISCAL_YEARS)
+        load.generate_program_exports(os.path.join(website, "assets", "files"),
+                                       programs_data, load.FISCAL_YEARS)
+        load.generate_program_outputs(cursor, [fiscal_year], website, indexer)
+        load.generate_search_page(os.path.join(website, "pages", "search.md"),
+                                  shared_data, fiscal_year)
+        load.generate_home_page(os.path.join(website, "pages", "home.md"),
+                                shared_data, fiscal_year)
+        load.generate_programs_table_json(os.path.join(indexer, "programs-table.json"),
+                                          programs_data, fiscal_year)
+        load.generate_categories_hierarchy_data(
+            os.path.join(website, "_data", "categories_hierarchy.json"),
+            load.get_categories_hierarchy(cursor))
+        load.generate_category_page(cursor, programs_data,
+                                    os.path.join(website, "pages", "category.md"),
+                                    fiscal_year)
+        load.generate_category_markdown_files(cursor, os.path.join(website, "_category"),
+                                              fiscal_year)
+        load.generate_subcategory_markdown_files(cursor, os.path.join(website, "_subcategory"),
+                                                 fiscal_year)
+    finally:
+        conn.close()
+
+
+def previous_results(pipeline, results_dir, latest):
+    """Returns the results of the run before latest for the same pipeline,
+    or None."""
+    paths = sorted(glob.glob(os.path.join(results_dir, f"{pipeline}-*.json")))
+    paths = [path for path in paths if os.path.abspath(path) != os.path.abspath(latest)]
+    if not paths:
+        return None
+    with open(paths[-1], encoding="utf-8") as f:
+        return json.load(f)
+
+
+def print_results(results):
+    print(f"{'stage':40s}{'wall (s)':>10s}{'statements':>12s}{'peak RSS (MiB)':>16s}")
+    for stage in results["stages"]:
+        rss = stage["peak_rss_bytes"]
+        print(f"{stage['name']:40s}{stage['wall_time_s']:10.3f}{stage['sqlite_statements']:12d}"
+              f"{rss / 2**20 if rss else float('nan'):16.0f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=float, action="append",
+                        help="multiple of the size of the current catalog, which may be "
+                             "repeated (default: 1)")
+    parser.add_argument("--results-dir", default=RESULTS_DIR,
+                        help="directory of the results and generated databases "
+                             "(default: benchmarks/results)")
+    parser.add_argument("--fiscal-year", default=load.constants.FISCAL_YEAR)
+    parser.add_argument("--threshold", type=float,
+                        default=instrumentation.REGRESSION_THRESHOLD,
+                        help="relative increase, compared with the previous results, that "
+                             "counts as a regression (default: %(default)s)")
+    parser.add_argument("--check-plans", action="store_true",
+                        help="fail if a query plan has a flag that is not in "
+                             "data_processing/query_plan_baseline.json")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.results_dir, exist_ok=True)
+    regressions = 0
+    for scale in args.scale or [1]:
+        db_path = database_path(scale, args.results_dir)
+        pipeline = f"bench_load-{scale:g}x"
+        with tempfile.TemporaryDirectory() as output_dir:
+            for directory in OUTPUT_DIRECTORIES:
+                os.makedirs(os.path.join(output_dir, directory))
+            instrumentation.start_run(pipeline)
+            # the generators print their progress
+            with contextlib.redirect_stdout(io.StringIO()):
+                try:
+                    run_generators(db_path, output_dir, args.fiscal_year)
+                finally:
+                    path = instrumentation.finish_run(args.results_dir)
+
+        with open(path, encoding="utf-8") as f:
+            results = json.load(f)
+        print(f"\n{pipeline}: {path}")
+        print_results(results)
+        previous = previous_results(pipeline, args.results_dir, path)
+        if previous is not None:
+            found, notes = instrumentation.compare_manifests(previous, results, args.threshold)
+            for note in notes:
+                print("NOTE " + note)
+            for regression in found:
+                print("REGRESSION " + regression)
+            regressions += len(found)
+        if args.check_plans:
+            found = queryplans.new_flags(queryplans.audit(db_path, args.fiscal_year),
+                                         queryplans.read_baseline())
+            for id, flags in found.items():
+                print(f"QUERY PLAN {id}: " + ", ".join(flags))
+            print(f"query plans: {len(found)} statement(s) with flags not in the baseline")
+            regressions += len(found)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
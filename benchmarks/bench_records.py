@@ -0,0 +1,180 @@
+"""
+Compares the memory taken by the program data of a synthetic catalog, ten
+times the size of the current one, as program dicts and as ProgramRecords,
+and the time to read each program's obligations for a fiscal year from them.
+
+The catalog is built from the front matter of every generated program page,
+with each program copied under new program numbers. Run from the root of the
+repository:
+
+    python benchmarks/bench_records.py
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import constants  # noqa: E402
+import records  # noqa: E402
+from bench_frontmatter import PROGRAM_PAGES_GLOB, load_front_matter  # noqa: E402
+
+
+WEBSITE_DIR = os.path.join(os.path.dirname(__file__), "..", "website")
+
+
+def program_dict(page):
+    """Returns the program dict, as built by load.iter_program_data, that a
+    program page was generated from."""
+    if page.get('data_url'):
+        with open(os.path.join(WEBSITE_DIR, *page['data_url'].split('/')),
+                  encoding="utf-8") as f:
+            data = json.load(f)
+    else:
+        # older pages embed their data as JSON strings
+        data = {key: json.loads(page[key]) if page.get(key) else None
+                for key in ('obligations', 'other_program_spending',
+                            'outlays', 'improper_payments')}
+
+    def series(key):
+        return data[key] or None
+
+    return {
+        'id': page['cfda'],
+        'name': page['title'],
+        'popular_name': page['popular_name'] or None,
+        'objective': page['objective'],
+        'sam_url': page['sam_url'],
+        'usaspending_url': page['usaspending_url'],
+        'grants_url': page['grants_url'],
+        'top_agency_name': page['agency'],
+        'sub_agency_name': page['sub-agency'],
+        'assistance_types': page['assistance_types'],
+        'beneficiary_types': page['beneficiary_types'],
+        'applicant_types': page['applicant_types'],
+        'categories': page['categories'],
+        'obligations': series('obligations'),
+        'other_program_spending': series('other_program_spending'),
+        'outlays': series('outlays'),
+        'results': page['results'],
+        # older pages were generated before authorizations had URLs, and
+        # before the fields below existed
+        'authorizations': [auth if isinstance(auth, dict) else {'text': auth, 'url': None}
+                           for auth in page['authorizations']],
+        'program_type': page.get('program_type', 'assistance_listing'),
+        'is_subpart_f': page.get('is_subpart_f'),
+        'rules_regulations': page.get('rules_regulations'),
+        'improper_payments': series('improper_payments') or []
+    }
+
+
+def catalog(templates, copies):
+    """Yields fresh program dicts, copies times each template, with new
+    program numbers."""
+    for copy in range(copies):
+        for template in templates:
+            program = json.loads(json.dumps(template))
+            program['id'] = f"{program['id']}-{copy}"
+            yield program
+
+
+def retained_memory(build):
+    """Returns what build() returns, and the memory it still takes."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def best_time(function, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def dict_obligations(programs, fiscal_year):
+    """Obligations of each program, read from program dicts as the programs
+    table JSON used to."""
+    totals = []
+    for program in programs:
+        if program['program_type'] == 'assistance_listing':
+            totals.append(next((obl['sam_actual'] for obl in program['obligations']
+                                if obl['x'] == fiscal_year), 0))
+        else:
+            spending = next((tx for tx in program['other_program_spending']
+                             if tx['x'] == fiscal_year), {'outlays': 0})
+            totals.append(spending['outlays'] + spending.get('forgone_revenue', 0))
+    return totals
+
+
+def record_obligations(programs, fiscal_year):
+    """Obligations of each program, read from ProgramRecords."""
+    totals = []
+    for program in programs:
+        if program.program_type == 'assistance_listing':
+            totals.append(program.obligations.get(fiscal_year, 'sam_actual'))
+        else:
+            spending = program.other_program_spending
+            total = spending.get(fiscal_year, 'outlays')
+            if 'forgone_revenue' in spending.fields:
+                total += spending.get(fiscal_year, 'forgone_revenue')
+            totals.append(total)
+    return totals
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--pages", default=PROGRAM_PAGES_GLOB,
+                        help="glob of program pages to build the catalog "
+                             "from (default: all program pages)")
+    parser.add_argument("--copies", type=int, default=10,
+                        help="number of copies of each program (default: 10)")
+    parser.add_argument("--fiscal-year", default=constants.FISCAL_YEAR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    templates = [program_dict(page) for page in load_front_matter(args.pages)]
+    dicts, dicts_size = retained_memory(
+        lambda: list(catalog(templates, args.copies)))
+    del dicts
+    programs, records_size = retained_memory(
+        lambda: [records.ProgramRecord.from_dict(program)
+                 for program in catalog(templates, args.copies)])
+    dicts = [program.to_dict() for program in programs]
+
+    dict_time = best_time(lambda: dict_obligations(dicts, args.fiscal_year),
+                          args.repeat)
+    record_time = best_time(
+        lambda: record_obligations(programs, args.fiscal_year), args.repeat)
+    mismatches = sum(a != b for a, b in zip(
+        dict_obligations(dicts, args.fiscal_year),
+        record_obligations(programs, args.fiscal_year)))
+
+    count = len(programs)
+    print(f"programs:             {count}")
+    print(f"program dicts:        {dicts_size / 2**20:.1f} MiB "
+          f"({dicts_size / count:.0f} bytes per program)")
+    print(f"program records:      {records_size / 2**20:.1f} MiB "
+          f"({records_size / count:.0f} bytes per program, "
+          f"{1 - records_size / dicts_size:.0%} less)")
+    print(f"obligations (dicts):  {dict_time:.3f}s")
+    print(f"obligations (records): {record_time:.3f}s "
+          f"({dict_time / record_time:.1f}x)")
+    print(f"mismatched programs:  {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,282 @@
+"""
+Compares computing the category and subcategory aggregates (obligations,
+program counts, agencies and applicant types) with the rollup cube against
+querying the database for each category, with the queries the category pages
+used to run before the rollup, and checks that both give the same totals.
+
+Run from the root of the repository, against a transformed database:
+
+    python benchmarks/bench_rollup.py --db data_processing/transformed/transformed_data.db
+"""
+
+import argparse
+import math
+import os
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import constants  # noqa: E402
+import load  # noqa: E402
+import rollup  # noqa: E402
+
+DEFAULT_DB = os.path.join(os.path.dirname(__file__), "..", "data_processing",
+                          "transformed", "transformed_data.db")
+
+GROUP_PROGRAMS_SQL = {
+    "category": """
+        SELECT DISTINCT p.id
+        FROM program p
+        JOIN program_to_category ptc ON p.id = ptc.program_id
+        JOIN category c ON ptc.category_id = c.id AND ptc.category_type = c.type
+        WHERE c.parent_id = ?
+        AND ptc.category_type = 'category'
+        """,
+    "subcategory": """
+        SELECT DISTINCT p.id
+        FROM program p
+        JOIN program_to_category ptc ON p.id = ptc.program_id
+        WHERE ptc.category_id = ?
+        AND ptc.category_type = 'category'
+        """
+}
+
+
+def assistance_listing_obligations(cursor, program_ids, fiscal_year):
+    """Returns the obligations of each assistance listing program, and their
+    total."""
+    placeholders = ",".join("?" * len(program_ids))
+    cursor.execute(f"""
+        SELECT program_id, COALESCE(SUM(amount), 0) as total_obs
+        FROM (
+            SELECT program_id, amount
+            FROM program_sam_spending
+            WHERE fiscal_year = ?
+            AND program_id IN ({placeholders})
+            AND is_actual = 1
+
+            UNION ALL
+
+            SELECT p1.program_id, p1.amount
+            FROM program_sam_spending p1
+            WHERE fiscal_year = ?
+            AND program_id IN ({placeholders})
+            AND is_actual = 0
+            AND NOT EXISTS (
+                SELECT 1
+                FROM program_sam_spending p2
+                WHERE p2.program_id = p1.program_id
+                AND p2.fiscal_year = p1.fiscal_year
+                AND p2.is_actual = 1
+            )
+        ) subquery
+        GROUP BY program_id
+        """, [fiscal_year] + program_ids + [fiscal_year] + program_ids)
+    program_obligations = {row["program_id"]: float(row["total_obs"])
+                           for row in cursor.fetchall()}
+    return program_obligations, sum(program_obligations.values())
+
+
+def other_program_obligations(cursor, program_ids, fiscal_year):
+    """Returns the total obligations of programs that are not assistance
+    listings."""
+    placeholders = ",".join("?" * len(program_ids))
+    cursor.execute(f"""
+        SELECT COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_obs
+        FROM other_program_spending
+        WHERE fiscal_year = ?
+        AND program_id IN ({placeholders})
+        """, [fiscal_year] + program_ids)
+    return float(cursor.fetchone()["total_obs"])
+
+
+def program_obligations_by_type(cursor, program_ids, fiscal_year):
+    """Returns the total obligations of the programs of each program type."""
+    placeholders = ",".join("?" * len(program_ids))
+    cursor.execute(f"""
+        SELECT id, COALESCE(program_type, 'assistance_listing') as program_type
+        FROM program
+        WHERE id IN ({placeholders})
+        """, program_ids)
+    programs_by_type = {}
+    for row in cursor.fetchall():
+        programs_by_type.setdefault(row["program_type"], []).append(row["id"])
+
+    results = {}
+    for program_type, type_program_ids in programs_by_type.items():
+        if program_type == "assistance_listing":
+            _, results[program_type] = assistance_listing_obligations(
+                cursor, type_program_ids, fiscal_year)
+        else:
+            results[program_type] = other_program_obligations(
+                cursor, type_program_ids, fiscal_year)
+    return results
+
+
+def agency_list(cursor, program_ids, fiscal_year):
+    """Returns the agencies of the programs with their program counts and
+    obligations."""
+    placeholders = ",".join("?" * len(program_ids))
+    cursor.execute(f"""
+        SELECT
+            a1.agency_name as title,
+            p.id as program_id,
+            p.program_type
+        FROM program p
+        LEFT JOIN agency a ON p.agency_id = a.id
+        LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
+        WHERE p.id IN ({placeholders})
+        """, program_ids)
+    agency_programs = {}
+    for row in cursor.fetchall():
+        programs = agency_programs.setdefault(row["title"] or "Unspecified",
+                                              ([], []))
+        programs[row["program_type"] != "assistance_listing"].append(
+            row["program_id"])
+
+    agencies = []
+    for agency_name, (assistance_programs, other_programs) in agency_programs.items():
+        total_obs = 0
+        if assistance_programs:
+            total_obs += assistance_listing_obligations(
+                cursor, assistance_programs, fiscal_year)[1]
+        if other_programs:
+            total_obs += other_program_obligations(cursor, other_programs,
+                                                   fiscal_year)
+        agencies.append({
+            "title": agency_name,
+            "total_num_programs": len(assistance_programs) + len(other_programs),
+            "total_obs": total_obs
+        })
+    return sorted(agencies, key=lambda x: (x["total_obs"], x["title"]),
+                  reverse=True)
+
+
+def applicant_type_list(cursor, program_ids):
+    """Returns the applicant types of the programs with their program
+    counts."""
+    cursor.execute(f"""
+        SELECT
+            c.name as title,
+            COUNT(DISTINCT ptc.program_id) as total_num_programs
+        FROM category c
+        JOIN program_to_category ptc ON c.id = ptc.category_id
+        WHERE c.type = 'applicant'
+        AND c.type = ptc.category_type
+        AND ptc.program_id IN ({",".join("?" * len(program_ids))})
+        GROUP BY c.name
+        HAVING
+            c.name IS NOT NULL
+            AND total_num_programs > 0
+        ORDER BY total_num_programs DESC, title
+        """, program_ids)
+    return [{"title": row["title"],
+             "total_num_programs": row["total_num_programs"]}
+            for row in cursor.fetchall()]
+
+
+def sql_aggregates(cursor, groups, fiscal_year):
+    """Computes each group's aggregates with queries over its programs."""
+    aggregates = {}
+    for dimension, group_id in groups:
+        cursor.execute(GROUP_PROGRAMS_SQL[dimension], (group_id,))
+        program_ids = [row["id"] for row in cursor.fetchall()]
+        if not program_ids:
+            aggregates[dimension, group_id] = (0, 0.0, [], [])
+            continue
+        by_type = program_obligations_by_type(cursor, program_ids, fiscal_year)
+        aggregates[dimension, group_id] = (
+            len(program_ids),
+            sum(by_type.values()),
+            agency_list(cursor, program_ids, fiscal_year),
+            applicant_type_list(cursor, program_ids))
+    return aggregates
+
+
+def rollup_aggregates(cursor, groups, fiscal_year):
+    """Computes each group's aggregates from a rollup cube."""
+    cube = rollup.RollupCube.from_database(cursor, [fiscal_year])
+    obligations = cube.program_obligations(fiscal_year)
+    aggregates = {}
+    for dimension in ("category", "subcategory"):
+        num_programs = cube.count(by=(dimension,))
+        total_obs = cube.sum(obligations, by=(dimension,))
+        agency_programs = cube.count(by=(dimension, "agency"))
+        agency_obs = cube.sum(obligations, by=(dimension, "agency"))
+        applicant_programs = cube.count(by=(dimension, "applicant_type"))
+        for code, group_id in enumerate(cube.labels(dimension)):
+            if (dimension, group_id) in groups:
+                aggregates[dimension, group_id] = (
+                    int(num_programs[code]),
+                    float(total_obs[code]),
+                    load.rollup_agency_list(cube, agency_programs[code],
+                                            agency_obs[code]),
+                    load.rollup_applicant_type_list(
+                        cube, applicant_programs[code]))
+    return aggregates
+
+
+def same(a, b):
+    """Compares aggregates, allowing sums to differ in rounding."""
+    if isinstance(a, float) or isinstance(b, float):
+        return math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-6)
+    if isinstance(a, dict):
+        return a.keys() == b.keys() and all(same(a[k], b[k]) for k in a)
+    if isinstance(a, (list, tuple)):
+        return len(a) == len(b) and all(same(x, y) for x, y in zip(a, b))
+    return a == b
+
+
+def best_time(function, repeat):
+    """Returns the best time, in seconds, and the result of a function."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--db", default=DEFAULT_DB,
+                        help="transformed database to read")
+    parser.add_argument("--fiscal-year", default=constants.FISCAL_YEAR)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.db)
+    conn.row_factory = sqlite3.Row
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT 'category', parent_id FROM category
+        WHERE type = 'category' AND parent_id IS NOT NULL
+        UNION
+        SELECT DISTINCT 'subcategory', id FROM category
+        WHERE type = 'category' AND parent_id IS NOT NULL
+        """)
+    groups = {tuple(row) for row in cursor.fetchall()}
+
+    sql_time, expected = best_time(
+        lambda: sql_aggregates(cursor, groups, args.fiscal_year), args.repeat)
+    rollup_time, actual = best_time(
+        lambda: rollup_aggregates(cursor, groups, args.fiscal_year),
+        args.repeat)
+    # groups without programs are not in the rollup
+    mismatches = sum(not same(expected[key], actual.get(key, (0, 0.0, [], [])))
+                     for key in expected)
+    conn.close()
+
+    print(f"groups:             {len(groups)}")
+    print(f"query per group:    {sql_time:.3f}s")
+    print(f"rollup cube:        {rollup_time:.3f}s "
+          f"({sql_time / rollup_time:.1f}x)")
+    print(f"mismatched groups:  {mismatches}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,287 @@
+"""
+Generates a synthetic transformed database, with the schema of transform.py,
+at a multiple of the size of the current catalog, so that load.py can be
+benchmarked at the scale it may have to handle (e.g., 10 or 100 times as many
+programs).
+
+At scale 1, the database has about as many programs, categories, spending
+rows and improper payments as the database built from the extracted files in
+data_processing/extracted. Agencies, assistance types, applicant types and
+beneficiary types are read from those files as they are; function
+categories and sub-categories are too, and are copied under new names at
+larger scales. Everything else is random, but the same for the same seed.
+Run from the root of the repository:
+
+    python benchmarks/synthetic_db.py --scale 10 --output /tmp/transformed_data.db
+"""
+
+import argparse
+import csv
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..",
+                                "data_processing"))
+import constants  # noqa: E402
+import transform  # noqa: E402
+
+EXTRACTED_DIR = os.path.join(os.path.dirname(__file__), "..",
+                             "data_processing", "extracted")
+
+# number of rows at scale 1, or of rows per program (and per fiscal year)
+ASSISTANCE_LISTINGS = 2520
+OTHER_PROGRAMS = 180
+SUBCATEGORIES_PER_PROGRAM = 3
+APPLICANT_TYPES_PER_PROGRAM = 4
+BENEFICIARY_TYPES_PER_PROGRAM = 4
+RESULTS_PER_PROGRAM = 3
+AUTHORIZATIONS_PER_PROGRAM = 1.5
+# rows per congressional district and assistance type of the USAspending.gov
+# obligations of a program in a fiscal year, and awards with outlays
+OBLIGATION_ROWS_PER_YEAR = 20
+OUTLAY_ROWS_PER_YEAR = 10
+IMPROPER_PAYMENT_ROWS = 210
+IMPROPER_PAYMENT_PROGRAMS = 150
+
+SPENDING_YEARS = [2022, 2023, 2024, 2025]
+# SAM.gov amounts of earlier years are actual, and of later years estimated
+LAST_ACTUAL_YEAR = int(constants.FISCAL_YEAR)
+
+WORDS = ("program grants assistance research services education health "
+         "housing community development support training state local rural "
+         "energy water safety family children veterans disaster recovery "
+         "infrastructure economic public national").split()
+
+INSERT_BATCH_SIZE = 10000
+
+
+def text(rnd, words):
+    """Returns random text of about words words."""
+    return " ".join(rnd.choice(WORDS) for _ in range(max(1, words))).capitalize() + "."
+
+
+def count(rnd, mean):
+    """Returns a random count with the given mean."""
+    return min(int(rnd.expovariate(1 / mean)) if mean > 0 else 0, int(mean * 10) + 1)
+
+
+def amount(rnd, scale=1e6):
+    """Returns a random amount, log-normally distributed like spending."""
+    return round(rnd.lognormvariate(math.log(scale), 2), 2)
+
+
+def insert(conn, table, rows):
+    """Inserts rows into a table in batches, and returns their number."""
+    inserted = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            conn.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(row))})", batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        conn.executemany(f"INSERT INTO {table} VALUES ({','.join('?' * len(batch[0]))})", batch)
+        inserted += len(batch)
+    return inserted
+
+
+def agencies():
+    """Yields the agency rows of the extracted organizations, as
+    transform.load_agency inserts them."""
+    with open(os.path.join(EXTRACTED_DIR, "organizations.json"), encoding="utf-8") as f:
+        for o in json.load(f):
+            name = o.get("agencyName", o["name"])
+            name = constants.AGENCY_DISPLAY_NAMES.get(name, name)
+            yield (o["orgKey"], name, o["l1OrgKey"], o.get("l2OrgKey"),
+                   name in constants.CFO_ACT_AGENCY_NAMES and o["orgKey"] == o["l1OrgKey"])
+
+
+def sam_categories():
+    """Yields the assistance, applicant and beneficiary type rows of the
+    extracted dictionary, as transform.load_sam_category inserts them."""
+    with open(os.path.join(EXTRACTED_DIR, "dictionary.json"), encoding="utf-8") as f:
+        dictionary = json.load(f)["_embedded"]["jSONObjectList"]
+    for i in dictionary:
+        if i["id"] == "assistance_type":
+            for e in i["elements"]:
+                yield (e["element_id"], "assistance",
+                       constants.ASSISTANCE_TYPE_DISPLAY_NAMES[e["value"]], None)
+                for s in e["elements"]:
+                    yield (s["element_id"], "assistance", s["value"], e["element_id"])
+        if i["id"] in ("applicant_types", "beneficiary_types"):
+            for e in i["elements"]:
+                yield (e["element_id"], i["id"].split("_")[0], e["value"], None)
+
+
+def function_categories(scale):
+    """Returns the function categories and sub-categories of the extracted
+    files, copied under new names to reach the scale, as
+    [(category, sub-category)]."""
+    with open(os.path.join(EXTRACTED_DIR, "program-to-function-sub-function.csv"),
+              encoding="utf-8") as f:
+        pairs = sorted({(row[1], row[2]) for row in csv.reader(f)})
+    copies = max(1, round(scale))
+    return [(category if copy == 0 else f"{category} {copy + 1}", subcategory)
+            for copy in range(copies) for category, subcategory in pairs]
+
+
+def generate(path, scale=1, seed=0):
+    """Generates the database at path, which must not exist, and returns the
+    number of rows of each table."""
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(path)
+    for name in sorted(dir(transform)):
+        if name.endswith("_CREATE_TABLE_SQL"):
+            conn.execute(getattr(transform, name))
+
+    rows = {}
+    rows["agency"] = insert(conn, "agency", agencies())
+    agency_ids = [row[0] for row in conn.execute("SELECT id FROM agency")]
+
+    categories = list(sam_categories())
+    subcategories = []
+    for category, subcategory in function_categories(scale):
+        parent_id = transform.convert_to_url_string(category)
+        subcategories.append(transform.convert_to_url_string(category + subcategory))
+        categories.append((parent_id, "category", category, None))
+        categories.append((subcategories[-1], "category", subcategory, parent_id))
+    rows["category"] = insert(conn, "category", dict(
+        ((row[0], row[1]), row) for row in categories).values())
+    assistance_types = [row[0] for row in categories
+                        if row[1] == "assistance" and row[3] is not None]
+    applicant_types = [row[0] for row in categories if row[1] == "applicant"]
+    beneficiary_types = [row[0] for row in categories if row[1] == "beneficiary"]
+
+    programs = [(f"{10 + i % 90}.{i // 90:03d}", "assistance_listing")
+                for i in range(round(ASSISTANCE_LISTINGS * scale))]
+    programs += [(f"TC.{i + 1:03d}", "tax_expenditure")
+                 for i in range(round(OTHER_PROGRAMS * scale))]
+    if programs[-1][1] == "tax_expenditure":
+        programs[-1] = ("IN.001", "interest")
+
+    def program_rows():
+        for program_id, program_type in programs:
+            yield (program_id, rnd.choice(agency_ids), text(rnd, 6),
+                   text(rnd, 3) if rnd.random() < 0.3 else None, text(rnd, 60),
+                   f"https://sam.gov/fal/{program_id}/view", "hash",
+                   "https://www.usaspending.gov/search/?hash=hash",
+                   f"https://grants.gov/search-grants?cfda={program_id}",
+                   program_type, rnd.random() < 0.3, text(rnd, 20))
+    rows["program"] = insert(conn, "program", program_rows())
+
+    program_assistance_types = {
+        program_id: rnd.sample(assistance_types, 1 + (rnd.random() < 0.1))
+        for program_id, program_type in programs if program_type == "assistance_listing"}
+
+    def category_rows():
+        for program_id, program_type in programs:
+            for category_id in {rnd.choice(subcategories)
+                                for _ in range(1 + count(rnd, SUBCATEGORIES_PER_PROGRAM - 1))}:
+                yield (program_id, category_id, "category")
+            if program_type != "assistance_listing":
+                continue
+            for category_id in program_assistance_types[program_id]:
+                yield (program_id, category_id, "assistance")
+            for category_id in set(rnd.sample(applicant_types, min(
+                    len(applicant_types), 1 + count(rnd, APPLICANT_TYPES_PER_PROGRAM - 1)))):
+                yield (program_id, category_id, "applicant")
+            for category_id in set(rnd.sample(beneficiary_types, min(
+                    len(beneficiary_types), count(rnd, BENEFICIARY_TYPES_PER_PROGRAM)))):
+                yield (program_id, category_id, "beneficiary")
+    rows["program_to_category"] = insert(conn, "program_to_category", category_rows())
+
+    def sam_spending_rows():
+        for program_id, types in program_assistance_types.items():
+            for assistance_type in types:
+                for year in SPENDING_YEARS:
+                    is_actual = int(year < LAST_ACTUAL_YEAR)
+                    yield (program_id, assistance_type, year, is_actual, amount(rnd))
+    rows["program_sam_spending"] = insert(conn, "program_sam_spending", sam_spending_rows())
+
+    def obligation_rows():
+        for program_id, types in program_assistance_types.items():
+            for year in SPENDING_YEARS:
+                for _ in range(count(rnd, OBLIGATION_ROWS_PER_YEAR)):
+                    yield (program_id, year, rnd.randint(2, 11),
+                           f"{rnd.choice(['CA', 'TX', 'NY', 'FL', 'OH'])}{rnd.randint(1, 30):02d}",
+                           amount(rnd, 1e5))
+    rows["usaspending_assistance_obligation_aggregation"] = insert(
+        conn, "usaspending_assistance_obligation_aggregation", obligation_rows())
+
+    def outlay_rows():
+        for program_id in program_assistance_types:
+            for year in SPENDING_YEARS:
+                for _ in range(count(rnd, OUTLAY_ROWS_PER_YEAR)):
+                    yield (program_id, year, amount(rnd, 1e5), amount(rnd, 1e5))
+    rows["usaspending_assistance_outlay_aggregation"] = insert(
+        conn, "usaspending_assistance_outlay_aggregation", outlay_rows())
+
+    def other_spending_rows():
+        for program_id, program_type in programs:
+            if program_type != "assistance_listing":
+                for year in SPENDING_YEARS:
+                    yield (program_id, year, amount(rnd) if program_type == "interest" else 0.0,
+                           amount(rnd) if program_type == "tax_expenditure" else 0.0,
+                           "additional-programs.csv")
+    rows["other_program_spending"] = insert(conn, "other_program_spending", other_spending_rows())
+
+    def result_rows():
+        for program_id in program_assistance_types:
+            results = min(len(SPENDING_YEARS), count(rnd, RESULTS_PER_PROGRAM))
+            for year in SPENDING_YEARS[len(SPENDING_YEARS) - results:]:
+                yield (program_id, year, text(rnd, 80))
+    rows["program_result"] = insert(conn, "program_result", result_rows())
+
+    def authorization_rows():
+        for program_id in program_assistance_types:
+            for _ in range(count(rnd, AUTHORIZATIONS_PER_PROGRAM)):
+                section = rnd.randint(1, 9999)
+                yield (program_id, f"{rnd.randint(1, 50)} U.S.C. {section}",
+                       f"https://www.govinfo.gov/link/uscode/42/{section}"
+                       if rnd.random() < 0.7 else None)
+    rows["program_authorization"] = insert(conn, "program_authorization", authorization_rows())
+
+    names = [text(rnd, 8) for _ in range(round(IMPROPER_PAYMENT_PROGRAMS * scale))]
+
+    def improper_payment_rows():
+        program_ids = list(program_assistance_types)
+        for _ in range(round(IMPROPER_PAYMENT_ROWS * scale)):
+            has_amounts = rnd.random() < 0.6
+            yield (rnd.choice(program_ids), rnd.choice(names) if rnd.random() < 0.95 else None,
+                   amount(rnd, 1e9) if has_amounts else None,
+                   amount(rnd, 1e7) if has_amounts else None,
+                   amount(rnd, 1e6) if has_amounts else None, int(rnd.random() < 0.3))
+    rows["improper_payment_mapping"] = insert(conn, "improper_payment_mapping", improper_payment_rows())
+
+    conn.commit()
+    conn.close()
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--scale", type=float, default=1,
+                        help="multiple of the size of the current catalog (default: 1)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True,
+                        help="path of the database to generate, which is replaced if it exists")
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.output):
+        os.remove(args.output)
+    start = time.perf_counter()
+    rows = generate(args.output, args.scale, args.seed)
+    for table, table_rows in rows.items():
+        print(f"{table + ':':48s}{table_rows}")
+    print(f"Generated {args.output} ({os.path.getsize(args.output) / 2**20:.0f} MiB) "
+          f"in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Read-optimized connections to the transformed database, for consumers that
+only read it, like load.py.
+
+The database file is opened read-only through a URI (and, once nothing
+writes to it anymore, as immutable, so SQLite does not lock it or check it for
+changes). Pages are memory-mapped rather than copied from the OS cache, the
+page cache is larger than SQLite's 2 MiB default, so tables scanned for each
+batch of programs stay cached, and more prepared statements are kept.
+
+Rows are sqlite3.Row objects by default. Loops over many rows can read plain
+tuples instead, which are faster to build and index, by looking up the index
+of each column once with column_indexes.
+"""
+
+import sqlite3
+from pathlib import Path
+
+# bytes of the database file mapped into memory
+MMAP_SIZE = 1024 * 1024 * 1024
+# size of the page cache, in KiB
+CACHE_SIZE_KIB = 64 * 1024
+# number of prepared statements kept by each connection (the default is 128)
+CACHED_STATEMENTS = 256
+
+
+def database_uri(path, immutable=False):
+    """Returns the URI that opens a database file read-only."""
+    uri = Path(path).resolve().as_uri() + "?mode=ro"
+    if immutable:
+        uri += "&immutable=1"
+    return uri
+
+
+def connect_read_only(path, immutable=False, query_only=True,
+                      tuple_rows=False, factory=sqlite3.Connection):
+    """
+    Opens a read-only connection to a database file. With immutable, the file
+    must not change while the connection is open (e.g., during a run of
+    load.py after the transform stages are done).
+
+    query_only also rejects writes to TEMP tables, so connections that store
+    temporary data (e.g., the program sets of programsets) must turn it off;
+    the database file itself stays read-only either way.
+
+    factory is the connection class (see instrumentation.connection_class).
+    """
+    conn = sqlite3.connect(database_uri(path, immutable), uri=True,
+                           cached_statements=CACHED_STATEMENTS,
+                           factory=factory)
+    if not tuple_rows:
+        conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    if query_only:
+        conn.execute("PRAGMA query_only = ON")
+    return conn
+
+
+def tuple_cursor(conn):
+    """Returns a cursor of the connection whose rows are plain tuples,
+    whatever the connection's row factory."""
+    cursor = conn.cursor()
+    cursor.row_factory = None
+    return cursor
+
+
+def column_indexes(cursor):
+    """Returns the index of each column of the cursor's last query, by name,
+    to read tuple rows by column name."""
+    return {column[0]: i for i, column in enumerate(cursor.description)}
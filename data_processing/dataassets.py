@@ -0,0 +1,67 @@
+"""
+Writes the data of generated pages (e.g., a category's agencies, or a
+program's obligations) to static JSON files in website/assets/data, which the
+pages load by URL, instead of embedding it in their front matter as JSON
+strings. Jekyll then copies the data as it is, and browsers can cache it.
+
+Each file is named after the hash of its content, so it can be cached forever
+and is only rewritten when its data changes. A gzip-compressed copy is
+written next to each file, which nginx serves as it is (gzip_static). No
+brotli copy is written, as the nginx image has no module to serve it.
+"""
+
+import gzip
+import json
+import os
+
+import sitefiles
+
+ASSETS_PATH = 'assets/data'
+# number of hex digits of the content hash in file names
+HASH_LENGTH = 16
+
+# the precompressed copies of each file, as (suffix, compress)
+COMPRESSED_COPIES = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+
+
+def asset_filename(name, content):
+    """Returns the file name of the data of a page, given its content."""
+    return f"{name}.{sitefiles.content_hash(content)[:HASH_LENGTH]}.json"
+
+
+class DataAssets:
+    """The data files of one kind of page (e.g., category) written during one
+    run into <website_dir>/assets/data/<kind>. Like the pages themselves,
+    files that were not written during the run can be pruned afterwards."""
+
+    def __init__(self, website_dir, kind):
+        self.directory = os.path.join(website_dir, *ASSETS_PATH.split('/'), kind)
+        os.makedirs(self.directory, exist_ok=True)
+        self.url = f"/{ASSETS_PATH}/{kind}"
+        self.files = sitefiles.GeneratedDirectory(self.directory, '*.json*')
+
+    @classmethod
+    def for_pages(cls, pages_dir, kind):
+        """Returns the data files of the pages of a collection directory of
+        the website, e.g., website/_category."""
+        return cls(os.path.dirname(os.path.normpath(pages_dir)), kind)
+
+    def write(self, name, data):
+        """Writes the data of a page, unless a file with the same content
+        exists. Returns the URL of the file."""
+        content = json.dumps(data, separators=(',', ':')).encode('utf-8')
+        filename = asset_filename(name, content)
+        if not self.files.keep(filename):
+            self.files.write_bytes(filename, content)
+        for suffix, compress in COMPRESSED_COPIES:
+            if not self.files.keep(filename + suffix):
+                self.files.write_bytes(filename + suffix, compress(content))
+        return f"{self.url}/{filename}"
+
+    def prune(self):
+        """Removes the data files of pages that no longer exist, or whose data
+        changed."""
+        self.files.prune()
+
+    def summary(self):
+        return f"JSON and gzip data files: {self.files.summary()}"
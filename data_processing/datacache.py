@@ -0,0 +1,87 @@
+"""
+Caches data computed from the transformed database, such as the agency tree
+shared by the search and home pages, for as long as the database does not
+change. The database is identified by a fingerprint of its file, so cached
+data is recomputed after the database is rebuilt.
+
+Data that is expensive to build, like programs_data, can also be stored on disk
+with pickle protocol 5, so that separate runs of load.py (e.g., to regenerate
+only the CSV) read it instead of querying the database again.
+"""
+
+import contextlib
+import copy
+import glob
+import hashlib
+import os
+import pickle
+import sqlite3
+
+_cache = {}
+
+
+def database_fingerprint(cursor: sqlite3.Cursor):
+    """Returns a fingerprint of the path, size and modification time of the
+    main database file a cursor is connected to, or None for in-memory and
+    temporary databases."""
+    cursor.execute("PRAGMA database_list")
+    path = None
+    for row in cursor.fetchall():
+        if row[1] == "main":
+            path = row[2]
+    if not path:
+        return None
+    stat = os.stat(path)
+    key = f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+def cached(cursor: sqlite3.Cursor, name, compute):
+    """Returns compute(), which is only called once for each fingerprint of
+    the database. Callers get their own copy of the cached data, so they may
+    modify it. Data from databases without a fingerprint is not cached."""
+    fingerprint = database_fingerprint(cursor)
+    if fingerprint is None:
+        return compute()
+    key = (name, fingerprint)
+    if key not in _cache:
+        _cache[key] = compute()
+    return copy.deepcopy(_cache[key])
+
+
+def clear():
+    """Removes all cached data."""
+    _cache.clear()
+
+
+def disk_cached(cursor: sqlite3.Cursor, name, compute, directory,
+                refresh=False):
+    """Returns compute(), which is stored in <directory>/<name>-<fingerprint>
+    .pickle and only called again once the database changes (or if refresh is
+    set). Files stored for earlier versions of the database are removed. Data
+    from databases without a fingerprint is not stored."""
+    fingerprint = database_fingerprint(cursor)
+    if fingerprint is None:
+        return compute()
+    path = os.path.join(directory, f"{name}-{fingerprint}.pickle")
+    if not refresh:
+        try:
+            with open(path, "rb") as f:
+                return pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+
+    data = compute()
+    os.makedirs(directory, exist_ok=True)
+    # written under a temporary name of this process, so a run that is
+    # interrupted does not leave a truncated file behind, and processes of a
+    # parallel load that compute the same data do not write the same file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    with open(temporary_path, "wb") as f:
+        pickle.dump(data, f, protocol=5)
+    os.replace(temporary_path, path)
+    for stale_path in glob.glob(os.path.join(directory, f"{name}-*.pickle")):
+        if os.path.abspath(stale_path) != os.path.abspath(path):
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(stale_path)
+    return data
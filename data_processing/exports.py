@@ -0,0 +1,246 @@
+"""
+Writes the downloadable exports of all program data: the CSV linked from the
+website, a gzip-compressed copy of it, and a Parquet file with typed columns
+for each fiscal year's obligations and outlays instead of JSON strings.
+
+Programs are written as they are produced, so the exports can be generated
+from iter_program_data without holding every program in memory. A manifest
+records the number of rows, the size and the SHA-256 checksum of each file,
+and is only rewritten when one of them changes.
+
+The Parquet file is only written when pyarrow is installed.
+"""
+
+import csv
+import gzip
+import io
+import json
+import os
+
+import sitefiles
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pyarrow is optional
+    pyarrow = None
+
+CSV_HEADER = [
+    'program_number',
+    'title',
+    'popular_name',
+    'agency',
+    'sub-agency',
+    'objective',
+    'sam_url',
+    'usaspending_url',
+    'grants_url',
+    'assistance_types',
+    'beneficiary_types',
+    'applicant_types',
+    'categories',
+    'obligations',
+    'outlays',
+    'other expenditures',
+]
+
+# the yearly series of the JSON columns of the CSV, as (CSV column, program
+# record attribute, [(JSON key, series field)])
+SERIES = [
+    ('obligations', 'obligations', [('sam_spending', 'sam_actual'),
+                                    ('usa_spending_actual', 'usa_spending_actual')]),
+    ('outlays', 'outlays', [('outlay', 'outlay'),
+                            ('obligation', 'obligation')]),
+    ('other_expenditures', 'other_program_spending', [('outlays', 'outlays'),
+                                                      ('revenue_losses', 'forgone_revenue')]),
+]
+
+LIST_COLUMNS = ['assistance_types', 'beneficiary_types', 'applicant_types',
+                'categories']
+
+# number of programs per Parquet row group
+BATCH_SIZE = 1000
+
+
+def csv_row(program):
+    """Returns the row of a program record in all-program-data.csv."""
+    obligations = program.obligations
+    other_spending = program.other_program_spending
+    return [
+        program.id,
+        program.name,
+        program.popular_name or '',
+        program.top_agency_name or 'Unspecified',
+        program.sub_agency_name or 'N/A',
+        program.objective,
+        program.sam_url,
+        program.usaspending_url,
+        program.grants_url,
+        ','.join(program.assistance_types),
+        ','.join(program.beneficiary_types),
+        ','.join(program.applicant_types),
+        ','.join(program.categories),
+        json.dumps([{
+            'x': year,
+            'sam_spending': obligations.get(year, 'sam_actual'),
+            'usa_spending_actual': obligations.get(year, 'usa_spending_actual')
+        } for year in obligations.years], separators=(',', ':')) if obligations and obligations.years else "",
+        json.dumps(program.outlays.to_list(), separators=(',', ':')) if program.outlays and program.outlays.years else "",
+        json.dumps([{
+            'x': year,
+            'outlays': other_spending.get(year, 'outlays'),
+            **({'revenue_losses': other_spending.get(year, 'forgone_revenue')}
+               if 'forgone_revenue' in other_spending.fields else {})
+        } for year in other_spending.years], separators=(',', ':')) if other_spending and other_spending.years else ""
+    ]
+
+
+def parquet_schema(fiscal_years):
+    """Returns the schema of the Parquet export: the CSV's text columns,
+    lists of strings instead of comma-separated values, and a float column
+    for each yearly amount (e.g., obligations_sam_spending_2024), which is
+    null for programs without that series."""
+    fields = [
+        ('program_number', pyarrow.string()),
+        ('title', pyarrow.string()),
+        ('popular_name', pyarrow.string()),
+        ('agency', pyarrow.string()),
+        ('sub_agency', pyarrow.string()),
+        ('objective', pyarrow.string()),
+        ('sam_url', pyarrow.string()),
+        ('usaspending_url', pyarrow.string()),
+        ('grants_url', pyarrow.string()),
+        ('program_type', pyarrow.string()),
+    ]
+    fields += [(column, pyarrow.list_(pyarrow.string()))
+               for column in LIST_COLUMNS]
+    for column, _, keys in SERIES:
+        for json_key, _ in keys:
+            fields += [(f"{column}_{json_key}_{year}", pyarrow.float64())
+                       for year in fiscal_years]
+    return pyarrow.schema(fields)
+
+
+def parquet_row(program, fiscal_years):
+    """Returns the values of a program record in the Parquet export, by
+    column."""
+    row = {
+        'program_number': program.id,
+        'title': program.name,
+        'popular_name': program.popular_name,
+        'agency': program.top_agency_name or 'Unspecified',
+        'sub_agency': program.sub_agency_name,
+        'objective': program.objective,
+        'sam_url': program.sam_url,
+        'usaspending_url': program.usaspending_url,
+        'grants_url': program.grants_url,
+        'program_type': program.program_type,
+    }
+    for column in LIST_COLUMNS:
+        row[column] = list(getattr(program, column))
+    for column, program_key, keys in SERIES:
+        series = getattr(program, program_key)
+        for json_key, series_key in keys:
+            for year in fiscal_years:
+                row[f"{column}_{json_key}_{year}"] = \
+                    series.get(str(year), series_key, None) \
+                    if series is not None and series_key in series.fields \
+                    else None
+    return row
+
+
+class ProgramExport:
+    """Writes programs to the CSV, gzip-compressed CSV and Parquet exports in
+    a directory as they are produced, and a manifest when closed."""
+
+    def __init__(self, directory, fiscal_years, name='all-program-data',
+                 batch_size=BATCH_SIZE):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.fiscal_years = [str(year) for year in fiscal_years]
+        self.name = name
+        self.batch_size = batch_size
+        self.rows = 0
+
+        self.csv_path = os.path.join(directory, f"{name}.csv")
+        self.csv_file = open(self.csv_path, 'w', newline='', encoding='utf-8')
+        self.csv_writer = csv.writer(self.csv_file)
+
+        # mtime=0 and no file name keep the compressed bytes, and so the
+        # checksum, the same for the same data
+        self.gzip_path = self.csv_path + '.gz'
+        self.gzip_raw = open(self.gzip_path, 'wb')
+        self.gzip_file = io.TextIOWrapper(
+            gzip.GzipFile(filename='', mode='wb', fileobj=self.gzip_raw,
+                          mtime=0),
+            encoding='utf-8', newline='')
+        self.gzip_writer = csv.writer(self.gzip_file)
+
+        for writer in (self.csv_writer, self.gzip_writer):
+            writer.writerow(CSV_HEADER)
+
+        self.parquet_path = None
+        if pyarrow is not None:
+            self.parquet_path = os.path.join(directory, f"{name}.parquet")
+            self.schema = parquet_schema(self.fiscal_years)
+            self.parquet_writer = pyarrow.parquet.ParquetWriter(
+                self.parquet_path, self.schema, compression='zstd')
+            self.batch = []
+
+    def write(self, program):
+        """Writes one program to every export."""
+        row = csv_row(program)
+        self.csv_writer.writerow(row)
+        self.gzip_writer.writerow(row)
+        if self.parquet_path:
+            self.batch.append(parquet_row(program, self.fiscal_years))
+            if len(self.batch) >= self.batch_size:
+                self._flush()
+        self.rows += 1
+
+    def _flush(self):
+        if self.batch:
+            self.parquet_writer.write_table(
+                pyarrow.Table.from_pylist(self.batch, schema=self.schema))
+            self.batch = []
+
+    def _close_files(self):
+        self.csv_file.close()
+        self.gzip_file.close()
+        self.gzip_raw.close()
+        if self.parquet_path:
+            self.parquet_writer.close()
+
+    def close(self):
+        """Finishes every export and writes the manifest. Returns the
+        manifest."""
+        paths = [self.csv_path, self.gzip_path]
+        if self.parquet_path:
+            self._flush()
+            paths.append(self.parquet_path)
+        self._close_files()
+
+        manifest = {
+            'fiscal_years': self.fiscal_years,
+            'files': [{
+                'path': os.path.basename(path),
+                'rows': self.rows,
+                'bytes': os.path.getsize(path),
+                'sha256': sitefiles.file_hash(path)
+            } for path in paths]
+        }
+        manifest_path = os.path.join(self.directory,
+                                     f"{self.name}.manifest.json")
+        sitefiles.write_if_changed(manifest_path,
+                                   json.dumps(manifest, indent=2) + '\n')
+        return manifest
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # incomplete exports get no manifest
+        if exc_type is None:
+            self.close()
+        else:
+            self._close_files()
@@ -7,6 +7,7 @@ import time
 from string import ascii_lowercase
 import requests
 import pandas as pd
+import instrumentation
 from tabula import read_pdf
 
 # file paths
@@ -15,6 +16,7 @@ SOURCE_DIRECTORY = "federal-program-inventory/data_processing/source/"
 EXTRACTED_DIRECTORY = "federal-program-inventory/data_processing/extracted/"
 
 
+@instrumentation.instrumented
 def extract_categories_from_pdf(year, debug=False):
     """Extracts the programs in each category / sub-category from the PDF."""
     data_values = read_pdf(
@@ -116,6 +118,7 @@ def extract_categories_from_pdf(year, debug=False):
     print("Extract PDF Categories Complete")
 
 
+@instrumentation.instrumented
 def extract_assistance_listing():
     """Extracts assistance listings from SAM.gov and saves them as JSON."""
     # run an empty search on SAM.gov to get all IDs
@@ -159,9 +162,12 @@ def extract_assistance_listing():
     with open(DISK_DIRECTORY + EXTRACTED_DIRECTORY
               + "assistance-listings.json", "w", encoding="utf-8") as f:
         f.write("["+",".join(listings_json_list)+"]")
+    instrumentation.record_rows("assistance-listings.json",
+                                written=len(listings_json_list))
     print("Extract Assistance Listings Complete")
 
 
+@instrumentation.instrumented
 def extract_dictionary():
     """Extracts an id-to-value mapping from SAM.gov for common picklists,
     such as applicant type, and saves them as JSON."""
@@ -179,6 +185,7 @@ def extract_dictionary():
     print("Extract Dictionary Complete")
 
 
+@instrumentation.instrumented
 def extract_organizations():
     """Extracts agencies from SAM.gov and saves them as JSON."""
     # run an empty search on SAM.gov to get all IDs
@@ -206,9 +213,12 @@ def extract_organizations():
     with open(DISK_DIRECTORY + EXTRACTED_DIRECTORY + "organizations.json", "w",
               encoding="utf-8") as f:
         f.write("["+",".join(organizations_json_list)+"]")
+    instrumentation.record_rows("organizations.json",
+                                written=len(organizations_json_list))
     print("Extract Organizations Complete")
 
 
+@instrumentation.instrumented
 def extract_usaspending_award_hashes():
     """Extracts a hash, used for linking to USASpending.gov search results,
     for each assistance listing number."""
@@ -365,6 +375,8 @@ def extract_usaspending_award_hashes():
               + "usaspending-program-search-hashes.json", "w",
               encoding="utf-8") as f:
         f.write(json.dumps(hashes))
+    instrumentation.record_rows("usaspending-program-search-hashes.json",
+                                written=len(hashes))
     print("Extract USASpending.gov Hashes Complete")
 
 def clean_json_data(filename):
@@ -410,22 +422,28 @@ def clean_json_data(filename):
         
     print(f"Clean {filename} Complete")
     
+@instrumentation.instrumented
 def clean_all_data():
     """Cleans all extracted JSON data files."""
     clean_json_data("assistance-listings.json")
     clean_json_data("dictionary.json")
     print("All Data Cleaning Complete")
 
-# Uncomment the necessary functions to extract new data.
-#
-# extract_categories_from_pdf("2023")
-# extract_assistance_listing()
+if __name__ == "__main__":
+    instrumentation.start_run("extract")
 
-# extract_dictionary()
-# clean_all_data()
-# extract_organizations()
-# extract_usaspending_award_hashes()
+    # Uncomment the necessary functions to extract new data.
+    #
+    # extract_categories_from_pdf("2023")
+    # extract_assistance_listing()
 
-# In addition to functions above, data must be downloaded from USASpending.gov
-# at: https://www.usaspending.gov/download_center/award_data_archive
-# This data is processed in the transformation stage of the process.
+    # extract_dictionary()
+    # clean_all_data()
+    # extract_organizations()
+    # extract_usaspending_award_hashes()
+
+    # In addition to functions above, data must be downloaded from USASpending.gov
+    # at: https://www.usaspending.gov/download_center/award_data_archive
+    # This data is processed in the transformation stage of the process.
+
+    instrumentation.finish_run()
@@ -0,0 +1,446 @@
+"""
+Writes the YAML front matter of the generated markdown files.
+
+The output is byte-for-byte identical to yaml.dump(data, allow_unicode=True),
+which is what Jekyll has always been given, but most of the work is done by
+the libyaml C emitter when it is installed. libyaml renders a few kinds of
+strings differently from the pure-Python emitter (e.g., how long double-quoted
+strings are folded), so those strings are rendered by this module in Python
+and spliced into the libyaml output.
+
+Without libyaml, the JSON-like documents of the front matter (mappings with
+string keys, lists, strings, numbers, booleans and None) are written by a
+block-style emitter in this module, which skips the event and node machinery
+of PyYAML's own emitter; anything else is left to yaml.dump.
+"""
+
+import functools
+import re
+import yaml
+from yaml.resolver import Resolver
+
+try:
+    from yaml import CDumper
+except ImportError:  # libyaml is not installed
+    CDumper = None
+
+# the line width used by yaml.dump
+DEFAULT_WIDTH = 80
+
+# strings PyYAML can only write double-quoted (i.e., with characters that are
+# not printable, such as carriage returns and tabs)
+DOUBLE_QUOTED_REGEX = re.compile(
+    "[^\n\x20-\x7e\x85\xa0-\ud7ff\ue000-\ufffd\U00010000-\U0010fffe]|\ufeff")
+
+# strings with line breaks or characters outside the basic multilingual plane,
+# which libyaml quotes differently
+PYTHON_ONLY_REGEX = re.compile("[\n\x85\u2028\u2029\U00010000-\U0010fffe]")
+
+# characters escaped within double-quoted strings, and those along with spaces
+# (where long double-quoted strings are folded)
+DOUBLE_QUOTED_ESCAPE_REGEX = re.compile(
+    '["\\\\\x85\u2028\u2029\ufeff]|[^\x20-\x7e\xa0-\ud7ff\ue000-\ufffd]')
+DOUBLE_QUOTED_BREAK_REGEX = re.compile(
+    '[ "\\\\\x85\u2028\u2029\ufeff]|[^\x20-\x7e\xa0-\ud7ff\ue000-\ufffd]')
+
+# line breaks, and spaces next to line breaks (which rule out single quotes)
+LINE_BREAKS = "\n\x85\u2028\u2029"
+LINE_BREAK_REGEX = re.compile("([\n\x85\u2028\u2029])")
+SPACE_AROUND_BREAK_REGEX = re.compile(
+    "[ ][\n\x85\u2028\u2029]|[\n\x85\u2028\u2029][ ]")
+
+# where something may happen when writing single-quoted strings, depending on
+# whether the writer is in a run of spaces, a run of line breaks, or neither
+SINGLE_QUOTED_REGEXES = {
+    "spaces": re.compile("[^ ]"),
+    "breaks": re.compile("[^\n\x85\u2028\u2029]"),
+    None: re.compile("[ \n\x85\u2028\u2029']")
+}
+
+ESCAPE_REPLACEMENTS = {
+    '\0': '0',
+    '\x07': 'a',
+    '\x08': 'b',
+    '\x09': 't',
+    '\x0A': 'n',
+    '\x0B': 'v',
+    '\x0C': 'f',
+    '\x0D': 'r',
+    '\x1B': 'e',
+    '"': '"',
+    '\\': '\\',
+    '\x85': 'N',
+    '\xA0': '_',
+    '\u2028': 'L',
+    '\u2029': 'P',
+}
+
+# runs of spaces, which plain scalars are folded at
+SPACES_REGEX = re.compile("( +)")
+
+# strings PyYAML does not write as plain scalars in block context
+# (Emitter.analyze_scalar): those with leading indicators, ": " or " #",
+# spaces at either end, line breaks, or special characters
+WHITESPACE = "\0 \t\r\n\x85\u2028\u2029"
+NOT_PLAIN_REGEX = re.compile(
+    "^(?:---|\\.\\.\\.)|^[#,\\[\\]{}&*!|>'\"%@`]"
+    "|^[?-](?:\\Z|[" + WHITESPACE + "])|:(?:\\Z|[" + WHITESPACE + "])"
+    "|[" + WHITESPACE + "]#|^ | \\Z|[\n\x85\u2028\u2029]")
+# how plain scalars would be read back (e.g., "2023" as an int)
+RESOLVER = Resolver()
+STR_TAG = "tag:yaml.org,2002:str"
+# keys longer than this are written as complex keys ("? key")
+MAX_SIMPLE_KEY_LENGTH = 128
+
+PLACEHOLDER_PREFIX = "frontmatter-placeholder-"
+PLACEHOLDER_LINE_REGEX = re.compile(
+    r"^(?P<lead> *(?:- )*)(?:(?P<key>[^ ].*?): )?"
+    + PLACEHOLDER_PREFIX + r"(?P<index>\d+)$")
+
+
+def write_double_quoted(text, column, indent, width=DEFAULT_WIDTH):
+    """Renders a double-quoted scalar that starts at the given column, folding
+    it as PyYAML's emitter does (Emitter.write_double_quoted)."""
+    chunks = ['"']
+    column += 1
+    length = len(text)
+    start = end = 0
+    while end <= length:
+        ch = text[end] if end < length else None
+        if ch is None or (ch != ' '
+                          and DOUBLE_QUOTED_ESCAPE_REGEX.match(ch)):
+            if start < end:
+                chunks.append(text[start:end])
+                column += end - start
+                start = end
+            if ch is not None:
+                if ch in ESCAPE_REPLACEMENTS:
+                    data = '\\' + ESCAPE_REPLACEMENTS[ch]
+                elif ch <= '\xFF':
+                    data = '\\x%02X' % ord(ch)
+                elif ch <= '\uFFFF':
+                    data = '\\u%04X' % ord(ch)
+                else:
+                    data = '\\U%08X' % ord(ch)
+                chunks.append(data)
+                column += len(data)
+                start = end + 1
+        if (0 < end < length - 1 and (ch == ' ' or start >= end)
+                and column + (end - start) > width):
+            chunks.append(text[start:end] + '\\')
+            if start < end:
+                start = end
+            chunks.append('\n' + ' ' * indent)
+            column = indent
+            if text[start] == ' ':
+                chunks.append('\\')
+                column += 1
+        end += 1
+        # nothing happens at ordinary characters while text is pending, so
+        # skip ahead to the next space or escaped character
+        if start < end <= length:
+            match = DOUBLE_QUOTED_BREAK_REGEX.search(text, end)
+            end = match.start() if match else length
+    chunks.append('"')
+    return ''.join(chunks)
+
+
+def write_single_quoted(text, column, indent, width=DEFAULT_WIDTH):
+    """Renders a single-quoted scalar that starts at the given column, folding
+    it as PyYAML's emitter does (Emitter.write_single_quoted)."""
+    chunks = ["'"]
+    column += 1
+    length = len(text)
+    state = None
+    start = end = 0
+    while end <= length:
+        ch = text[end] if end < length else None
+        if state == "spaces":
+            if ch is None or ch != ' ':
+                if (start + 1 == end and column > width and start != 0
+                        and end != length):
+                    chunks.append('\n' + ' ' * indent)
+                    column = indent
+                else:
+                    chunks.append(text[start:end])
+                    column += end - start
+                start = end
+        elif state == "breaks":
+            if ch is None or ch not in LINE_BREAKS:
+                if text[start] == '\n':
+                    chunks.append('\n')
+                chunks.append(text[start:end] + ' ' * indent)
+                column = indent
+                start = end
+        elif ch is None or ch in " '" or ch in LINE_BREAKS:
+            if start < end:
+                chunks.append(text[start:end])
+                column += end - start
+                start = end
+        if ch == "'":
+            chunks.append("''")
+            column += 2
+            start = end + 1
+        if ch is not None:
+            state = ("spaces" if ch == ' '
+                     else "breaks" if ch in LINE_BREAKS else None)
+        end += 1
+        # skip ahead to where the state may change
+        if end < length:
+            match = SINGLE_QUOTED_REGEXES[state].search(text, end)
+            end = match.start() if match else length
+    chunks.append("'")
+    return ''.join(chunks)
+
+
+def write_plain(text, column, indent, width=DEFAULT_WIDTH):
+    """Renders a plain scalar that starts at the given column, folding it as
+    PyYAML's emitter does (Emitter.write_plain). Plain scalars have no line
+    breaks, and no spaces at either end."""
+    chunks = []
+    for part in SPACES_REGEX.split(text):
+        # a single space is where a line that is already too long is folded
+        if part == ' ' and column > width:
+            chunks.append('\n' + ' ' * indent)
+            column = indent
+        else:
+            chunks.append(part)
+            column += len(part)
+    return ''.join(chunks)
+
+
+@functools.lru_cache(maxsize=4096)
+def string_style(text):
+    """Returns how PyYAML writes a string in block context: "plain", "'" or
+    '"' (Emitter.choose_scalar_style)."""
+    special = DOUBLE_QUOTED_REGEX.search(text)
+    if (text and not special and not NOT_PLAIN_REGEX.search(text)
+            and RESOLVER.resolve(yaml.ScalarNode, text, (True, False)) == STR_TAG):
+        return "plain"
+    if not special and not SPACE_AROUND_BREAK_REGEX.search(text):
+        return "'"
+    return '"'
+
+
+class _Unsupported(Exception):
+    """Data that the block-style emitter does not write like yaml.dump."""
+
+
+def _float(value):
+    """Renders a float as PyYAML's representer does."""
+    if value != value:
+        return '.nan'
+    if value == float('inf'):
+        return '.inf'
+    if value == -float('inf'):
+        return '-.inf'
+    text = repr(value).lower()
+    if '.' not in text and 'e' in text:
+        text = text.replace('e', '.0e', 1)
+    return text
+
+
+def _scalar(value, column, indent, seen):
+    """Renders a scalar (or an empty container) that starts at the given
+    column, with its continuation lines at indent."""
+    kind = type(value)
+    if kind is str:
+        style = string_style(value)
+        if style == "plain":
+            return write_plain(value, column, indent)
+        if style == "'":
+            return write_single_quoted(value, column, indent)
+        return write_double_quoted(value, column, indent)
+    if value is None:
+        return 'null'
+    if kind is bool:
+        return 'true' if value else 'false'
+    if kind is int:
+        return str(value)
+    if kind is float:
+        return _float(value)
+    if kind is dict or kind is list:
+        _see(value, seen)
+        return '{}' if kind is dict else '[]'
+    raise _Unsupported(kind)
+
+
+def _see(container, seen):
+    # containers referenced more than once are emitted as YAML aliases
+    if id(container) in seen:
+        raise _Unsupported("alias")
+    seen.add(id(container))
+
+
+def _emit_mapping(data, indent, lead, lines, seen):
+    """Appends the lines of a non-empty mapping whose keys are at indent,
+    where lead is the text before the first key on its line."""
+    _see(data, seen)
+    for key in sorted(data):
+        if (type(key) is not str or len(key) >= MAX_SIMPLE_KEY_LENGTH
+                or string_style(key) != "plain" or key == ''):
+            raise _Unsupported(key)
+        prefix = lead + key + ':'
+        lead = ' ' * indent
+        value = data[key]
+        if type(value) is dict and value:
+            lines.append(prefix)
+            _emit_mapping(value, indent + 2, ' ' * (indent + 2), lines, seen)
+        elif type(value) is list and value:
+            # sequences in mappings are not indented
+            lines.append(prefix)
+            _emit_sequence(value, indent, ' ' * indent, lines, seen)
+        else:
+            lines.append(prefix + ' ' + _scalar(value, len(prefix) + 1,
+                                                indent + 2, seen))
+
+
+def _emit_sequence(data, indent, lead, lines, seen):
+    """Appends the lines of a non-empty sequence whose dashes are at indent,
+    where lead is the text before the first dash on its line."""
+    _see(data, seen)
+    for item in data:
+        prefix = lead + '- '
+        lead = ' ' * indent
+        if type(item) is dict and item:
+            _emit_mapping(item, indent + 2, prefix, lines, seen)
+        elif type(item) is list and item:
+            _emit_sequence(item, indent + 2, prefix, lines, seen)
+        else:
+            lines.append(prefix + _scalar(item, len(prefix), indent + 2,
+                                          seen))
+
+
+def emit(data):
+    """Returns a non-empty mapping of JSON-like values as YAML, exactly as
+    yaml.dump(data, allow_unicode=True) would, without libyaml; or None for
+    any other data."""
+    if type(data) is not dict or not data:
+        return None
+    lines = []
+    try:
+        _emit_mapping(data, 0, '', lines, set())
+    except _Unsupported:
+        return None
+    return '\n'.join(lines) + '\n'
+
+
+def _python_scalar(value, key_length, column):
+    """Renders a scalar with PyYAML's pure-Python emitter, as the value of a
+    key of the given length (or as a sequence item if key_length is None)
+    starting at the given column. Returns the text after the key."""
+    width = DEFAULT_WIDTH - column
+    if key_length is None:
+        text = yaml.dump([value], allow_unicode=True, width=width)
+        skip = 2
+    else:
+        text = yaml.dump({'x' * key_length: value}, allow_unicode=True,
+                         width=width)
+        skip = key_length + 2
+    # line breaks within the scalar are written as is, not only as "\n"
+    parts = LINE_BREAK_REGEX.split(text[:-1])
+    parts[0] = parts[0][skip:]
+    for i in range(2, len(parts), 2):
+        if parts[i]:
+            parts[i] = ' ' * column + parts[i]
+    return ''.join(parts)
+
+
+def _render_placeholder(line_match, value):
+    """Renders the string that replaced a placeholder in the libyaml
+    output, in the same position."""
+    lead = line_match.group('lead')
+    key = line_match.group('key')
+    if key is None:
+        prefix = lead
+        column = len(lead) - 2
+        key_length = None
+    else:
+        prefix = lead + key + ': '
+        column = len(lead)
+        key_length = len(key)
+    # strings with special characters, or with spaces next to line breaks,
+    # can only be double-quoted; other strings with line breaks can only be
+    # single-quoted
+    if (DOUBLE_QUOTED_REGEX.search(value)
+            or SPACE_AROUND_BREAK_REGEX.search(value)):
+        return prefix + write_double_quoted(value, len(prefix), column + 2)
+    if LINE_BREAK_REGEX.search(value):
+        return prefix + write_single_quoted(value, len(prefix), column + 2)
+    return prefix + _python_scalar(value, key_length, column)
+
+
+def _replace_strings(data, placeholders, copies):
+    """Returns a copy of data where strings that libyaml would render
+    differently are replaced with placeholders, or None if data contains
+    anything other than the plain JSON-like values used in front matter."""
+    if isinstance(data, str):
+        if data.startswith(PLACEHOLDER_PREFIX):
+            return None
+        if PYTHON_ONLY_REGEX.search(data) or DOUBLE_QUOTED_REGEX.search(data):
+            placeholders.append(data)
+            return PLACEHOLDER_PREFIX + str(len(placeholders) - 1)
+        return data
+    if data is None or isinstance(data, (bool, int, float)):
+        return data
+    # containers referenced more than once are emitted as YAML aliases, so
+    # the copies must share references in the same way
+    if id(data) in copies:
+        return copies[id(data)]
+    if type(data) is dict:
+        copy = copies[id(data)] = {}
+        for key, value in data.items():
+            if (not isinstance(key, str) or len(key) > 100
+                    or PYTHON_ONLY_REGEX.search(key)
+                    or DOUBLE_QUOTED_REGEX.search(key)):
+                return None
+            copy[key] = _replace_strings(value, placeholders, copies)
+            if copy[key] is None and value is not None:
+                return None
+        return copy
+    if type(data) is list:
+        copy = copies[id(data)] = []
+        for value in data:
+            item = _replace_strings(value, placeholders, copies)
+            if item is None and value is not None:
+                return None
+            copy.append(item)
+        return copy
+    return None
+
+
+def dump(data):
+    """Returns data as YAML, exactly as yaml.dump(data, allow_unicode=True)
+    would."""
+    if CDumper is None:
+        text = emit(data)
+        return text if text is not None else yaml.dump(data, allow_unicode=True)
+    placeholders = []
+    copy = _replace_strings(data, placeholders, {})
+    if copy is None:
+        return yaml.dump(data, allow_unicode=True)
+    text = yaml.dump(copy, allow_unicode=True, Dumper=CDumper)
+    if not placeholders:
+        return text
+
+    lines = text.split('\n')
+    for i, line in enumerate(lines):
+        if PLACEHOLDER_PREFIX not in line:
+            continue
+        match = PLACEHOLDER_LINE_REGEX.match(line)
+        if match is None or len(match.group('lead')) + 2 >= DEFAULT_WIDTH - 4:
+            return yaml.dump(data, allow_unicode=True)
+        lines[i] = _render_placeholder(
+            match, placeholders[int(match.group('index'))])
+    return '\n'.join(lines)
+
+
+def page(data):
+    """Returns the text of a markdown file with data as its YAML front
+    matter."""
+    return '---\n' + dump(data) + '---\n'
+
+
+def write(file, data):
+    """Writes data to a markdown file as YAML front matter."""
+    file.write(page(data))
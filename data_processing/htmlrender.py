@@ -0,0 +1,236 @@
+"""
+Renders program pages straight to HTML with Jinja2, as Jekyll renders them
+with website/_layouts/program.html, so that the site build does not have to
+run Liquid over thousands of program pages, and only handles the low-volume
+pages. Pages are rendered in parallel, in a pool of processes.
+
+The program layout and the site's <head> use Liquid features Jinja does not
+have, so they are ported to Jinja in data_processing/templates. Every other
+layout and include (e.g., the header, footer, and the program page's scripts)
+is read from the website as it is, with its Liquid include tags rewritten to
+Jinja ones.
+
+Jekyll renders the program results with kramdown, which this renderer does
+not reproduce. Programs whose results are not plain paragraphs (see
+is_renderable) are left to Jekyll as markdown files.
+"""
+
+import multiprocessing
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import jinja2
+import yaml
+
+import sitefiles
+
+WEBSITE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "website")
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+
+# the front matter of website/_layouts/program.html
+PROGRAM_LAYOUT = {'layout': 'default', 'footer_include': '_footer-program.html'}
+
+# number of pages rendered by each task sent to the pool
+RENDER_BATCH_SIZE = 100
+
+LIQUID_INCLUDE = re.compile(r"{%-?\s*include\s+(?:{{\s*(.+?)\s*}}|([\w./-]+))\s*-?%}")
+
+# text that kramdown renders as more than plain paragraphs: markdown syntax,
+# HTML, entities, and characters it turns into typographic symbols
+NOT_PLAIN_MARKDOWN = re.compile(
+    r"""[*_`\[\]\\<>&#|{}$'"^~\t]|--|\.\.\.|  \n"""
+    r"""|^ *(?:[-+:=]|\d+[.)])(?: |$)|^ *[-=]+ *$|^ {4}""",
+    re.MULTILINE)
+
+
+class LiquidIncludeLoader(jinja2.FileSystemLoader):
+    """Loads templates from the Jinja ports in data_processing/templates, or
+    else from the website's layouts and includes, without their front matter
+    and with Liquid's {% include name.html %} and
+    {% include {{ expression }} %} rewritten to Jinja includes."""
+
+    def __init__(self, website_dir=WEBSITE_DIR):
+        super().__init__([TEMPLATES_DIR,
+                          os.path.join(website_dir, "_layouts"),
+                          os.path.join(website_dir, "_includes")])
+
+    def get_source(self, environment, template):
+        source, filename, uptodate = super().get_source(environment, template)
+        if source.startswith("---\n"):
+            source = source[source.index("\n---\n", 4) + 5:]
+        return LIQUID_INCLUDE.sub(_jinja_include, source), filename, uptodate
+
+
+def _jinja_include(match):
+    expression, name = match.groups()
+    return "{% include " + (expression or repr(name)) + " %}"
+
+
+def is_plain_markdown(text):
+    """Returns True if kramdown renders the text as plain paragraphs."""
+    return text is None or not NOT_PLAIN_MARKDOWN.search(text)
+
+
+def markdownify(text):
+    """Renders plain paragraphs (see is_plain_markdown) as kramdown does.
+    Raises ValueError for other markdown."""
+    if text is None:
+        return ""
+    if not is_plain_markdown(text):
+        raise ValueError(f"not plain paragraphs: {text[:40]!r}")
+    paragraphs = [
+        "\n".join(line.strip() for line in paragraph.strip().splitlines())
+        for paragraph in re.split(r"\n[ \t]*\n", text.strip())
+        if paragraph.strip()
+    ]
+    return "".join(f"<p>{paragraph}</p>\n\n" for paragraph in paragraphs)[:-1]
+
+
+def is_renderable(page):
+    """Returns True if the page of a program (its front matter, as built by
+    load.program_page) can be rendered here exactly as Jekyll renders it."""
+    return all(is_plain_markdown(result['description'])
+               for result in page.get('results') or [])
+
+
+def liquid_truthy(value):
+    """Liquid's truthiness: everything but nil and false, including 0 and ''."""
+    return value is not None and value is not False
+
+
+def relative_url(site):
+    return lambda url: f"{site.get('baseurl') or ''}{url}" if url is not None else ""
+
+
+def create_environment(website_dir=WEBSITE_DIR):
+    """Returns the Jinja environment of the website, with the Liquid filters
+    the templates use. Like Liquid, it does not escape HTML and renders
+    undefined variables as empty strings."""
+    with open(os.path.join(website_dir, "_config.yml"), encoding="utf-8") as f:
+        site = yaml.safe_load(f)
+    environment = jinja2.Environment(loader=LiquidIncludeLoader(website_dir),
+                                     autoescape=False,
+                                     undefined=jinja2.ChainableUndefined,
+                                     keep_trailing_newline=True)
+    environment.filters['markdownify'] = markdownify
+    environment.filters['relative_url'] = relative_url(site)
+    environment.filters['remove_first'] = lambda s, old: str(s).replace(str(old), "", 1)
+    environment.tests['truthy'] = liquid_truthy
+    environment.globals.update(
+        site=site,
+        jekyll={'environment': os.environ.get('JEKYLL_ENV', 'development')})
+    return environment
+
+
+def render_program_page(environment, page):
+    """Returns the HTML of a program page, given its front matter."""
+    page = dict(page, url=page['permalink'])
+    content = environment.get_template("program.html").render(page=page, layout=PROGRAM_LAYOUT)
+    return environment.get_template("default.html").render(page=page, layout=PROGRAM_LAYOUT,
+                                                           content=content)
+
+
+def html_path(website_dir, page):
+    """Returns the path of the HTML file of a page at its permalink in the
+    website directory, from which Jekyll copies it to the site as it is."""
+    return os.path.join(website_dir, *page['permalink'].strip('/').split('/'))
+
+
+_environment = None
+
+
+def _init_worker(website_dir):
+    global _environment
+    _environment = create_environment(website_dir)
+
+
+def _render_batch(output_dir, pages):
+    """Renders and writes a batch of pages in a worker. Returns the paths of
+    the pages and whether each was written."""
+    results = []
+    for page in pages:
+        path = html_path(output_dir, page)
+        results.append((path, sitefiles.write_if_changed(path, render_program_page(_environment, page))))
+    return results
+
+
+class ProgramHtmlRenderer:
+    """
+    Renders the program pages it is given with the layouts of website_dir to
+    HTML files in <output_dir>/program, in a pool of worker processes (or in
+    this process if workers is 1). Files are only rewritten if they changed,
+    and, unless prune is False (e.g., when other processes render the other
+    programs), HTML files of programs that were not rendered are removed when
+    the renderer is closed without error.
+    """
+
+    def __init__(self, output_dir=WEBSITE_DIR, workers=None, batch_size=RENDER_BATCH_SIZE,
+                 website_dir=WEBSITE_DIR, prune=True):
+        self.output_dir = output_dir
+        self.prune = prune
+        os.makedirs(os.path.join(output_dir, "program"), exist_ok=True)
+        self.files = sitefiles.GeneratedDirectory(os.path.join(output_dir, "program"), "*.html")
+        self.batch_size = batch_size
+        self.batch = []
+        self.futures = []
+        self.count = 0
+        self.workers = workers or os.cpu_count() or 1
+        self.executor = None
+        if self.workers > 1:
+            # worker processes are spawned, rather than forked, so that no
+            # open SQLite handle is ever shared with a child process
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker, initargs=(website_dir,))
+        else:
+            _init_worker(website_dir)
+
+    def render(self, page):
+        """Renders the page of a program, given its front matter."""
+        self.batch.append(page)
+        self.count += 1
+        if len(self.batch) >= self.batch_size:
+            self._submit()
+
+    def _submit(self):
+        if not self.batch:
+            return
+        if self.executor is None:
+            self._record(_render_batch(self.output_dir, self.batch))
+        else:
+            self.futures.append(self.executor.submit(_render_batch, self.output_dir, self.batch))
+        self.batch = []
+
+    def _record(self, results):
+        for path, written in results:
+            self.files.record(os.path.basename(path), written)
+
+    def close(self):
+        """Waits for every page to be rendered, and removes the HTML files of
+        programs that were not rendered, unless prune is False."""
+        self._submit()
+        for future in self.futures:
+            self._record(future.result())
+        self.futures = []
+        self._shutdown()
+        if self.prune:
+            self.files.prune()
+
+    def _shutdown(self, cancel=False):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=cancel)
+            self.executor = None
+
+    def summary(self):
+        return f"{self.count} rendered to HTML ({self.files.summary()})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self._shutdown(cancel=True)
@@ -0,0 +1,563 @@
+"""
+Lightweight instrumentation for the extract, transform, and load stages.
+
+Each run records, per stage, the wall time, CPU time, peak resident memory,
+bytes read and written by the process, SQLite statement counts, and rows
+read and written per table (or source file), and writes them to a JSON run
+manifest. Manifests from two runs can be compared to flag regressions:
+
+    python instrumentation.py compare manifests/old.json manifests/new.json
+
+Runs can also profile their SQL (with --profile-sql, or PROFILE_SQL=1 in the
+environment): every statement executed on a connection opened with
+connection_class() is normalized into a fingerprint, and the calls, time,
+and rows returned of each fingerprint are written to the manifest and
+reported at the end of the run:
+
+    python instrumentation.py profile manifests/load-20250101T000000Z.json
+"""
+
+import argparse
+import datetime
+import functools
+import json
+import os
+import platform
+import re
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# run manifests are written relative to the directory the pipeline is run in
+MANIFEST_DIRECTORY = "manifests/"
+
+# default thresholds used when comparing two manifests
+REGRESSION_THRESHOLD = 0.25
+MIN_SECONDS_DELTA = 0.5
+MIN_RSS_BYTES_DELTA = 16 * 1024 * 1024
+
+STATEMENT_TYPE_REGEX = re.compile(r"^\s*(?:--[^\n]*\n\s*)*([A-Za-z]+)")
+WRITTEN_TABLE_REGEX = re.compile(
+    r"^\s*(?:INSERT(?:\s+OR\s+\w+)?\s+INTO|REPLACE\s+INTO|UPDATE(?:\s+OR\s+\w+)?"
+    r"|DELETE\s+FROM)\s+(?:\w+\.)?\"?(\w+)", re.IGNORECASE)
+
+# statements reported at the end of a profiled run
+SQL_PROFILE_TOP = 15
+# profiling is turned on for runs started while this variable is set, so
+# that it reaches worker processes too
+PROFILE_SQL_VARIABLE = "PROFILE_SQL"
+
+SQL_LITERAL_REGEX = re.compile(
+    r"'(?:[^']|'')*'|--[^\n]*|/\*.*?\*/|(?<![\w.])\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b"
+    r"|[:@$][A-Za-z_]\w*|\?\d*", re.DOTALL)
+SQL_LIST_REGEX = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+SQL_ROWS_REGEX = re.compile(r"(\(\.\.\.\))(?:\s*,\s*\(\.\.\.\))+")
+
+_active_run = None
+_stage_stack = []
+_pending_flushes = []
+
+
+class StageRecord:
+    """Measurements for a single pipeline stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time_s = 0.0
+        self.cpu_time_s = 0.0
+        self.peak_rss_bytes = None
+        self.bytes_read = None
+        self.bytes_written = None
+        self.sqlite_statements = 0
+        self.sqlite_statements_by_type = {}
+        self.tables = {}
+
+    def add_rows(self, table, read=0, written=0):
+        """Adds to the rows read from, and written to, a table or file."""
+        counts = self.tables.setdefault(table, {"rows_read": 0,
+                                                "rows_written": 0})
+        counts["rows_read"] += read
+        counts["rows_written"] += written
+
+    def add_statement(self, statement_type):
+        """Counts one executed SQLite statement."""
+        self.sqlite_statements += 1
+        self.sqlite_statements_by_type[statement_type] = \
+            self.sqlite_statements_by_type.get(statement_type, 0) + 1
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "wall_time_s": round(self.wall_time_s, 4),
+            "cpu_time_s": round(self.cpu_time_s, 4),
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "sqlite_statements": self.sqlite_statements,
+            "sqlite_statements_by_type": dict(
+                sorted(self.sqlite_statements_by_type.items())),
+            "tables": dict(sorted(self.tables.items()))
+        }
+
+
+class RunManifest:
+    """The stage records of one pipeline run."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.started_at = datetime.datetime.now(datetime.timezone.utc)
+        self.started = time.perf_counter()
+        self.stages = []
+        # fingerprint -> calls, time, and rows returned, if SQL is profiled
+        self.sql_profile = None
+
+    def to_dict(self):
+        manifest = {
+            "pipeline": self.pipeline,
+            "started_at": self.started_at.isoformat(timespec="seconds"),
+            "wall_time_s": round(time.perf_counter() - self.started, 4),
+            "host": platform.node(),
+            "python": platform.python_version(),
+            "argv": sys.argv,
+            "stages": self.stages
+        }
+        if self.sql_profile is not None:
+            manifest["sql_profile"] = sql_profile_entries(self.sql_profile)
+        return manifest
+
+    def write(self, directory=MANIFEST_DIRECTORY):
+        """Writes the manifest as JSON and returns its path."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, self.pipeline + "-"
+                            + self.started_at.strftime("%Y%m%dT%H%M%SZ")
+                            + ".json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        return path
+
+
+def start_run(pipeline, profile_sql=None):
+    """Starts collecting stage records for a pipeline run. SQL is profiled
+    if profile_sql is true, or, by default, if PROFILE_SQL is set."""
+    global _active_run
+    _active_run = RunManifest(pipeline)
+    if profile_sql is None:
+        profile_sql = os.environ.get(PROFILE_SQL_VARIABLE, "0") not in ("", "0")
+    if profile_sql:
+        _active_run.sql_profile = {}
+    return _active_run
+
+
+def finish_run(directory=MANIFEST_DIRECTORY):
+    """Writes the manifest of the active run, if any, and returns its path."""
+    global _active_run
+    if _active_run is None:
+        return None
+    _flush_watched_connections()
+    path = _active_run.write(directory)
+    if _active_run.sql_profile is not None:
+        for line in sql_profile_report(
+                sql_profile_entries(_active_run.sql_profile)):
+            print(line)
+    _active_run = None
+    _pending_flushes.clear()
+    print(f"Wrote run manifest to {path}")
+    return path
+
+
+def current_run():
+    """Returns the active run, if any."""
+    return _active_run
+
+
+def add_stages(stages, sql_profile=None):
+    """Adds stage records, and the SQL profile, collected elsewhere (e.g.,
+    by a worker process) to the active run."""
+    if _active_run is None:
+        return
+    _active_run.stages.extend(stages)
+    if sql_profile and _active_run.sql_profile is not None:
+        for fingerprint, statistics in sql_profile.items():
+            totals = _sql_statistics(fingerprint)
+            for key, value in statistics.items():
+                totals[key] += value
+
+
+def record_rows(table, read=0, written=0):
+    """Records rows read from, or written to, a table or file by the stages
+    that are currently running."""
+    for record in _stage_stack:
+        record.add_rows(table, read, written)
+
+
+def _read_process_io():
+    """Returns the bytes read and written by this process so far, where the
+    platform exposes them."""
+    try:
+        with open("/proc/self/io", encoding="ascii") as f:
+            io = dict(line.split(": ") for line in f.read().splitlines())
+        return int(io["rchar"]), int(io["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def _reset_peak_rss():
+    """Resets the resident memory high-water mark, where supported, so that
+    peaks are measured per stage rather than per process."""
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def _read_peak_rss():
+    """Returns the resident memory high-water mark, in bytes."""
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            match = re.search(r"VmHWM:\s+(\d+) kB", f.read())
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in kilobytes on Linux and bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _update_peaks():
+    peak = _read_peak_rss()
+    if peak is not None:
+        for record in _stage_stack:
+            record.peak_rss_bytes = max(record.peak_rss_bytes or 0, peak)
+
+
+@contextmanager
+def stage(name):
+    """Measures the enclosed block as a pipeline stage. Stages may be
+    nested; statements and rows are counted towards every running stage.
+    Nothing is measured unless a run is active."""
+    record = StageRecord(name)
+    if _active_run is None:
+        yield record
+        return
+    _flush_watched_connections()
+    _update_peaks()
+    _reset_peak_rss()
+    _stage_stack.append(record)
+    read_start, written_start = _read_process_io()
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    try:
+        yield record
+    finally:
+        record.wall_time_s = time.perf_counter() - wall_start
+        record.cpu_time_s = time.process_time() - cpu_start
+        read_end, written_end = _read_process_io()
+        if read_start is not None and read_end is not None:
+            record.bytes_read = read_end - read_start
+            record.bytes_written = written_end - written_start
+        _flush_watched_connections()
+        _update_peaks()
+        _stage_stack.pop()
+        if _active_run is not None:
+            _active_run.stages.append(record.to_dict())
+
+
+def instrumented(func):
+    """Decorator that measures each call of a function as a stage."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with stage(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def _flush_watched_connections():
+    """Attributes the rows written by the last statement on each watched
+    connection; connections that have since been closed are dropped."""
+    for flush in list(_pending_flushes):
+        try:
+            flush()
+        except sqlite3.ProgrammingError:
+            _pending_flushes.remove(flush)
+
+
+def watch(connection):
+    """Counts the statements executed on a SQLite connection, and the rows
+    each one writes, towards the running stages. Connections are only
+    watched while a run is active, so the trace callback adds no overhead
+    otherwise."""
+    if _active_run is None:
+        return connection
+    # the trace callback fires as each statement starts, so the rows changed
+    # by the previous statement are attributed to its table at that point
+    state = {"table": None, "changes": connection.total_changes}
+
+    def flush():
+        changes = connection.total_changes
+        if state["table"] is not None and changes > state["changes"]:
+            record_rows(state["table"], written=changes - state["changes"])
+        state["changes"] = changes
+        state["table"] = None
+
+    def trace(statement):
+        flush()
+        match = STATEMENT_TYPE_REGEX.match(statement)
+        statement_type = match.group(1).upper() if match else "OTHER"
+        for record in _stage_stack:
+            record.add_statement(statement_type)
+        match = WRITTEN_TABLE_REGEX.match(statement)
+        if match:
+            state["table"] = match.group(1)
+
+    _pending_flushes.append(flush)
+    connection.set_trace_callback(trace)
+    return connection
+
+
+@functools.lru_cache(maxsize=4096)
+def sql_fingerprint(statement):
+    """Normalizes a SQL statement, so that statements which only differ in
+    their literals, parameters, comments, whitespace, or the length of IN
+    lists and VALUES rows share a fingerprint."""
+    statement = SQL_LITERAL_REGEX.sub(
+        lambda m: " " if m.group(0)[0] in "-/" else "?", statement)
+    statement = SQL_LIST_REGEX.sub("(...)", statement)
+    statement = SQL_ROWS_REGEX.sub(r"\1, ...", statement)
+    return " ".join(statement.split()).rstrip(";").rstrip()
+
+
+def _sql_statistics(fingerprint):
+    return _active_run.sql_profile.setdefault(
+        fingerprint, {"calls": 0, "time_s": 0.0, "rows": 0})
+
+
+class ProfilingCursor(sqlite3.Cursor):
+    """Cursor that adds the time spent executing each statement and fetching
+    its rows, and the number of rows fetched, to the SQL profile of the
+    active run."""
+
+    def _profile(self, statement):
+        self._statistics = None
+        if _active_run is not None and _active_run.sql_profile is not None:
+            self._statistics = _sql_statistics(sql_fingerprint(statement))
+            self._statistics["calls"] += 1
+
+    def _add(self, start, rows=0):
+        statistics = getattr(self, "_statistics", None)
+        if statistics is not None:
+            statistics["time_s"] += time.perf_counter() - start
+            statistics["rows"] += rows
+
+    def execute(self, sql, parameters=()):
+        self._profile(sql)
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._add(start)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._profile(sql)
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._add(start)
+
+    def executescript(self, sql_script):
+        self._profile(sql_script)
+        start = time.perf_counter()
+        try:
+            return super().executescript(sql_script)
+        finally:
+            self._add(start)
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._add(start, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._add(start, len(rows))
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._add(start, len(rows))
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._add(start)
+            raise
+        self._add(start, 1)
+        return row
+
+
+class ProfilingConnection(sqlite3.Connection):
+    """Connection whose cursors, including those of its execute shortcuts,
+    are ProfilingCursors."""
+
+    def cursor(self, factory=ProfilingCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+
+def connection_class():
+    """Returns the class to open SQLite connections with (the factory
+    argument of sqlite3.connect): ProfilingConnection while the active run
+    profiles SQL, and sqlite3.Connection otherwise, so connections are only
+    slowed down by profiling when it is asked for."""
+    if _active_run is not None and _active_run.sql_profile is not None:
+        return ProfilingConnection
+    return sqlite3.Connection
+
+
+def sql_profile_entries(sql_profile):
+    """Returns the statistics of each fingerprint of a SQL profile, with its
+    average time per call, slowest first."""
+    entries = [{"fingerprint": fingerprint,
+                "calls": s["calls"],
+                "time_s": round(s["time_s"], 6),
+                "avg_time_s": round(s["time_s"] / s["calls"], 6) if s["calls"] else 0.0,
+                "rows": s["rows"]}
+               for fingerprint, s in sql_profile.items()]
+    return sorted(entries, key=lambda e: e["time_s"], reverse=True)
+
+
+def sql_profile_report(entries, top=SQL_PROFILE_TOP, sort="time_s"):
+    """Returns the lines of a report of the top statements of a SQL
+    profile, by total time (or by another statistic, e.g. "calls")."""
+    entries = sorted(entries, key=lambda e: e[sort], reverse=True)
+    total = sum(e["time_s"] for e in entries)
+    lines = [f"SQL profile: {sum(e['calls'] for e in entries)} calls of "
+             f"{len(entries)} statements in {total:.3f}s",
+             f"{'calls':>8} {'total s':>9} {'avg ms':>9} {'rows':>10}  statement"]
+    for e in entries[:top]:
+        statement = e["fingerprint"]
+        if len(statement) > 100:
+            statement = statement[:97] + "..."
+        lines.append(f"{e['calls']:8d} {e['time_s']:9.3f} "
+                     f"{e['avg_time_s'] * 1000:9.3f} {e['rows']:10d}  {statement}")
+    return lines
+
+
+def compare_manifests(old, new, threshold=REGRESSION_THRESHOLD,
+                      min_seconds=MIN_SECONDS_DELTA,
+                      min_rss_bytes=MIN_RSS_BYTES_DELTA):
+    """Compares two run manifests stage by stage. Returns a list of
+    regressions (slower, larger, or chattier stages) and a list of notes
+    (row count changes and stages present in only one run)."""
+    regressions = []
+    notes = []
+    old_stages = {s["name"]: s for s in old["stages"]}
+    new_stages = {s["name"]: s for s in new["stages"]}
+
+    def grew(old_value, new_value, min_delta):
+        return (old_value is not None and new_value is not None
+                and new_value - old_value > min_delta
+                and new_value > old_value * (1 + threshold))
+
+    for name, n in new_stages.items():
+        o = old_stages.get(name)
+        if o is None:
+            notes.append(f"{name}: new stage")
+            continue
+        for metric, min_delta in [("wall_time_s", min_seconds),
+                                  ("cpu_time_s", min_seconds),
+                                  ("peak_rss_bytes", min_rss_bytes),
+                                  ("sqlite_statements", 0)]:
+            if grew(o.get(metric), n.get(metric), min_delta):
+                regressions.append(f"{name}: {metric} {o[metric]} -> "
+                                   f"{n[metric]}")
+        for table in sorted(set(o["tables"]) | set(n["tables"])):
+            for metric in ["rows_read", "rows_written"]:
+                before = o["tables"].get(table, {}).get(metric, 0)
+                after = n["tables"].get(table, {}).get(metric, 0)
+                if abs(after - before) > before * threshold:
+                    notes.append(f"{name}: {table} {metric} {before} -> "
+                                 f"{after}")
+    for name in old_stages:
+        if name not in new_stages:
+            notes.append(f"{name}: stage missing from new run")
+    return regressions, notes
+
+
+def main(argv=None):
+    """Compares two run manifests, or reports the SQL profile of one, from
+    the command line; exits with a non-zero status if any regressions are
+    found."""
+    parser = argparse.ArgumentParser(description="Compares run manifests.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    compare = subparsers.add_parser("compare", help="flag regressions "
+                                    "between a previous and a new manifest")
+    compare.add_argument("old")
+    compare.add_argument("new")
+    compare.add_argument("--threshold", type=float,
+                         default=REGRESSION_THRESHOLD,
+                         help="relative increase that counts as a "
+                              "regression (default: %(default)s)")
+    compare.add_argument("--min-seconds", type=float,
+                         default=MIN_SECONDS_DELTA,
+                         help="ignore time increases smaller than this "
+                              "(default: %(default)s)")
+    profile = subparsers.add_parser("profile", help="report the top "
+                                    "statements of a profiled run")
+    profile.add_argument("manifest")
+    profile.add_argument("--top", type=int, default=SQL_PROFILE_TOP)
+    profile.add_argument("--sort", default="time_s",
+                         choices=["time_s", "calls", "avg_time_s", "rows"])
+    args = parser.parse_args(argv)
+
+    if args.command == "profile":
+        with open(args.manifest, encoding="utf-8") as f:
+            manifest = json.load(f)
+        if "sql_profile" not in manifest:
+            print("the run was not profiled (see --profile-sql)")
+            return 1
+        for line in sql_profile_report(manifest["sql_profile"], args.top,
+                                       args.sort):
+            print(line)
+        return 0
+
+    with open(args.old, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    regressions, notes = compare_manifests(old, new, args.threshold,
+                                           args.min_seconds)
+    for note in notes:
+        print("NOTE " + note)
+    for regression in regressions:
+        print("REGRESSION " + regression)
+    print(f"{len(regressions)} regression(s) found")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
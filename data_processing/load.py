@@ -1,19 +1,43 @@
 """Creates markdown files for static site generation."""
 
+import argparse
+import contextlib
+import glob
+import multiprocessing
 import sqlite3
 import os
 import json
-import yaml
 import csv
+import tempfile
+import zlib
+import numpy as np
+import connections
 import constants
-from typing import List, Dict, Any
+import dataassets
+import datacache
+import exports
+import frontmatter
+import htmlrender
+import instrumentation
+import programsets
+import records
+import rollup
+import shards
+import sitefiles
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cached_property
+from typing import List, Dict, Any, Iterable, Iterator
 
 # Constants
 CURRENT_DIR = os.getcwd()
 DB_FILE_PATH = os.path.join("transformed", "transformed_data.db")
 MARKDOWN_DIR = os.path.join(CURRENT_DIR, "..", "website", "_program")
 full_path = os.path.join(CURRENT_DIR, DB_FILE_PATH)
+CACHE_DIR = os.path.join(CURRENT_DIR, "cache")
 FISCAL_YEARS = ['2023', '2024', '2025']
+# number of programs whose details are loaded at once by iter_program_data
+PROGRAM_BATCH_SIZE = 500
 
 
 def ensure_directory_exists(directory_path):
@@ -21,319 +45,44 @@ def ensure_directory_exists(directory_path):
         os.makedirs(directory_path)
 
 
-def get_assistance_program_obligations(cursor, program_id, fiscal_years):
-    """Get obligations data for specified fiscal years."""
-    obligations = []
-    for year in fiscal_years:
-        year_data = {
-            'x': year,
-            'sam_estimate' : 0.0,
-            'sam_actual': 0.0,
-            'usa_spending_actual': 0.0
-        }
-
-        # Check if we have actual data first
-        cursor.execute("""
-            SELECT SUM(amount) as actual_amount
-            FROM program_sam_spending
-            WHERE program_id = ?
-            AND fiscal_year = ?
-            AND is_actual = 1
-            GROUP BY fiscal_year
-        """, (program_id, year))
-
-        actual_row = cursor.fetchone()
-
-        if actual_row and actual_row['actual_amount']:
-            # If we have actual data, use that and ignore estimates
-            year_data['sam_actual'] = float(actual_row['actual_amount'])
-        else:
-            # Only if we don't have actual data, check for estimates.
-            # Regardless of whether the value is an actual (preferred) or
-            # estimate, the value is stored as "sam_actual" and presented on
-            # the frontend as just "SAM.gov"
-            cursor.execute("""
-                SELECT SUM(amount) as estimated_amount
-                FROM program_sam_spending
-                WHERE program_id = ?
-                AND fiscal_year = ?
-                AND is_actual = 0
-                GROUP BY fiscal_year
-            """, (program_id, year))
-
-            estimate_row = cursor.fetchone()
-            if estimate_row and estimate_row['estimated_amount']:
-                year_data['sam_actual'] = float(estimate_row['estimated_amount'])
-
-        # Get USA spending obligations for reference
-        cursor.execute("""
-            SELECT ROUND(SUM(obligations), 2) as total_obligations
-            FROM usaspending_assistance_obligation_aggregation
-            WHERE cfda_number = ? AND action_date_fiscal_year = ?
-            GROUP BY cfda_number, action_date_fiscal_year
-        """, (program_id, year))
-
-        usa_row = cursor.fetchone()
-        if usa_row and usa_row['total_obligations'] is not None:
-            year_data['usa_spending_actual'] = float(usa_row['total_obligations'])
-
-        obligations.append(year_data)
-
-    return obligations
-
-
-def get_other_program_obligations(cursor, program_id, fiscal_years, program_type):
-    """Get obligations data for other programs."""
-    other_program_obligations = []
-    for year in fiscal_years:
-        cursor.execute("""
-            SELECT fiscal_year, outlays, forgone_revenue, source
-            FROM other_program_spending
-            WHERE program_id = ? AND fiscal_year = ?
-        """, (program_id, year))
-
-        row = cursor.fetchone()
-        year_data = {
-            'x': year,
-            'outlays': float(row['outlays']) if row and row['outlays'] is not None else 0.0,
-        }
-
-        if program_type == "tax_expenditure":
-            year_data['forgone_revenue'] = float(row['forgone_revenue']) if row and row['forgone_revenue'] is not None else 0.0
-
-        other_program_obligations.append(year_data)
-
-    return other_program_obligations
-
-
-def get_outlays_data(cursor, program_id, fiscal_years):
-    """Get outlays data for specified fiscal years."""
-    outlays = []
-    for year in fiscal_years:
-        year_data = {
-            'x': year,
-            'outlay': 0.0,
-            'obligation': 0.0
-        }
-
-        # Get outlays data
-        cursor.execute("""
-            SELECT
-                ROUND(SUM(outlay), 2) as total_outlay,
-                ROUND(SUM(obligation), 2) as total_obligation
-            FROM usaspending_assistance_outlay_aggregation
-            WHERE cfda_number = ?
-            AND award_first_fiscal_year = ?
-            GROUP BY cfda_number, award_first_fiscal_year
-        """, (program_id, year))
-
-        row = cursor.fetchone()
-        if row:
-            if row['total_outlay'] is not None:
-                year_data['outlay'] = float(row['total_outlay'])
-            if row['total_obligation'] is not None:
-                year_data['obligation'] = float(row['total_obligation'])
-
-        outlays.append(year_data)
-
-    return outlays
-
-def get_assistance_listing_obligations(cursor, program_ids, fiscal_year):
-    """Get total and per-program obligations for assistance listing programs."""
-    if not program_ids:
-        return {}, 0.0
-        
-    placeholders = ','.join('?' * len(program_ids))
-    params = [fiscal_year] + program_ids + [fiscal_year] + program_ids
-    
-    cursor.execute(f"""
-        SELECT program_id, COALESCE(SUM(amount), 0) as total_obs
-        FROM (
-            SELECT program_id, amount
-            FROM program_sam_spending
-            WHERE fiscal_year = ? 
-            AND program_id IN ({placeholders})
-            AND is_actual = 1
-            
-            UNION ALL
-            
-            SELECT p1.program_id, p1.amount
-            FROM program_sam_spending p1
-            WHERE fiscal_year = ?
-            AND program_id IN ({placeholders})
-            AND is_actual = 0
-            AND NOT EXISTS (
-                SELECT 1 
-                FROM program_sam_spending p2
-                WHERE p2.program_id = p1.program_id
-                AND p2.fiscal_year = p1.fiscal_year
-                AND p2.is_actual = 1
-            )
-        ) subquery
-        GROUP BY program_id
-    """, params)
-    
-    program_obligations = {}
-    total_obligations = 0.0
-    
-    for row in cursor.fetchall():
-        amount = float(row['total_obs'])
-        program_obligations[row['program_id']] = amount
-        total_obligations += amount
-    
-    return program_obligations, total_obligations
-
-def get_program_obligations_by_type(cursor, program_ids, fiscal_year):
-    """Get obligations grouped by program type."""
-    if not program_ids:
-        return {}
-        
-    # Get all programs and their types
-    placeholders = ','.join('?' * len(program_ids))
-    cursor.execute(f"""
-        SELECT id, COALESCE(program_type, 'assistance_listing') as program_type
-        FROM program 
-        WHERE id IN ({placeholders})
-    """, program_ids)
-    
-    # Group programs by type
-    programs_by_type = {}
-    for row in cursor.fetchall():
-        prog_type = row['program_type']
-        if prog_type not in programs_by_type:
-            programs_by_type[prog_type] = []
-        programs_by_type[prog_type].append(row['id'])
-    
-    # Calculate obligations for each type
-    results = {}
-    for prog_type, type_program_ids in programs_by_type.items():
-        if prog_type == 'assistance_listing':
-            _, total = get_assistance_listing_obligations(cursor, type_program_ids, fiscal_year)
-        else:
-            # Logic for other program types remains unchanged
-            placeholders = ','.join('?' * len(type_program_ids))
-            cursor.execute(f"""
-                SELECT COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_obs 
-                FROM other_program_spending
-                WHERE fiscal_year = ?
-                AND program_id IN ({placeholders})
-            """, [fiscal_year] + type_program_ids)
-            total = float(cursor.fetchone()['total_obs'])
-            
-        results[prog_type] = total
-    
-    return results
-
-def generate_agency_list(cursor: sqlite3.Cursor, program_ids: List[str], fiscal_year: str) -> List[Dict[str, Any]]:
-    """
-    Generate list of agencies with program counts and obligations for a set of
-    programs. Includes both SAM spending and other program obligations.
-    """
-    if not program_ids:
-        return []
-
-    # First get programs by agency with their types
-    placeholders = ','.join('?' * len(program_ids))
-    cursor.execute(f"""
-        SELECT
-            a1.agency_name as title,
-            p.id as program_id,
-            p.program_type
-        FROM program p
-        LEFT JOIN agency a ON p.agency_id = a.id
-        LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
-        WHERE p.id IN ({placeholders})
-    """, program_ids)
-
-    # Group programs by agency and type
-    agency_programs = {}
-    for row in cursor.fetchall():
-        agency_name = row['title'] or 'Unspecified'
-        if agency_name not in agency_programs:
-            agency_programs[agency_name] = {
-                'assistance_program': [],
-                'other_program': []
-            }
+def convert_to_url_string(s: str) -> str:
+    """Convert a string to URL-friendly format."""
+    return str(''.join(c if c.isalnum() else '-' for c in s.lower()))
 
-        if row['program_type'] == 'assistance_listing':
-            agency_programs[agency_name]['assistance_program'].append(row['program_id'])
-        else:
-            agency_programs[agency_name]['other_program'].append(row['program_id'])
-
-    # Calculate obligations for each agency
-    agencies = []
-    for agency_name, programs in agency_programs.items():
-        total_obs = 0
-        total_programs = len(programs['assistance_program']) + len(programs['other_program'])
-
-        # Get assistance program obligations
-        if programs['assistance_program']:
-            _, agency_total_obs = get_assistance_listing_obligations(cursor, programs['assistance_program'], fiscal_year)
-            total_obs += agency_total_obs
-
-        # Get other obligations
-        if programs['other_program']:
-            placeholders = ','.join('?' * len(programs['other_program']))
-            cursor.execute(f"""
-                SELECT COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_obs
-                FROM other_program_spending
-                WHERE fiscal_year = ?
-                AND program_id IN ({placeholders})
-            """, [fiscal_year] + programs['other_program'])
-
-            total_obs += float(cursor.fetchone()['total_obs'])
-
-        agencies.append({
-            'title': agency_name,
-            'total_num_programs': total_programs,
-            'total_obs': total_obs
-        })
 
-    # Sort by total obligations descending
-    return sorted(agencies, key=lambda x: (x['total_obs'], x['title']), reverse=True)
+def clean_string(s: str) -> str:
+    """Clean a string by removing newlines and excessive whitespace."""
+    return s.replace('\n', '').replace('\r', '').strip()
 
 
-def generate_applicant_type_list(cursor: sqlite3.Cursor, program_ids: List[str]) -> List[Dict[str, Any]]:
+def fiscal_year_prefix(fiscal_year: str) -> str:
     """
-    Generate list of applicant types with program counts for a set of programs.
+    Return the URL prefix of a fiscal year's pages, which is also the name of
+    the subdirectory their files are written to: none for
+    constants.FISCAL_YEAR, whose pages are the site itself, and e.g. /fy2023
+    for other years.
     """
-    if not program_ids:
-        return []
-
-    cursor.execute("""
-        SELECT
-            c.name as title,
-            COUNT(DISTINCT ptc.program_id) as total_num_programs
-        FROM category c
-        JOIN program_to_category ptc ON c.id = ptc.category_id
-        WHERE c.type = 'applicant'
-        AND c.type = ptc.category_type
-        AND ptc.program_id IN ({})
-        GROUP BY c.name
-        HAVING
-            c.name IS NOT NULL
-            AND total_num_programs > 0
-        ORDER BY total_num_programs DESC, title
-    """.format(','.join('?' * len(program_ids))), program_ids)
-
-    applicant_types = []
-    for row in cursor.fetchall():
-        applicant_types.append({
-            'title': row['title'],
-            'total_num_programs': row['total_num_programs']
-        })
+    if fiscal_year == constants.FISCAL_YEAR:
+        return ''
+    return f"/fy{fiscal_year}"
 
-    return applicant_types
 
-
-def convert_to_url_string(s: str) -> str:
-    """Convert a string to URL-friendly format."""
-    return str(''.join(c if c.isalnum() else '-' for c in s.lower()))
+def fiscal_year_dir(directory: str, fiscal_year: str) -> str:
+    """Return the subdirectory of a directory that a fiscal year's files are written to."""
+    prefix = fiscal_year_prefix(fiscal_year)
+    return os.path.join(directory, prefix[1:]) if prefix else directory
 
 
-def clean_string(s: str) -> str:
-    """Clean a string by removing newlines and excessive whitespace."""
-    return s.replace('\n', '').replace('\r', '').strip()
+def fiscal_year_categories_hierarchy(categories_hierarchy: List[Dict[str, Any]],
+                                     fiscal_year: str) -> List[Dict[str, Any]]:
+    """Return the category hierarchy with the permalinks of a fiscal year's category pages."""
+    prefix = fiscal_year_prefix(fiscal_year)
+    return [{
+        **category,
+        'permalink': prefix + category['permalink'],
+        'subcategories': [{**sub, 'permalink': prefix + sub['permalink']}
+                          for sub in category['subcategories']]
+    } for category in categories_hierarchy]
 
 
 def get_categories_hierarchy(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
@@ -384,383 +133,496 @@ def get_categories_hierarchy(cursor: sqlite3.Cursor) -> List[Dict[str, Any]]:
 
     return categories
 
-def get_improper_payment_info(cursor: sqlite3.Cursor, program_id: str) -> List[Dict[str, Any]]:
-    """Get improper payment data for a program including related programs."""
-    # Get all improper payment records this program is associated with
-    cursor.execute("""
-        SELECT 
-            improper_payment_program_name,
-            outlays,
-            improper_payment_amount as improper_payments,
-            insufficient_documentation_amount as insufficient_payment,
-            high_priority_program as high_priority
-        FROM improper_payment_mapping
-        WHERE program_id = ?
-    """, (program_id,))
-    
-    improper_payments = []
-    
-    for payment_row in cursor.fetchall():
-        improper_name = payment_row['improper_payment_program_name']
-            
-        # Get related programs
-        cursor.execute("""
-            SELECT DISTINCT 
-                p.id,
-                p.name
-            FROM improper_payment_mapping ip
-            JOIN program p ON ip.program_id = p.id
-            WHERE ip.improper_payment_program_name = ?
-            AND p.id != ?
-        """, (improper_name, program_id))
-        
-        related_programs = [{
-            'id': prog['id'],
-            'name': prog['name'],
-            'permalink': f"/program/{prog['id']}"
-        } for prog in cursor.fetchall()]
-        
-        improper_payments.append({
-            'name': improper_name,
-            'outlays': float(payment_row['outlays']) if payment_row['outlays'] else 0.0,
-            'improper_payments': float(payment_row['improper_payments']) if payment_row['improper_payments'] else 0.0,
-            'insufficient_payment': float(payment_row['insufficient_payment']) if payment_row['insufficient_payment'] else 0.0,
-            'high_priority': bool(payment_row['high_priority']),
-            'related_programs': related_programs
-        })
-    
-    return improper_payments
+def rollup_agency_list(cube: rollup.RollupCube, counts, obligations) -> List[Dict[str, Any]]:
+    """
+    List the agencies of a group of programs with their program counts and
+    obligations, given the group's row of the rollup's counts and sums by
+    agency.
+    """
+    agencies = [{
+        'title': agency or 'Unspecified',
+        'total_num_programs': int(counts[code]),
+        'total_obs': float(obligations[code])
+    } for code, agency in enumerate(cube.labels('agency')) if counts[code]]
 
-def generate_category_markdown_files(cursor: sqlite3.Cursor, output_dir: str, fiscal_year: str):
-    """Generate markdown files for categories with obligations from both regular and other programs."""
-    ensure_directory_exists(output_dir)
+    # Sort by total obligations descending
+    return sorted(agencies, key=lambda x: (x['total_obs'], x['title']), reverse=True)
 
-    # Get all parent categories with at least one program
-    cursor.execute("""
-        WITH program_counts AS (
-            SELECT
-                c.parent_id,
-                COUNT(DISTINCT p.id) as program_count
-            FROM category c
-            JOIN program_to_category ptc ON c.id = ptc.category_id
-            JOIN program p ON ptc.program_id = p.id
-            WHERE c.type = 'category'
-            AND ptc.category_type = 'category'
-            AND c.parent_id IS NOT NULL
-            GROUP BY c.parent_id
-            HAVING program_count > 0
-        )
-        SELECT DISTINCT
-            c.parent_id as id,
-            pc.name as title
-        FROM category c
-        JOIN category pc ON c.parent_id = pc.id
-        JOIN program_counts pc_count ON c.parent_id = pc_count.parent_id
-    """)
 
-    parent_categories = cursor.fetchall()
-    for parent in parent_categories:
-        # Get unique program IDs in this category
-        cursor.execute("""
-            SELECT DISTINCT p.id, p.program_type
-            FROM program p
-            JOIN program_to_category ptc ON p.id = ptc.program_id
-            JOIN category c ON ptc.category_id = c.id
-            WHERE c.parent_id = ?
-            AND ptc.category_type = 'category'
-        """, (parent['id'],))
+def rollup_applicant_type_list(cube: rollup.RollupCube, counts) -> List[Dict[str, Any]]:
+    """
+    List the applicant types of a group of programs with their program
+    counts, given the group's row of the rollup's counts by applicant type.
+    """
+    applicant_types = [{
+        'title': applicant_type,
+        'total_num_programs': int(counts[code])
+    } for code, applicant_type in enumerate(cube.labels('applicant_type')) if counts[code]]
 
-        programs = cursor.fetchall()
-        if not programs:
-            continue
+    return sorted(applicant_types, key=lambda x: (-x['total_num_programs'], x['title']))
 
-        # Split programs by type
-        assistance_program_ids = [p['id'] for p in programs if p['program_type'] == 'assistance_listing']
-        other_program_ids = [p['id'] for p in programs if p['program_type'] != 'assistance_listing']
-
-        # Calculate total category obligations
-        total_category_obs = 0
-
-        # Get obligations for regular programs
-        if assistance_program_ids:
-            _, total_obs = get_assistance_listing_obligations(cursor, assistance_program_ids, fiscal_year)
-            total_category_obs += total_obs
-
-        # Get obligations for other programs
-        if other_program_ids:
-            placeholders = ','.join('?' * len(other_program_ids))
-            cursor.execute(f"""
-                SELECT COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_other_obligation
-                FROM other_program_spending
-                WHERE fiscal_year = ?
-                AND program_id IN ({placeholders})
-            """, [fiscal_year] + other_program_ids)
-
-            total_category_obs += float(cursor.fetchone()['total_other_obligation'])
-
-        # Get subcategories with their stats
-        cursor.execute("""
-            SELECT
-                c.name as title,
-                c.id as category_id
-            FROM category c
-            WHERE c.parent_id = ?
-            AND EXISTS (
-                SELECT 1
-                FROM program_to_category ptc
-                WHERE ptc.category_id = c.id
-                AND ptc.category_type = 'category'
-            )
-        """, (parent['id'],))
-
-        subcats = []
-        for subcat in cursor.fetchall():
-            # Get programs for this subcategory
-            cursor.execute("""
-                SELECT DISTINCT p.id, p.program_type
-                FROM program p
-                JOIN program_to_category ptc ON p.id = ptc.program_id
-                WHERE ptc.category_id = ?
-                AND ptc.category_type = 'category'
-            """, (subcat['category_id'],))
-
-            subcat_programs = cursor.fetchall()
-
-            # Split subcategory programs by type
-            sub_assistance_ids = [p['id'] for p in subcat_programs if p['program_type'] == 'assistance_listing']
-            sub_other_ids = [p['id'] for p in subcat_programs if p['program_type'] != 'assistance_listing']
-
-            # Calculate total obligations for subcategory
-            subcat_total_obs = 0
-            program_count = len(subcat_programs)
-
-            # Get regular program obligations
-            if sub_assistance_ids:
-                _, total_obs = get_assistance_listing_obligations(cursor, sub_assistance_ids, fiscal_year)
-                subcat_total_obs += total_obs
-            # Get other obligations
-            if sub_other_ids:
-                placeholders = ','.join('?' * len(sub_other_ids))
-                cursor.execute(f"""
-                    SELECT COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_other_obligation
-                    FROM other_program_spending
-                    WHERE fiscal_year = ?
-                    AND program_id IN ({placeholders})
-                """, [fiscal_year] + sub_other_ids)
-
-                subcat_total_obs += float(cursor.fetchone()['total_other_obligation'])
-
-            subcats.append({
-                'title': subcat['title'],
-                'program_count': program_count,
-                'total_obligations': subcat_total_obs
-            })
 
-        # Calculate category totals including both types of programs
-        cursor.execute("""
-            SELECT
-                COUNT(DISTINCT p.id) as total_num_programs,
-                COUNT(DISTINCT a1.agency_name) as total_num_agencies,
-                COUNT(DISTINCT c_app.name) as total_num_applicant_types
-            FROM program p
-            JOIN program_to_category ptc ON p.id = ptc.program_id
-            JOIN category c ON ptc.category_id = c.id
-            LEFT JOIN agency a ON p.agency_id = a.id
-            LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
-            LEFT JOIN program_to_category ptc_app ON p.id = ptc_app.program_id
-                AND ptc_app.category_type = 'applicant'
-            LEFT JOIN category c_app ON ptc_app.category_id = c_app.id
-            WHERE c.parent_id = ?
-            AND ptc.category_type = 'category'
-        """, (parent['id'],))
+@instrumentation.instrumented
+def generate_category_markdown_files(cursor: sqlite3.Cursor, output_dir: str, fiscal_year: str,
+                                     cube: rollup.RollupCube = None):
+    """
+    Generate markdown files for categories with obligations from both regular
+    and other programs. The sub-category, agency and applicant type lists of
+    each category are written to its data file in website/assets/data. The
+    pages and data files of fiscal years other than constants.FISCAL_YEAR are
+    written to subdirectories, with permalinks under the year's prefix (see
+    fiscal_year_prefix).
+    """
+    prefix = fiscal_year_prefix(fiscal_year)
+    pages_dir = fiscal_year_dir(output_dir, fiscal_year)
+    ensure_directory_exists(pages_dir)
+    pages = sitefiles.GeneratedDirectory(pages_dir)
+    assets = dataassets.DataAssets.for_pages(output_dir, f"category{prefix}")
+    if cube is None:
+        cube = rollup.RollupCube.from_database(cursor, [fiscal_year])
+
+    # Compute the totals of every category, subcategory and agency at once
+    obligations = cube.program_obligations(fiscal_year)
+    num_programs = cube.count(by=('category',))
+    total_obs = cube.sum(obligations, by=('category',))
+    num_agencies = cube.count_distinct('agency', by=('category',))
+    num_applicant_types = cube.count_distinct('applicant_type', by=('category',))
+    subcat_num_programs = cube.count(by=('subcategory',))
+    subcat_total_obs = cube.sum(obligations, by=('subcategory',))
+    agency_num_programs = cube.count(by=('category', 'agency'))
+    agency_total_obs = cube.sum(obligations, by=('category', 'agency'))
+    applicant_num_programs = cube.count(by=('category', 'applicant_type'))
+
+    subcats_by_parent = defaultdict(list)
+    for subcat_code, subcat_id in enumerate(cube.labels('subcategory')):
+        subcats_by_parent[cube.categories[subcat_id]['parent_id']].append(subcat_code)
+
+    for code, parent_id in enumerate(cube.labels('category')):
+        parent = cube.categories.get(parent_id)
+        if parent is None or not num_programs[code]:
+            continue
 
-        totals = cursor.fetchone()
+        category_title = clean_string(parent['name'])
+        category_url = convert_to_url_string(category_title)
 
-        category_title = clean_string(parent['title'])
+        subcats = sorted([{
+            'title': cube.categories[cube.labels('subcategory')[subcat_code]]['name'],
+            'program_count': int(subcat_num_programs[subcat_code]),
+            'total_obligations': float(subcat_total_obs[subcat_code])
+        } for subcat_code in subcats_by_parent[parent_id]], key=lambda x: x['title'])
 
-        subcats.sort(key=lambda x: x['title'])
         # Create category data
         category_data = {
             'title': category_title,
-            'permalink': f"/category/{convert_to_url_string(category_title)}",
+            'permalink': f"{prefix}/category/{convert_to_url_string(category_title)}",
             'fiscal_year': fiscal_year,
-            'total_num_programs': totals['total_num_programs'],
+            'total_num_programs': int(num_programs[code]),
             'total_num_sub_cats': len(subcats),
-            'total_num_agencies': totals['total_num_agencies'],
-            'total_num_applicant_types': totals['total_num_applicant_types'],
-            'total_obs': total_category_obs,
-            'sub_cats': json.dumps([{
-                'title': sub['title'],
-                'permalink': f"/category/{convert_to_url_string(category_title)}/{convert_to_url_string(sub['title'])}",
-                'total_num_programs': sub['program_count'],
-                'total_obs': float(sub['total_obligations'])
-            } for sub in subcats], separators=(',', ':')),
-            'agencies': json.dumps(generate_agency_list(cursor, [p['id'] for p in programs], fiscal_year), separators=(',', ':')),
-            'applicant_types': json.dumps(generate_applicant_type_list(cursor, [p['id'] for p in programs]), separators=(',', ':')),
-            'categories_subcategories': get_categories_hierarchy(cursor)
+            'total_num_agencies': int(num_agencies[code]),
+            'total_num_applicant_types': int(num_applicant_types[code]),
+            'total_obs': float(total_obs[code]),
+            'data_url': assets.write(category_url, {
+                'sub_cats': [{
+                    'title': sub['title'],
+                    'permalink': f"{prefix}/category/{category_url}/{convert_to_url_string(sub['title'])}",
+                    'total_num_programs': sub['program_count'],
+                    'total_obs': sub['total_obligations']
+                } for sub in subcats],
+                'agencies': rollup_agency_list(cube, agency_num_programs[code], agency_total_obs[code]),
+                'applicant_types': rollup_applicant_type_list(cube, applicant_num_programs[code])
+            })
         }
+        if prefix:
+            category_data['site_prefix'] = prefix
 
-        # Write category markdown file
-        file_path = os.path.join(output_dir, f"{convert_to_url_string(category_title)}.md")
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write('---\n')
-            yaml.dump(category_data, file, allow_unicode=True)
-            file.write('---\n')
-
-    print("Successfully generated category markdown files")
+        # Write category markdown file, if it changed
+        pages.write_page(f"{category_url}.md", category_data)
 
+    # Remove files for categories that no longer exist
+    pages.prune()
+    assets.prune()
+    print(f"Successfully generated category markdown files ({pages.summary()}; {assets.summary()})")
 
-def generate_subcategory_markdown_files(cursor: sqlite3.Cursor, output_dir: str, fiscal_year: str):
-    """Generate markdown files for subcategories with obligations from both regular and other programs."""
-    ensure_directory_exists(output_dir)
-
-    # Get all subcategories that have at least one program
-    cursor.execute("""
-        WITH subcategory_programs AS (
-            SELECT
-                c.id,
-                COUNT(DISTINCT p.id) as program_count
-            FROM category c
-            JOIN program_to_category ptc ON c.id = ptc.category_id
-            JOIN program p ON ptc.program_id = p.id
-            WHERE c.type = 'category'
-            AND ptc.category_type = 'category'
-            AND c.parent_id IS NOT NULL
-            GROUP BY c.id
-            HAVING program_count > 0
-        )
-        SELECT DISTINCT
-            c.id,
-            c.name as title,
-            c.parent_id,
-            pc.name as parent_title
-        FROM category c
-        JOIN category pc ON c.parent_id = pc.id
-        JOIN subcategory_programs sp ON c.id = sp.id
-    """)
 
-    subcategories = cursor.fetchall()
-    for subcat in subcategories:
-        # Get all programs with their types and spending data
-        cursor.execute("""
-            SELECT DISTINCT
-                p.id,
-                p.name as title,
-                p.program_type,
-                p.popular_name,
-                a1.agency_name as agency_name
-            FROM program p
-            JOIN program_to_category ptc ON p.id = ptc.program_id
-            LEFT JOIN agency a ON p.agency_id = a.id
-            LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
-            WHERE ptc.category_id = ?
-            AND ptc.category_type = 'category'
-        """, (subcat['id'],))
-
-        programs = cursor.fetchall()
-        if not programs:
+@instrumentation.instrumented
+def generate_subcategory_markdown_files(cursor: sqlite3.Cursor, output_dir: str, fiscal_year: str,
+                                        cube: rollup.RollupCube = None):
+    """
+    Generate markdown files for subcategories with obligations from both
+    regular and other programs. The agency, applicant type and program lists
+    of each subcategory are written to its data file in website/assets/data.
+    Other fiscal years are written like in generate_category_markdown_files.
+    """
+    prefix = fiscal_year_prefix(fiscal_year)
+    pages_dir = fiscal_year_dir(output_dir, fiscal_year)
+    ensure_directory_exists(pages_dir)
+    pages = sitefiles.GeneratedDirectory(pages_dir)
+    assets = dataassets.DataAssets.for_pages(output_dir, f"subcategory{prefix}")
+    if cube is None:
+        cube = rollup.RollupCube.from_database(cursor, [fiscal_year])
+
+    # Compute the totals of every subcategory and agency at once
+    obligations = cube.program_obligations(fiscal_year)
+    num_programs = cube.count(by=('subcategory',))
+    total_obs = cube.sum(obligations, by=('subcategory',))
+    num_agencies = cube.count_distinct('agency', by=('subcategory',))
+    num_applicant_types = cube.count_distinct('applicant_type', by=('subcategory',))
+    agency_num_programs = cube.count(by=('subcategory', 'agency'))
+    agency_total_obs = cube.sum(obligations, by=('subcategory', 'agency'))
+    applicant_num_programs = cube.count(by=('subcategory', 'applicant_type'))
+
+    for code, subcat_id in enumerate(cube.labels('subcategory')):
+        subcat = cube.categories[subcat_id]
+        parent = cube.categories.get(subcat['parent_id'])
+        if parent is None or not num_programs[code]:
             continue
 
-        # Split programs by type
-        assistance_program_ids = [p['id'] for p in programs if p['program_type'] == 'assistance_listing']
-        other_program_ids = [p['id'] for p in programs if p['program_type'] != 'assistance_listing']
-
-        # Initialize total obligations
-        total_subcategory_obs = 0.0
-        program_obligations = {}
-
-        # Get obligations for regular programs
-        program_obligations = {}
-        if assistance_program_ids:
-            program_obs, total_obs = get_assistance_listing_obligations(
-                cursor, assistance_program_ids, fiscal_year)
-            program_obligations.update(program_obs)
-            total_subcategory_obs += total_obs
-
-        # Get obligations for other programs
-        if other_program_ids:
-            placeholders = ','.join('?' * len(other_program_ids))
-            cursor.execute(f"""
-                SELECT program_id,
-                    COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as total_obs
-                FROM other_program_spending
-                WHERE fiscal_year = ?
-                AND program_id IN ({placeholders})
-                GROUP BY program_id
-            """, [fiscal_year] + other_program_ids)
-
-            for row in cursor.fetchall():
-                program_obligations[row['program_id']] = float(row['total_obs'])
-                total_subcategory_obs += float(row['total_obs'])
-
-        # Calculate subcategory totals
-        program_ids = [p['id'] for p in programs]
-        cursor.execute("""
-            SELECT
-                COUNT(DISTINCT p.id) as total_num_programs,
-                COUNT(DISTINCT a1.agency_name) as total_num_agencies,
-                COUNT(DISTINCT c_app.name) as total_num_applicant_types
-            FROM program p
-            JOIN program_to_category ptc ON p.id = ptc.program_id
-            LEFT JOIN agency a ON p.agency_id = a.id
-            LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
-            LEFT JOIN program_to_category ptc_app ON p.id = ptc_app.program_id
-                AND ptc_app.category_type = 'applicant'
-            LEFT JOIN category c_app ON ptc_app.category_id = c_app.id
-            WHERE ptc.category_id = ?
-            AND ptc.category_type = 'category'
-        """, (subcat['id'],))
-
-        totals = cursor.fetchone()
+        programs = [{
+            'cfda': cube.program_ids[i],
+            'permalink': f"/program/{cube.program_ids[i]}",
+            'title': cube.programs[i]['name'],
+            'popular_name': cube.programs[i]['popular_name'],
+            'agency': cube.programs[i]['tier_1_agency'] or 'Unspecified',
+            'total_obs': float(obligations[i]),
+            'program_type': cube.programs[i]['program_type']
+        } for i in np.flatnonzero(cube.mask('subcategory', subcat_id))]
 
         # Create subcategory data
-        parent_title = subcat['parent_title']
-        subcategory_title = subcat['title']
+        parent_title = parent['name']
+        subcategory_title = subcat['name']
+        page_name = f"{convert_to_url_string(parent_title)}---{convert_to_url_string(subcategory_title)}"
 
         subcategory_data = {
             'title': subcategory_title,
-            'permalink': f"/category/{convert_to_url_string(parent_title)}/{convert_to_url_string(subcategory_title)}",
+            'permalink': f"{prefix}/category/{convert_to_url_string(parent_title)}/{convert_to_url_string(subcategory_title)}",
             'parent_title': parent_title,
-            'parent_permalink': f"/category/{convert_to_url_string(parent_title)}",
+            'parent_permalink': f"{prefix}/category/{convert_to_url_string(parent_title)}",
             'fiscal_year': fiscal_year,
-            'total_num_programs': totals['total_num_programs'],
-            'total_num_agencies': totals['total_num_agencies'],
-            'total_num_applicant_types': totals['total_num_applicant_types'],
-            'total_obs': total_subcategory_obs,
-            'agencies': json.dumps(generate_agency_list(cursor, program_ids, fiscal_year), separators=(',', ':')),
-            'applicant_types': json.dumps(generate_applicant_type_list(cursor, program_ids), separators=(',', ':')),
-            'categories_subcategories': get_categories_hierarchy(cursor),
-            'programs': json.dumps(sorted([{
-                'cfda': p['id'],
-                'permalink': f"/program/{p['id']}",
-                'title': p['title'],
-                'popular_name': p['popular_name'],
-                'agency': p['agency_name'] or 'Unspecified',
-                'total_obs': program_obligations.get(p['id'], 0.0),
-                'program_type': p['program_type']
-            } for p in programs], key=lambda x: (-x['total_obs'], x['title'])), separators=(',', ':'))
+            'total_num_programs': int(num_programs[code]),
+            'total_num_agencies': int(num_agencies[code]),
+            'total_num_applicant_types': int(num_applicant_types[code]),
+            'total_obs': float(total_obs[code]),
+            'data_url': assets.write(page_name, {
+                'agencies': rollup_agency_list(cube, agency_num_programs[code], agency_total_obs[code]),
+                'applicant_types': rollup_applicant_type_list(cube, applicant_num_programs[code]),
+                'programs': sorted(programs, key=lambda x: (-x['total_obs'], x['title']))
+            })
+        }
+        if prefix:
+            subcategory_data['site_prefix'] = prefix
+
+        # Write subcategory markdown file, if it changed
+        pages.write_page(f"{page_name}.md", subcategory_data)
+
+    # Remove files for subcategories that no longer exist
+    pages.prune()
+    assets.prune()
+    print(f"Successfully generated sub-category markdown files ({pages.summary()}; {assets.summary()})")
+
+
+def get_improper_payment_programs(cursor: sqlite3.Cursor) -> Dict[str, Dict[str, str]]:
+    """
+    Get the programs that share each improper payment program, as the name of
+    each program by its id, in mapping order and without duplicates.
+    """
+    cursor.execute("""
+        SELECT ip.improper_payment_program_name, p.id, p.name
+        FROM improper_payment_mapping ip
+        JOIN program p ON ip.program_id = p.id
+        WHERE ip.improper_payment_program_name IS NOT NULL
+        ORDER BY ip.rowid
+    """)
+    improper_payment_programs = defaultdict(dict)
+    for row in cursor.fetchall():
+        improper_payment_programs[
+            row['improper_payment_program_name']
+        ].setdefault(row['id'], row['name'])
+    return improper_payment_programs
+
+
+def prefetch_program_details(cursor: sqlite3.Cursor, fiscal_years: list[str],
+                             program_ids: Iterable[str] = None,
+                             improper_payment_programs: Dict[str, Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Load every child table used by generate_program_data once, grouped by
+    program id, so that program records can be assembled without querying
+    the database per program.
+
+    If program_ids is given, only the details of those programs are loaded.
+    Programs related through improper payments are found among all programs,
+    by get_improper_payment_programs, unless improper_payment_programs is
+    given (e.g., loaded once for every batch of iter_program_data).
+    """
+    year_placeholders = ','.join('?' * len(fiscal_years))
+
+    set_params = []
+    if program_ids is not None:
+        set_params = [programsets.ProgramSet.of(cursor, program_ids).set_id]
+
+    def only_programs(keyword, column):
+        """Restricts a query to program_ids, e.g., "AND program_id IN (...)"."""
+        if not set_params:
+            return ""
+        return f"{keyword} {column} IN ({programsets.MEMBERS_SQL})"
+    details = {
+        'categories': defaultdict(list),
+        'sam_spending': {},
+        'usaspending_obligations': {},
+        'outlays': {},
+        'other_program_spending': {},
+        'results': defaultdict(list),
+        'authorizations': defaultdict(list),
+        'improper_payments': defaultdict(list),
+        'improper_payment_programs': improper_payment_programs
+    }
+
+    # pc.type orders rows whose parent id matches categories of several
+    # types, as the per-program query does via the category primary key
+    cursor.execute(f"""
+        SELECT
+            ptc.program_id,
+            c.id as category_id,
+            c.type as category_type,
+            CASE
+                WHEN c.type = 'assistance' AND c.parent_id IS NOT NULL
+                    THEN pc.name
+                ELSE c.name
+            END as category_name,
+            pc.name as parent_category_name
+        FROM program_to_category ptc
+        INNER JOIN category c ON ptc.category_id = c.id
+        LEFT JOIN category pc ON c.parent_id = pc.id
+        WHERE c.type = ptc.category_type {only_programs('AND', 'ptc.program_id')}
+        ORDER BY ptc.program_id, ptc.category_id, ptc.category_type, pc.type
+    """, set_params)
+    for row in cursor.fetchall():
+        details['categories'][row['program_id']].append(row)
+
+    cursor.execute(f"""
+        SELECT program_id, fiscal_year, is_actual, SUM(amount) as amount
+        FROM program_sam_spending
+        WHERE fiscal_year IN ({year_placeholders}) {only_programs('AND', 'program_id')}
+        GROUP BY program_id, fiscal_year, is_actual
+    """, list(fiscal_years) + set_params)
+    for row in cursor.fetchall():
+        details['sam_spending'][(row['program_id'], str(row['fiscal_year']),
+                                 row['is_actual'])] = row['amount']
+
+    cursor.execute(f"""
+        SELECT
+            cfda_number,
+            action_date_fiscal_year,
+            ROUND(SUM(obligations), 2) as total_obligations
+        FROM usaspending_assistance_obligation_aggregation
+        WHERE action_date_fiscal_year IN ({year_placeholders}) {only_programs('AND', 'cfda_number')}
+        GROUP BY cfda_number, action_date_fiscal_year
+    """, list(fiscal_years) + set_params)
+    for row in cursor.fetchall():
+        details['usaspending_obligations'][
+            (row['cfda_number'], str(row['action_date_fiscal_year']))
+        ] = row['total_obligations']
+
+    cursor.execute(f"""
+        SELECT
+            cfda_number,
+            award_first_fiscal_year,
+            ROUND(SUM(outlay), 2) as total_outlay,
+            ROUND(SUM(obligation), 2) as total_obligation
+        FROM usaspending_assistance_outlay_aggregation
+        WHERE award_first_fiscal_year IN ({year_placeholders}) {only_programs('AND', 'cfda_number')}
+        GROUP BY cfda_number, award_first_fiscal_year
+    """, list(fiscal_years) + set_params)
+    for row in cursor.fetchall():
+        details['outlays'][(row['cfda_number'],
+                            str(row['award_first_fiscal_year']))] = row
+
+    cursor.execute(f"""
+        SELECT program_id, fiscal_year, outlays, forgone_revenue
+        FROM other_program_spending
+        WHERE fiscal_year IN ({year_placeholders}) {only_programs('AND', 'program_id')}
+    """, list(fiscal_years) + set_params)
+    for row in cursor.fetchall():
+        details['other_program_spending'][(row['program_id'],
+                                           str(row['fiscal_year']))] = row
+
+    cursor.execute(f"""
+        SELECT program_id, fiscal_year, result
+        FROM program_result
+        {only_programs('WHERE', 'program_id')}
+        ORDER BY program_id, fiscal_year
+    """, set_params)
+    for row in cursor.fetchall():
+        details['results'][row['program_id']].append(
+            {'year': str(row['fiscal_year']), 'description': row['result']})
+
+    cursor.execute(f"""
+        SELECT program_id, text, url
+        FROM program_authorization
+        {only_programs('WHERE', 'program_id')}
+        ORDER BY rowid
+    """, set_params)
+    for row in cursor.fetchall():
+        details['authorizations'][row['program_id']].append(
+            {'text': row['text'], 'url': row['url']})
+
+    cursor.execute(f"""
+        SELECT
+            program_id,
+            improper_payment_program_name,
+            outlays,
+            improper_payment_amount as improper_payments,
+            insufficient_documentation_amount as insufficient_payment,
+            high_priority_program as high_priority
+        FROM improper_payment_mapping
+        {only_programs('WHERE', 'program_id')}
+        ORDER BY rowid
+    """, set_params)
+    for row in cursor.fetchall():
+        details['improper_payments'][row['program_id']].append(row)
+
+    if improper_payment_programs is None:
+        details['improper_payment_programs'] = get_improper_payment_programs(cursor)
+
+    return details
+
+
+def build_assistance_program_obligations(details, program_id, fiscal_years):
+    """Get the SAM.gov and USAspending obligations of an assistance listing
+    program for each fiscal year, from its prefetched details."""
+    obligations = []
+    for year in fiscal_years:
+        year_data = {
+            'x': year,
+            'sam_estimate' : 0.0,
+            'sam_actual': 0.0,
+            'usa_spending_actual': 0.0
+        }
+
+        # Actual amounts are preferred over estimates. Regardless of whether
+        # the value is an actual or an estimate, it is stored as "sam_actual"
+        # and presented on the frontend as just "SAM.gov"
+        actual_amount = details['sam_spending'].get((program_id, str(year), 1))
+        estimated_amount = details['sam_spending'].get(
+            (program_id, str(year), 0))
+        if actual_amount:
+            year_data['sam_actual'] = float(actual_amount)
+        elif estimated_amount:
+            year_data['sam_actual'] = float(estimated_amount)
+
+        total_obligations = details['usaspending_obligations'].get(
+            (program_id, str(year)))
+        if total_obligations is not None:
+            year_data['usa_spending_actual'] = float(total_obligations)
+
+        obligations.append(year_data)
+
+    return obligations
+
+
+def build_other_program_obligations(details, program_id, fiscal_years, program_type):
+    """Get the outlays (and forgone revenue of tax expenditures) of a program
+    that is not an assistance listing for each fiscal year, from its
+    prefetched details."""
+    other_program_obligations = []
+    for year in fiscal_years:
+        row = details['other_program_spending'].get((program_id, str(year)))
+        year_data = {
+            'x': year,
+            'outlays': float(row['outlays']) if row and row['outlays'] is not None else 0.0,
         }
 
-        # Write subcategory markdown file
-        file_path = os.path.join(output_dir,
-            f"{convert_to_url_string(parent_title)}---{convert_to_url_string(subcategory_title)}.md")
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.write('---\n')
-            yaml.dump(subcategory_data, file, allow_unicode=True)
-            file.write('---\n')
+        if program_type == "tax_expenditure":
+            year_data['forgone_revenue'] = float(row['forgone_revenue']) if row and row['forgone_revenue'] is not None else 0.0
 
-    print("Successfully generated sub-category markdown files")
+        other_program_obligations.append(year_data)
 
+    return other_program_obligations
 
-def generate_program_data(cursor: sqlite3.Cursor, fiscal_years: list[str]) -> List[Dict[str, Any]]:
+
+def build_outlays_data(details, program_id, fiscal_years):
+    """Get the USAspending outlays and obligations of a program for each
+    fiscal year, from its prefetched details."""
+    outlays = []
+    for year in fiscal_years:
+        year_data = {
+            'x': year,
+            'outlay': 0.0,
+            'obligation': 0.0
+        }
+
+        row = details['outlays'].get((program_id, str(year)))
+        if row:
+            if row['total_outlay'] is not None:
+                year_data['outlay'] = float(row['total_outlay'])
+            if row['total_obligation'] is not None:
+                year_data['obligation'] = float(row['total_obligation'])
+
+        outlays.append(year_data)
+
+    return outlays
+
+
+def build_improper_payment_info(details, program_id):
+    """Get the improper payment data of a program, including the related
+    programs that share each improper payment program, from its prefetched
+    details."""
+    improper_payments = []
+
+    for payment_row in details['improper_payments'].get(program_id, []):
+        improper_name = payment_row['improper_payment_program_name']
+
+        related_programs = [{
+            'id': related_id,
+            'name': related_name,
+            'permalink': f"/program/{related_id}"
+        } for related_id, related_name in details['improper_payment_programs'].get(improper_name, {}).items()
+            if related_id != program_id]
+
+        improper_payments.append({
+            'name': improper_name,
+            'outlays': float(payment_row['outlays']) if payment_row['outlays'] else 0.0,
+            'improper_payments': float(payment_row['improper_payments']) if payment_row['improper_payments'] else 0.0,
+            'insufficient_payment': float(payment_row['insufficient_payment']) if payment_row['insufficient_payment'] else 0.0,
+            'high_priority': bool(payment_row['high_priority']),
+            'related_programs': related_programs
+        })
+
+    return improper_payments
+
+
+@instrumentation.instrumented
+def generate_program_data(cursor: sqlite3.Cursor, fiscal_years: list[str]) -> List[records.ProgramRecord]:
     """
     Generate comprehensive program data that can be reused across different generation functions.
-    Returns a list of dictionaries containing all necessary program information.
+    Returns a list of records containing all necessary program information.
     """
-    programs_data = []
+    programs_data = list(iter_program_data(cursor, fiscal_years))
 
-    # Get base program information
-    cursor.execute("""
+    print("Completed program object creation")
+
+    return programs_data
+
+
+def iter_program_data(cursor: sqlite3.Cursor, fiscal_years: list[str],
+                      shard: tuple[int, int] = None) -> Iterator[records.ProgramRecord]:
+    """
+    Yield the data of each program, as in generate_program_data, as soon as it
+    is built, so that it can be written out without holding every program in
+    memory. Programs are read in batches of PROGRAM_BATCH_SIZE, and only the
+    details of one batch are loaded at a time.
+
+    With shard=(index, count), only the programs of one of count shards are
+    built (see program_shard), so that count processes can build every
+    program between them.
+    """
+    # Get base program information, on a cursor of its own so that it can be
+    # read while the details of each batch are queried
+    programsets.create_tables(cursor)
+    programs_cursor = cursor.connection.cursor()
+    # programs related through improper payments are found among all
+    # programs, so they are loaded once for every batch
+    improper_payment_programs = get_improper_payment_programs(cursor)
+    programs_cursor.execute("""
         SELECT
             p.id,
             p.name,
@@ -782,56 +644,55 @@ def generate_program_data(cursor: sqlite3.Cursor, fiscal_years: list[str]) -> Li
         LEFT JOIN agency a ON p.agency_id = a.id
     """)
 
-    base_programs = cursor.fetchall()
-
+    while True:
+        base_programs = programs_cursor.fetchmany(PROGRAM_BATCH_SIZE)
+        if not base_programs:
+            break
+        if shard is not None:
+            base_programs = [program for program in base_programs
+                             if program_shard(program['id'], shard[1]) == shard[0]]
+            if not base_programs:
+                continue
+        details = prefetch_program_details(cursor, fiscal_years,
+                                           [program['id'] for program in base_programs],
+                                           improper_payment_programs)
+        yield from build_program_data(details, base_programs, fiscal_years)
+
+
+def program_shard(program_id: str, count: int) -> int:
+    """Return the shard of a program, out of count, which only depends on its id."""
+    return zlib.crc32(program_id.encode('utf-8')) % count
+
+
+def build_program_data(details, base_programs, fiscal_years) -> Iterator[records.ProgramRecord]:
+    """Yield the record of each of the base programs from their prefetched details."""
+    # one tuple of years is shared by the spending series of every program
+    years = tuple(fiscal_years)
     for program in base_programs:
-        cursor.execute("""
-            SELECT DISTINCT
-                c.id as category_id,
-                c.type as category_type,
-                CASE
-                    WHEN c.type = 'assistance' AND c.parent_id IS NOT NULL
-                        THEN pc.name
-                    ELSE c.name
-                END as category_name,
-                pc.name as parent_category_name
-            FROM program_to_category ptc
-            INNER JOIN category c ON ptc.category_id = c.id
-            LEFT JOIN category pc ON c.parent_id = pc.id
-            WHERE ptc.program_id = ?
-            AND c.type = ptc.category_type
-        """, (program['id'],))
-
-        categories = cursor.fetchall()
+        categories = details['categories'].get(program['id'], [])
 
         # Get obligations based on program type
         program_type = program['program_type']
         if program_type == 'assistance_listing':
-            obligations = get_assistance_program_obligations(cursor, program['id'], fiscal_years)
+            obligations = records.YearlySeries.from_list(
+                build_assistance_program_obligations(details, program['id'], fiscal_years),
+                records.OBLIGATION_FIELDS, years)
             other_program_spending = None
-            outlays = get_outlays_data(cursor, program['id'], fiscal_years)
+            outlays = records.YearlySeries.from_list(
+                build_outlays_data(details, program['id'], fiscal_years),
+                records.OUTLAY_FIELDS, years)
         else:
             obligations = None
-            other_program_spending = get_other_program_obligations(cursor, program['id'], fiscal_years, program_type)
+            other_program_spending = records.YearlySeries.from_list(
+                build_other_program_obligations(details, program['id'], fiscal_years, program_type),
+                records.spending_fields(program_type), years)
             outlays = None
-            
-        # Get program results
-        cursor.execute("""
-            SELECT fiscal_year, result
-            FROM program_result
-            WHERE program_id = ?
-            ORDER BY fiscal_year
-        """, (program['id'],))
-        results = [{'year': str(row['fiscal_year']), 'description': row['result']}
-                  for row in cursor.fetchall()]
-
-        # Get program authorizations
-        cursor.execute("""
-            SELECT text, url
-            FROM program_authorization
-            WHERE program_id = ?
-        """, (program['id'],))
-        authorizations = [{'text': row['text'], 'url': row['url']} for row in cursor.fetchall()]
+
+        # Get program results and authorizations
+        results = tuple((result['year'], result['description'])
+                        for result in details['results'].get(program['id'], []))
+        authorizations = tuple((auth['text'], auth['url'])
+                               for auth in details['authorizations'].get(program['id'], []))
 
         # Use sets to prevent duplicates when organizing categories
         program_categories = {
@@ -855,200 +716,112 @@ def generate_program_data(cursor: sqlite3.Cursor, fiscal_years: list[str]) -> Li
                 else:
                     program_categories['categories'][category_id] = cat['category_name']
 
-        improper_payment_data = get_improper_payment_info(cursor, program['id'])
-
-        # Create comprehensive program data
-        program_data = {
-            'id': program['id'],
-            'name': program['name'],
-            'popular_name': program['popular_name'],
-            'objective': program['objective'],
-            'sam_url': program['sam_url'],
-            'usaspending_url': program['usaspending_url'],
-            'grants_url': program['grants_url'],
-            'top_agency_name': program['top_agency_name'],
-            'sub_agency_name': program['sub_agency_name'],
-            'assistance_types': sorted(list(program_categories['assistance'].values())),
-            'beneficiary_types': sorted(list(program_categories['beneficiary'].values())),
-            'applicant_types': sorted(list(program_categories['applicant'].values())),
-            'categories': sorted(list(program_categories['categories'].values())),
-            'obligations': obligations,
-            'other_program_spending': other_program_spending,
-            'outlays': outlays,
-            'results': results,
-            'authorizations': authorizations,
-            'program_type': program['program_type'],
-            'is_subpart_f': program['is_subpart_f'],
-            'rules_regulations': program['rules_regulations'],
-            'improper_payments': improper_payment_data
-        }
-
-        programs_data.append(program_data)
-
-    print("Completed program object creation")
-
-    return programs_data
+        improper_payment_data = build_improper_payment_info(details, program['id'])
+
+        # Create comprehensive program record
+        yield records.ProgramRecord(
+            id=program['id'],
+            name=program['name'],
+            popular_name=program['popular_name'],
+            objective=program['objective'],
+            sam_url=program['sam_url'],
+            usaspending_url=program['usaspending_url'],
+            grants_url=program['grants_url'],
+            top_agency_name=program['top_agency_name'],
+            sub_agency_name=program['sub_agency_name'],
+            assistance_types=tuple(sorted(program_categories['assistance'].values())),
+            beneficiary_types=tuple(sorted(program_categories['beneficiary'].values())),
+            applicant_types=tuple(sorted(program_categories['applicant'].values())),
+            categories=tuple(sorted(program_categories['categories'].values())),
+            obligations=obligations,
+            other_program_spending=other_program_spending,
+            outlays=outlays,
+            results=results,
+            authorizations=authorizations,
+            program_type=program['program_type'],
+            is_subpart_f=program['is_subpart_f'],
+            rules_regulations=program['rules_regulations'],
+            improper_payments=tuple(improper_payment_data)
+        )
 
 
-def generate_shared_data(cursor: sqlite3.Cursor) -> Dict[str, Any]:
+def get_agency_tree(cursor: sqlite3.Cursor) -> Dict[str, List[Dict[str, Any]]]:
     """
-    Generate shared data used across multiple pages.
-    Returns a dictionary containing agencies, applicant types, and categories data.
+    Build the tree of tier-1 agencies with programs, split into CFO Act
+    agencies and other agencies, from one grouped query. Agencies that have
+    sub-agencies list those with programs, followed by an "Unspecified"
+    sub-agency if some of their programs belong to no sub-agency.
     """
-    # Get CFO agencies
     cursor.execute("""
-        SELECT DISTINCT 
-            a1.id,
-            a1.agency_name as title
-        FROM program p
-        JOIN agency a ON p.agency_id = a.id
-        JOIN agency a1 ON a.tier_1_agency_id = a1.id
-        WHERE a1.is_cfo_act_agency = 1
-        ORDER BY title
-    """)
-    
-    cfo_agencies = []
-    for row in cursor.fetchall():
-        if not row['title']:
-            continue
-            
-        agency = {'title': row['title']}
-        
-        # Check if this agency has any sub-agencies
-        cursor.execute("""
-            SELECT DISTINCT a2.agency_name as title
-            FROM agency a
-            JOIN agency a2 ON a.tier_2_agency_id = a2.id
-            WHERE a.tier_1_agency_id = ?
-            AND a.tier_2_agency_id IS NOT NULL
-            AND a2.agency_name IS NOT NULL
-        """, (row['id'],))
-        
-        has_sub_agencies = len(cursor.fetchall()) > 0
-        
-        if has_sub_agencies:
-            # Get programs associated only with the top-level agency
-            cursor.execute("""
-                SELECT DISTINCT p.id
-                FROM program p
-                JOIN agency a ON p.agency_id = a.id
-                WHERE a.tier_1_agency_id = ?
-                AND a.tier_2_agency_id IS NULL
-            """, (row['id'],))
-            
-            top_level_only_programs = set(r['id'] for r in cursor.fetchall())
-            
-            # Get sub-agencies and their programs
-            cursor.execute("""
-                SELECT DISTINCT
-                    a2.agency_name as title,
-                    GROUP_CONCAT(p.id) as program_ids
-                FROM program p
-                JOIN agency a ON p.agency_id = a.id
-                JOIN agency a2 ON a.tier_2_agency_id = a2.id
-                WHERE a.tier_1_agency_id = ?
-                AND a.tier_2_agency_id IS NOT NULL
-                AND a2.agency_name IS NOT NULL
-                GROUP BY a2.agency_name
-                ORDER BY title
-            """, (row['id'],))
-            
-            sub_agencies = []
-            for sub_row in cursor.fetchall():
-                if sub_row['title']:
-                    program_ids = set(sub_row['program_ids'].split(',') if sub_row['program_ids'] else [])
-                    sub_agencies.append({
-                        'title': sub_row['title']
-                    })
-            
-            # Add Unspecified sub-agency if needed
-            if sub_agencies and top_level_only_programs:
-                sub_agencies.append({
-                    'title': 'Unspecified'
-                })
-            
-            if sub_agencies:
-                agency['sub_categories'] = sub_agencies
-                
-        cfo_agencies.append(agency)
-    
-    # Get non-CFO agencies
-    cursor.execute("""
-        SELECT DISTINCT 
+        SELECT
             a1.id,
-            a1.agency_name as title
-        FROM program p
-        JOIN agency a ON p.agency_id = a.id
+            a1.agency_name as title,
+            a1.is_cfo_act_agency,
+            a.tier_2_agency_id IS NULL as is_top_level,
+            a2.agency_name as sub_title,
+            COUNT(p.id) as num_programs
+        FROM agency a
         JOIN agency a1 ON a.tier_1_agency_id = a1.id
-        WHERE a1.is_cfo_act_agency = 0
-        ORDER BY title
+        LEFT JOIN agency a2 ON a.tier_2_agency_id = a2.id
+        LEFT JOIN program p ON p.agency_id = a.id
+        GROUP BY a1.id, is_top_level, a2.agency_name
+        ORDER BY a1.agency_name, a1.id, a2.agency_name
     """)
-    
-    other_agencies = []
+
+    # Group rows by tier-1 agency
+    tier_1_agencies = {}
     for row in cursor.fetchall():
-        if not row['title']:
+        if row['id'] not in tier_1_agencies:
+            tier_1_agencies[row['id']] = {
+                'title': row['title'],
+                'is_cfo_act_agency': row['is_cfo_act_agency'],
+                'num_programs': 0,
+                'top_level_programs': 0,
+                'has_sub_agencies': False,
+                'sub_agencies': []
+            }
+        tier_1 = tier_1_agencies[row['id']]
+        tier_1['num_programs'] += row['num_programs']
+        if row['is_top_level']:
+            tier_1['top_level_programs'] += row['num_programs']
+        elif row['sub_title'] is not None:
+            tier_1['has_sub_agencies'] = True
+            if row['sub_title'] and row['num_programs']:
+                tier_1['sub_agencies'].append({'title': row['sub_title']})
+
+    tree = {'cfo_agencies': [], 'other_agencies': []}
+    for tier_1 in tier_1_agencies.values():
+        if not tier_1['title'] or not tier_1['num_programs']:
             continue
-            
-        agency = {'title': row['title']}
-        
-        # Check if this agency has any sub-agencies
-        cursor.execute("""
-            SELECT DISTINCT a2.agency_name as title
-            FROM agency a
-            JOIN agency a2 ON a.tier_2_agency_id = a2.id
-            WHERE a.tier_1_agency_id = ?
-            AND a.tier_2_agency_id IS NOT NULL
-            AND a2.agency_name IS NOT NULL
-        """, (row['id'],))
-        
-        has_sub_agencies = len(cursor.fetchall()) > 0
-        
-        if has_sub_agencies:
-            # Get programs associated only with the top-level agency
-            cursor.execute("""
-                SELECT DISTINCT p.id
-                FROM program p
-                JOIN agency a ON p.agency_id = a.id
-                WHERE a.tier_1_agency_id = ?
-                AND a.tier_2_agency_id IS NULL
-            """, (row['id'],))
-            
-            top_level_only_programs = set(r['id'] for r in cursor.fetchall())
-            
-            # Get sub-agencies and their programs
-            cursor.execute("""
-                SELECT DISTINCT
-                    a2.agency_name as title,
-                    GROUP_CONCAT(p.id) as program_ids
-                FROM program p
-                JOIN agency a ON p.agency_id = a.id
-                JOIN agency a2 ON a.tier_2_agency_id = a2.id
-                WHERE a.tier_1_agency_id = ?
-                AND a.tier_2_agency_id IS NOT NULL
-                AND a2.agency_name IS NOT NULL
-                GROUP BY a2.agency_name
-                ORDER BY title
-            """, (row['id'],))
-            
-            sub_agencies = []
-            for sub_row in cursor.fetchall():
-                if sub_row['title']:
-                    program_ids = set(sub_row['program_ids'].split(',') if sub_row['program_ids'] else [])
-                    sub_agencies.append({
-                        'title': sub_row['title']
-                    })
-            
-            # Add Unspecified sub-agency if needed
-            if sub_agencies and top_level_only_programs:
-                sub_agencies.append({
-                    'title': 'Unspecified'
-                })
-            
-            if sub_agencies:
-                agency['sub_categories'] = sub_agencies
-                
-        other_agencies.append(agency)
-    
+
+        agency = {'title': tier_1['title']}
+        sub_agencies = tier_1['sub_agencies']
+
+        # Add Unspecified sub-agency if needed
+        if tier_1['has_sub_agencies'] and sub_agencies:
+            if tier_1['top_level_programs']:
+                sub_agencies.append({'title': 'Unspecified'})
+            agency['sub_categories'] = sub_agencies
+
+        if tier_1['is_cfo_act_agency'] == 1:
+            tree['cfo_agencies'].append(agency)
+        elif tier_1['is_cfo_act_agency'] == 0:
+            tree['other_agencies'].append(agency)
+
+    return tree
+
+
+@instrumentation.instrumented
+def generate_shared_data(cursor: sqlite3.Cursor) -> Dict[str, Any]:
+    """
+    Generate shared data used across multiple pages.
+    Returns a dictionary containing agencies, applicant types, and categories data.
+    """
+    # Get CFO and non-CFO agencies, unless they were already built from this database
+    agency_tree = datacache.cached(cursor, 'agency_tree', lambda: get_agency_tree(cursor))
+    cfo_agencies = agency_tree['cfo_agencies']
+    other_agencies = agency_tree['other_agencies']
+
     # Get simple categories for applicants
     cursor.execute("""
         SELECT DISTINCT 
@@ -1149,64 +922,166 @@ def generate_shared_data(cursor: sqlite3.Cursor) -> Dict[str, Any]:
         'categories': sorted(categories, key=lambda x: x['title'])
     }
 
-def generate_program_markdown_files(output_dir: str, programs_data: List[Dict[str, Any]], fiscal_years: list[str]):
-    """Generate individual markdown files for each program using pre-generated data."""
-    ensure_directory_exists(output_dir)
-
-    for program in programs_data:
-        # Create listing dictionary using pre-generated data
-        listing = {
-            'title': program['name'],
-            'layout': 'program',
-            'permalink': f"/program/{program['id']}.html",
-            'fiscal_year': constants.FISCAL_YEAR,
-            'cfda': program['id'],
-            'objective': program['objective'],
-            'sam_url': program['sam_url'],
-            'usaspending_url': program['usaspending_url'],
-            'grants_url': program['grants_url'],
-            'popular_name': program['popular_name'] if program['popular_name'] else '',
-            'assistance_types': program['assistance_types'],
-            'beneficiary_types': program['beneficiary_types'],
-            'applicant_types': program['applicant_types'],
-            'categories': program['categories'],
-            'agency': program['top_agency_name'] or 'Unspecified',
-            'sub-agency': program['sub_agency_name'] or 'N/A',
-            'obligations': json.dumps(program['obligations'], separators=(',', ':')),
-            'results': program['results'],
-            'program_type': program['program_type'],
-            'authorizations': [{'text': auth['text'], 'url': auth['url']} for auth in program['authorizations']],
-            'is_subpart_f': program['is_subpart_f'],
-            'rules_regulations': program['rules_regulations'],
-            'improper_payments': json.dumps(program['improper_payments'], separators=(',', ':')) if program['improper_payments'] else None,
+def program_data(program: records.ProgramRecord) -> Dict[str, Any]:
+    """Return the data of a program's page that is loaded from its data file:
+    the yearly spending charted on the page and its improper payments."""
+    if program.program_type != 'assistance_listing':
+        data = {
+            'obligations': None,
+            'outlays': None,
+            'other_program_spending': program.other_program_spending.to_list()
+        }
+    else:
+        data = {
+            'obligations': program.obligations.to_list(),
+            'outlays': program.outlays.to_list(),
+            'other_program_spending': None
         }
+    data['improper_payments'] = list(program.improper_payments)
+    return data
+
+
+def program_page(program: records.ProgramRecord, data_url: str) -> Dict[str, Any]:
+    """Return the front matter of a program's markdown file, given the URL of
+    its data file."""
+    listing = {
+        'title': program.name,
+        'layout': 'program',
+        'permalink': f"/program/{program.id}.html",
+        'fiscal_year': constants.FISCAL_YEAR,
+        'cfda': program.id,
+        'objective': program.objective,
+        'sam_url': program.sam_url,
+        'usaspending_url': program.usaspending_url,
+        'grants_url': program.grants_url,
+        'popular_name': program.popular_name if program.popular_name else '',
+        'assistance_types': list(program.assistance_types),
+        'beneficiary_types': list(program.beneficiary_types),
+        'applicant_types': list(program.applicant_types),
+        'categories': list(program.categories),
+        'agency': program.top_agency_name or 'Unspecified',
+        'sub-agency': program.sub_agency_name or 'N/A',
+        'results': [{'year': year, 'description': description} for year, description in program.results],
+        'program_type': program.program_type,
+        'authorizations': [{'text': text, 'url': url} for text, url in program.authorizations],
+        'is_subpart_f': program.is_subpart_f,
+        'rules_regulations': program.rules_regulations,
+        'has_improper_payments': bool(program.improper_payments),
+        'data_url': data_url,
+    }
+
+    return listing
+
 
-        # Add obligations based on program type
-        if program['program_type'] != 'assistance_listing':
-            listing['other_program_spending'] = json.dumps(program['other_program_spending'], separators=(',', ':'))
-            listing['obligations'] = None
-            listing['outlays'] = None
+class ProgramPagesSink:
+    """
+    Writes the markdown file and the data file of each program it is given,
+    if they changed. Once every program was written without error, files for
+    programs that no longer exist are removed.
+
+    With render_html, the pages that htmlrender can render exactly as Jekyll
+    would are rendered to HTML in website/program by html_workers processes
+    instead, and only the other pages are written as markdown files for
+    Jekyll. Either way, pages left over in the other format are removed.
+
+    With prune=False, which is used for shards of the programs, no file is
+    removed: files() returns the files generated for the shard, which are
+    merged with those of the other shards and pruned with
+    prune_program_pages.
+    """
+
+    def __init__(self, output_dir: str, render_html: bool = False, html_workers: int = None,
+                 prune: bool = True):
+        ensure_directory_exists(output_dir)
+        self.prune = prune
+        self.pages = sitefiles.GeneratedDirectory(output_dir)
+        self.assets = dataassets.DataAssets.for_pages(output_dir, 'program')
+        website_dir = os.path.dirname(os.path.normpath(output_dir))
+        if render_html:
+            self.renderer = htmlrender.ProgramHtmlRenderer(website_dir, html_workers, prune=prune)
+            self.html_pages = self.renderer.files
+        else:
+            self.renderer = None
+            self.html_pages = sitefiles.GeneratedDirectory(os.path.join(website_dir, 'program'), '*.html')
+        self.count = 0
+
+    def write(self, program: records.ProgramRecord):
+        data_url = self.assets.write(program.id, program_data(program))
+        page = program_page(program, data_url)
+        if self.renderer is not None and htmlrender.is_renderable(page):
+            self.renderer.render(page)
         else:
-            listing['obligations'] = json.dumps(program['obligations'], separators=(',', ':'))
-            listing['outlays'] = json.dumps(program['outlays'], separators=(',', ':'))
-            listing['other_program_spending'] = None
+            self.pages.write_page(f"{program.id}.md", page)
+        self.count += 1
+
+    def __enter__(self):
+        if self.renderer is not None:
+            self.renderer.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.renderer is not None:
+            self.renderer.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            if self.prune:
+                # Remove files for programs that no longer exist, or that are
+                # now in the other format
+                self.pages.prune()
+                self.assets.prune()
+                if self.renderer is None:
+                    self.html_pages.prune()
+            instrumentation.record_rows("_program", written=self.pages.written + self.html_pages.written)
+            print(f"Created pages for {self.count} programs (markdown files: {self.pages.summary()}; "
+                  f"HTML files: {self.html_pages.summary()}; {self.assets.summary()})")
+
+    def files(self) -> Dict[str, sitefiles.GeneratedDirectory]:
+        """Return the files generated so far, by kind."""
+        return {'markdown': self.pages, 'html': self.html_pages, 'data': self.assets.files}
+
+
+def prune_program_pages(shard_files: Iterable[Dict[str, sitefiles.GeneratedDirectory]]):
+    """
+    Remove the files of programs that were not generated by any shard of the
+    programs, given the files() of the ProgramPagesSink of every shard.
+    """
+    merged = {}
+    for files in shard_files:
+        for kind, directory in files.items():
+            if kind in merged:
+                merged[kind].merge(directory)
+            else:
+                merged[kind] = directory
+    for directory in merged.values():
+        directory.prune()
+    print(f"Pruned program pages (markdown files: {merged['markdown'].summary()}; "
+          f"HTML files: {merged['html'].summary()}; data files: {merged['data'].summary()})")
 
-        # Write markdown file
-        markdown_file_path = os.path.join(output_dir, f"{program['id']}.md")
-        with open(markdown_file_path, 'w', encoding='utf-8') as file:
-            file.write('---\n')
-            yaml.dump(listing, file, allow_unicode=True)
-            file.write('---\n')
 
-    print(f"Created markdown files for {len(programs_data)} programs")
+@instrumentation.instrumented
+def generate_program_markdown_files(output_dir: str, programs_data: Iterable[records.ProgramRecord], fiscal_years: list[str]):
+    """Generate individual markdown files for each program using pre-generated data."""
+    stream_programs(programs_data, [ProgramPagesSink(output_dir)])
+
 
+@instrumentation.instrumented
+def generate_program_html_files(output_dir: str, programs_data: Iterable[records.ProgramRecord],
+                                fiscal_years: list[str], workers: int = None):
+    """
+    Render the program pages to HTML in parallel with htmlrender, so Jekyll
+    does not have to, and write markdown files only for the programs it cannot
+    render.
+    """
+    stream_programs(programs_data, [ProgramPagesSink(output_dir, render_html=True, html_workers=workers)])
 
+
+@instrumentation.instrumented
 def generate_search_page(output_path: str, shared_data: Dict[str, Any], fiscal_year: str):
     """Generate the search page using pre-generated shared data."""
+    prefix = fiscal_year_prefix(fiscal_year)
     search_page = {
         'title': 'Program search',
         'layout': 'search',
-        'permalink': '/search.html',
+        'permalink': f"{prefix}/search.html",
         'fiscal_year': fiscal_year,
         'cfo_agencies': shared_data['cfo_agencies'],
         'other_agencies': shared_data['other_agencies'],
@@ -1215,22 +1090,23 @@ def generate_search_page(output_path: str, shared_data: Dict[str, Any], fiscal_y
         'beneficiary_types': shared_data['beneficiary_types'],
         'categories': shared_data['categories']
     }
+    if prefix:
+        search_page['site_prefix'] = prefix
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        file.write('---\n')
-        yaml.dump(search_page, file, allow_unicode=True)
-        file.write('---\n')
+    sitefiles.write_if_changed(output_path, frontmatter.page(search_page))
     print("Successfully generated search page")
 
 
+@instrumentation.instrumented
 def generate_home_page(output_path: str, shared_data: Dict[str, Any],
                        fiscal_year: str):
     """Generate the home page using pre-generated shared data."""
+    prefix = fiscal_year_prefix(fiscal_year)
     page = {
         'title': 'Home',
         'layout': 'home',
-        'permalink': '/',
+        'permalink': f"{prefix}/",
         'fiscal_year': fiscal_year,
         'cfo_agencies': shared_data['cfo_agencies'],
         'other_agencies': shared_data['other_agencies'],
@@ -1238,163 +1114,191 @@ def generate_home_page(output_path: str, shared_data: Dict[str, Any],
         'program_types': shared_data['assistance_types'],
         'categories': shared_data['categories']
     }
+    if prefix:
+        page['site_prefix'] = prefix
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        file.write('---\n')
-        yaml.dump(page, file, allow_unicode=True)
-        file.write('---\n')
+    sitefiles.write_if_changed(output_path, frontmatter.page(page))
     print("Successfully generated home page")
 
 
-def generate_programs_table_json(output_path: str, programs_data: List[Dict[str, Any]], fiscal_year: str):
-    """Generate the programs table JSON file using pre-generated data."""
-    programs_json = []
+def programs_table_document(program: records.ProgramRecord, fiscal_year: str) -> Dict[str, Any]:
+    """Return the document of a program in the programs table JSON."""
+    # Calculate obligations based on program type
+    if program.program_type == 'assistance_listing':
+        # For assistance programs, use sam_actual
+        current_year_obligation = program.obligations.get(fiscal_year, 'sam_actual')
+    elif program.program_type == 'interest':
+        current_year_obligation = program.other_program_spending.get(fiscal_year, 'outlays')
+    else:
+        # For other programs, sum outlays and forgone_revenue
+        spending = program.other_program_spending
+        current_year_obligation = spending.get(fiscal_year, 'outlays')
+        if 'forgone_revenue' in spending.fields:
+            current_year_obligation += spending.get(fiscal_year, 'forgone_revenue')
+
+    unique_categories = set()
+    categories_json = []
+
+    for cat in program.categories:
+        parts = cat.split(' - ', 1)
+        if len(parts) == 2:
+            parent, subcategory = parts
+            category_tuple = (parent, subcategory)
+            if category_tuple not in unique_categories:
+                unique_categories.add(category_tuple)
+                categories_json.append({
+                    'title': parent,
+                    'subCategory': {'title': subcategory}
+                })
 
-    for program in programs_data:
-        # Calculate obligations based on program type
-        if program['program_type'] == 'assistance_listing':
-           # For assistance programs, use sam_actual
-            current_year_obligation = next(
-                (obl['sam_actual']
-                for obl in program['obligations'] 
-                if obl['x'] == fiscal_year), 
-                0
-            )
-        else:         
-             # For other programs, sum outlays and forgone_revenue
-            current_year_part_obligation = next(
-                (tx for tx in program['other_program_spending'] if tx['x'] == fiscal_year),
-                {'outlays': 0, 'forgone_revenue': 0}
-            )
-            if program["program_type"] == "interest":
-                current_year_obligation = current_year_part_obligation['outlays']
-            else:
-                 current_year_obligation = current_year_part_obligation['outlays'] + current_year_part_obligation['forgone_revenue']
-
-        unique_categories = set()
-        categories_json = []
-
-        for cat in program['categories']:
-            parts = cat.split(' - ', 1)
-            if len(parts) == 2:
-                parent, subcategory = parts
-                category_tuple = (parent, subcategory)
-                if category_tuple not in unique_categories:
-                    unique_categories.add(category_tuple)
-                    categories_json.append({
-                        'title': parent,
-                        'subCategory': {'title': subcategory}
-                    })
-
-        program_json = {
-            'cfda': program['id'],
-            'title': program['name'],
-            'permalink': f"/program/{program['id']}",
-            'obligations': float(current_year_obligation),
-            'objectives': program['objective'],
-            'popularName': program['popular_name'],
-            'agency': {
-                'title': program['top_agency_name'] or 'Unspecified',
-                'subAgency': {
-                    'title': program['sub_agency_name'] or 'N/A'
-                }
-            },
-            'assistanceTypes': program['assistance_types'],
-            'applicantTypes': program['applicant_types'],
-            'categories': categories_json
-        }
+    return {
+        'cfda': program.id,
+        'title': program.name,
+        'permalink': f"/program/{program.id}",
+        'obligations': float(current_year_obligation),
+        'objectives': program.objective,
+        'popularName': program.popular_name,
+        'agency': {
+            'title': program.top_agency_name or 'Unspecified',
+            'subAgency': {
+                'title': program.sub_agency_name or 'N/A'
+            }
+        },
+        'assistanceTypes': list(program.assistance_types),
+        'applicantTypes': list(program.applicant_types),
+        'categories': categories_json
+    }
 
-        programs_json.append(program_json)
 
-    # Sort by obligations descending
-    programs_json.sort(key=lambda x: x['obligations'], reverse=True)
+class ProgramsTableSink:
+    """
+    Writes the programs table JSON and its NDJSON shards from the programs it
+    is given. The documents are spooled to a temporary file as they arrive,
+    and only their obligations and program numbers are kept in memory to
+    write them in order.
+    """
 
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        json.dump(programs_json, file, separators=(',', ':'))
-    print("Successfully generated program json")
+    def __init__(self, output_path: str, fiscal_year: str):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        self.output_path = output_path
+        self.fiscal_year = fiscal_year
+        self.spool = tempfile.TemporaryFile()
+        # (obligations, program number, offset, length) of each document
+        self.documents = []
+
+    def write(self, program: records.ProgramRecord):
+        document = programs_table_document(program, self.fiscal_year)
+        data = json.dumps(document, separators=(',', ':')).encode('utf-8')
+        self.documents.append((document['obligations'], document['cfda'], self.spool.tell(), len(data)))
+        self.spool.write(data)
+
+    def read(self, entry) -> bytes:
+        self.spool.seek(entry[2])
+        return self.spool.read(entry[3])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.finish()
+        finally:
+            self.spool.close()
+
+    def finish(self):
+        # Sort by obligations descending
+        by_obligations = sorted(self.documents, key=lambda x: x[0], reverse=True)
+        with sitefiles.replacing(self.output_path) as file:
+            file.write(b'[')
+            for i, entry in enumerate(by_obligations):
+                if i:
+                    file.write(b',')
+                file.write(self.read(entry))
+            file.write(b']')
+        instrumentation.record_rows(os.path.basename(self.output_path),
+                                    written=len(self.documents))
+
+        name = os.path.splitext(os.path.basename(self.output_path))[0]
+        by_program = sorted(self.documents, key=lambda x: x[1])
+        manifest = shards.write_shards(os.path.dirname(self.output_path), name,
+                                       (json.loads(self.read(entry)) for entry in by_program),
+                                       key='cfda', presorted=True, fiscal_year=self.fiscal_year)
+        print(f"Successfully generated program json ({len(manifest['shards'])} NDJSON shards, "
+              f"version {manifest['version'][:12]})")
+
+
+@instrumentation.instrumented
+def generate_programs_table_json(output_path: str, programs_data: Iterable[records.ProgramRecord], fiscal_year: str):
+    """
+    Generate the programs table JSON file using pre-generated data, and the
+    same documents as NDJSON shards with a manifest next to it (e.g.,
+    programs-table-00000.ndjson and programs-table.manifest.json).
+    """
+    stream_programs(programs_data, [ProgramsTableSink(output_path, fiscal_year)])
 
 
+@instrumentation.instrumented
 def generate_category_page(cursor: sqlite3.Cursor,
-                           programs_data: List[Dict[str, Any]],
-                           output_path: str, fiscal_year: str):
-    """Generate the category page using a mix of pre-generated data and database queries."""
+                           programs_data: List[records.ProgramRecord],
+                           output_path: str, fiscal_year: str,
+                           cube: rollup.RollupCube = None):
+    """Generate the category page using pre-generated data and the category rollup."""
+    prefix = fiscal_year_prefix(fiscal_year)
+    if cube is None:
+        cube = rollup.RollupCube.from_database(cursor, [fiscal_year])
+
     # Get all unique categories and their hierarchies
     categories = set()
     for program in programs_data:
-        for category in program['categories']:
+        for category in program.categories:
             if ' - ' in category:
                 parent = category.split(' - ')[0]
                 categories.add(parent)
     categories = sorted(list(categories))
 
-    # Get all program IDs
-    cursor.execute("""
-        SELECT DISTINCT id 
-        FROM program
-    """)
-    program_ids = [row['id'] for row in cursor.fetchall()]
-
-    # Calculate obligations by program type using the utility function
-    obligations_result = get_program_obligations_by_type(cursor, program_ids, fiscal_year)
+    # Calculate obligations by program type
+    obligations = cube.program_obligations(fiscal_year)
     obligations_by_type = []
-    
-    for prog_type, total_obs in obligations_result.items():
-        if total_obs > 0:
+    type_obs = cube.sum(obligations, by=('program_type',))
+    for code, prog_type in enumerate(cube.labels('program_type')):
+        if type_obs[code] > 0:
             obligations_by_type.append({
                 'title': constants.PROGRAM_TYPE_MAPPING.get(prog_type, prog_type),
-                'total_obs': total_obs
+                'total_obs': float(type_obs[code])
             })
 
-    # Get total number of unique programs
-    cursor.execute("""
-        SELECT COUNT(DISTINCT p.id) as total_programs
-        FROM program p
-        JOIN program_to_category ptc ON p.id = ptc.program_id
-        JOIN category c ON ptc.category_id = c.id
-        WHERE c.type = 'category'
-        AND ptc.category_type = 'category'
-    """)
-    total_programs = cursor.fetchone()['total_programs']
+    # Get total number of unique programs in any category
+    total_programs = int(cube.mask('subcategory').sum())
 
     # Total obligations is sum of all program type obligations
     total_obs = sum(type_obj['total_obs'] for type_obj in obligations_by_type)
 
     # Calculate category stats
+    parent_ids = {}
+    for category in cube.categories.values():
+        if category['parent_id'] is None:
+            parent_ids.setdefault(category['name'], category['id'])
+    category_codes = cube.dimensions['category'].index
+    num_programs = cube.count(by=('category',))
+    category_obs = cube.sum(obligations, by=('category',))
+
     category_stats = {}
     for category in categories:
-        # Get programs for this category
-        cursor.execute("""
-            SELECT DISTINCT p.id, p.program_type
-            FROM program p
-            JOIN program_to_category ptc ON p.id = ptc.program_id
-            JOIN category c ON ptc.category_id = c.id
-            WHERE c.parent_id = (
-                SELECT id FROM category WHERE name = ?
-            )
-            AND ptc.category_type = 'category'
-        """, (category,))
-        programs = cursor.fetchall()
-
-        if programs:
-            program_ids = [p['id'] for p in programs]
-            
-            # Use the utility function to calculate obligations
-            obligations_result = get_program_obligations_by_type(cursor, program_ids, fiscal_year)
-            total_cat_obs = sum(total_obs for total_obs in obligations_result.values())
-
+        code = category_codes.get(parent_ids.get(category))
+        if code is not None:
             category_stats[category] = {
                 'title': category,
-                'total_num_programs': len(programs),
-                'total_obs': total_cat_obs,
-                'permalink': f"/category/{convert_to_url_string(category)}"
+                'total_num_programs': int(num_programs[code]),
+                'total_obs': float(category_obs[code]),
+                'permalink': f"{prefix}/category/{convert_to_url_string(category)}"
             }
 
     # Prepare categories list and JSON
     categories_list = [{
         'title': cat,
-        'permalink': f"/category/{convert_to_url_string(cat)}"
+        'permalink': f"{prefix}/category/{convert_to_url_string(cat)}"
     } for cat in categories]
 
     categories_json = json.dumps(sorted(list(category_stats.values()),
@@ -1405,119 +1309,488 @@ def generate_category_page(cursor: sqlite3.Cursor,
     category_page = {
         'title': 'Categories',
         'layout': 'category-index',
-        'permalink': '/category.html',
+        'permalink': f"{prefix}/category.html",
         'fiscal_year': fiscal_year,
         'total_num_programs': total_programs,
         'total_obs': total_obs,
         'obligations_by_type': sorted(obligations_by_type, key=lambda x: x['title']),
         'categories': categories_list,
-        'categories_json': categories_json,
-        'categories_hierarchy': get_categories_hierarchy(cursor)
+        'categories_json': categories_json
     }
+    if prefix:
+        category_page['site_prefix'] = prefix
 
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        file.write('---\n')
-        yaml.dump(category_page, file, allow_unicode=True)
-        file.write('---\n')
+    sitefiles.write_if_changed(output_path, frontmatter.page(category_page))
 
 
-def generate_program_csv(output_path: str, programs_data: List[Dict[str, Any]], fiscal_years: list[str]):
-    """Generate CSV file containing all program data using pre-generated data."""
+@instrumentation.instrumented
+def generate_categories_hierarchy_data(output_path: str, categories_hierarchy: List[Dict[str, Any]]):
+    """
+    Write the category hierarchy to a Jekyll data file (website/_data), which
+    the category pages read as site.data.categories_hierarchy instead of each
+    repeating it in its front matter.
+    """
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    sitefiles.write_if_changed(output_path, json.dumps(categories_hierarchy, indent=2) + '\n')
+
+
+def fiscal_year_output_dirs(fiscal_year: str, website_dir: str, indexer_dir: str) -> Dict[str, str]:
+    """
+    Return the directories of a fiscal year's pages, category hierarchy data
+    file and programs table JSON: those of the site itself for
+    constants.FISCAL_YEAR, and their subdirectories named after the year's
+    prefix (e.g., website/pages/fy2023, website/_data/fy2023 and
+    indexer/fy2023) for other years, which Jekyll builds and the indexer
+    indexes along with the current year. The category and sub-category pages
+    place themselves the same way in their collections.
+    """
+    return {
+        'pages': fiscal_year_dir(os.path.join(website_dir, 'pages'), fiscal_year),
+        'data': fiscal_year_dir(os.path.join(website_dir, '_data'), fiscal_year),
+        'category': os.path.join(website_dir, '_category'),
+        'subcategory': os.path.join(website_dir, '_subcategory'),
+        'indexer': fiscal_year_dir(indexer_dir, fiscal_year)
+    }
+
 
-    with open(output_path, 'w', newline='', encoding='utf-8') as file:
-        csvwriter = csv.writer(file)
-        csvwriter.writerow([
-            'program_number',
-            'title',
-            'popular_name',
-            'agency',
-            'sub-agency',
-            'objective',
-            'sam_url',
-            'usaspending_url',
-            'grants_url',
-            'assistance_types',
-            'beneficiary_types',
-            'applicant_types',
-            'categories',
-            'obligations',
-            'outlays',
-            'other expenditures',
-
-        ])
-
-        for program in programs_data:
-            csvwriter.writerow([
-                program['id'],
-                program['name'],
-                program['popular_name'] or '',
-                program['top_agency_name'] or 'Unspecified',
-                program['sub_agency_name'] or 'N/A',
-                program['objective'],
-                program['sam_url'],
-                program['usaspending_url'],
-                program['grants_url'],
-                ','.join(program['assistance_types']),
-                ','.join(program['beneficiary_types']),
-                ','.join(program['applicant_types']),
-                ','.join(program['categories']),
-                json.dumps([{
-                    'x': obl['x'],
-                    'sam_spending': obl['sam_actual'],
-                    'usa_spending_actual': obl['usa_spending_actual']
-                } for obl in program['obligations']], separators=(',', ':')) if program['obligations'] else "",
-                json.dumps(program['outlays'], separators=(',', ':')) if program['outlays'] else "",
-                json.dumps([{
-                    'x': spend['x'],
-                    'outlays': spend['outlays'],
-                    **({'revenue_losses': spend['forgone_revenue']} if 'forgone_revenue' in spend else {})
-                } for spend in program['other_program_spending']], separators=(',', ':')) if program['other_program_spending'] else ""
-            ])
-
-    print(f"Generated CSV file with {len(programs_data)} programs")
-
-
-try:
-    conn = sqlite3.connect(full_path)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    # programs_data = generate_program_data(cursor, FISCAL_YEARS)
-
-    # shared_data = generate_shared_data(cursor)
-
-    # generate_program_markdown_files(MARKDOWN_DIR, programs_data, FISCAL_YEARS)
-
-    # generate_program_csv('../website/assets/files/all-program-data.csv', programs_data, FISCAL_YEARS)
-
-    # search_path = os.path.join('../website', 'pages', 'search.md')
-    # generate_search_page(search_path, shared_data, constants.FISCAL_YEAR)
-
-    # category_path = os.path.join('../website', 'pages', 'category.md')
-    # generate_category_page(cursor, programs_data, category_path,
-    #                        constants.FISCAL_YEAR)
-
-    # home_path = os.path.join('../website', 'pages', 'home.md')
-    # generate_home_page(home_path, shared_data, constants.FISCAL_YEAR)
-
-    # programs_json_path = os.path.join('../indexer', 'programs-table.json')
-    # generate_programs_table_json(programs_json_path, programs_data,
-    #                              constants.FISCAL_YEAR)
-
-    # category_dir = os.path.join('../website', '_category')
-    # generate_category_markdown_files(cursor, category_dir, constants.FISCAL_YEAR)
-
-    # subcategory_dir = os.path.join('../website', '_subcategory')
-    # generate_subcategory_markdown_files(cursor, subcategory_dir, constants.FISCAL_YEAR)
-
-except sqlite3.Error as e:
-    print(f"Database error occurred: {e}")
-    raise e
-except Exception as e:
-    print(f"An error occurred: {e}")
-    raise e
-finally:
-    if 'conn' in locals():
-        conn.close()
\ No newline at end of file
+@instrumentation.instrumented
+def generate_fiscal_year_pages(cursor: sqlite3.Cursor, programs_data: List[records.ProgramRecord],
+                               shared_data: Dict[str, Any], fiscal_years: list[str],
+                               website_dir: str = '../website', indexer_dir: str = '../indexer',
+                               programs_table: bool = True):
+    """
+    Generate the search, home, category and sub-category pages, the category
+    hierarchy data file and, with programs_table, the programs table JSON of
+    several fiscal years. The category rollup and hierarchy are loaded once
+    for all years, so each additional year only renders its pages.
+    """
+    category_rollup = rollup.RollupCube.from_database(cursor, fiscal_years)
+    categories_hierarchy = get_categories_hierarchy(cursor)
+
+    for fiscal_year in fiscal_years:
+        dirs = fiscal_year_output_dirs(fiscal_year, website_dir, indexer_dir)
+        print(f"Generating fiscal year {fiscal_year} pages in {dirs['pages']}")
+
+        generate_search_page(os.path.join(dirs['pages'], 'search.md'),
+                             shared_data, fiscal_year)
+        generate_home_page(os.path.join(dirs['pages'], 'home.md'),
+                           shared_data, fiscal_year)
+        if programs_table:
+            generate_programs_table_json(os.path.join(dirs['indexer'], 'programs-table.json'),
+                                         programs_data, fiscal_year)
+        generate_categories_hierarchy_data(os.path.join(dirs['data'], 'categories_hierarchy.json'),
+                                           fiscal_year_categories_hierarchy(categories_hierarchy, fiscal_year))
+        generate_category_page(cursor, programs_data,
+                               os.path.join(dirs['pages'], 'category.md'),
+                               fiscal_year, category_rollup)
+        generate_category_markdown_files(cursor, dirs['category'], fiscal_year, category_rollup)
+        generate_subcategory_markdown_files(cursor, dirs['subcategory'], fiscal_year, category_rollup)
+
+
+class ProgramCsvSink:
+    """Writes the row of each program it is given to a CSV file of all program data."""
+
+    def __init__(self, output_path: str):
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+        self.output_path = output_path
+        self.file = open(output_path, 'w', newline='', encoding='utf-8')
+        self.csvwriter = csv.writer(self.file)
+        self.csvwriter.writerow(exports.CSV_HEADER)
+        self.count = 0
+
+    def write(self, program: records.ProgramRecord):
+        self.csvwriter.writerow(exports.csv_row(program))
+        self.count += 1
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.file.close()
+        if exc_type is None:
+            instrumentation.record_rows(os.path.basename(self.output_path),
+                                        written=self.count)
+            print(f"Generated CSV file with {self.count} programs")
+
+
+@instrumentation.instrumented
+def generate_program_csv(output_path: str, programs_data: Iterable[records.ProgramRecord], fiscal_years: list[str]):
+    """Generate CSV file containing all program data using pre-generated data."""
+    stream_programs(programs_data, [ProgramCsvSink(output_path)])
+
+
+@instrumentation.instrumented
+def generate_program_exports(output_dir: str, programs: Iterable[records.ProgramRecord], fiscal_years: list[str]):
+    """
+    Write the CSV, gzip-compressed CSV and Parquet exports of all program data,
+    with their manifest. Programs are written as they are produced, so they can
+    be streamed from iter_program_data.
+    """
+    export = exports.ProgramExport(output_dir, fiscal_years)
+    stream_programs(programs, [export])
+    report_program_export(export)
+
+
+def report_program_export(export: exports.ProgramExport):
+    instrumentation.record_rows(f"{export.name}.*", written=export.rows)
+    formats = 'CSV, gzip and Parquet' if export.parquet_path else 'CSV and gzip (pyarrow is not installed)'
+    print(f"Generated {formats} exports with {export.rows} programs")
+
+
+def stream_programs(programs: Iterable[records.ProgramRecord], sinks: list):
+    """
+    Write each program to every sink before the next program is built, so
+    that programs streamed from iter_program_data are never all held in
+    memory. Sinks are context managers with a write(program) method, like
+    exports.ProgramExport, that finish their files when they exit.
+    """
+    with contextlib.ExitStack() as stack:
+        for sink in sinks:
+            stack.enter_context(sink)
+        for program in programs:
+            for sink in sinks:
+                sink.write(program)
+
+
+@instrumentation.instrumented
+def generate_program_outputs(cursor: sqlite3.Cursor, fiscal_years: list[str],
+                             website_dir: str = '../website', indexer_dir: str = '../indexer',
+                             program_pages: bool = True):
+    """
+    Generate the program markdown files, the exports of all program data and
+    the programs table JSON of each of fiscal_years in a single pass over the
+    programs, which are streamed from the database instead of being built as
+    programs_data first. Without program_pages, the program markdown files
+    are left to other jobs (see plan_load_jobs).
+    """
+    export = exports.ProgramExport(os.path.join(website_dir, 'assets', 'files'), FISCAL_YEARS)
+    sinks = [export]
+    if program_pages:
+        sinks.insert(0, ProgramPagesSink(os.path.join(website_dir, '_program')))
+    for fiscal_year in fiscal_years:
+        dirs = fiscal_year_output_dirs(fiscal_year, website_dir, indexer_dir)
+        sinks.append(ProgramsTableSink(os.path.join(dirs['indexer'], 'programs-table.json'), fiscal_year))
+
+    stream_programs(iter_program_data(cursor, FISCAL_YEARS), sinks)
+    report_program_export(export)
+
+
+class LoadData:
+    """
+    The program data and shared data the website is generated from, built on
+    first use. Both are cached on disk for the fingerprint of the database, so
+    separate runs of load.py only query the database once after it changes.
+    """
+
+    def __init__(self, cursor: sqlite3.Cursor, cache_dir: str = CACHE_DIR, refresh: bool = False):
+        self.cursor = cursor
+        self.cache_dir = cache_dir
+        self.refresh = refresh
+
+    @cached_property
+    def programs_data(self) -> List[records.ProgramRecord]:
+        return datacache.disk_cached(self.cursor, f"program_records_{'_'.join(FISCAL_YEARS)}",
+                                     lambda: generate_program_data(self.cursor, FISCAL_YEARS),
+                                     self.cache_dir, self.refresh)
+
+    @cached_property
+    def shared_data(self) -> Dict[str, Any]:
+        return datacache.disk_cached(self.cursor, "shared_data",
+                                     lambda: generate_shared_data(self.cursor),
+                                     self.cache_dir, self.refresh)
+
+
+# Each target generates some of the website's files from the LoadData, given
+# the fiscal years and every target of the run
+LOAD_TARGETS = {
+    "program_pages": lambda data, fiscal_years, targets: generate_program_markdown_files(
+        MARKDOWN_DIR, data.programs_data, FISCAL_YEARS),
+    # program pages rendered to HTML instead of markdown files where possible
+    "program_html": lambda data, fiscal_years, targets: generate_program_html_files(
+        MARKDOWN_DIR, data.programs_data, FISCAL_YEARS),
+    "program_csv": lambda data, fiscal_years, targets: generate_program_csv(
+        '../website/assets/files/all-program-data.csv', data.programs_data, FISCAL_YEARS),
+    # writes all-program-data.csv too, along with its gzip and Parquet versions
+    "program_exports": lambda data, fiscal_years, targets: generate_program_exports(
+        '../website/assets/files', data.programs_data, FISCAL_YEARS),
+    # program pages, exports and the programs table JSON of each fiscal year,
+    # written in one pass over the programs streamed from the database
+    # instead of the cached program data, to keep memory use flat
+    "program_outputs": lambda data, fiscal_years, targets: generate_program_outputs(
+        data.cursor, fiscal_years),
+    # search, home, category and sub-category pages, and the programs table
+    # JSON unless program_outputs writes it in the same run
+    "fiscal_year_pages": lambda data, fiscal_years, targets: generate_fiscal_year_pages(
+        data.cursor, data.programs_data, data.shared_data, fiscal_years,
+        programs_table='program_outputs' not in targets),
+}
+
+
+# Parallel load: the targets are split into jobs that generate their files
+# independently of each other (e.g., a shard of the program pages, or the
+# pages of every fiscal year), which run in worker processes, each with a
+# read-only connection of its own.
+
+# website and indexer directories of the jobs, as in fiscal_year_output_dirs,
+# and the directory of the cached program and shared data (see LoadData)
+LOAD_DIRS = {'website': '../website', 'indexer': '../indexer', 'cache': CACHE_DIR}
+
+# cost, in seconds, of jobs that did not run in the latest parallel load
+DEFAULT_JOB_COST = 1.0
+
+
+def program_pages_job(data: LoadData, dirs: Dict[str, str], shard: int, shards: int,
+                      render_html: bool = False):
+    """Write the pages of one shard of the programs, and return their files
+    (see ProgramPagesSink.files) to be pruned once every shard is written."""
+    sink = ProgramPagesSink(os.path.join(dirs['website'], '_program'), render_html,
+                            html_workers=1, prune=False)
+    stream_programs(iter_program_data(data.cursor, FISCAL_YEARS, shard=(shard, shards)), [sink])
+    return sink.files()
+
+
+def program_csv_job(data: LoadData, dirs: Dict[str, str]):
+    generate_program_csv(os.path.join(dirs['website'], 'assets', 'files', 'all-program-data.csv'),
+                         iter_program_data(data.cursor, FISCAL_YEARS), FISCAL_YEARS)
+
+
+def program_exports_job(data: LoadData, dirs: Dict[str, str]):
+    generate_program_exports(os.path.join(dirs['website'], 'assets', 'files'),
+                             iter_program_data(data.cursor, FISCAL_YEARS), FISCAL_YEARS)
+
+
+def program_outputs_job(data: LoadData, dirs: Dict[str, str], fiscal_years: list[str]):
+    """Write the exports and the programs table JSON of every fiscal year in
+    one pass over the programs, while the program pages are written by the
+    shards."""
+    generate_program_outputs(data.cursor, fiscal_years, dirs['website'], dirs['indexer'],
+                             program_pages=False)
+
+
+def fiscal_year_pages_job(data: LoadData, dirs: Dict[str, str], fiscal_years: list[str],
+                          programs_table: bool = True):
+    """Write the pages of every fiscal year, which share one category rollup
+    and hierarchy (see generate_fiscal_year_pages)."""
+    generate_fiscal_year_pages(data.cursor, data.programs_data, data.shared_data, fiscal_years,
+                               dirs['website'], dirs['indexer'], programs_table)
+
+
+def plan_load_jobs(targets: list[str], fiscal_years: list[str], shards: int) -> Dict[str, tuple]:
+    """
+    Return the jobs that generate the same files as the targets, by name, as
+    (function, arguments). The program pages are split into shards jobs, and
+    every other target is a single job that reads the programs once, like
+    the target does in a single process, whatever the number of fiscal years.
+    """
+    if 'program_pages' in targets and 'program_html' in targets:
+        raise ValueError("program_pages and program_html write the same pages, and cannot both be run")
+    jobs = {}
+    for target in targets:
+        if target in ('program_pages', 'program_html', 'program_outputs'):
+            for shard in range(shards):
+                jobs[f"program_pages[{shard}/{shards}]"] = (
+                    program_pages_job, (shard, shards, target == 'program_html'))
+        if target == 'program_csv':
+            jobs['program_csv'] = (program_csv_job, ())
+        if target == 'program_exports':
+            jobs['program_exports'] = (program_exports_job, ())
+        if target == 'program_outputs':
+            jobs['program_outputs'] = (program_outputs_job, (fiscal_years,))
+        if target == 'fiscal_year_pages':
+            # the programs tables are written by program_outputs when it
+            # runs too, rather than by both jobs at the same time
+            jobs['fiscal_year_pages'] = (fiscal_year_pages_job,
+                                         (fiscal_years, 'program_outputs' not in targets))
+    return jobs
+
+
+def job_kind(name: str) -> str:
+    """Return the kind of a job, e.g., program_pages for program_pages[0/4]."""
+    return name.split('[')[0]
+
+
+def latest_job_costs(manifest_dir: str = instrumentation.MANIFEST_DIRECTORY) -> Dict[str, float]:
+    """
+    Return the wall time of each job of the latest load run manifest that has
+    any, by name, or an empty dict if no parallel load was measured.
+    """
+    for path in sorted(glob.glob(os.path.join(manifest_dir, 'load-*.json')), reverse=True):
+        try:
+            with open(path, encoding='utf-8') as f:
+                stages = json.load(f)['stages']
+        except (OSError, ValueError, KeyError):
+            continue
+        costs = {stage['name']: stage['wall_time_s'] for stage in stages
+                 if stage.get('job')}
+        if costs:
+            return costs
+    return {}
+
+
+def estimate_job_costs(names: Iterable[str], history: Dict[str, float]) -> Dict[str, float]:
+    """
+    Return the estimated cost of each job from the costs of the latest run.
+    Jobs that did not run then are estimated from the jobs of the same kind:
+    a shard of the program pages from the total of the shards, whatever their
+    number, and other jobs from their average.
+    """
+    costs = {}
+    for name in names:
+        if name in history:
+            costs[name] = history[name]
+            continue
+        same_kind = [cost for past, cost in history.items() if job_kind(past) == job_kind(name)]
+        if not same_kind:
+            costs[name] = DEFAULT_JOB_COST
+        elif '/' in name:
+            costs[name] = sum(same_kind) / int(name[name.index('/') + 1:-1])
+        else:
+            costs[name] = sum(same_kind) / len(same_kind)
+    return costs
+
+
+def connect_read_only(db_path: str) -> sqlite3.Connection:
+    """
+    Open a read-optimized connection to the transformed database, which does
+    not change while it is loaded. query_only is off, since program sets are
+    written to TEMP tables (see programsets); the file is read-only anyway.
+    """
+    return connections.connect_read_only(db_path, immutable=True, query_only=False,
+                                         factory=instrumentation.connection_class())
+
+
+def run_load_job(name: str, function, args: tuple, db_path: str, dirs: Dict[str, str],
+                 instrument: bool = False):
+    """
+    Run a job, in a worker process, on a read-only connection of its own.
+    Return its name, what the job returned, its instrumentation records, and
+    its SQL profile, if any.
+    """
+    run = instrumentation.start_run('load') if instrument else None
+    conn = instrumentation.watch(connect_read_only(db_path))
+    try:
+        with instrumentation.stage(name) as record:
+            result = function(LoadData(conn.cursor(), dirs['cache']), dirs, *args)
+    finally:
+        conn.close()
+    stages = run.stages if run else []
+    sql_profile = run.sql_profile if run else None
+    for stage in stages:
+        # the job itself, as opposed to the stages it ran, is what is
+        # scheduled by its cost in later runs
+        if stage['name'] == record.name:
+            stage['job'] = True
+    return name, result, stages, sql_profile
+
+
+def run_load_jobs(db_path: str, jobs: Dict[str, tuple], workers: int = None,
+                  dirs: Dict[str, str] = None, manifest_dir: str = instrumentation.MANIFEST_DIRECTORY):
+    """
+    Run jobs (see plan_load_jobs) in a pool of worker processes. Jobs are
+    started longest first, as measured by the latest run (see
+    latest_job_costs), so that the longest ones do not start last and keep
+    the other workers waiting. Program pages that no shard generated are
+    removed once every job has finished without error.
+    """
+    dirs = dirs or LOAD_DIRS
+    workers = workers or os.cpu_count() or 1
+    costs = estimate_job_costs(jobs, latest_job_costs(manifest_dir))
+    order = sorted(jobs, key=lambda name: costs[name], reverse=True)
+    print(f"Running {len(order)} jobs in {workers} worker processes "
+          f"(estimated {sum(costs.values()):.1f}s of work)")
+
+    shard_files = []
+    # worker processes are spawned, rather than forked, so that no open
+    # SQLite handle is ever shared with a child process
+    with ProcessPoolExecutor(max_workers=min(workers, len(order)) or 1,
+                             mp_context=multiprocessing.get_context("spawn")) as executor:
+        futures = [executor.submit(run_load_job, name, *jobs[name], db_path, dirs,
+                                   instrumentation.current_run() is not None)
+                   for name in order]
+        for future in as_completed(futures):
+            name, result, stages, sql_profile = future.result()
+            instrumentation.add_stages(stages, sql_profile)
+            if job_kind(name) == 'program_pages':
+                shard_files.append(result)
+            print(f"{name} Complete")
+
+    if shard_files:
+        prune_program_pages(shard_files)
+
+def main(argv=None):
+    """Generates the website files of the targets selected on the command line."""
+    parser = argparse.ArgumentParser(
+        description="Generates the website's files from the transformed database.")
+    parser.add_argument("targets", nargs="*", metavar="target",
+                        help="targets to generate: " + ", ".join(LOAD_TARGETS))
+    parser.add_argument("--fiscal-year", dest="fiscal_years", action="append",
+                        choices=FISCAL_YEARS, default=None,
+                        help="fiscal year of the fiscal_year_pages, which may be repeated "
+                             f"(default: {constants.FISCAL_YEAR}); other years are written under "
+                             "their prefix, e.g. /fy2023")
+    parser.add_argument("--refresh-cache", action="store_true",
+                        help="rebuild the cached program and shared data from the database")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes (default: 1); with more than one, the "
+                             "targets are split into jobs, like shards of the program pages, which "
+                             "run concurrently")
+    parser.add_argument("--profile-sql", action="store_true",
+                        help="profile the SQL statements of the run, and report the slowest ones")
+    parser.add_argument("--list", action="store_true",
+                        help="list the available targets and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name in LOAD_TARGETS:
+            print(name)
+        return
+    if not args.targets:
+        parser.error("no targets given (see --list)")
+    unknown = [name for name in args.targets if name not in LOAD_TARGETS]
+    if unknown:
+        parser.error("unknown targets: " + ", ".join(unknown))
+    fiscal_years = args.fiscal_years or [constants.FISCAL_YEAR]
+    workers = args.workers
+
+    if args.profile_sql:
+        # set in the environment, so that worker processes profile too
+        os.environ[instrumentation.PROFILE_SQL_VARIABLE] = "1"
+    instrumentation.start_run("load")
+    if workers > 1:
+        try:
+            jobs = plan_load_jobs(args.targets, fiscal_years, workers)
+        except ValueError as e:
+            parser.error(str(e))
+        try:
+            if args.refresh_cache and 'fiscal_year_pages' in jobs:
+                # rebuilt once, rather than by every job that reads it
+                with contextlib.closing(connect_read_only(full_path)) as conn:
+                    data = LoadData(conn.cursor(), LOAD_DIRS['cache'], refresh=True)
+                    data.programs_data, data.shared_data
+            run_load_jobs(full_path, jobs, workers)
+        finally:
+            instrumentation.finish_run()
+        return
+
+    conn = None
+    try:
+        conn = instrumentation.watch(connect_read_only(full_path))
+        data = LoadData(conn.cursor(), refresh=args.refresh_cache)
+        for name in args.targets:
+            LOAD_TARGETS[name](data, fiscal_years, args.targets)
+
+    except sqlite3.Error as e:
+        print(f"Database error occurred: {e}")
+        raise e
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        raise e
+    finally:
+        if conn is not None:
+            conn.close()
+        instrumentation.finish_run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Sets of program ids stored in a temporary table, so that queries over a set
+of programs can join against it instead of binding every id in an
+IN (?, ?, ...) list. This works for sets of any size (SQLite limits the number
+of bound variables), and the text of each query is the same whatever the size
+of the set, so its prepared statement is cached and reused.
+
+Each distinct set is stored once per connection: creating a set with the same
+ids again returns the existing set.
+"""
+
+import hashlib
+import sqlite3
+
+PROGRAM_SET_CREATE_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS program_set (
+        set_id INTEGER NOT NULL,
+        program_id TEXT NOT NULL,
+        PRIMARY KEY (set_id, program_id)
+    ) WITHOUT ROWID
+    """
+
+PROGRAM_SET_KEY_CREATE_TABLE_SQL = """
+    CREATE TEMP TABLE IF NOT EXISTS program_set_key (
+        set_id INTEGER PRIMARY KEY,
+        key TEXT NOT NULL UNIQUE
+    )
+    """
+
+PROGRAM_SET_KEY_SELECT_SQL = """
+    SELECT set_id FROM temp.program_set_key WHERE key = ?
+    """
+
+PROGRAM_SET_KEY_INSERT_SQL = """
+    INSERT INTO temp.program_set_key (key) VALUES (?)
+    """
+
+PROGRAM_SET_INSERT_SQL = """
+    INSERT INTO temp.program_set (set_id, program_id) VALUES (?, ?)
+    """
+
+# the ids of a set's programs, e.g., for "WHERE program_id IN ({MEMBERS_SQL})"
+MEMBERS_SQL = "SELECT program_id FROM temp.program_set WHERE set_id = ?"
+
+
+def create_tables(cursor: sqlite3.Cursor):
+    """Creates the temporary tables of program sets, if they do not exist.
+    Creating them aborts the statements being read on the connection, so
+    callers reading a statement while creating sets must call this first."""
+    cursor.execute(PROGRAM_SET_CREATE_TABLE_SQL)
+    cursor.execute(PROGRAM_SET_KEY_CREATE_TABLE_SQL)
+
+
+class ProgramSet:
+    """A set of program ids stored in the temporary program_set table of a
+    connection. Queries select its programs with MEMBERS_SQL, binding
+    set_id."""
+
+    def __init__(self, cursor: sqlite3.Cursor, program_ids):
+        self.program_ids = sorted(set(program_ids))
+        key = hashlib.sha256(
+            "\x1f".join(self.program_ids).encode("utf-8")).hexdigest()
+
+        create_tables(cursor)
+        cursor.execute(PROGRAM_SET_KEY_SELECT_SQL, (key,))
+        row = cursor.fetchone()
+        if row is not None:
+            self.set_id = row[0]
+            return
+
+        cursor.execute(PROGRAM_SET_KEY_INSERT_SQL, (key,))
+        self.set_id = cursor.lastrowid
+        cursor.executemany(PROGRAM_SET_INSERT_SQL,
+                           ((self.set_id, program_id)
+                            for program_id in self.program_ids))
+
+    @classmethod
+    def of(cls, cursor: sqlite3.Cursor, programs):
+        """Returns programs if it is already a ProgramSet, or a ProgramSet of
+        the given program ids."""
+        if isinstance(programs, cls):
+            return programs
+        return cls(cursor, programs)
+
+    def __len__(self):
+        return len(self.program_ids)
+
+    def __iter__(self):
+        return iter(self.program_ids)
@@ -0,0 +1,302 @@
+"""
+Audits the query plans of the SQL statements of transform.py and load.py
+against a populated transformed database.
+
+The statements of transform.py are the SQL string literals in its source (its
+*_SQL constants and the statements passed to execute inline). The tables of
+its temporary USASpending.gov database are created, empty, from their CREATE
+TABLE statements in an attached in-memory database.
+The statements of load.py are mostly built at run time (e.g., the IN lists of
+program sets), so they are captured by running its jobs against the database
+into a temporary directory, with their parameters bound as SQLite traces them.
+
+Each statement's EXPLAIN QUERY PLAN is checked for full scans of tables, temp
+B-trees built for ORDER BY, GROUP BY or DISTINCT, and correlated subqueries,
+which run once per row of the outer query. Scans are flagged whatever the size
+of the table, so that the flags of a statement do not depend on the database
+it is audited against; the report shows the rows of each scanned table:
+
+    python queryplans.py --db transformed/transformed_data.db
+
+Flags that are known and accepted are listed, by statement, in
+query_plan_baseline.json; with --check, the audit exits with a non-zero status
+if a statement has any other flag, so that a new slow plan fails the build
+(see benchmarks/bench_load.py). --write-baseline accepts the current flags.
+"""
+
+import argparse
+import ast
+import contextlib
+import hashlib
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import tempfile
+
+import connections
+import constants
+import instrumentation
+import load
+import transform
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "query_plan_baseline.json")
+
+# statements whose plans are audited; DDL and PRAGMAs have none
+PLANNED_STATEMENT_REGEX = re.compile(
+    r"^\s*(?:SELECT|INSERT|UPDATE|DELETE|REPLACE|WITH)\b", re.IGNORECASE)
+CREATE_TABLE_REGEX = re.compile(r"^\s*CREATE\s+TABLE\s+(\w+)", re.IGNORECASE)
+TEMPORARY_TABLE_REGEX = re.compile(r"\btemp_db\.(\w+)")
+SCAN_REGEX = re.compile(r"^SCAN (?:\w+\.)?(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?$")
+TEMP_B_TREE_REGEX = re.compile(r"^USE TEMP B-TREE FOR (.+)$")
+CORRELATED_REGEX = re.compile(r"^CORRELATED (?:SCALAR|LIST) SUBQUERY")
+# tables of a statement and their aliases, which plans refer to them by
+TABLE_ALIAS_REGEX = re.compile(
+    r"\b(?:FROM|JOIN)\s+(?:\w+\.)?(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+SQL_KEYWORDS = {"WHERE", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL",
+                "OUTER", "ON", "USING", "GROUP", "ORDER", "LIMIT", "UNION", "EXCEPT",
+                "INTERSECT", "WINDOW", "HAVING", "AS", "SELECT", "VALUES"}
+
+# directories the load jobs write to, in the temporary directory
+LOAD_OUTPUT_DIRECTORIES = ["website/_program", "website/program", "website/pages",
+                           "website/_category", "website/_subcategory",
+                           "website/_data", "website/assets/files", "indexer", "cache"]
+
+
+def statement_id(fingerprint):
+    """Returns a short, stable identifier of a statement's fingerprint."""
+    return hashlib.sha1(fingerprint.encode("utf-8")).hexdigest()[:12]
+
+
+def source_statements(path):
+    """Returns the SQL string literals of a Python source file that have a
+    query plan. f-strings are left out, since their SQL is only known once
+    they are formatted."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), path)
+    formatted = {id(value) for node in ast.walk(tree) if isinstance(node, ast.JoinedStr)
+                 for value in node.values}
+    return [node.value for node in ast.walk(tree)
+            if isinstance(node, ast.Constant) and isinstance(node.value, str)
+            and id(node) not in formatted and PLANNED_STATEMENT_REGEX.match(node.value)]
+
+
+def create_temporary_tables(conn):
+    """Attaches the temporary and scratch databases of transform.py to a
+    connection, in memory, with the tables of the temporary database (the
+    USASpending.gov data) created empty."""
+    conn.execute("ATTACH DATABASE ':memory:' AS temp_db")
+    conn.execute("ATTACH DATABASE ':memory:' AS scratch_db")
+    sql = [value for name, value in vars(transform).items() if name.endswith("_SQL")]
+    temporary_tables = {table for value in sql
+                        for table in TEMPORARY_TABLE_REGEX.findall(value)}
+    for value in sql:
+        match = CREATE_TABLE_REGEX.match(value)
+        if match and match.group(1) in temporary_tables:
+            conn.execute(CREATE_TABLE_REGEX.sub(
+                lambda m: f"CREATE TABLE temp_db.{m.group(1)}", value, count=1))
+
+
+def capture_load_statements(conn, fiscal_year=constants.FISCAL_YEAR):
+    """Runs the jobs of load.py on a connection, writing their files to a
+    temporary directory, and returns every statement they executed."""
+    statements = []
+    conn.set_trace_callback(statements.append)
+    with tempfile.TemporaryDirectory() as output_dir:
+        for directory in LOAD_OUTPUT_DIRECTORIES:
+            os.makedirs(os.path.join(output_dir, directory))
+        dirs = {'website': os.path.join(output_dir, 'website'),
+                'indexer': os.path.join(output_dir, 'indexer'),
+                'cache': os.path.join(output_dir, 'cache')}
+        data = load.LoadData(conn.cursor(), dirs['cache'])
+        jobs = load.plan_load_jobs(['program_pages', 'program_exports', 'fiscal_year_pages'],
+                                   [fiscal_year], 1)
+        # the jobs print their progress
+        with contextlib.redirect_stdout(io.StringIO()):
+            for function, args in jobs.values():
+                function(data, dirs, *args)
+    conn.set_trace_callback(None)
+    return [s for s in statements if PLANNED_STATEMENT_REGEX.match(s)]
+
+
+def explain(conn, statement):
+    """Returns the details of a statement's query plan, with each parameter
+    bound to NULL."""
+    parameters = ()
+    while True:
+        try:
+            rows = conn.execute("EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+            return [row[3] for row in rows]
+        except sqlite3.ProgrammingError as e:
+            match = re.search(r"statement uses (\d+)", str(e))
+            if match is None or parameters:
+                raise
+            parameters = (None,) * int(match.group(1))
+
+
+def table_aliases(statement):
+    """Returns the table of each alias of a statement."""
+    aliases = {}
+    for table, alias in TABLE_ALIAS_REGEX.findall(statement):
+        if alias and alias.upper() not in SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def plan_flags(statement, details, tables):
+    """Returns the flags of a statement's query plan: full scans of tables,
+    temp B-trees, and correlated subqueries."""
+    aliases = table_aliases(statement)
+    flags = []
+    for detail in details:
+        match = SCAN_REGEX.match(detail)
+        table = aliases.get(match.group(1), match.group(1)) if match else None
+        if table in tables:
+            flags.append(f"full scan of {table}"
+                         + (f" (index {match.group(2)})" if match.group(2) else ""))
+            continue
+        match = TEMP_B_TREE_REGEX.match(detail)
+        if match:
+            flags.append(f"temp B-tree for {match.group(1)}")
+            continue
+        if CORRELATED_REGEX.match(detail):
+            flags.append("correlated subquery")
+    return sorted(set(flags))
+
+
+def table_row_counts(conn):
+    """Returns the number of rows of each table the connection can read, or
+    None for the tables created empty by create_temporary_tables."""
+    counts = {}
+    for schema in ("main", "temp", "temp_db"):
+        for (name,) in conn.execute(
+                f"SELECT name FROM {schema}.sqlite_master WHERE type = 'table'").fetchall():
+            counts[name] = None if schema == "temp_db" else \
+                conn.execute(f'SELECT COUNT(*) FROM {schema}."{name}"').fetchone()[0]
+    return counts
+
+
+def audit(db_path, fiscal_year=constants.FISCAL_YEAR):
+    """Returns the audit of every statement, by statement id: its source
+    files, fingerprint, plan, and flags."""
+    conn = connections.connect_read_only(db_path, immutable=True, query_only=False)
+    try:
+        create_temporary_tables(conn)
+        sources = {}
+        for module in (transform, load):
+            for statement in source_statements(module.__file__):
+                sources.setdefault(statement, set()).add(os.path.basename(module.__file__))
+        for statement in capture_load_statements(conn, fiscal_year):
+            sources.setdefault(statement, set()).add("load.py (run)")
+
+        table_rows = table_row_counts(conn)
+        results = {}
+        for statement, files in sources.items():
+            fingerprint = instrumentation.sql_fingerprint(statement)
+            result = results.get(statement_id(fingerprint))
+            if result is not None:
+                result["sources"] |= files
+                continue
+            try:
+                details = explain(conn, statement)
+                error = None
+            except sqlite3.Error as e:
+                details, error = [], str(e)
+            flags = plan_flags(statement, details, table_rows)
+            results[statement_id(fingerprint)] = {
+                "fingerprint": fingerprint, "sources": set(files), "plan": details,
+                "flags": flags, "error": error,
+                "scanned_rows": {flag.split()[3]: table_rows[flag.split()[3]]
+                                 for flag in flags if flag.startswith("full scan of ")}}
+        return results
+    finally:
+        conn.close()
+
+
+def read_baseline(path=BASELINE_PATH):
+    """Returns the accepted flags of each statement id."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {statement["id"]: set(statement["flags"]) for statement in json.load(f)}
+    except FileNotFoundError:
+        return {}
+
+
+def write_baseline(results, path=BASELINE_PATH):
+    """Accepts the current flags of every statement."""
+    baseline = [{"id": id, "statement": result["fingerprint"][:120], "flags": result["flags"]}
+                for id, result in sorted(results.items(), key=lambda r: r[1]["fingerprint"])
+                if result["flags"]]
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2)
+        f.write("\n")
+
+
+def new_flags(results, baseline):
+    """Returns the flags of each statement that the baseline does not accept."""
+    found = {}
+    for id, result in results.items():
+        flags = [flag for flag in result["flags"] if flag not in baseline.get(id, set())]
+        if flags:
+            found[id] = flags
+    return found
+
+
+def report(results, baseline, verbose=False):
+    """Returns the lines of the audit's report: each flagged statement, its
+    flags (new ones marked as such) and its plan."""
+    lines = []
+    flagged = 0
+    for id, result in sorted(results.items(), key=lambda r: r[1]["fingerprint"]):
+        if not (result["flags"] or result["error"] or verbose):
+            continue
+        flagged += bool(result["flags"])
+        lines.append(f"{id} [{', '.join(sorted(result['sources']))}] {result['fingerprint'][:160]}")
+        for flag in result["flags"]:
+            accepted = flag in baseline.get(id, set())
+            rows = result["scanned_rows"].get(flag.split()[3]) if flag.startswith("full scan") else None
+            lines.append(f"    {'' if accepted else 'NEW '}{flag}"
+                         + (f" ({rows} rows)" if rows is not None else ""))
+        if result["error"]:
+            lines.append(f"    not explained: {result['error']}")
+        for detail in result["plan"]:
+            lines.append(f"      | {detail}")
+    lines.append(f"{len(results)} statements audited, {flagged} flagged")
+    return lines
+
+
+def main(argv=None):
+    """Audits the query plans from the command line; with --check, exits
+    with a non-zero status if any flag is not in the baseline."""
+    parser = argparse.ArgumentParser(
+        description="Audits the query plans of the SQL of transform.py and load.py.")
+    parser.add_argument("--db", default=load.full_path,
+                        help="populated transformed database (default: %(default)s)")
+    parser.add_argument("--fiscal-year", default=constants.FISCAL_YEAR)
+    parser.add_argument("--baseline", default=BASELINE_PATH,
+                        help="flags that are accepted (default: %(default)s)")
+    parser.add_argument("--check", action="store_true",
+                        help="fail if a statement has a flag that is not in the baseline")
+    parser.add_argument("--write-baseline", action="store_true",
+                        help="accept the current flags of every statement")
+    parser.add_argument("--verbose", action="store_true",
+                        help="also list the plans of statements that are not flagged")
+    args = parser.parse_args(argv)
+
+    results = audit(args.db, args.fiscal_year)
+    if args.write_baseline:
+        write_baseline(results, args.baseline)
+        print(f"Wrote the accepted flags to {args.baseline}")
+    baseline = read_baseline(args.baseline)
+    for line in report(results, baseline, args.verbose):
+        print(line)
+    found = new_flags(results, baseline)
+    print(f"{sum(len(flags) for flags in found.values())} flag(s) not in the baseline")
+    return 1 if args.check and found else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,164 @@
+"""
+Compact records of the program data the website is generated from. A
+ProgramRecord stores a program's fields in slots instead of a dict, lists as
+tuples, and each yearly spending series (e.g., obligations) as one array of
+doubles, so the program data of the whole catalog takes less memory and its
+fields are read as attributes.
+
+Records can still be read like the program dicts they replace (e.g.,
+program['obligations'] returns the list of yearly dicts), and converted to
+and from them with to_dict and from_dict.
+"""
+
+from array import array
+
+OBLIGATION_FIELDS = ('sam_estimate', 'sam_actual', 'usa_spending_actual')
+OUTLAY_FIELDS = ('outlay', 'obligation')
+OTHER_SPENDING_FIELDS = ('outlays',)
+TAX_EXPENDITURE_SPENDING_FIELDS = ('outlays', 'forgone_revenue')
+
+
+class YearlySeries:
+    """Amounts of a program for each fiscal year, stored by year and then by
+    field in one array, e.g., the sam_estimate, sam_actual and
+    usa_spending_actual obligations of each year. The tuples of years and
+    fields are shared by every series built for the same years."""
+
+    __slots__ = ('years', 'fields', 'values')
+
+    def __init__(self, years, fields, values):
+        self.years = years
+        self.fields = fields
+        self.values = array('d', values)
+
+    @classmethod
+    def from_list(cls, entries, fields, years=None):
+        """Returns the series of a list of yearly dicts, like
+        [{'x': '2024', 'outlay': 1.0, 'obligation': 2.0}]."""
+        if years is None:
+            years = tuple(entry['x'] for entry in entries)
+        return cls(years, fields,
+                   [float(entry[field]) for entry in entries
+                    for field in fields])
+
+    def get(self, year, field, default=0.0):
+        """Returns the amount of a field in a year, or default for years not
+        in the series. Raises KeyError for fields not in the series."""
+        if field not in self.fields:
+            raise KeyError(field)
+        try:
+            i = self.years.index(year)
+        except ValueError:
+            return default
+        return self.values[i * len(self.fields) + self.fields.index(field)]
+
+    def to_list(self):
+        """Returns the series as a list of yearly dicts."""
+        width = len(self.fields)
+        return [{'x': year,
+                 **dict(zip(self.fields, self.values[i * width:(i + 1) * width]))}
+                for i, year in enumerate(self.years)]
+
+    def __eq__(self, other):
+        return (isinstance(other, YearlySeries) and self.years == other.years
+                and self.fields == other.fields and self.values == other.values)
+
+    def __repr__(self):
+        return f"YearlySeries({self.to_list()!r})"
+
+
+def spending_fields(program_type):
+    """Returns the fields of the other program spending series of a program
+    type."""
+    if program_type == 'tax_expenditure':
+        return TAX_EXPENDITURE_SPENDING_FIELDS
+    return OTHER_SPENDING_FIELDS
+
+
+class ProgramRecord:
+    """The data of a program, as built by load.iter_program_data."""
+
+    __slots__ = (
+        'id',
+        'name',
+        'popular_name',
+        'objective',
+        'sam_url',
+        'usaspending_url',
+        'grants_url',
+        'top_agency_name',
+        'sub_agency_name',
+        'assistance_types',
+        'beneficiary_types',
+        'applicant_types',
+        'categories',
+        'obligations',
+        'other_program_spending',
+        'outlays',
+        'results',
+        'authorizations',
+        'program_type',
+        'is_subpart_f',
+        'rules_regulations',
+        'improper_payments',
+    )
+
+    # fields stored as tuples, and read as lists
+    LIST_FIELDS = ('assistance_types', 'beneficiary_types', 'applicant_types',
+                   'categories')
+    SERIES_FIELDS = ('obligations', 'other_program_spending', 'outlays')
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields[name])
+
+    @classmethod
+    def from_dict(cls, program):
+        """Returns the record of a program dict."""
+        fields = dict(program)
+        for name in cls.LIST_FIELDS:
+            fields[name] = tuple(fields[name])
+        if fields['obligations'] is not None:
+            fields['obligations'] = YearlySeries.from_list(
+                fields['obligations'], OBLIGATION_FIELDS)
+        if fields['outlays'] is not None:
+            fields['outlays'] = YearlySeries.from_list(
+                fields['outlays'], OUTLAY_FIELDS)
+        if fields['other_program_spending'] is not None:
+            fields['other_program_spending'] = YearlySeries.from_list(
+                fields['other_program_spending'],
+                spending_fields(fields['program_type']))
+        fields['results'] = tuple((result['year'], result['description'])
+                                  for result in fields['results'])
+        fields['authorizations'] = tuple((auth['text'], auth['url'])
+                                         for auth in fields['authorizations'])
+        fields['improper_payments'] = tuple(fields['improper_payments'])
+        return cls(**fields)
+
+    def __getitem__(self, name):
+        """Returns a field as it is in the program dicts."""
+        if name not in self.__slots__:
+            raise KeyError(name)
+        value = getattr(self, name)
+        if name in self.LIST_FIELDS or name == 'improper_payments':
+            return list(value)
+        if name in self.SERIES_FIELDS:
+            return value.to_list() if value is not None else None
+        if name == 'results':
+            return [{'year': year, 'description': description}
+                    for year, description in value]
+        if name == 'authorizations':
+            return [{'text': text, 'url': url} for text, url in value]
+        return value
+
+    def to_dict(self):
+        """Returns the program dict of the record."""
+        return {name: self[name] for name in self.__slots__}
+
+    def __eq__(self, other):
+        return isinstance(other, ProgramRecord) and all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__)
+
+    def __repr__(self):
+        return f"ProgramRecord(id={self.id!r}, name={self.name!r})"
@@ -0,0 +1,297 @@
+"""
+An in-memory rollup of program obligations by agency, category, subcategory,
+applicant type and program type, which the category pages are generated from.
+
+The relation between programs and these attributes is loaded from the
+database once into NumPy arrays: each dimension is a sorted list of (program,
+value) pairs, so that programs may have any number of values (e.g., several
+subcategories) or none. Sums and distinct counts grouped by any combination of
+dimensions are then computed with a handful of vectorized operations, instead
+of a query per category, subcategory and agency.
+"""
+
+import sqlite3
+import numpy as np
+
+import connections
+
+ASSISTANCE_LISTING = "assistance_listing"
+
+# one row per program, in the order of their ids
+PROGRAMS_SQL = """
+    SELECT
+        p.id,
+        p.name,
+        p.popular_name,
+        COALESCE(p.program_type, 'assistance_listing') as program_type,
+        NULLIF(a1.agency_name, '') as tier_1_agency,
+        NULLIF(a2.agency_name, '') as tier_2_agency
+    FROM program p
+    LEFT JOIN agency a ON p.agency_id = a.id
+    LEFT JOIN agency a1 ON a.tier_1_agency_id = a1.id
+    LEFT JOIN agency a2 ON a.tier_2_agency_id = a2.id
+    ORDER BY p.id
+    """
+
+CATEGORIES_SQL = """
+    SELECT id, name, parent_id
+    FROM category
+    WHERE type = 'category'
+    ORDER BY rowid
+    """
+
+PROGRAM_CATEGORIES_SQL = """
+    SELECT DISTINCT ptc.program_id, c.id as category_id, c.parent_id
+    FROM program_to_category ptc
+    JOIN category c ON ptc.category_id = c.id
+        AND ptc.category_type = c.type
+    WHERE ptc.category_type = 'category'
+    ORDER BY ptc.program_id, c.id
+    """
+
+PROGRAM_APPLICANT_TYPES_SQL = """
+    SELECT DISTINCT ptc.program_id, c.name
+    FROM program_to_category ptc
+    JOIN category c ON ptc.category_id = c.id
+        AND ptc.category_type = c.type
+    WHERE ptc.category_type = 'applicant'
+    AND c.name IS NOT NULL
+    ORDER BY ptc.program_id, c.name
+    """
+
+# SAM.gov obligations, actual and estimated, of each program and year; the
+# actual obligations are used where there are any
+SAM_OBLIGATIONS_SQL = """
+    SELECT program_id, fiscal_year, is_actual, SUM(amount) as amount
+    FROM program_sam_spending
+    WHERE fiscal_year IN ({placeholders})
+    AND is_actual IN (0, 1)
+    GROUP BY program_id, fiscal_year, is_actual
+    ORDER BY program_id, fiscal_year, is_actual
+    """
+
+OTHER_OBLIGATIONS_SQL = """
+    SELECT
+        program_id,
+        fiscal_year,
+        COALESCE(SUM(outlays), 0) + COALESCE(SUM(forgone_revenue), 0) as amount
+    FROM other_program_spending
+    WHERE fiscal_year IN ({placeholders})
+    GROUP BY program_id, fiscal_year
+    """
+
+
+class Dimension:
+    """The values of one attribute of programs, as (program, value) pairs
+    sorted by program and then by value. Values are stored as codes, which
+    index into labels."""
+
+    def __init__(self, name, labels, programs, values, num_programs):
+        self.name = name
+        self.labels = labels
+        self.index = {label: code for code, label in enumerate(labels)}
+        self.programs = programs
+        self.values = values
+        # the pairs of program i are offsets[i]:offsets[i + 1]
+        self.offsets = np.searchsorted(programs, np.arange(num_programs + 1))
+
+    @classmethod
+    def from_pairs(cls, name, pairs, program_index):
+        """Builds a dimension from (program id, label) pairs. Duplicates and
+        programs not in program_index are ignored."""
+        labels = []
+        codes = {}
+        programs = []
+        values = []
+        for program_id, label in pairs:
+            if program_id not in program_index:
+                continue
+            if label not in codes:
+                codes[label] = len(labels)
+                labels.append(label)
+            programs.append(program_index[program_id])
+            values.append(codes[label])
+
+        size = max(len(labels), 1)
+        keys = np.unique(np.array(programs, dtype=np.int64) * size
+                         + np.array(values, dtype=np.int64))
+        return cls(name, labels, (keys // size).astype(np.intp),
+                   (keys % size).astype(np.intp), len(program_index))
+
+    def __len__(self):
+        return len(self.labels)
+
+
+class RollupCube:
+    """Programs, their attributes and their obligations by fiscal year,
+    held in NumPy arrays. Group-by operations take a tuple of dimension names
+    and return an array with one axis per dimension, indexed by the codes of
+    each dimension's labels."""
+
+    def __init__(self, programs, dimensions, obligations, fiscal_years,
+                 categories=None):
+        self.programs = programs
+        self.program_ids = [program['id'] for program in programs]
+        self.dimensions = {dimension.name: dimension
+                           for dimension in dimensions}
+        self.fiscal_years = [str(year) for year in fiscal_years]
+        # obligations[i, j] is the obligations of program i in fiscal_years[j]
+        self.obligations = obligations
+        # the id, name and parent_id of each category, by id
+        self.categories = categories or {}
+
+    @classmethod
+    def from_database(cls, cursor: sqlite3.Cursor, fiscal_years):
+        """Loads the rollup of every program for the given fiscal years."""
+        fiscal_years = [str(year) for year in fiscal_years]
+        cursor.execute(PROGRAMS_SQL)
+        programs = [dict(row) for row in cursor.fetchall()]
+        program_index = {program['id']: i
+                         for i, program in enumerate(programs)}
+
+        cursor.execute(CATEGORIES_SQL)
+        categories = {}
+        for row in cursor.fetchall():
+            categories.setdefault(row['id'], dict(row))
+
+        # rows of the larger queries are read as tuples
+        rows = connections.tuple_cursor(cursor.connection)
+        rows.execute(PROGRAM_CATEGORIES_SQL)
+        category = connections.column_indexes(rows)
+        category_rows = rows.fetchall()
+        rows.execute(PROGRAM_APPLICANT_TYPES_SQL)
+        applicant = connections.column_indexes(rows)
+        applicant_rows = rows.fetchall()
+
+        dimensions = [
+            Dimension.from_pairs(
+                'program_type',
+                ((p['id'], p['program_type']) for p in programs),
+                program_index),
+            Dimension.from_pairs(
+                'agency', ((p['id'], p['tier_1_agency']) for p in programs),
+                program_index),
+            Dimension.from_pairs(
+                'sub_agency', ((p['id'], p['tier_2_agency']) for p in programs),
+                program_index),
+            Dimension.from_pairs(
+                'category',
+                ((row[category['program_id']], row[category['parent_id']])
+                 for row in category_rows
+                 if row[category['parent_id']] is not None),
+                program_index),
+            Dimension.from_pairs(
+                'subcategory',
+                ((row[category['program_id']], row[category['category_id']])
+                 for row in category_rows),
+                program_index),
+            Dimension.from_pairs(
+                'applicant_type',
+                ((row[applicant['program_id']], row[applicant['name']])
+                 for row in applicant_rows),
+                program_index)
+        ]
+
+        obligations = np.zeros((len(programs), len(fiscal_years)))
+        year_index = {year: j for j, year in enumerate(fiscal_years)}
+        assistance = {program['id'] for program in programs
+                      if program['program_type'] == ASSISTANCE_LISTING}
+        placeholders = ','.join('?' * len(fiscal_years))
+
+        # rows are ordered so that actual obligations replace estimated ones
+        rows.execute(SAM_OBLIGATIONS_SQL.format(placeholders=placeholders),
+                     fiscal_years)
+        column = connections.column_indexes(rows)
+        program_id, fiscal_year, amount = (
+            column['program_id'], column['fiscal_year'], column['amount'])
+        for row in rows.fetchall():
+            if row[program_id] in assistance:
+                obligations[program_index[row[program_id]],
+                            year_index[str(row[fiscal_year])]] = row[amount]
+
+        rows.execute(OTHER_OBLIGATIONS_SQL.format(placeholders=placeholders),
+                     fiscal_years)
+        column = connections.column_indexes(rows)
+        program_id, fiscal_year, amount = (
+            column['program_id'], column['fiscal_year'], column['amount'])
+        for row in rows.fetchall():
+            if (row[program_id] in program_index
+                    and row[program_id] not in assistance):
+                obligations[program_index[row[program_id]],
+                            year_index[str(row[fiscal_year])]] = row[amount]
+
+        return cls(programs, dimensions, obligations, fiscal_years,
+                   categories)
+
+    def program_obligations(self, fiscal_year):
+        """Returns the obligations of each program in a fiscal year: SAM.gov
+        obligations for assistance listings, and outlays plus forgone revenue
+        for other programs."""
+        return self.obligations[:, self.fiscal_years.index(str(fiscal_year))]
+
+    def mask(self, dimension, label=None):
+        """Returns a boolean array of the programs that have the given value
+        of a dimension, or any value if label is None."""
+        dimension = self.dimensions[dimension]
+        selected = np.zeros(len(self.programs), dtype=bool)
+        if label is None:
+            selected[dimension.programs] = True
+        elif label in dimension.index:
+            code = dimension.index[label]
+            selected[dimension.programs[dimension.values == code]] = True
+        return selected
+
+    def labels(self, dimension):
+        return self.dimensions[dimension].labels
+
+    def _pairs(self, by, where):
+        """Returns the program and combined group code of each (program,
+        group) pair for the given dimensions, in program order, along with
+        the shape of the groups."""
+        programs = np.arange(len(self.programs))
+        if where is not None:
+            programs = programs[where]
+        codes = np.zeros(len(programs), dtype=np.intp)
+        shape = ()
+        for name in by:
+            dimension = self.dimensions[name]
+            # repeat each pair once per value of its program's dimension
+            starts = dimension.offsets[programs]
+            counts = dimension.offsets[programs + 1] - starts
+            total = int(counts.sum())
+            ends = np.cumsum(counts)
+            positions = (np.repeat(starts - (ends - counts), counts)
+                         + np.arange(total))
+            programs = np.repeat(programs, counts)
+            codes = (np.repeat(codes, counts) * len(dimension)
+                     + dimension.values[positions])
+            shape += (len(dimension),)
+        return programs, codes, shape
+
+    def sum(self, values, by=(), where=None):
+        """Sums a per-program array by groups of the given dimensions. A
+        program with several values of a dimension counts towards each."""
+        programs, codes, shape = self._pairs(by, where)
+        size = int(np.prod(shape, dtype=np.intp))
+        return np.bincount(codes, weights=values[programs],
+                           minlength=size).reshape(shape)
+
+    def count(self, by=(), where=None):
+        """Counts the distinct programs in groups of the given dimensions."""
+        programs, codes, shape = self._pairs(by, where)
+        size = int(np.prod(shape, dtype=np.intp))
+        return np.bincount(codes, minlength=size).reshape(shape)
+
+    def count_distinct(self, dimension, by=(), where=None):
+        """Counts the distinct values of a dimension among the programs in
+        groups of the given dimensions. As with SQL's COUNT(DISTINCT), a
+        missing value (None) is not counted."""
+        size = max(len(self.dimensions[dimension]), 1)
+        programs, codes, shape = self._pairs(tuple(by) + (dimension,), where)
+        missing = self.dimensions[dimension].index.get(None)
+        if missing is not None:
+            codes = codes[codes % size != missing]
+        groups = np.unique(codes) // size
+        return np.bincount(groups, minlength=int(np.prod(shape[:-1],
+                                                         dtype=np.intp))
+                           ).reshape(shape[:-1])
@@ -0,0 +1,87 @@
+"""
+Writes documents as NDJSON shards (one JSON document per line) with a
+manifest, so that consumers like the indexer can stream documents instead of
+parsing one large JSON array, and can tell whether anything changed by reading
+only the manifest.
+
+The manifest lists the number of documents, the hash of each document by its
+key, each shard's size and checksum, and a version of the whole dataset, which
+only changes when a document is added, removed or changed. Documents are
+sharded in key order, a fixed number per shard, so a changed document only
+rewrites its own shard, but an added or removed document shifts the documents
+after it and rewrites its shard and every shard that follows.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+
+import sitefiles
+
+# number of documents per shard
+SHARD_SIZE = 500
+
+
+def document_line(document):
+    """Returns the NDJSON line of a document."""
+    return json.dumps(document, separators=(',', ':')) + '\n'
+
+
+def dataset_version(document_hashes):
+    """Returns the version of a dataset, given the hash of each document by
+    its key."""
+    digest = hashlib.sha256()
+    for key in sorted(document_hashes):
+        digest.update(f"{key}\0{document_hashes[key]}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+
+def write_shards(directory, name, documents, key, shard_size=SHARD_SIZE,
+                 presorted=False, **info):
+    """Writes documents to <name>-00000.ndjson, <name>-00001.ndjson, ... in a
+    directory, and their manifest to <name>.manifest.json, and removes shards
+    left over from larger datasets. Files are only rewritten when their
+    content changes. Documents that are presorted by key are written as they
+    are iterated, one shard at a time. Other keyword arguments (e.g.,
+    fiscal_year) are added to the manifest. Returns the manifest."""
+    if not presorted:
+        documents = sorted(documents, key=lambda document: document[key])
+    documents = iter(documents)
+    shards = sitefiles.GeneratedDirectory(directory, f"{name}-*.ndjson")
+    document_hashes = {}
+    shard_list = []
+
+    while True:
+        shard_documents = list(itertools.islice(documents, shard_size))
+        if not shard_documents:
+            break
+        lines = []
+        for document in shard_documents:
+            line = document_line(document)
+            document_hashes[document[key]] = \
+                sitefiles.content_hash(line.encode('utf-8'))
+            lines.append(line)
+        content = ''.join(lines)
+        filename = f"{name}-{len(shard_list):05d}.ndjson"
+        shards.write(filename, content)
+        data = content.encode('utf-8')
+        shard_list.append({
+            'path': filename,
+            'documents': len(lines),
+            'bytes': len(data),
+            'sha256': sitefiles.content_hash(data)
+        })
+    shards.prune()
+
+    manifest = {
+        'version': dataset_version(document_hashes),
+        **info,
+        'key': key,
+        'document_count': len(document_hashes),
+        'shards': shard_list,
+        'documents': document_hashes
+    }
+    sitefiles.write_if_changed(os.path.join(directory, f"{name}.manifest.json"),
+                               json.dumps(manifest, indent=2) + '\n')
+    return manifest
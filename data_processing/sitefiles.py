@@ -0,0 +1,146 @@
+"""
+Writes generated website files only when their content changes, so that
+unchanged pages keep their modification times (for Jekyll's incremental
+rebuilds) and do not show up in diffs, and removes pages that are no longer
+generated.
+"""
+
+import contextlib
+import glob
+import hashlib
+import os
+import frontmatter
+
+
+def content_hash(data):
+    """Returns the SHA-256 hex digest of the given bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_hash(path):
+    """Returns the SHA-256 hex digest of a file's contents, or None if the
+    file does not exist."""
+    try:
+        with open(path, "rb") as f:
+            return content_hash(f.read())
+    except FileNotFoundError:
+        return None
+
+
+def write_if_changed(path, content):
+    """Writes text to a file unless the file already has exactly that
+    content. Returns True if the file was written."""
+    return write_bytes_if_changed(path, content.encode("utf-8"))
+
+
+def write_bytes_if_changed(path, data):
+    """Writes bytes to a file unless the file already has exactly that
+    content. Returns True if the file was written."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        size = None
+    # a file of a different size cannot have the same content
+    if size == len(data) and file_hash(path) == content_hash(data):
+        return False
+    with replacing(path) as f:
+        f.write(data)
+    return True
+
+
+@contextlib.contextmanager
+def replacing(path):
+    """Opens a temporary file next to path for writing bytes, which replaces
+    the file at path once it is closed without error, so that readers (e.g.,
+    the indexer, or another process writing the same file) never see a partly
+    written file."""
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temporary_path, "wb") as f:
+            yield f
+        os.replace(temporary_path, path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temporary_path)
+        raise
+
+
+class GeneratedDirectory:
+    """The files generated into a directory during one run. Files are only
+    written when their content changed, and files matching the pattern that
+    were not generated (e.g., for programs that no longer exist, or whose
+    file name changed) can be pruned afterwards."""
+
+    def __init__(self, directory, pattern="*.md"):
+        self.directory = directory
+        self.pattern = pattern
+        self.generated = set()
+        self.written = 0
+        self.unchanged = 0
+        self.deleted = 0
+
+    def write(self, filename, content):
+        """Writes a file in the directory if its content changed."""
+        path = os.path.join(self.directory, filename)
+        self.generated.add(os.path.normcase(os.path.abspath(path)))
+        if write_if_changed(path, content):
+            self.written += 1
+        else:
+            self.unchanged += 1
+
+    def write_bytes(self, filename, data):
+        """Writes bytes to a file in the directory if its content changed."""
+        path = os.path.join(self.directory, filename)
+        self.generated.add(os.path.normcase(os.path.abspath(path)))
+        if write_bytes_if_changed(path, data):
+            self.written += 1
+        else:
+            self.unchanged += 1
+
+    def record(self, filename, written):
+        """Records a file of the directory that was written elsewhere, e.g.,
+        by a worker process, and whether it was changed."""
+        path = os.path.join(self.directory, filename)
+        self.generated.add(os.path.normcase(os.path.abspath(path)))
+        if written:
+            self.written += 1
+        else:
+            self.unchanged += 1
+
+    def merge(self, other):
+        """Adds the files generated into the same directory elsewhere, e.g.,
+        by a worker process that generated some of them, so that pruning
+        keeps them."""
+        self.generated |= other.generated
+        self.written += other.written
+        self.unchanged += other.unchanged
+        self.deleted += other.deleted
+
+    def keep(self, filename):
+        """Keeps a file of the directory without reading it, if it exists,
+        e.g., a file named after the hash of its content. Returns True if the
+        file exists."""
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            return False
+        self.generated.add(os.path.normcase(os.path.abspath(path)))
+        self.unchanged += 1
+        return True
+
+    def write_page(self, filename, data):
+        """Writes a markdown file with data as its front matter if its
+        content changed."""
+        self.write(filename, frontmatter.page(data))
+
+    def prune(self):
+        """Removes the files matching the pattern that were not generated
+        during this run."""
+        for path in sorted(glob.glob(os.path.join(self.directory,
+                                                  self.pattern))):
+            if os.path.normcase(os.path.abspath(path)) not in self.generated:
+                os.remove(path)
+                self.deleted += 1
+
+    def summary(self):
+        return (f"{self.written} written, {self.unchanged} unchanged, "
+                f"{self.deleted} deleted")
@@ -3,11 +3,17 @@ Transform extracted program information and store the transformed
 information in a SQLite database for generation of markdown files.
 """
 
+import argparse
 import csv
 import json
+import multiprocessing
 import os
+import shutil
 import sqlite3
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
 import constants
+import instrumentation
 import pandas as pd
 
 # temporary (large) database file paths
@@ -89,6 +95,19 @@ ATTACH_TEMPORARY_DB_TO_TRANSFORMED_DB_SQL = f"""
     ATTACH DATABASE '{TEMP_DB_DISK_DIRECTORY}{TEMP_DB_FILE_PATH}' AS temp_db;
     """
 
+ATTACH_SCRATCH_DB_SQL = """
+    ATTACH DATABASE ? AS scratch_db;
+    """
+
+DETACH_SCRATCH_DB_SQL = """
+    DETACH DATABASE scratch_db;
+    """
+
+SCRATCH_TABLE_SCHEMA_SQL = """
+    SELECT sql FROM scratch_db.sqlite_master
+    WHERE type = 'table' AND name = ?;
+    """
+
 AGENCY_DROP_TABLE_SQL = """
     DROP TABLE IF EXISTS agency;
     """
@@ -344,19 +363,61 @@ IMPROPER_PAYMENT_MAPPING_CREATE_TABLE_SQL = """
     );
 """
 
-# establish a database connection to store temporary working data
-temp_conn = sqlite3.connect(TEMP_DB_DISK_DIRECTORY + TEMP_DB_FILE_PATH)
-temp_cur = temp_conn.cursor()
-
-# establish a database connection to store transformed data that is used
-# in the load / generate stage
-conn = sqlite3.connect(TRANSFORMED_FILES_DIRECTORY + TRANSFORMED_DB_FILE_PATH)
-cur = conn.cursor()
-
-# attach the temporary database to the transformed database, to allow for
-# efficient transferring of data
-cur.execute(ATTACH_TEMPORARY_DB_TO_TRANSFORMED_DB_SQL)
-conn.commit()
+# database connections are opened lazily, on first use by a stage, so that
+# importing this module (e.g., in tests or the stage runner) does not touch
+# the disk; stages run in scratch databases point these at their own file
+temp_conn = None
+temp_cur = None
+conn = None
+cur = None
+temp_db_attached = False
+
+
+def open_temp_connection():
+    """Opens the connection to the temporary (large) database used to store
+    working USASpending.gov data, if it is not already open."""
+    global temp_conn, temp_cur
+    if temp_conn is None:
+        temp_conn = instrumentation.watch(
+            sqlite3.connect(TEMP_DB_DISK_DIRECTORY + TEMP_DB_FILE_PATH,
+                            factory=instrumentation.connection_class()))
+        temp_cur = temp_conn.cursor()
+    return temp_conn
+
+
+def open_connection(db_path=None):
+    """Opens the connection to the transformed database (or, for stages run
+    in isolation, a scratch database at `db_path`), if it is not already
+    open."""
+    global conn, cur
+    if conn is None:
+        conn = instrumentation.watch(
+            sqlite3.connect(db_path or TRANSFORMED_FILES_DIRECTORY
+                            + TRANSFORMED_DB_FILE_PATH,
+                            factory=instrumentation.connection_class()))
+        cur = conn.cursor()
+    return conn
+
+
+def attach_temp_db():
+    """Attaches the temporary database to the transformed database, to allow
+    for efficient transferring of data."""
+    global temp_db_attached
+    open_connection()
+    if not temp_db_attached:
+        cur.execute(ATTACH_TEMPORARY_DB_TO_TRANSFORMED_DB_SQL)
+        temp_db_attached = True
+
+
+def close_connections():
+    """Closes any open database connections."""
+    global temp_conn, temp_cur, conn, cur, temp_db_attached
+    if temp_conn is not None:
+        temp_conn.close()
+    if conn is not None:
+        conn.close()
+    temp_conn, temp_cur, conn, cur = None, None, None, None
+    temp_db_attached = False
 
 
 def convert_to_url_string(s):
@@ -367,6 +428,7 @@ def convert_to_url_string(s):
 def load_usaspending_initial_files():
     """Loads non-delta USASpending.gov CSV files into a SQLite Database for
     further transformation."""
+    open_temp_connection()
 
     # create assistance table for USASpending.gov data
     temp_cur.execute(USASPENDING_ASSISTANCE_DROP_TABLE_SQL)
@@ -388,7 +450,9 @@ def load_usaspending_initial_files():
                       + ASSISTANCE_EXTRACTED_FILES_DIRECTORY + file, "r",
                       encoding="latin-1") as f:
                 reader = csv.DictReader(f)
+                rows_read = 0
                 for r in reader:
+                    rows_read += 1
                     temp_cur.execute(USASPENDING_ASSISTANCE_INSERT_SQL, [
                         r["assistance_transaction_unique_key"],
                         r["assistance_award_unique_key"],
@@ -400,6 +464,7 @@ def load_usaspending_initial_files():
                         r["cfda_number"],
                         r["assistance_type_code"]
                     ])
+                instrumentation.record_rows(file, read=rows_read)
                 temp_conn.commit()
 
     # load contract data; the list is sorted to ensure files are processed
@@ -412,7 +477,9 @@ def load_usaspending_initial_files():
                       + CONTRACT_EXTRACTED_FILES_DIRECTORY
                       + file, "r", encoding="latin-1") as f:
                 reader = csv.DictReader(f)
+                rows_read = 0
                 for r in reader:
+                    rows_read += 1
                     temp_cur.execute(USASPENDING_CONTRACT_INSERT_SQL, [
                         r["contract_transaction_unique_key"],
                         r["contract_award_unique_key"],
@@ -429,12 +496,14 @@ def load_usaspending_initial_files():
                             + "performance_cd_current"],
                         r["award_type_code"]
                     ])
+                instrumentation.record_rows(file, read=rows_read)
                 temp_conn.commit()
 
 
 def load_usaspending_delta_files():
     """Loads delta USASpending.gov CSV files into a SQLite Database for
     further transformation."""
+    open_temp_connection()
     # load assistance data; the list is sorted to ensure files are processed
     # in chronological order
     for file in sorted(os.listdir(USASPENDING_DISK_DIRECTORY
@@ -445,7 +514,9 @@ def load_usaspending_delta_files():
                       + ASSISTANCE_DELTA_FILES_DIRECTORY
                       + file, "r", encoding="latin-1") as f:
                 reader = csv.DictReader(f)
+                rows_read = 0
                 for r in reader:
+                    rows_read += 1
                     temp_cur.execute(USASPENDING_ASSISTANCE_DELETE_SQL,
                                      [r["assistance_transaction_unique_key"]])
                     # if "C" (change) or "" (add), insert new DB row
@@ -461,6 +532,7 @@ def load_usaspending_delta_files():
                             r["cfda_number"],
                             r["assistance_type_code"],
                         ])
+                instrumentation.record_rows(file, read=rows_read)
                 temp_conn.commit()
 
     # load contract data; the list is sorted to ensure files are processed
@@ -473,7 +545,9 @@ def load_usaspending_delta_files():
                       + CONTRACT_DELTA_FILES_DIRECTORY
                       + file, "r", encoding="latin-1") as f:
                 reader = csv.DictReader(f)
+                rows_read = 0
                 for r in reader:
+                    rows_read += 1
                     temp_cur.execute(USASPENDING_CONTRACT_DELETE_SQL,
                                      [r["contract_transaction_unique_key"]])
                     temp_conn.commit()
@@ -495,12 +569,14 @@ def load_usaspending_delta_files():
                                 + "performance_cd_current"],
                             r["award_type_code"]
                         ])
+                instrumentation.record_rows(file, read=rows_read)
                 temp_conn.commit()
 
 
 def transform_and_insert_usaspending_aggregation_data():
     """Queries USASpending.gov data in the temporary database and inserts the
     results into the transformed database."""
+    attach_temp_db()
     cur.execute(USASPENDING_ASSISTANCE_OBLIGATION_AGGEGATION_DROP_TABLE_SQL)
     cur.execute(USASPENDING_ASSISTANCE_OBLIGATION_AGGEGATION_CREATE_TABLE_SQL)
     cur.execute(
@@ -516,12 +592,16 @@ def transform_and_insert_usaspending_aggregation_data():
 def load_agency():
     """Transforms the SAM.gov agency data and inserts the cleaned data into
     the transformed database."""
+    open_connection()
     cur.execute(AGENCY_DROP_TABLE_SQL)
     cur.execute(AGENCY_CREATE_TABLE_SQL)
     conn.commit()
     with open(REPO_DISK_DIRECTORY + EXTRACTED_FILES_DIRECTORY
               + "organizations.json", encoding="utf-8") as f:
-        for o in json.load(f):
+        organizations = json.load(f)
+        instrumentation.record_rows("organizations.json",
+                                    read=len(organizations))
+        for o in organizations:
             name = o.get("agencyName", o["name"])
             if name in constants.AGENCY_DISPLAY_NAMES:
                 name = constants.AGENCY_DISPLAY_NAMES[name]
@@ -535,11 +615,14 @@ def load_agency():
 def load_sam_category():
     """Transforms the SAM.gov assistance type, applicant type, and beneficiary
     type data and inserts the cleaned data into the transformed database."""
+    open_connection()
     cur.execute(CATEGORY_DROP_TABLE_SQL)
     cur.execute(CATEGORY_CREATE_TABLE_SQL)
     with open(REPO_DISK_DIRECTORY + EXTRACTED_FILES_DIRECTORY
               + "dictionary.json", encoding="utf-8") as f:
-        for i in json.load(f)["_embedded"]["jSONObjectList"]:
+        dictionary = json.load(f)["_embedded"]["jSONObjectList"]
+        instrumentation.record_rows("dictionary.json", read=len(dictionary))
+        for i in dictionary:
             if i["id"] == "assistance_type":
                 for e in i["elements"]:
                     e["value"] = constants.ASSISTANCE_TYPE_DISPLAY_NAMES[
@@ -564,6 +647,7 @@ def load_sam_category():
 def load_sam_programs():
     """Transforms the SAM.gov assistance listing data and inserts the cleaned
     data into the transformed database."""
+    open_connection()
     cur.execute(PROGRAM_DROP_TABLE_SQL)
     cur.execute(PROGRAM_CREATE_TABLE_SQL)
     cur.execute(PROGRAM_AUTHORIZATION_DROP_TABLE_SQL)
@@ -580,7 +664,10 @@ def load_sam_programs():
         usaspending_hashes = json.load(f)
     with open(REPO_DISK_DIRECTORY + EXTRACTED_FILES_DIRECTORY
               + "assistance-listings.json", encoding="utf-8") as f:
-        for listing in json.load(f):
+        listings = json.load(f)
+        instrumentation.record_rows("assistance-listings.json",
+                                    read=len(listings))
+        for listing in listings:
             d = listing["data"]
             # if the program has an alternative "popular name"
             popular_name = None
@@ -768,6 +855,7 @@ def load_sam_programs():
 # load category and sub-category values, including program mapping,
 # from CSV exported from SAM.gov PDF
 def load_category_and_sub_category():
+    open_connection()
     category_insert_sql = "INSERT INTO category VALUES (?, ?, ?, ?)"
     program_to_category_insert_sql = """INSERT INTO program_to_category
                                      VALUES (?, ?, ?)"""
@@ -776,10 +864,14 @@ def load_category_and_sub_category():
     programs_to_sub_categories = set()
     with open(REPO_DISK_DIRECTORY + EXTRACTED_FILES_DIRECTORY
               + "program-to-function-sub-function.csv", encoding="utf-8") as f:
+        rows_read = 0
         for row in csv.reader(f):
+            rows_read += 1
             categories.add(row[1])
             sub_categories.add((row[1], row[2]))
             programs_to_sub_categories.add((row[0], row[1], row[2]))
+        instrumentation.record_rows("program-to-function-sub-function.csv",
+                                    read=rows_read)
         for c in categories:
             cur.execute(category_insert_sql, [convert_to_url_string(c),
                         "category", c, None])
@@ -798,10 +890,12 @@ def load_additional_programs():
         print(f"{ADDITIONAL_PROGRAMS_DATA_PATH} - Not Found")
         return
 
+    open_connection()
     cur.execute(OTHER_PROGRAM_SPENDING_DROP_TABLE_SQL)
     cur.execute(OTHER_PROGRAM_SPENDING_CREATE_TABLE_SQL)
 
     df = pd.read_csv(ADDITIONAL_PROGRAMS_DATA_PATH)
+    instrumentation.record_rows("additional-programs.csv", read=len(df))
     # Strip whitespace from all string columns
     df = df.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
     df = df.rename(columns={
@@ -971,6 +1065,7 @@ def load_additional_programs():
 
 def load_improper_payment_mapping():
     """Loads improper payment mapping data from CSV into the database."""
+    open_connection()
     cur.execute(IMPROPER_PAYMENT_MAPPING_DROP_TABLE_SQL)
     cur.execute(IMPROPER_PAYMENT_MAPPING_CREATE_TABLE_SQL)
     
@@ -981,6 +1076,8 @@ def load_improper_payment_mapping():
         return
         
     df = pd.read_csv(file_path)
+    instrumentation.record_rows("improper-payment-program-mapping.csv",
+                                read=len(df))
     
     # Strip whitespace from column names
     df.columns = df.columns.str.strip()
@@ -1014,17 +1111,239 @@ def load_improper_payment_mapping():
     conn.commit()
     print("Successfully loaded improper payment mapping data")
 
-# uncomment the necessary functions to database with data
-#
-# load_usaspending_initial_files()
-# load_usaspending_delta_files()
-# transform_and_insert_usaspending_aggregation_data()
-# load_agency()
-# load_sam_category()
-# load_sam_programs()
-# load_category_and_sub_category()
-# load_additional_programs()
-# load_improper_payment_mapping()
-
-# close the db connection
-conn.close()
+
+
+# stage graph used by the transform runner; "depends_on" lists the stages
+# whose tables must be populated before a stage can run, and "tables" lists
+# the tables a stage (re)creates. Stages marked "isolated" read only
+# extracted files (or the temporary database) and create every table they
+# write, so several of them can run concurrently in separate scratch
+# databases whose tables are then merged into the transformed database.
+TRANSFORM_STAGES = {
+    "load_usaspending_initial_files": {
+        "function": load_usaspending_initial_files,
+        "depends_on": [],
+        "tables": [],
+        "isolated": False
+    },
+    "load_usaspending_delta_files": {
+        "function": load_usaspending_delta_files,
+        "depends_on": ["load_usaspending_initial_files"],
+        "tables": [],
+        "isolated": False
+    },
+    "transform_and_insert_usaspending_aggregation_data": {
+        "function": transform_and_insert_usaspending_aggregation_data,
+        "depends_on": ["load_usaspending_delta_files"],
+        "tables": ["usaspending_assistance_obligation_aggregation",
+                   "usaspending_assistance_outlay_aggregation"],
+        "isolated": True
+    },
+    "load_agency": {
+        "function": load_agency,
+        "depends_on": [],
+        "tables": ["agency"],
+        "isolated": True
+    },
+    "load_sam_category": {
+        "function": load_sam_category,
+        "depends_on": [],
+        "tables": ["category"],
+        "isolated": True
+    },
+    "load_sam_programs": {
+        "function": load_sam_programs,
+        "depends_on": [],
+        "tables": ["program", "program_authorization", "program_result",
+                   "program_sam_spending", "program_to_category"],
+        "isolated": True
+    },
+    "load_category_and_sub_category": {
+        "function": load_category_and_sub_category,
+        "depends_on": ["load_sam_category", "load_sam_programs"],
+        "tables": [],
+        "isolated": False
+    },
+    "load_additional_programs": {
+        "function": load_additional_programs,
+        "depends_on": ["load_agency", "load_sam_category",
+                       "load_sam_programs"],
+        "tables": ["other_program_spending"],
+        "isolated": False
+    },
+    "load_improper_payment_mapping": {
+        "function": load_improper_payment_mapping,
+        "depends_on": [],
+        "tables": ["improper_payment_mapping"],
+        "isolated": True
+    }
+}
+
+# stages run when none are selected on the command line; the USASpending.gov
+# stages require the (very large) award data archives and must be requested
+# explicitly
+DEFAULT_STAGES = [
+    "load_agency",
+    "load_sam_category",
+    "load_sam_programs",
+    "load_category_and_sub_category",
+    "load_additional_programs",
+    "load_improper_payment_mapping"
+]
+
+
+def resolve_stages(stage_names, include_dependencies=False):
+    """Returns the selected stages, and optionally all of their upstream
+    stages, in the order they are declared in the stage graph."""
+    selected = set()
+    pending = list(stage_names)
+    while pending:
+        name = pending.pop()
+        if name not in TRANSFORM_STAGES:
+            raise ValueError(f"Unknown transform stage: {name}")
+        if name in selected:
+            continue
+        selected.add(name)
+        if include_dependencies:
+            pending.extend(TRANSFORM_STAGES[name]["depends_on"])
+    return [name for name in TRANSFORM_STAGES if name in selected]
+
+
+def plan_waves(stage_names):
+    """Groups the selected stages into waves; every stage in a wave depends
+    only on stages in earlier waves (or on stages that were not selected,
+    whose tables are assumed to already be populated)."""
+    remaining = list(stage_names)
+    completed = set()
+    waves = []
+    while remaining:
+        wave = [name for name in remaining
+                if all(d in completed or d not in remaining
+                       for d in TRANSFORM_STAGES[name]["depends_on"])]
+        if not wave:
+            raise ValueError("Transform stage graph contains a cycle: "
+                             + ", ".join(remaining))
+        waves.append(wave)
+        completed.update(wave)
+        remaining = [name for name in remaining if name not in wave]
+    return waves
+
+
+def merge_scratch_database(scratch_path, tables):
+    """Copies the given tables from a scratch database into the transformed
+    database, replacing any existing copies of those tables."""
+    open_connection()
+    cur.execute(ATTACH_SCRATCH_DB_SQL, [scratch_path])
+    for table in tables:
+        cur.execute(SCRATCH_TABLE_SCHEMA_SQL, [table])
+        row = cur.fetchone()
+        if row is None:
+            continue
+        cur.execute(f"DROP TABLE IF EXISTS main.{table};")
+        cur.execute(row[0])
+        cur.execute(f"INSERT INTO main.{table} SELECT * FROM scratch_db.{table};")
+    conn.commit()
+    cur.execute(DETACH_SCRATCH_DB_SQL)
+
+
+def run_stage_in_scratch_database(name, scratch_path, instrument=False):
+    """Runs an isolated stage, in a worker process, against its own scratch
+    database. Returns the stage's name, its instrumentation records, and its
+    SQL profile, if any."""
+    run = instrumentation.start_run("transform") if instrument else None
+    open_connection(scratch_path)
+    try:
+        with instrumentation.stage(name):
+            TRANSFORM_STAGES[name]["function"]()
+    finally:
+        close_connections()
+    return (name, run.stages if run else [],
+            run.sql_profile if run else None)
+
+
+def run_stages(stage_names, workers=None):
+    """Runs the selected stages in dependency order. Within each wave,
+    isolated stages run concurrently in scratch databases (which are then
+    merged into the transformed database) and the remaining stages run one
+    after another against the transformed database."""
+    workers = workers or os.cpu_count() or 1
+    for wave in plan_waves(stage_names):
+        isolated = [n for n in wave if TRANSFORM_STAGES[n]["isolated"]]
+        in_place = [n for n in wave if not TRANSFORM_STAGES[n]["isolated"]]
+        if len(isolated) > 1 and workers > 1:
+            scratch_dir = tempfile.mkdtemp(prefix="scratch-",
+                                           dir=TRANSFORMED_FILES_DIRECTORY)
+            try:
+                scratch_paths = {n: os.path.join(scratch_dir, n + ".db")
+                                 for n in isolated}
+                # worker processes are spawned, rather than forked, so that
+                # no open SQLite handle is ever shared with a child process
+                with ProcessPoolExecutor(
+                        max_workers=min(workers, len(isolated)),
+                        mp_context=multiprocessing.get_context("spawn")
+                        ) as executor:
+                    futures = [executor.submit(
+                                   run_stage_in_scratch_database, n,
+                                   scratch_paths[n],
+                                   instrumentation.current_run() is not None)
+                               for n in isolated]
+                    for future in futures:
+                        name, stages, sql_profile = future.result()
+                        instrumentation.add_stages(stages, sql_profile)
+                        print(name + " Complete")
+                for n in isolated:
+                    with instrumentation.stage(n + " (merge)"):
+                        merge_scratch_database(scratch_paths[n],
+                                               TRANSFORM_STAGES[n]["tables"])
+            finally:
+                shutil.rmtree(scratch_dir, ignore_errors=True)
+        else:
+            in_place = isolated + in_place
+        for n in in_place:
+            with instrumentation.stage(n):
+                TRANSFORM_STAGES[n]["function"]()
+            print(n + " Complete")
+
+
+def main(argv=None):
+    """Runs the transform stages selected on the command line."""
+    parser = argparse.ArgumentParser(
+        description="Transforms extracted data into the transformed database.")
+    parser.add_argument("stages", nargs="*", metavar="stage",
+                        help="stages to run (default: "
+                             + ", ".join(DEFAULT_STAGES) + ")")
+    parser.add_argument("--with-dependencies", action="store_true",
+                        help="also run every upstream stage of the selection")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="maximum number of stages to run concurrently")
+    parser.add_argument("--profile-sql", action="store_true",
+                        help="profile the SQL statements of the run, and "
+                             "report the slowest ones")
+    parser.add_argument("--list", action="store_true",
+                        help="list the available stages and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, stage in TRANSFORM_STAGES.items():
+            print(name + (" (depends on: " + ", ".join(stage["depends_on"])
+                          + ")" if stage["depends_on"] else ""))
+        return
+
+    try:
+        stage_names = resolve_stages(args.stages or DEFAULT_STAGES,
+                                     args.with_dependencies)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.profile_sql:
+        # set in the environment, so that worker processes profile too
+        os.environ[instrumentation.PROFILE_SQL_VARIABLE] = "1"
+    instrumentation.start_run("transform")
+    try:
+        run_stages(stage_names, args.workers)
+    finally:
+        close_connections()
+        instrumentation.finish_run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,7 @@
+from contextlib import contextmanager
 from elasticsearch import Elasticsearch, helpers
+import glob
+import hashlib
 import json
 import logging
 import time
@@ -15,151 +18,117 @@ ES_PORT = int(os.getenv("ES_PORT", "9200"))
 ES_SCHEME = os.getenv("ES_SCHEME", "http")
 ES_BASE = f"{ES_SCHEME}://{ES_HOST}:{ES_PORT}"
 
-# Wait until elasticsearch service is live
-status_code = 0
-while status_code != 200:
-    try:
-        r = requests.get(ES_BASE, timeout=5)
-        status_code = r.status_code
-        if status_code != 200:
-            print(f"Elasticsearch returned {status_code}; waiting 5 seconds.")
-            time.sleep(5)
-    except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
-        print("Elasticsearch service not available; waiting 5 seconds.")
-        time.sleep(5)
-
-# Elasticsearch client connected to the service
+# Elasticsearch client of the service, which connects on first use
 es = Elasticsearch(hosts=[ES_BASE])
 
-
-def delete_index(index_name):
-    """Delete index if it exists"""
-    try:
-        if es.indices.exists(index=index_name):
-            logger.info(f"Deleting existing index '{index_name}'")
-            es.indices.delete(index=index_name)
-            logger.info(f"Successfully deleted index '{index_name}'")
-            time.sleep(10)  # wait 10 seconds after deletion to proceed
-            return True
-        else:
-            logger.info(f"Index { index_name } does not exist, no need to \
-                          delete.")
-            return False
-    except Exception as e:
-        logger.error(f"Error deleting index: {str(e)}")
-        raise
-
-
-def create_index_with_mapping(index_name):
-    """Create new index with mapping"""
-    mapping = {
-        "settings": {
-            "index": {
-                "query": {
-                    "default_field": ["title", "objectives", "cfda",
-                                      "popularName"]
-                }
+# Settings and mapping of the programs index
+INDEX_MAPPING = {
+    "settings": {
+        "index": {
+            "query": {
+                "default_field": ["title", "objectives", "cfda",
+                                  "popularName"]
             }
-        },
-        "mappings": {
-            "dynamic": "strict",  # Prevent automatic field creation
-            "properties": {
-                "cfda": {
-                    "type": "text",
-                    "analyzer": "english",  # Add stemming
-                    "fields": {
-                        "keyword": {
-                            "type": "keyword"
-                        }
+        }
+    },
+    "mappings": {
+        "dynamic": "strict",  # Prevent automatic field creation
+        "properties": {
+            "cfda": {
+                "type": "text",
+                "analyzer": "english",  # Add stemming
+                "fields": {
+                    "keyword": {
+                        "type": "keyword"
                     }
-                },
-                "title": {
-                    "type": "text",
-                    "analyzer": "english",  # Add stemming
-                    "fields": {
-                        "keyword": {
-                            "type": "keyword"
-                        }
+                }
+            },
+            "title": {
+                "type": "text",
+                "analyzer": "english",  # Add stemming
+                "fields": {
+                    "keyword": {
+                        "type": "keyword"
                     }
-                },
-                "agency": {
-                    "type": "nested",
-                    "properties": {
-                        "title": {
-                            "type": "text",
-                            "fields": {
-                                "keyword": {
-                                    "type": "keyword"
-                                }
+                }
+            },
+            "agency": {
+                "type": "nested",
+                "properties": {
+                    "title": {
+                        "type": "text",
+                        "fields": {
+                            "keyword": {
+                                "type": "keyword"
                             }
-                        },
-                        "subAgency": {
-                            "type": "nested",
-                            "properties": {
-                                "title": {
-                                    "type": "text",
-                                    "fields": {
-                                        "keyword": {
-                                            "type": "keyword"
-                                        }
+                        }
+                    },
+                    "subAgency": {
+                        "type": "nested",
+                        "properties": {
+                            "title": {
+                                "type": "text",
+                                "fields": {
+                                    "keyword": {
+                                        "type": "keyword"
                                     }
                                 }
                             }
                         }
                     }
-                },
-                "obligations": {
-                    "type": "float"
-                },
-                "objectives": {
-                    "type": "text",
-                    "analyzer": "english",  # Add stemming
-                    "fields": {
-                        "keyword": {
-                            "type": "keyword"
-                        }
+                }
+            },
+            "obligations": {
+                "type": "float"
+            },
+            "objectives": {
+                "type": "text",
+                "analyzer": "english",  # Add stemming
+                "fields": {
+                    "keyword": {
+                        "type": "keyword"
                     }
-                },
-                "popularName": {
-                    "type": "text",
-                    "analyzer": "english",  # Add stemming
-                    "fields": {
-                        "keyword": {
-                            "type": "keyword"
-                        }
+                }
+            },
+            "popularName": {
+                "type": "text",
+                "analyzer": "english",  # Add stemming
+                "fields": {
+                    "keyword": {
+                        "type": "keyword"
                     }
-                },
-                "permalink": {
-                    "type": "text",
-                    "index": False
-                },
-                "assistanceTypes": {
-                    "type": "keyword"
-                },
-                "applicantTypes": {
-                    "type": "keyword",
-                    "index": True
-                },
-                "categories": {
-                    "type": "nested",
-                    "properties": {
-                        "title": {
-                            "type": "text",
-                            "fields": {
-                                "keyword": {
-                                    "type": "keyword"
-                                }
+                }
+            },
+            "permalink": {
+                "type": "text",
+                "index": False
+            },
+            "assistanceTypes": {
+                "type": "keyword"
+            },
+            "applicantTypes": {
+                "type": "keyword",
+                "index": True
+            },
+            "categories": {
+                "type": "nested",
+                "properties": {
+                    "title": {
+                        "type": "text",
+                        "fields": {
+                            "keyword": {
+                                "type": "keyword"
                             }
-                        },
-                        "subCategory": {
-                            "type": "nested",
-                            "properties": {
-                                "title": {
-                                    "type": "text",
-                                    "fields": {
-                                        "keyword": {
-                                            "type": "keyword"
-                                        }
+                        }
+                    },
+                    "subCategory": {
+                        "type": "nested",
+                        "properties": {
+                            "title": {
+                                "type": "text",
+                                "fields": {
+                                    "keyword": {
+                                        "type": "keyword"
                                     }
                                 }
                             }
@@ -169,6 +138,85 @@ def create_index_with_mapping(index_name):
             }
         }
     }
+}
+
+# Full rebuilds are loaded into a new versioned index (e.g.,
+# programs_v20250101120000), which replaces the live index behind the alias
+# that the API queries once it is verified, so searches never see an empty or
+# partial index
+VERSION_SEPARATOR = "_v"
+# previous versions kept after a swap, to roll back to
+KEEP_PREVIOUS_VERSIONS = 1
+# replicas of the live index (indexes are bulk loaded without replicas)
+INDEX_REPLICAS = int(os.getenv("ES_REPLICAS", "1"))
+# time to wait for them to recover after a bulk load; a single node cluster
+# never allocates replicas, and needs ES_REPLICAS=0
+REPLICAS_TIMEOUT = os.getenv("ES_REPLICAS_TIMEOUT", "5m")
+
+# Bulk loading: documents are sent in chunks of at most BULK_CHUNK_SIZE
+# documents and BULK_MAX_CHUNK_BYTES bytes, over BULK_THREADS threads.
+# Documents rejected because the cluster is busy (429) are sent again up to
+# BULK_MAX_RETRIES times, waiting BULK_INITIAL_BACKOFF seconds the first time
+# and twice as long each time after that, up to BULK_MAX_BACKOFF.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "500"))
+BULK_MAX_CHUNK_BYTES = int(os.getenv("BULK_MAX_CHUNK_BYTES",
+                                     str(10 * 1024 * 1024)))
+BULK_THREADS = int(os.getenv("BULK_THREADS", "2"))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "5"))
+BULK_INITIAL_BACKOFF = 2
+BULK_MAX_BACKOFF = 60
+
+# Side index of each version that stores the content hash of each indexed
+# program, by the program's id (e.g., programs_v20250101120000_content_hashes).
+# It is kept out of the programs index, whose mapping is strict and whose
+# documents are returned by the API as they are.
+# The version of the manifest it was last synced with is kept in its _meta.
+HASH_INDEX_SUFFIX = "_content_hashes"
+HASH_MAPPING = {
+    "mappings": {
+        "dynamic": "strict",
+        "properties": {
+            "hash": {
+                "type": "keyword",
+                "index": False
+            }
+        }
+    }
+}
+
+
+def wait_for_elasticsearch():
+    """Wait until elasticsearch service is live"""
+    status_code = 0
+    while status_code != 200:
+        try:
+            r = requests.get(ES_BASE, timeout=5)
+            status_code = r.status_code
+            if status_code != 200:
+                print(f"Elasticsearch returned {status_code}; waiting 5 seconds.")
+                time.sleep(5)
+        except (requests.exceptions.ConnectionError, requests.exceptions.ReadTimeout):
+            print("Elasticsearch service not available; waiting 5 seconds.")
+            time.sleep(5)
+
+
+def mapping_hash():
+    """Hash of the index settings and mapping, stored in the _meta of each
+    version, to tell when the live index was built from an older mapping"""
+    content = json.dumps(INDEX_MAPPING, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def create_index_with_mapping(index_name):
+    """Create new index with mapping"""
+    mapping = {
+        "settings": {
+            "index": {**INDEX_MAPPING["settings"]["index"],
+                      "number_of_replicas": INDEX_REPLICAS}
+        },
+        "mappings": {**INDEX_MAPPING["mappings"],
+                     "_meta": {"mapping_hash": mapping_hash()}}
+    }
 
     try:
         logger.info(f"Creating new index '{index_name}' with mapping")
@@ -184,29 +232,133 @@ def create_index_with_mapping(index_name):
         raise
 
 
-def load_data(json_file, index_name):
-    """Load data into index"""
+def read_manifest(json_file):
+    """The manifest that load.py writes next to the JSON file (e.g.,
+    programs-table.manifest.json), with the version of the programs and the
+    hash of each one by id, or None if there is none"""
+    manifest_file = os.path.splitext(json_file)[0] + ".manifest.json"
     try:
-        # Read JSON file
+        with open(manifest_file, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def read_programs(json_file):
+    """
+    Yield the programs of the JSON file one at a time. When the NDJSON shards
+    that load.py writes next to it are there (e.g., programs-table-00000.ndjson,
+    listed in programs-table.manifest.json), programs are streamed from the
+    shards, a line at a time, instead of parsing the whole JSON array.
+    """
+    directory = os.path.dirname(json_file)
+    manifest = read_manifest(json_file)
+    if manifest is None:
         with open(json_file, 'r') as f:
-            programs = json.load(f)
+            yield from json.load(f)
+        return
 
-        logger.info(f"Loaded {len(programs)} programs from {json_file}")
+    for shard in manifest['shards']:
+        with open(os.path.join(directory, shard['path']), 'r') as f:
+            for line in f:
+                yield json.loads(line)
 
-        # Prepare bulk actions
-        actions = []
-        for program in programs:
-            action = {
+
+def index_actions(json_file, index_name, ids=None):
+    """Bulk actions that index the programs of the JSON file, or only the
+    programs whose ids are in ids"""
+    for program in read_programs(json_file):
+        if ids is None or program['cfda'] in ids:
+            yield {
                 "_op_type": "index",
                 "_index": index_name,
                 "_id": program['cfda'],
                 "_source": program
             }
-            actions.append(action)
 
-        # Perform bulk indexing
-        success, failed = helpers.bulk(es, actions, stats_only=True)
-        logger.info(f"Bulk indexing completed: {success} succeeded, {failed} failed")
+
+def bulk_results(actions):
+    """Send bulk actions in chunks, over BULK_THREADS threads, and yield the
+    (ok, item) result of each action"""
+    options = {"chunk_size": BULK_CHUNK_SIZE,
+               "max_chunk_bytes": BULK_MAX_CHUNK_BYTES,
+               "raise_on_error": False,
+               "raise_on_exception": False}
+    if BULK_THREADS > 1:
+        return helpers.parallel_bulk(es, actions, thread_count=BULK_THREADS,
+                                     **options)
+    return helpers.streaming_bulk(es, actions, **options)
+
+
+@contextmanager
+def bulk_load_settings(index_name):
+    """Turn off the refreshes and replicas of an index while it is bulk
+    loaded, and restore its previous settings afterwards"""
+    response = es.indices.get_settings(index=index_name)
+    settings = next(iter(response.values()))['settings']['index']
+    previous = {
+        # None is the default refresh interval
+        "refresh_interval": settings.get('refresh_interval'),
+        "number_of_replicas": settings.get('number_of_replicas',
+                                           INDEX_REPLICAS)
+    }
+    es.indices.put_settings(index=index_name, settings={
+        "index": {"refresh_interval": "-1", "number_of_replicas": 0}
+    })
+    try:
+        yield
+    finally:
+        es.indices.put_settings(index=index_name,
+                                settings={"index": previous})
+
+
+def bulk_with_retries(actions):
+    """
+    Send the bulk actions that actions(ids) yields through bulk_results, with
+    ids None the first time, and then the ids of the documents rejected
+    because the cluster is busy (429), which are sent again with backoff.
+    Deleting a document that does not exist is not an error. Returns the ids
+    of the documents that succeeded and of those that failed.
+    """
+    succeeded, failed = set(), set()
+    # ids of the documents left to send, after the first attempt
+    ids = None
+    for attempt in range(BULK_MAX_RETRIES + 1):
+        if attempt:
+            backoff = min(BULK_INITIAL_BACKOFF * 2 ** (attempt - 1),
+                          BULK_MAX_BACKOFF)
+            logger.warning(f"{len(ids)} programs rejected; retrying "
+                           f"in {backoff} seconds")
+            time.sleep(backoff)
+        rejected = set()
+        for ok, item in bulk_results(actions(ids)):
+            op_type, result = next(iter(item.items()))
+            if ok or (op_type == "delete" and result.get('status') == 404):
+                succeeded.add(result['_id'])
+            elif result.get('status') == 429:
+                rejected.add(result['_id'])
+            else:
+                failed.add(result['_id'])
+                logger.error(f"Bulk operation failed: {item}")
+        if not rejected:
+            break
+        ids = rejected
+    return succeeded, failed | rejected
+
+
+def load_data(json_file, index_name):
+    """
+    Load data into index, streaming the programs of the JSON file in chunks
+    (see read_programs and bulk_with_retries). Programs rejected because the
+    cluster is busy are retried with backoff. Returns the number of documents
+    in the index.
+    """
+    try:
+        with bulk_load_settings(index_name):
+            indexed, failed = bulk_with_retries(
+                lambda ids: index_actions(json_file, index_name, ids))
+        logger.info(f"Bulk indexing completed: {len(indexed)} succeeded, "
+                    f"{len(failed)} failed")
 
         # Refresh index to make documents searchable immediately
         es.indices.refresh(index=index_name)
@@ -221,6 +373,283 @@ def load_data(json_file, index_name):
         raise
 
 
+def document_hash(program):
+    """Content hash of a program document: the hash of its NDJSON line, as
+    listed in the manifest"""
+    line = json.dumps(program, separators=(',', ':')) + '\n'
+    return hashlib.sha256(line.encode('utf-8')).hexdigest()
+
+
+def file_hashes(json_file, manifest):
+    """Content hashes of the programs of the JSON file, by id: those listed
+    in its manifest, or else those of the programs read from the file"""
+    if manifest is not None:
+        return manifest['documents']
+    return {program['cfda']: document_hash(program)
+            for program in read_programs(json_file)}
+
+
+def hash_index_name(index_name):
+    return index_name + HASH_INDEX_SUFFIX
+
+
+def live_index(alias):
+    """Name of the index behind the alias, or None if there is none"""
+    if es.indices.exists_alias(name=alias):
+        return next(iter(es.indices.get_alias(name=alias)))
+    if es.indices.exists(index=alias):
+        # an index created before versions were swapped behind the alias
+        return alias
+    return None
+
+
+def get_indexed_hashes(index_name):
+    """Content hashes of the programs of an index, by id, from its side
+    index"""
+    hash_index = hash_index_name(index_name)
+    if not es.indices.exists(index=hash_index):
+        logger.info(f"Creating content hash index '{hash_index}'")
+        es.indices.create(index=hash_index, body=HASH_MAPPING)
+        return {}
+    return {hit['_id']: hit['_source']['hash']
+            for hit in helpers.scan(es, index=hash_index,
+                                    query={"query": {"match_all": {}}})}
+
+
+def synced_version(hash_index):
+    """Version of the manifest the index was last synced with, from the _meta
+    of its hash index, or None"""
+    if not es.indices.exists(index=hash_index):
+        return None
+    mapping = es.indices.get_mapping(index=hash_index)[hash_index]['mappings']
+    return mapping.get('_meta', {}).get('manifest_version')
+
+
+def record_synced_version(hash_index, version):
+    """Record the version of the manifest the index is synced with"""
+    if version is not None:
+        es.indices.put_mapping(index=hash_index,
+                               meta={"manifest_version": version})
+
+
+def diff_programs(hashes, indexed_hashes):
+    """
+    Compare the content hashes of the programs of the JSON file, by id, with
+    those recorded for the index. Returns the hashes of the programs to upsert
+    (new or changed), by id, and the ids of the programs to delete.
+    """
+    changed = {id: hash for id, hash in hashes.items()
+               if indexed_hashes.get(id) != hash}
+    removed = sorted(set(indexed_hashes) - set(hashes))
+    return changed, removed
+
+
+def delete_actions(index_name, ids):
+    """Bulk actions that delete the documents of the ids"""
+    for id in ids:
+        yield {"_op_type": "delete", "_index": index_name, "_id": id}
+
+
+def sync_actions(json_file, index_name, changed, removed):
+    """Returns the actions(ids) of bulk_with_retries that upsert the changed
+    programs of the JSON file and delete the removed ones, or only those of
+    the ids"""
+    def actions(ids):
+        upserts = set(changed) if ids is None else set(changed) & ids
+        yield from index_actions(json_file, index_name, upserts)
+        yield from delete_actions(index_name, [id for id in removed
+                                               if ids is None or id in ids])
+    return actions
+
+
+def hash_actions(hash_index, hashes, removed):
+    """Returns the actions(ids) of bulk_with_retries that record the hashes
+    of upserted programs and delete those of removed ones, or only those of
+    the ids"""
+    def actions(ids):
+        for id, hash in hashes.items():
+            if ids is None or id in ids:
+                yield {"_op_type": "index", "_index": hash_index, "_id": id,
+                       "_source": {"hash": hash}}
+        yield from delete_actions(hash_index, [id for id in removed
+                                               if ids is None or id in ids])
+    return actions
+
+
+def sync_index(json_file, index_name):
+    """
+    Bring the index up to date with the JSON file by upserting only the
+    programs whose content changed, and deleting the programs that were
+    removed, as told by the hashes of the file's manifest. Content hashes are
+    only recorded once their program is indexed, and the manifest's version
+    once every change is, so programs that failed are retried on the next
+    cycle, and a cycle where the version did not change only reads the
+    manifest. Returns the number of programs upserted and deleted.
+    """
+    try:
+        # writes go through the alias, and hashes to the live version's index
+        live = live_index(index_name)
+        hash_index = hash_index_name(live)
+        manifest = read_manifest(json_file)
+        version = manifest['version'] if manifest is not None else None
+        if version is not None and version == synced_version(hash_index):
+            logger.debug(f"Index '{index_name}' is up to date with version "
+                         f"{version[:12]} of {json_file}")
+            return 0, 0
+        changed, removed = diff_programs(file_hashes(json_file, manifest),
+                                         get_indexed_hashes(live))
+        if not changed and not removed:
+            logger.debug(f"Index '{index_name}' is up to date with {json_file}")
+            record_synced_version(hash_index, version)
+            return 0, 0
+        logger.info(f"Upserting {len(changed)} and deleting {len(removed)} "
+                    f"programs of {json_file}")
+
+        # the programs are streamed from the JSON file again, in chunks, and
+        # those rejected because the cluster is busy are retried (see
+        # bulk_with_retries); deleting a program that is only in the hash
+        # index is not an error
+        succeeded, failed = bulk_with_retries(
+            sync_actions(json_file, index_name, changed, removed))
+        upserted = {id: hash for id, hash in changed.items()
+                    if id in succeeded}
+        deleted = [id for id in removed if id in succeeded]
+
+        _, hashes_failed = bulk_with_retries(
+            hash_actions(hash_index, upserted, deleted))
+        if hashes_failed:
+            raise RuntimeError(f"Could not record the content hashes of "
+                               f"{len(hashes_failed)} programs")
+
+        if not failed:
+            record_synced_version(hash_index, version)
+
+        # Refresh index to make documents searchable immediately
+        es.indices.refresh(index=index_name)
+        logger.info(f"Sync completed: {len(succeeded)} succeeded, "
+                    f"{len(failed)} failed")
+        return len(upserted), len(deleted)
+
+    except Exception as e:
+        logger.error(f"Error syncing data: {str(e)}")
+        raise
+
+
+def needs_rebuild(alias):
+    """Whether the index behind the alias is missing, was created before
+    versions were swapped behind the alias, or was built from an older
+    mapping"""
+    index = live_index(alias)
+    if index is None or index == alias:
+        return True
+    mapping = es.indices.get_mapping(index=index)[index]['mappings']
+    return mapping.get('_meta', {}).get('mapping_hash') != mapping_hash()
+
+
+def wait_for_replicas(index_name):
+    """Wait for the replicas of a version that was bulk loaded without them
+    to be allocated and recovered, i.e., for the index to be green, so that
+    it is not swapped in with only its primaries"""
+    health = es.cluster.health(index=index_name, wait_for_status="green",
+                               timeout=REPLICAS_TIMEOUT)
+    logger.info(f"Index '{index_name}' health: {health['status']}")
+    if health.get('timed_out') or health['status'] != "green":
+        raise RuntimeError(f"Replicas of index '{index_name}' were not "
+                           f"recovered within {REPLICAS_TIMEOUT} "
+                           f"(status {health['status']})")
+
+
+def swap_alias(alias, index_name):
+    """Point the alias at a new version of the index, atomically, so that
+    searches go from the previous version to the new one without a gap"""
+    current = live_index(alias)
+    actions = [{"add": {"index": index_name, "alias": alias}}]
+    if current == alias:
+        # the index created before versions were used goes in the same step
+        actions.append({"remove_index": {"index": alias}})
+    elif current is not None:
+        actions.append({"remove": {"index": current, "alias": alias}})
+    es.indices.update_aliases(actions=actions)
+    logger.info(f"Alias '{alias}' now points to '{index_name}' "
+                f"(previously {current})")
+
+
+def delete_old_versions(alias, index_name):
+    """Delete the versions older than the KEEP_PREVIOUS_VERSIONS before the
+    live one, and the hash indexes of deleted versions"""
+    prefix = alias + VERSION_SEPARATOR
+    versions = sorted(name for name in es.indices.get(index=prefix + "*")
+                      if name[len(prefix):].isdigit() and name < index_name)
+    old = versions[:max(len(versions) - KEEP_PREVIOUS_VERSIONS, 0)]
+    # the hash index of the index created before versions were used
+    old_hash_indexes = [hash_index_name(alias)]
+    for version in old:
+        logger.info(f"Deleting old index version '{version}'")
+        old_hash_indexes.append(hash_index_name(version))
+        es.indices.delete(index=version)
+    for hash_index in old_hash_indexes:
+        es.indices.delete(index=hash_index, ignore_unavailable=True)
+
+
+def rebuild_index(json_file, alias):
+    """
+    Build a new version of the index from the JSON file, verify it, and swap
+    it in behind the alias. The live index keeps serving searches until the
+    swap; a version that fails to build or verify is deleted and the live
+    index is left as it is. Returns the number of programs in the new version.
+    """
+    index_name = f"{alias}{VERSION_SEPARATOR}" \
+                 f"{time.strftime('%Y%m%d%H%M%S', time.gmtime())}"
+    create_index_with_mapping(index_name)
+    try:
+        load_data(json_file, index_name)
+        wait_for_replicas(index_name)
+        hash_index = hash_index_name(index_name)
+        es.indices.create(index=hash_index, body=HASH_MAPPING)
+        manifest = read_manifest(json_file)
+        with bulk_load_settings(hash_index):
+            hashed = sum(ok for ok, _ in helpers.streaming_bulk(
+                es, ({"_op_type": "index", "_index": hash_index,
+                      "_id": id, "_source": {"hash": hash}}
+                     for id, hash in file_hashes(json_file, manifest).items()),
+                chunk_size=BULK_CHUNK_SIZE,
+                max_chunk_bytes=BULK_MAX_CHUNK_BYTES,
+                max_retries=BULK_MAX_RETRIES,
+                initial_backoff=BULK_INITIAL_BACKOFF,
+                max_backoff=BULK_MAX_BACKOFF))
+        es.indices.refresh(index=hash_index)
+        count = verify_index(index_name)
+        if count != hashed:
+            raise RuntimeError(f"Index '{index_name}' has {count} programs, "
+                               f"expected {hashed}")
+        if manifest is not None:
+            record_synced_version(hash_index, manifest['version'])
+    except Exception as e:
+        logger.error(f"Error building index '{index_name}': {str(e)}")
+        es.indices.delete(index=[index_name, hash_index_name(index_name)],
+                          ignore_unavailable=True)
+        raise
+
+    swap_alias(alias, index_name)
+    delete_old_versions(alias, index_name)
+    return count
+
+
+def fiscal_year_indexes(index_name, json_file):
+    """
+    The (alias, JSON file) of the current fiscal year's programs, and of each
+    other fiscal year that load.py wrote to a subdirectory named after its
+    prefix, which is indexed behind an alias of its own (e.g.,
+    fy2023/programs-table.json behind programs_fy2023)
+    """
+    indexes = [(index_name, json_file)]
+    directory, filename = os.path.split(json_file)
+    for path in sorted(glob.glob(os.path.join(directory, "fy*", filename))):
+        year = os.path.basename(os.path.dirname(path))
+        indexes.append((f"{index_name}_{year}", path))
+    return indexes
+
+
 def verify_index(index_name):
     """Verify index contents"""
     try:
@@ -247,6 +676,8 @@ def verify_index(index_name):
 
 
 if __name__ == "__main__":
+    wait_for_elasticsearch()
+
     # Define the name of the index that stores program information and the
     # location of the JSON file that contains all program information
     index_name = "programs"
@@ -263,29 +694,25 @@ if __name__ == "__main__":
     status_code = 0
     while status_code == 0:
         try:
-
-            # Check if index exists
-            if not es.indices.exists(index=index_name):
-                create_index_with_mapping(index_name)
-
-            # Check document count
-            with open(json_file, 'r') as f:
-                programs = json.load(f)
-            json_program_count = len(programs)
-            es_program_count = es.count(index=index_name)
-            es_program_count = int(es_program_count['count'])
-
-            # If document count in ES does not equal source JSON, rebuild
-            if json_program_count != es_program_count:
-                if es_program_count != 0:
-                    delete_index(index_name)
-                    create_index_with_mapping(index_name)
-                new_es_program_count = load_data(json_file, index_name)
-                final_es_program_count = verify_index(index_name)
-                logger.info(f"Indexing complete. JSON: {json_program_count}; \
-                              Initial ES: {es_program_count}; \
-                              New ES: {new_es_program_count}; \
-                              Verified ES: {final_es_program_count}")
+            for alias, year_file in fiscal_year_indexes(index_name, json_file):
+
+                # Build a new version of the index behind the alias if there
+                # is none yet, or if the mapping changed
+                if needs_rebuild(alias):
+                    final_es_program_count = rebuild_index(year_file, alias)
+                    logger.info(f"Rebuild of '{alias}' complete. \
+                                  Verified ES: {final_es_program_count}")
+
+                # Otherwise, upsert the programs whose content changed since
+                # the last cycle, and delete the removed ones
+                else:
+                    upserted, deleted = sync_index(year_file, alias)
+                    if upserted or deleted:
+                        final_es_program_count = verify_index(alias)
+                        logger.info(f"Indexing of '{alias}' complete. \
+                                      Upserted: {upserted}; \
+                                      Deleted: {deleted}; \
+                                      Verified ES: {final_es_program_count}")
 
         except Exception as e:
             logger.error(f"Indexing process failed: {str(e)}")
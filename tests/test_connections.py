@@ -0,0 +1,74 @@
+"""
+This tests the read-optimized connections to the transformed database that
+load.py reads it with.
+"""
+
+import sqlite3
+
+import pytest
+
+from data_processing import connections
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "transformed_data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE program (id TEXT PRIMARY KEY, name TEXT)")
+    conn.execute("INSERT INTO program VALUES ('10.001', 'Program A')")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+class TestConnectReadOnly:
+
+    def test_database_is_read_only(self, database):
+        """Writes to the database fail, and it is opened through a URI"""
+        conn = connections.connect_read_only(database, immutable=True)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM program")
+        assert conn.execute("SELECT name FROM program").fetchone()['name'] == 'Program A'
+        conn.close()
+        assert connections.database_uri(database, immutable=True).endswith("?mode=ro&immutable=1")
+
+    def test_pragmas(self, database):
+        """Pages are memory-mapped and the page cache is larger"""
+        conn = connections.connect_read_only(database)
+        assert conn.execute("PRAGMA mmap_size").fetchone()[0] == connections.MMAP_SIZE
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -connections.CACHE_SIZE_KIB
+        assert conn.execute("PRAGMA query_only").fetchone()[0] == 1
+        conn.close()
+
+    def test_temp_tables_need_query_only_off(self, database):
+        """query_only rejects TEMP tables, which can be written otherwise"""
+        conn = connections.connect_read_only(database)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("CREATE TEMP TABLE program_set (program_id TEXT)")
+        conn.close()
+
+        conn = connections.connect_read_only(database, query_only=False)
+        conn.execute("CREATE TEMP TABLE program_set (program_id TEXT)")
+        conn.execute("INSERT INTO program_set VALUES ('10.001')")
+        conn.close()
+
+
+class TestTupleRows:
+
+    def test_tuple_rows_by_column_index(self, database):
+        """Tuple rows are read by the index of each column"""
+        conn = connections.connect_read_only(database)
+        cursor = connections.tuple_cursor(conn)
+        cursor.execute("SELECT name, id FROM program")
+        columns = connections.column_indexes(cursor)
+        row = cursor.fetchone()
+        assert type(row) is tuple
+        assert (row[columns['id']], row[columns['name']]) == ('10.001', 'Program A')
+        # other cursors keep the connection's rows
+        assert isinstance(conn.execute("SELECT id FROM program").fetchone(), sqlite3.Row)
+        conn.close()
+
+    def test_tuple_row_connections(self, database):
+        conn = connections.connect_read_only(database, tuple_rows=True)
+        assert conn.execute("SELECT id FROM program").fetchone() == ('10.001',)
+        conn.close()
@@ -0,0 +1,45 @@
+"""
+This tests the content-hashed data files of the generated pages.
+"""
+
+import gzip
+import json
+
+from data_processing import dataassets
+
+
+class TestDataAssets:
+
+    def assets(self, tmp_path):
+        (tmp_path / 'assets' / 'data' / 'category').mkdir(parents=True, exist_ok=True)
+        return dataassets.DataAssets.for_pages(str(tmp_path / '_category'), 'category')
+
+    def test_files_are_named_after_their_content(self, tmp_path):
+        """The same data gets the same URL, and different data another one"""
+        assets = self.assets(tmp_path)
+        url = assets.write('food', {'agencies': [{'title': 'USDA'}]})
+
+        assert url.startswith('/assets/data/category/food.') and url.endswith('.json')
+        assert assets.write('food', {'agencies': [{'title': 'USDA'}]}) == url
+        assert assets.write('food', {'agencies': []}) != url
+        data_file = tmp_path / url.lstrip('/')
+        assert json.loads(data_file.read_text()) == {'agencies': [{'title': 'USDA'}]}
+        assert gzip.decompress(data_file.with_name(data_file.name + '.gz').read_bytes()) == data_file.read_bytes()
+        assert not data_file.with_name(data_file.name + '.br').exists()
+
+    def test_unchanged_files_are_kept(self, tmp_path):
+        """A later run keeps the files of unchanged data without rewriting
+        them, and removes the files of data that changed"""
+        assets = self.assets(tmp_path)
+        kept = assets.write('food', {'agencies': []})
+        changed = assets.write('health', {'agencies': []})
+        assets.prune()
+
+        assets = self.assets(tmp_path)
+        assert assets.write('food', {'agencies': []}) == kept
+        assets.write('health', {'agencies': [{'title': 'HHS'}]})
+        assets.prune()
+        assert assets.files.written == len(dataassets.COMPRESSED_COPIES) + 1
+        assert (tmp_path / kept.lstrip('/')).exists()
+        assert not (tmp_path / changed.lstrip('/')).exists()
+        assert not (tmp_path / (changed.lstrip('/') + '.gz')).exists()
@@ -0,0 +1,90 @@
+"""
+This tests the cache of data computed from the transformed database.
+"""
+
+import os
+import sqlite3
+import pytest
+from unittest.mock import MagicMock
+
+from data_processing import datacache
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = tmp_path / "transformed_data.db"
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE agency (id INTEGER PRIMARY KEY)")
+    conn.commit()
+    yield path, conn
+    conn.close()
+    datacache.clear()
+
+
+class TestCached:
+
+    def test_computed_once_per_fingerprint(self, database):
+        """Data is only recomputed after the database file changes"""
+        path, conn = database
+        compute = MagicMock(return_value={'agencies': []})
+
+        first = datacache.cached(conn.cursor(), 'tree', compute)
+        first['agencies'].append('modified by the caller')
+        assert datacache.cached(conn.cursor(), 'tree', compute) == {'agencies': []}
+        assert compute.call_count == 1
+
+        conn.execute("INSERT INTO agency VALUES (1)")
+        conn.commit()
+        os.utime(path, ns=(0, 0))
+        datacache.cached(conn.cursor(), 'tree', compute)
+        assert compute.call_count == 2
+
+    def test_in_memory_databases_are_not_cached(self):
+        """Without a database file there is no fingerprint"""
+        conn = sqlite3.connect(':memory:')
+        compute = MagicMock(return_value=[])
+
+        assert datacache.database_fingerprint(conn.cursor()) is None
+        datacache.cached(conn.cursor(), 'tree', compute)
+        datacache.cached(conn.cursor(), 'tree', compute)
+        assert compute.call_count == 2
+        conn.close()
+
+
+class TestDiskCached:
+
+    def test_stored_until_the_database_changes(self, database, tmp_path):
+        """Data is read from disk until the database file changes, and files
+        for earlier versions of the database are removed"""
+        path, conn = database
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        compute = MagicMock(return_value=[{'id': '10.001'}])
+
+        assert datacache.disk_cached(conn.cursor(), 'programs', compute, str(cache_dir)) == [{'id': '10.001'}]
+        assert datacache.disk_cached(conn.cursor(), 'programs', compute, str(cache_dir)) == [{'id': '10.001'}]
+        assert compute.call_count == 1
+
+        conn.execute("INSERT INTO agency VALUES (1)")
+        conn.commit()
+        os.utime(path, ns=(0, 0))
+        datacache.disk_cached(conn.cursor(), 'programs', compute, str(cache_dir))
+        assert compute.call_count == 2
+        assert [p.name for p in cache_dir.iterdir()] == \
+            [f"programs-{datacache.database_fingerprint(conn.cursor())}.pickle"]
+
+    def test_refresh_and_unreadable_files_recompute(self, database, tmp_path):
+        """Refreshing, or a truncated file, computes the data again"""
+        _, conn = database
+        cache_dir = tmp_path / "cache"
+        cache_dir.mkdir()
+        compute = MagicMock(return_value={'categories': []})
+
+        datacache.disk_cached(conn.cursor(), 'shared', compute, str(cache_dir))
+        datacache.disk_cached(conn.cursor(), 'shared', compute, str(cache_dir), refresh=True)
+        assert compute.call_count == 2
+
+        for cache_file in cache_dir.iterdir():
+            cache_file.write_bytes(b"")
+        assert datacache.disk_cached(conn.cursor(), 'shared', compute, str(cache_dir)) == {'categories': []}
+        assert compute.call_count == 3
@@ -0,0 +1,96 @@
+"""
+This tests the downloadable exports of all program data.
+"""
+
+import csv
+import gzip
+import json
+import os
+import pytest
+
+from data_processing import exports, records
+
+PROGRAM = records.ProgramRecord.from_dict({
+    'id': '10.001',
+    'name': 'Agricultural Research',
+    'popular_name': None,
+    'objective': 'To make agricultural research discoveries.',
+    'sam_url': 'https://sam.gov/fal/1/view',
+    'usaspending_url': 'https://www.usaspending.gov/search/?hash=abc',
+    'grants_url': 'https://grants.gov/search-grants?cfda=10.001',
+    'top_agency_name': 'Department of Agriculture',
+    'sub_agency_name': None,
+    'assistance_types': ['Project Grants'],
+    'beneficiary_types': [],
+    'applicant_types': ['State Government', 'Universities'],
+    'categories': ['Food - Research'],
+    'obligations': [{'x': '2024', 'sam_estimate': 0.0, 'sam_actual': 100.0, 'usa_spending_actual': 90.5}],
+    'outlays': [{'x': '2024', 'outlay': 80.0, 'obligation': 90.5}],
+    'other_program_spending': None,
+    'results': [],
+    'authorizations': [],
+    'program_type': 'assistance_listing',
+    'is_subpart_f': 0,
+    'rules_regulations': None,
+    'improper_payments': []
+})
+
+TAX_PROGRAM = records.ProgramRecord.from_dict(dict(
+    PROGRAM.to_dict(), id='TX001', program_type='tax_expenditure',
+    obligations=None, outlays=None,
+    other_program_spending=[{'x': '2024', 'outlays': 0.0, 'forgone_revenue': 500.0}]))
+
+
+class TestProgramExport:
+
+    def test_exports_and_manifest(self, tmp_path):
+        """The CSV and its compressed copy are identical, and the manifest
+        lists each file"""
+        with exports.ProgramExport(str(tmp_path), ['2024']) as export:
+            export.write(PROGRAM)
+            export.write(TAX_PROGRAM)
+
+        csv_bytes = (tmp_path / 'all-program-data.csv').read_bytes()
+        assert gzip.decompress((tmp_path / 'all-program-data.csv.gz').read_bytes()) == csv_bytes
+        rows = list(csv.reader(csv_bytes.decode('utf-8').splitlines()))
+        assert rows[0] == exports.CSV_HEADER
+        assert rows[1][3:5] == ['Department of Agriculture', 'N/A']
+        assert json.loads(rows[1][13]) == [{'x': '2024', 'sam_spending': 100.0, 'usa_spending_actual': 90.5}]
+        assert json.loads(rows[2][15]) == [{'x': '2024', 'outlays': 0.0, 'revenue_losses': 500.0}]
+
+        manifest = json.loads((tmp_path / 'all-program-data.manifest.json').read_text())
+        files = {f['path']: f for f in manifest['files']}
+        assert files['all-program-data.csv']['rows'] == 2
+        assert files['all-program-data.csv']['bytes'] == len(csv_bytes)
+
+    def test_unchanged_manifest_is_not_rewritten(self, tmp_path):
+        """Exporting the same programs again leaves the manifest as it was"""
+        manifest_path = tmp_path / 'all-program-data.manifest.json'
+        with exports.ProgramExport(str(tmp_path), ['2024']) as export:
+            export.write(PROGRAM)
+        os.utime(manifest_path, ns=(0, 0))
+
+        with exports.ProgramExport(str(tmp_path), ['2024']) as export:
+            export.write(PROGRAM)
+        assert manifest_path.stat().st_mtime_ns == 0
+        assert 'generated_at' not in json.loads(manifest_path.read_text())
+
+    def test_parquet_has_typed_yearly_columns(self, tmp_path):
+        """Yearly amounts are float columns, null for programs without them"""
+        parquet = pytest.importorskip('pyarrow.parquet')
+        with exports.ProgramExport(str(tmp_path), ['2024'], batch_size=1) as export:
+            export.write(PROGRAM)
+            export.write(TAX_PROGRAM)
+
+        table = parquet.read_table(str(tmp_path / 'all-program-data.parquet'))
+        columns = table.to_pydict()
+        assert columns['obligations_sam_spending_2024'] == [100.0, None]
+        assert columns['other_expenditures_revenue_losses_2024'] == [None, 500.0]
+        assert columns['applicant_types'][0] == ['State Government', 'Universities']
+
+    def test_no_manifest_for_incomplete_exports(self, tmp_path):
+        """An export interrupted by an error has no manifest"""
+        with pytest.raises(AttributeError):
+            with exports.ProgramExport(str(tmp_path), ['2024']) as export:
+                export.write({})
+        assert not (tmp_path / 'all-program-data.manifest.json').exists()
@@ -0,0 +1,138 @@
+"""
+This tests the front matter writer used for the generated markdown files.
+Its output has to match yaml.dump exactly, so each test compares the two.
+"""
+
+import io
+import yaml
+import pytest
+from unittest.mock import patch
+
+from data_processing import frontmatter
+
+LONG_TEXT = ("Selected examples of progress: Brucellosis class free status "
+             "States - 50 States and 3 Territories; ")
+
+
+def expected(data):
+    return yaml.dump(data, allow_unicode=True)
+
+
+class TestDump:
+
+    def test_plain_program_page(self):
+        """Simple values are written exactly as yaml.dump writes them"""
+        data = {
+            'title': 'Sample Program',
+            'permalink': '/program/10.001',
+            'fiscal_year': 2023,
+            'obligations': 1000000.5,
+            'is_subpart_f': True,
+            'popular_name': None,
+            'assistance_types': ['Formula Grants', 'Project Grants'],
+            'obligations_json': '[{"x":"2023","sam_actual":0.0}]',
+            'authorizations': [],
+            'agency': {}
+        }
+        assert frontmatter.dump(data) == expected(data)
+
+    def test_double_quoted_strings_are_folded_like_pyyaml(self):
+        """Long strings with carriage returns are folded as PyYAML folds
+        them, which libyaml does differently"""
+        data = {'results': [{'description': (LONG_TEXT + "\r\n") * 4,
+                             'year': '2023'}]}
+        assert frontmatter.dump(data) == expected(data)
+
+    def test_single_quoted_strings_with_line_breaks(self):
+        """Strings with line breaks are single-quoted at any depth"""
+        data = {'a': {'b': ["It's a list\n\nof " + LONG_TEXT * 3]}}
+        assert frontmatter.dump(data) == expected(data)
+
+    @pytest.mark.parametrize('value', [
+        'emoji \U0001F600 text',
+        'space before break \n next',
+        '\ttab',
+        "'quoted'",
+        '2023',
+        ''
+    ])
+    def test_other_strings(self, value):
+        """Strings libyaml may render differently still match yaml.dump"""
+        data = {'key': value, 'items': [value]}
+        assert frontmatter.dump(data) == expected(data)
+
+    def test_shared_lists_become_aliases(self):
+        """Lists referenced twice are written as YAML aliases"""
+        shared = ['Line one\r\nline two']
+        data = {'first': shared, 'second': shared}
+        assert frontmatter.dump(data) == expected(data)
+
+    def test_without_libyaml(self):
+        """Without libyaml the block-style emitter in Python is used"""
+        data = {'description': LONG_TEXT * 3}
+        with patch.object(frontmatter, 'CDumper', None), \
+                patch.object(frontmatter, 'emit', wraps=frontmatter.emit) as emit:
+            assert frontmatter.dump(data) == expected(data)
+        emit.assert_called_once_with(data)
+
+    def test_without_libyaml_other_data(self):
+        """Data the emitter does not handle is left to yaml.dump"""
+        shared = ['shared']
+        data = {'first': shared, 'second': shared, 'tuple': (1, 2)}
+        with patch.object(frontmatter, 'CDumper', None):
+            assert frontmatter.dump(data) == expected(data)
+
+
+class TestEmit:
+
+    def test_page_shapes(self):
+        """Nested mappings and lists, empty containers, and every kind of
+        scalar are written as yaml.dump writes them"""
+        data = {
+            'title': 'Sample: Program #1',
+            'fiscal_year': 2023,
+            'obligations': 1e20,
+            'ratio': 0.1,
+            'is_subpart_f': False,
+            'popular_name': None,
+            'code': '2023',
+            'empty': '',
+            'objective': LONG_TEXT * 4,
+            'categories': ['- dash', ['nested', {'a': 1}], {}, []],
+            'improper_payments': [{
+                'name': 'Payment Program',
+                'related_programs': [{'id': '10.002', 'permalink': '/program/10.002'}],
+                'results': {'fy2023': ["It's\nmultiline", 'tab\tseparated']}
+            }]
+        }
+        assert frontmatter.emit(data) == expected(data)
+
+    @pytest.mark.parametrize('value', [
+        'yes', 'null', '~', '1.5', '0x1F', '2023-01-01', '---', '? x', 'a: b',
+        'a #b', 'trailing ', ' leading', '\u2028', '\ufeff', 'é \U0001F600',
+        'word  ' * 30 + 'end'
+    ])
+    def test_strings(self, value):
+        """Strings are plain, single- or double-quoted, and folded, as
+        PyYAML's emitter decides"""
+        data = {'key': value, 'items': [value, [value]]}
+        assert frontmatter.emit(data) == expected(data)
+
+    def test_unsupported_data(self):
+        """Other data is not written, so that yaml.dump writes it"""
+        shared = {}
+        assert frontmatter.emit({'a': shared, 'b': shared}) is None
+        assert frontmatter.emit({1: 'int key'}) is None
+        assert frontmatter.emit({'2023': 'quoted key'}) is None
+        assert frontmatter.emit({'key': {1, 2}}) is None
+        assert frontmatter.emit(['not', 'a', 'mapping']) is None
+        assert frontmatter.emit({}) is None
+
+
+class TestWrite:
+
+    def test_write_wraps_front_matter(self):
+        """The front matter is written between --- lines"""
+        file = io.StringIO()
+        frontmatter.write(file, {'title': 'Search'})
+        assert file.getvalue() == '---\ntitle: Search\n---\n'
@@ -0,0 +1,133 @@
+"""
+This tests the renderer of program pages to HTML that bypasses Jekyll. When
+the site has been built with Jekyll (website/_site) from markdown program
+pages (the program_pages target of load.py), the rendered pages of a sample of
+programs are compared against Jekyll's.
+"""
+
+import re
+from pathlib import Path
+
+import pytest
+import yaml
+
+from data_processing import htmlrender
+
+WEBSITE_DIR = Path(__file__).parent.parent / 'website'
+JEKYLL_SITE_DIR = WEBSITE_DIR / '_site'
+PARITY_SAMPLE_SIZE = 50
+
+PAGE = {
+    'title': 'Agricultural Research',
+    'layout': 'program',
+    'permalink': '/program/10.001.html',
+    'fiscal_year': '2024',
+    'cfda': '10.001',
+    'objective': 'To make agricultural research discoveries.',
+    'sam_url': 'https://sam.gov/fal/1/view',
+    'usaspending_url': 'https://www.usaspending.gov/search/?hash=abc',
+    'grants_url': 'https://grants.gov/search-grants?cfda=10.001',
+    'popular_name': '',
+    'assistance_types': ['Project Grants'],
+    'beneficiary_types': [],
+    'applicant_types': ['State Government'],
+    'categories': ['Food - Research', 'Agricultural - Research and Development'],
+    'agency': 'Department of Agriculture',
+    'sub-agency': 'N/A',
+    'results': [{'year': '2024', 'description': 'Second result'},
+                {'year': '2023', 'description': 'First result\n\nwith two paragraphs'}],
+    'program_type': 'assistance_listing',
+    'authorizations': [{'text': 'Act', 'url': None}],
+    'is_subpart_f': 0,
+    'rules_regulations': None,
+    'has_improper_payments': False,
+    'data_url': '/assets/data/program/10.001.0123456789abcdef.json',
+}
+
+
+def front_matter(path):
+    text = path.read_text(encoding='utf-8')
+    return yaml.safe_load(text[4:text.index('\n---\n', 4) + 1])
+
+
+def normalize_html(html):
+    """Collapses the whitespace that Liquid and Jinja tags leave differently."""
+    return re.sub(r'\s+', ' ', re.sub(r'>\s+<', '><', html)).strip()
+
+
+@pytest.fixture
+def environment():
+    return htmlrender.create_environment(str(WEBSITE_DIR))
+
+
+class TestMarkdownify:
+
+    def test_plain_paragraphs(self):
+        """Plain paragraphs are rendered like kramdown does"""
+        assert htmlrender.markdownify('One\nline\n\n  Two ') == '<p>One\nline</p>\n\n<p>Two</p>\n'
+        assert htmlrender.markdownify(None) == ''
+
+    @pytest.mark.parametrize('text', ["The agency's goal", 'A *bold* claim', '1. First', '- item',
+                                      'Costs & benefits', 'Wait...', 'Title\n====='])
+    def test_other_markdown_is_not_plain(self, text):
+        """Markdown that kramdown renders as more than plain paragraphs is
+        left to Jekyll"""
+        assert not htmlrender.is_plain_markdown(text)
+        assert not htmlrender.is_renderable(dict(PAGE, results=[{'year': '2024', 'description': text}]))
+        with pytest.raises(ValueError):
+            htmlrender.markdownify(text)
+
+
+class TestRenderProgramPage:
+
+    def test_render(self, environment):
+        """The page is rendered in the default layout, with the program's
+        footer scripts"""
+        html = htmlrender.render_program_page(environment, PAGE)
+
+        assert '<title>Agricultural Research | Federal Program Inventory</title>' in html
+        assert '<link rel="canonical" href="https://fpi.omb.gov/program/10.001.html" />' in html
+        assert 'fetchPageData("/assets/data/program/10.001.0123456789abcdef.json", {' in html
+        # the page has a data file, so nothing is embedded to fall back on
+        assert 'outlays: null,' in html
+        # sorted by year, like Liquid's sort
+        assert html.index('First result') < html.index('Second result')
+        assert normalize_html(html).count('data-filter-type="category"') == 2
+
+    def test_liquid_truthiness(self, environment):
+        """Like Liquid, 0 and '' are true, and undefined values are empty"""
+        assert 'Single Audit Applies' in htmlrender.render_program_page(environment, PAGE)
+        assert 'Single Audit Applies' not in htmlrender.render_program_page(
+            environment, dict(PAGE, is_subpart_f=None))
+        assert 'N/A' in htmlrender.render_program_page(environment, dict(PAGE, popular_name=None))
+
+
+class TestProgramHtmlRenderer:
+
+    @pytest.mark.parametrize('workers', [1, 2])
+    def test_pages_are_written_and_pruned(self, tmp_path, workers):
+        """Pages are rendered to their permalinks, and pages of programs that
+        were not rendered are removed"""
+        (tmp_path / 'program').mkdir()
+        (tmp_path / 'program' / '99.999.html').write_text('archived program')
+        with htmlrender.ProgramHtmlRenderer(str(tmp_path), workers, batch_size=1) as renderer:
+            renderer.render(PAGE)
+            renderer.render(dict(PAGE, cfda='10.002', permalink='/program/10.002.html'))
+
+        assert sorted(path.name for path in (tmp_path / 'program').iterdir()) == ['10.001.html', '10.002.html']
+        assert renderer.files.written == 2
+
+
+@pytest.mark.skipif(not (JEKYLL_SITE_DIR / 'program').is_dir(),
+                    reason="the site has not been built with Jekyll (bundle exec jekyll build in website/)")
+def test_parity_with_jekyll():
+    """A sample of program pages renders like Jekyll's build of the same pages"""
+    environment = htmlrender.create_environment(str(WEBSITE_DIR))
+    pages = [page for page in map(front_matter, sorted((WEBSITE_DIR / '_program').glob('*.md')))
+             if htmlrender.is_renderable(page)]
+    step = max(1, len(pages) // PARITY_SAMPLE_SIZE)
+
+    for page in pages[::step]:
+        jekyll_html = (JEKYLL_SITE_DIR / page['permalink'].lstrip('/')).read_text(encoding='utf-8')
+        assert normalize_html(htmlrender.render_program_page(environment, page)) == \
+            normalize_html(jekyll_html), page['cfda']
@@ -0,0 +1,307 @@
+"""
+This tests the indexer's incremental sync of the programs index and the
+swaps of its versions behind the alias, with a mocked Elasticsearch client.
+"""
+
+import json
+import os
+import sys
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'indexer')))
+
+import index_programs
+from data_processing import shards
+
+
+def program(cfda, title='Program'):
+    return {'cfda': cfda, 'title': title}
+
+
+@pytest.fixture
+def es():
+    with patch.object(index_programs, 'es', MagicMock()) as es:
+        yield es
+
+
+def fake_bulk_results(statuses=None):
+    """A bulk_results that records the actions it is sent, and succeeds with
+    each unless statuses has a list of the statuses of its attempts"""
+    statuses = {id: list(codes) for id, codes in (statuses or {}).items()}
+    sent = []
+
+    def bulk_results(actions):
+        for action in actions:
+            sent.append((action['_op_type'], action['_index'], action['_id']))
+            codes = statuses.get(action['_id'])
+            status = codes.pop(0) if codes else 200
+            yield 200 <= status < 300, {action['_op_type']: {'_id': action['_id'], 'status': status}}
+
+    bulk_results.sent = sent
+    return bulk_results
+
+
+@pytest.fixture
+def json_file(tmp_path):
+    path = tmp_path / 'programs-table.json'
+    path.write_text(json.dumps([program('10.001'), program('10.002', 'Changed'), program('10.003')]))
+    return str(path)
+
+
+class TestDiffPrograms:
+
+    def test_changed_and_removed(self):
+        """New and changed programs are upserted, unchanged ones are not, and
+        programs no longer in the file are removed"""
+        upserts, removed = index_programs.diff_programs(
+            {'10.001': 'a', '10.002': 'b2', '10.003': 'c'},
+            {'10.001': 'a', '10.002': 'b1', '10.004': 'd'})
+
+        assert upserts == {'10.002': 'b2', '10.003': 'c'}
+        assert removed == ['10.004']
+
+    def test_hash_matches_the_manifest(self, tmp_path):
+        """Programs are hashed as shards.py hashes their NDJSON lines, so the
+        hashes listed in the manifest can be compared with the index's"""
+        manifest = shards.write_shards(str(tmp_path), 'programs-table',
+                                       [program('10.001'), program('10.002')], 'cfda')
+
+        assert manifest['documents'] == {p['cfda']: index_programs.document_hash(p)
+                                         for p in [program('10.001'), program('10.002')]}
+
+
+class TestBulkWithRetries:
+
+    def actions(self, ids):
+        for id in ['10.001', '10.002', '10.003']:
+            if ids is None or id in ids:
+                yield {'_op_type': 'index', '_index': 'programs', '_id': id}
+        if ids is None or '10.004' in ids:
+            yield {'_op_type': 'delete', '_index': 'programs', '_id': '10.004'}
+
+    def test_rejected_documents_are_retried(self):
+        """Documents rejected because the cluster is busy are sent again,
+        alone, after a backoff, and other failures are not retried"""
+        bulk_results = fake_bulk_results({'10.002': [429, 429], '10.003': [400], '10.004': [404]})
+        with patch.object(index_programs, 'bulk_results', bulk_results), \
+             patch.object(index_programs.time, 'sleep') as sleep:
+            succeeded, failed = index_programs.bulk_with_retries(self.actions)
+
+        assert succeeded == {'10.001', '10.002', '10.004'}
+        assert failed == {'10.003'}
+        assert [id for _, _, id in bulk_results.sent] == ['10.001', '10.002', '10.003', '10.004', '10.002', '10.002']
+        assert [call.args[0] for call in sleep.call_args_list] == [2, 4]
+
+    def test_gives_up_after_the_last_retry(self):
+        bulk_results = fake_bulk_results({'10.001': [429] * (index_programs.BULK_MAX_RETRIES + 1)})
+        with patch.object(index_programs, 'bulk_results', bulk_results), \
+             patch.object(index_programs.time, 'sleep'):
+            succeeded, failed = index_programs.bulk_with_retries(self.actions)
+
+        assert failed == {'10.001'}
+        assert succeeded == {'10.002', '10.003', '10.004'}
+
+
+class TestSyncIndex:
+
+    @pytest.fixture
+    def indexed(self):
+        """The index has 10.001 unchanged, an older 10.002, and 10.004, which
+        was removed from the file"""
+        hashes = {'10.001': index_programs.document_hash(program('10.001')),
+                  '10.002': index_programs.document_hash(program('10.002')),
+                  '10.004': 'removed'}
+        with patch.object(index_programs, 'live_index', return_value='programs_v1'), \
+             patch.object(index_programs, 'get_indexed_hashes', return_value=hashes):
+            yield
+
+    @pytest.fixture
+    def manifest(self, json_file):
+        """A manifest next to the JSON file, at version 'v2'"""
+        programs = json.loads(open(json_file).read())
+        path = os.path.splitext(json_file)[0] + '.manifest.json'
+        with open(os.path.splitext(json_file)[0] + '-00000.ndjson', 'w') as f:
+            f.writelines(json.dumps(p, separators=(',', ':')) + '\n' for p in programs)
+        with open(path, 'w') as f:
+            json.dump({'version': 'v2', 'shards': [{'path': 'programs-table-00000.ndjson'}],
+                       'documents': {p['cfda']: index_programs.document_hash(p) for p in programs}}, f)
+        return path
+
+    def test_only_changes_are_written(self, es, indexed, json_file):
+        """Changed and new programs are upserted through the alias, removed
+        ones deleted, and their hashes recorded in the live version's hash
+        index"""
+        bulk_results = fake_bulk_results()
+        with patch.object(index_programs, 'bulk_results', bulk_results):
+            assert index_programs.sync_index(json_file, 'programs') == (2, 1)
+
+        assert bulk_results.sent == [
+            ('index', 'programs', '10.002'), ('index', 'programs', '10.003'), ('delete', 'programs', '10.004'),
+            ('index', 'programs_v1_content_hashes', '10.002'),
+            ('index', 'programs_v1_content_hashes', '10.003'),
+            ('delete', 'programs_v1_content_hashes', '10.004')]
+        es.indices.refresh.assert_called_once_with(index='programs')
+
+    def test_failed_programs_are_not_hashed(self, es, indexed, json_file):
+        """Programs that failed to index keep their old hash, so that they are
+        retried on the next cycle"""
+        bulk_results = fake_bulk_results({'10.003': [400]})
+        with patch.object(index_programs, 'bulk_results', bulk_results):
+            assert index_programs.sync_index(json_file, 'programs') == (1, 1)
+
+        assert [id for _, index, id in bulk_results.sent if index.endswith('_content_hashes')] == \
+            ['10.002', '10.004']
+
+    def test_rejected_programs_are_retried(self, es, indexed, json_file):
+        """Programs rejected because the cluster is busy are upserted again
+        after a backoff, and hashed once they are indexed"""
+        bulk_results = fake_bulk_results({'10.003': [429]})
+        with patch.object(index_programs, 'bulk_results', bulk_results), \
+             patch.object(index_programs.time, 'sleep'):
+            assert index_programs.sync_index(json_file, 'programs') == (2, 1)
+
+        assert [id for _, index, id in bulk_results.sent if index == 'programs'] == \
+            ['10.002', '10.003', '10.004', '10.003']
+        assert ('index', 'programs_v1_content_hashes', '10.003') in bulk_results.sent
+
+    def test_up_to_date(self, es, json_file):
+        """Nothing is written when the index matches the file"""
+        programs = json.loads(open(json_file).read())
+        hashes = {p['cfda']: index_programs.document_hash(p) for p in programs}
+        with patch.object(index_programs, 'live_index', return_value='programs_v1'), \
+             patch.object(index_programs, 'get_indexed_hashes', return_value=hashes), \
+             patch.object(index_programs, 'bulk_results') as bulk_results:
+            assert index_programs.sync_index(json_file, 'programs') == (0, 0)
+
+        bulk_results.assert_not_called()
+
+    def test_synced_version_is_skipped(self, es, manifest, json_file):
+        """A cycle where the manifest's version is the one last synced only
+        reads the manifest"""
+        es.indices.get_mapping.return_value = {
+            'programs_v1_content_hashes': {'mappings': {'_meta': {'manifest_version': 'v2'}}}}
+        with patch.object(index_programs, 'live_index', return_value='programs_v1'), \
+             patch.object(index_programs, 'get_indexed_hashes') as get_indexed_hashes, \
+             patch.object(index_programs, 'bulk_results') as bulk_results:
+            assert index_programs.sync_index(json_file, 'programs') == (0, 0)
+
+        get_indexed_hashes.assert_not_called()
+        bulk_results.assert_not_called()
+
+    def test_new_version_is_diffed_against_the_manifest(self, es, indexed, manifest, json_file):
+        """A new version is synced from the manifest's hashes, and recorded
+        once every change is indexed"""
+        es.indices.get_mapping.return_value = {
+            'programs_v1_content_hashes': {'mappings': {'_meta': {'manifest_version': 'v1'}}}}
+        bulk_results = fake_bulk_results()
+        with patch.object(index_programs, 'bulk_results', bulk_results), \
+             patch.object(index_programs, 'document_hash') as document_hash:
+            assert index_programs.sync_index(json_file, 'programs') == (2, 1)
+
+        document_hash.assert_not_called()
+        es.indices.put_mapping.assert_called_once_with(
+            index='programs_v1_content_hashes', meta={'manifest_version': 'v2'})
+
+    def test_version_is_not_recorded_after_failures(self, es, indexed, manifest, json_file):
+        """The version is synced again on the next cycle when a program
+        failed to index"""
+        es.indices.get_mapping.return_value = {'programs_v1_content_hashes': {'mappings': {}}}
+        with patch.object(index_programs, 'bulk_results', fake_bulk_results({'10.003': [400]})):
+            assert index_programs.sync_index(json_file, 'programs') == (1, 1)
+
+        es.indices.put_mapping.assert_not_called()
+
+
+class TestWaitForReplicas:
+
+    def test_waits_for_green(self, es):
+        """Replicas are recovered once the index is green, not yellow, which
+        only means its primaries are allocated"""
+        es.cluster.health.return_value = {'status': 'green', 'timed_out': False}
+        index_programs.wait_for_replicas('programs_v2')
+
+        assert es.cluster.health.call_args.kwargs['wait_for_status'] == 'green'
+
+    def test_fails_without_replicas(self, es):
+        """A version whose replicas did not recover is not swapped in"""
+        es.cluster.health.return_value = {'status': 'yellow', 'timed_out': True}
+        with pytest.raises(RuntimeError):
+            index_programs.wait_for_replicas('programs_v2')
+
+
+class TestSwapAlias:
+
+    def test_replaces_the_previous_version(self, es):
+        """The alias moves from the previous version in one update"""
+        with patch.object(index_programs, 'live_index', return_value='programs_v1'):
+            index_programs.swap_alias('programs', 'programs_v2')
+
+        es.indices.update_aliases.assert_called_once_with(actions=[
+            {'add': {'index': 'programs_v2', 'alias': 'programs'}},
+            {'remove': {'index': 'programs_v1', 'alias': 'programs'}}])
+
+    def test_removes_the_legacy_index(self, es):
+        """An index created before versions were used, under the alias's
+        name, is removed in the same update"""
+        with patch.object(index_programs, 'live_index', return_value='programs'):
+            index_programs.swap_alias('programs', 'programs_v2')
+
+        es.indices.update_aliases.assert_called_once_with(actions=[
+            {'add': {'index': 'programs_v2', 'alias': 'programs'}},
+            {'remove_index': {'index': 'programs'}}])
+
+    def test_first_version(self, es):
+        with patch.object(index_programs, 'live_index', return_value=None):
+            index_programs.swap_alias('programs', 'programs_v1')
+
+        es.indices.update_aliases.assert_called_once_with(actions=[
+            {'add': {'index': 'programs_v1', 'alias': 'programs'}}])
+
+
+class TestDeleteOldVersions:
+
+    def deleted(self, es):
+        return [call.kwargs['index'] for call in es.indices.delete.call_args_list]
+
+    def test_keeps_the_previous_versions(self, es):
+        """Versions older than the ones kept to roll back to are deleted with
+        their hash indexes, and the live and newer versions are kept"""
+        es.indices.get.return_value = {name: {} for name in [
+            'programs_v20250101000000', 'programs_v20250201000000', 'programs_v20250301000000',
+            'programs_v20250401000000', 'programs_v20250201000000_content_hashes']}
+
+        with patch.object(index_programs, 'KEEP_PREVIOUS_VERSIONS', 1):
+            index_programs.delete_old_versions('programs', 'programs_v20250301000000')
+
+        es.indices.get.assert_called_once_with(index='programs_v*')
+        assert self.deleted(es) == ['programs_v20250101000000', 'programs_content_hashes',
+                                    'programs_v20250101000000_content_hashes']
+
+    def test_nothing_to_delete(self, es):
+        """With no more versions than are kept, only the hash index of the
+        legacy index is removed, if there is one"""
+        es.indices.get.return_value = {'programs_v20250101000000': {}, 'programs_v20250201000000': {}}
+
+        with patch.object(index_programs, 'KEEP_PREVIOUS_VERSIONS', 1):
+            index_programs.delete_old_versions('programs', 'programs_v20250201000000')
+
+        assert self.deleted(es) == ['programs_content_hashes']
+        es.indices.delete.assert_called_once_with(index='programs_content_hashes', ignore_unavailable=True)
+
+
+class TestFiscalYearIndexes:
+
+    def test_other_years_have_aliases_of_their_own(self, tmp_path, json_file):
+        """Programs tables that load.py wrote for other fiscal years are
+        indexed behind aliases named after their directories"""
+        for year in ['fy2025', 'fy2023']:
+            (tmp_path / year).mkdir()
+            (tmp_path / year / 'programs-table.json').write_text('[]')
+
+        assert index_programs.fiscal_year_indexes('programs', json_file) == [
+            ('programs', json_file),
+            ('programs_fy2023', str(tmp_path / 'fy2023' / 'programs-table.json')),
+            ('programs_fy2025', str(tmp_path / 'fy2025' / 'programs-table.json'))]
@@ -0,0 +1,181 @@
+"""
+This tests the instrumentation that records per-stage measurements for the
+extract, transform, and load pipelines and compares run manifests.
+"""
+
+import json
+import sqlite3
+import pytest
+
+from data_processing import instrumentation
+
+
+@pytest.fixture
+def active_run():
+    """Starts a run and makes sure it is discarded after each test."""
+    run = instrumentation.start_run("test")
+    yield run
+    instrumentation._active_run = None
+    instrumentation._pending_flushes.clear()
+
+
+class TestStage:
+
+    def test_stage_without_run_measures_nothing(self):
+        """Without an active run, stages should only run the enclosed block"""
+        with instrumentation.stage("noop") as record:
+            instrumentation.record_rows("table", read=5)
+        assert record.wall_time_s == 0.0
+        assert record.tables == {}
+
+    def test_stage_counts_statements_and_rows(self, active_run):
+        """Statements and written rows on watched connections are counted"""
+        conn = instrumentation.watch(sqlite3.connect(":memory:"))
+        with instrumentation.stage("load_things") as record:
+            conn.execute("CREATE TABLE thing (id INTEGER)")
+            conn.executemany("INSERT INTO thing VALUES (?)",
+                             [(1,), (2,), (3,)])
+            conn.execute("DELETE FROM thing WHERE id = 1")
+            conn.execute("SELECT * FROM thing").fetchall()
+        conn.close()
+
+        assert record.sqlite_statements_by_type["CREATE"] == 1
+        assert record.sqlite_statements_by_type["INSERT"] == 3
+        assert record.sqlite_statements_by_type["SELECT"] == 1
+        assert record.tables["thing"]["rows_written"] == 4
+        assert record.wall_time_s > 0
+        assert active_run.stages[0]["name"] == "load_things"
+
+    def test_nested_stages_share_counts(self, active_run):
+        """Rows recorded in a nested stage count towards the outer stage"""
+        with instrumentation.stage("outer") as outer:
+            with instrumentation.stage("inner") as inner:
+                instrumentation.record_rows("source.csv", read=10)
+            instrumentation.record_rows("source.csv", read=2)
+
+        assert inner.tables["source.csv"]["rows_read"] == 10
+        assert outer.tables["source.csv"]["rows_read"] == 12
+        assert [s["name"] for s in active_run.stages] == ["inner", "outer"]
+
+    def test_instrumented_decorator(self, active_run):
+        """Decorated functions are recorded as stages under their name"""
+        @instrumentation.instrumented
+        def generate_things():
+            return "done"
+
+        assert generate_things() == "done"
+        assert active_run.stages[0]["name"] == "generate_things"
+
+
+class TestRunManifest:
+
+    def test_finish_run_writes_manifest(self, active_run, tmp_path):
+        """The manifest is written as JSON and the run is cleared"""
+        with instrumentation.stage("stage_one"):
+            instrumentation.record_rows("program", written=3)
+
+        path = instrumentation.finish_run(str(tmp_path))
+
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        assert manifest["pipeline"] == "test"
+        assert manifest["stages"][0]["tables"]["program"]["rows_written"] == 3
+        assert instrumentation.current_run() is None
+
+
+class TestCompareManifests:
+
+    def manifest(self, wall_time_s, rows_written=100):
+        return {"stages": [{
+            "name": "load_programs",
+            "wall_time_s": wall_time_s,
+            "cpu_time_s": 1.0,
+            "peak_rss_bytes": 1000,
+            "sqlite_statements": 10,
+            "tables": {"program": {"rows_read": 0,
+                                   "rows_written": rows_written}}
+        }]}
+
+    def test_compare_flags_slower_stage(self):
+        """A stage that got much slower is reported as a regression"""
+        regressions, notes = instrumentation.compare_manifests(
+            self.manifest(10.0), self.manifest(20.0))
+        assert regressions == ["load_programs: wall_time_s 10.0 -> 20.0"]
+        assert notes == []
+
+    def test_compare_ignores_small_changes(self):
+        """Changes under the minimum delta are not regressions"""
+        regressions, _ = instrumentation.compare_manifests(
+            self.manifest(0.1), self.manifest(0.3))
+        assert regressions == []
+
+    def test_compare_notes_row_count_changes(self):
+        """Large changes in rows written are noted"""
+        regressions, notes = instrumentation.compare_manifests(
+            self.manifest(10.0), self.manifest(10.0, rows_written=10))
+        assert regressions == []
+        assert notes == ["load_programs: program rows_written 100 -> 10"]
+
+
+class TestSqlProfile:
+
+    @pytest.fixture
+    def profiled_run(self):
+        run = instrumentation.start_run("test", profile_sql=True)
+        yield run
+        instrumentation._active_run = None
+        instrumentation._pending_flushes.clear()
+
+    def test_fingerprint_normalizes_literals_and_lists(self):
+        """Statements that only differ in values share a fingerprint"""
+        first = instrumentation.sql_fingerprint(
+            "SELECT * FROM program  -- batch\nWHERE id IN (?, ?, ?) AND x = 5;")
+        second = instrumentation.sql_fingerprint(
+            "SELECT * FROM program WHERE id IN (?) AND x = 'a''b'")
+        assert first == second == "SELECT * FROM program WHERE id IN (...) AND x = ?"
+        assert instrumentation.sql_fingerprint(
+            "INSERT INTO t VALUES (1, :name), (2, :name)") == "INSERT INTO t VALUES (...), ..."
+        assert instrumentation.sql_fingerprint(
+            "SELECT obligation_2024 FROM t2") == "SELECT obligation_2024 FROM t2"
+
+    def test_connections_are_only_profiled_when_asked(self, active_run):
+        """Without profiling, connections are opened as usual"""
+        assert instrumentation.connection_class() is sqlite3.Connection
+        assert "sql_profile" not in active_run.to_dict()
+
+    def test_profile_counts_calls_time_and_rows(self, profiled_run):
+        """Calls, time, and fetched rows are recorded per fingerprint"""
+        conn = instrumentation.watch(sqlite3.connect(
+            ":memory:", factory=instrumentation.connection_class()))
+        conn.execute("CREATE TABLE thing (id INTEGER)")
+        conn.executemany("INSERT INTO thing VALUES (?)", [(1,), (2,), (3,)])
+        for i in range(1, 4):
+            conn.execute("SELECT id FROM thing WHERE id >= ?", (i,)).fetchall()
+        assert len(list(conn.cursor().execute("SELECT id FROM thing WHERE id >= 2"))) == 2
+        conn.close()
+
+        entries = {e["fingerprint"]: e for e in
+                   instrumentation.sql_profile_entries(profiled_run.sql_profile)}
+        select = entries["SELECT id FROM thing WHERE id >= ?"]
+        assert select["calls"] == 4
+        assert select["rows"] == 3 + 2 + 1 + 2
+        assert select["time_s"] > 0
+        assert entries["INSERT INTO thing VALUES (...)"]["calls"] == 1
+        report = instrumentation.sql_profile_report(list(entries.values()), top=1)
+        assert report[0] == "SQL profile: 6 calls of 3 statements in " \
+            f"{sum(e['time_s'] for e in entries.values()):.3f}s"
+        assert len(report) == 3
+
+    def test_worker_profiles_are_merged(self, profiled_run, tmp_path):
+        """Profiles of worker processes add up, and are written to the manifest"""
+        worker = {"SELECT 1": {"calls": 2, "time_s": 0.5, "rows": 2}}
+        instrumentation.add_stages([], worker)
+        instrumentation.add_stages([], worker)
+
+        path = instrumentation.finish_run(str(tmp_path))
+
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+        assert manifest["sql_profile"] == [{"fingerprint": "SELECT 1", "calls": 4,
+                                            "time_s": 1.0, "avg_time_s": 0.25,
+                                            "rows": 4}]
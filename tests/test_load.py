@@ -8,6 +8,8 @@ KNOWN ISSUES:
 """
 
 import os
+import pathlib
+import gzip
 import json
 import yaml
 import pytest
@@ -19,6 +21,7 @@ import sqlite3
 with patch('sqlite3.connect', return_value=MagicMock()):
     # Import the module
     from data_processing import load
+from data_processing import records
 
 class TestEnsureDirectoryExists:
 
@@ -51,186 +54,6 @@ class TestEnsureDirectoryExists:
         # Verify makedirs was NOT called
         mock_makedirs.assert_not_called()
 
-class TestGetAssistanceProgramObligations:
-    
-    def test_get_assistance_program_obligations(self):
-        """
-        Test getting obligation data for assistance programs.
-        This should collect data from both SAM.gov and USASpending.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Set up mock cursor responses for different queries
-        def execute_side_effect(query, params):
-            if "program_sam_spending" in query and "is_actual = 1" in query:
-                # Actual amount query
-                mock_cursor.fetchone.return_value = {'actual_amount': 1000000}
-            elif "usaspending_assistance_obligation_aggregation" in query:
-                # USA spending obligations
-                mock_cursor.fetchone.return_value = {'total_obligations': 1200000}
-            else:
-                mock_cursor.fetchone.return_value = None
-        
-        mock_cursor.execute.side_effect = execute_side_effect
-        
-        # Call the function with our test program
-        result = load.get_assistance_program_obligations(
-            mock_cursor, '10.001', ['2023', '2024'])
-        
-        # Verify the results
-        assert len(result) == 2  # Two fiscal years
-        assert result[0]['x'] == '2023'
-        assert result[0]['sam_actual'] == 1000000.0
-        assert result[0]['usa_spending_actual'] == 1200000.0
-
-class TestGetOtherProgramObligations:
-    
-    def test_get_other_program_obligations_tax_expenditure(self):
-        """
-        Test getting obligation data for tax expenditure programs.
-        These have both outlays and forgone revenue.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Set up cursor response
-        mock_cursor.fetchone.return_value = {
-            'fiscal_year': 2023,
-            'outlays': 0,
-            'forgone_revenue': 2000000,
-            'source': 'additional-programs.csv'
-        }
-        
-        # Call the function for a tax expenditure program
-        result = load.get_other_program_obligations(
-            mock_cursor, 'TX001', ['2023'], 'tax_expenditure')
-        
-        # Verify the results
-        assert len(result) == 1
-        assert result[0]['x'] == '2023'
-        assert result[0]['outlays'] == 0.0
-        assert result[0]['forgone_revenue'] == 2000000.0
-    
-    def test_get_other_program_obligations_interest(self):
-        """
-        Test getting obligation data for interest programs.
-        These only have outlays, no forgone revenue.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Set up cursor response
-        mock_cursor.fetchone.return_value = {
-            'fiscal_year': 2023,
-            'outlays': 5000000,
-            'forgone_revenue': 0,
-            'source': 'additional-programs.csv'
-        }
-        
-        # Call the function for an interest program
-        result = load.get_other_program_obligations(
-            mock_cursor, 'I001', ['2023'], 'interest')
-        
-        # Verify the results
-        assert len(result) == 1
-        assert result[0]['x'] == '2023'
-        assert result[0]['outlays'] == 5000000.0
-        assert 'forgone_revenue' not in result[0]  # Should not be present for interest programs
-
-class TestGetOutlaysData:
-    
-    def test_get_outlays_data(self):
-        """
-        Test getting outlays data for programs.
-        This should return both outlays and their corresponding obligations.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Set up cursor response
-        mock_cursor.fetchone.return_value = {
-            'total_outlay': 800000,
-            'total_obligation': 1000000
-        }
-        
-        # Call the function
-        result = load.get_outlays_data(
-            mock_cursor, '10.001', ['2023', '2024'])
-        
-        # Verify the results
-        assert len(result) == 2  # Two fiscal years
-        assert result[0]['x'] == '2023'
-        assert result[0]['outlay'] == 800000.0
-        assert result[0]['obligation'] == 1000000.0
-
-class TestGetAssistanceListingObligations:
-    
-    def test_get_assistance_listing_obligations_with_data(self):
-        """
-        Test getting obligations for assistance listings with actual data.
-        This should handle both actual and estimated amounts.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Mock cursor fetchall response for program obligations
-        mock_cursor.fetchall.return_value = [
-            {'program_id': '10.001', 'total_obs': 1000000},
-            {'program_id': '10.002', 'total_obs': 2000000}
-        ]
-        
-        # Call the function
-        program_obs, total_obs = load.get_assistance_listing_obligations(
-            mock_cursor, ['10.001', '10.002'], '2023')
-        
-        # Verify the results
-        assert len(program_obs) == 2  # Two programs
-        assert program_obs['10.001'] == 1000000.0
-        assert program_obs['10.002'] == 2000000.0
-        assert total_obs == 3000000.0
-    
-    def test_get_assistance_listing_obligations_empty(self):
-        """Test handling of empty program list - should return empty results"""
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Call the function with empty list
-        program_obs, total_obs = load.get_assistance_listing_obligations(
-            mock_cursor, [], '2023')
-        
-        # Verify the results
-        assert program_obs == {}
-        assert total_obs == 0.0
-
-
-class TestGenerateApplicantTypeList:
-    
-    def test_generate_applicant_type_list(self):
-        """
-        Test generating a list of applicant types with program counts.
-        This is used for filtering on the website.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Mock query response
-        mock_cursor.fetchall.return_value = [
-            {'title': 'State Government', 'total_num_programs': 10},
-            {'title': 'Local Government', 'total_num_programs': 5}
-        ]
-        
-        # Call the function
-        result = load.generate_applicant_type_list(
-            mock_cursor, ['10.001', '10.002'])
-        
-        # Verify the results
-        assert len(result) == 2
-        assert result[0]['title'] == 'State Government'
-        assert result[0]['total_num_programs'] == 10
-        assert result[1]['title'] == 'Local Government'
-        assert result[1]['total_num_programs'] == 5
-
 class TestConvertToURLString:
     
     def test_convert_to_url_string(self):
@@ -289,49 +112,497 @@ class TestGetCategoriesHierarchy:
         assert len(result[1]['subcategories']) == 1
         assert result[1]['subcategories'][0]['title'] == 'Public Health'
 
-class TestGetImproperPaymentInfo:
-    
-    def test_get_improper_payment_info(self):
-        """
-        Test getting improper payment data for a program.
-        This should include related programs information.
-        """
-        # Create a mock cursor
-        mock_cursor = MagicMock()
-        
-        # Setup mock responses - first for the main query
-        mock_cursor.fetchall.side_effect = [
-            # First query - improper payment data
-            [
-                {
-                    'improper_payment_program_name': 'Test Payment Program',
-                    'outlays': 10000000, 
-                    'improper_payments': 500000,
-                    'insufficient_payment': 100000,
-                    'high_priority': 1
-                }
-            ],
-            # Second query - related programs
-            [
-                {'id': '10.002', 'name': 'Related Program'}
-            ]
+class TestPrefetchProgramDetails:
+
+    @pytest.fixture
+    def program_db(self):
+        """In-memory database with the transformed schema and a few programs"""
+        from data_processing import transform
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        for sql in [transform.AGENCY_CREATE_TABLE_SQL,
+                    transform.CATEGORY_CREATE_TABLE_SQL,
+                    transform.PROGRAM_CREATE_TABLE_SQL,
+                    transform.PROGRAM_AUTHORIZATION_CREATE_TABLE_SQL,
+                    transform.PROGRAM_RESULT_CREATE_TABLE_SQL,
+                    transform.PROGRAM_SAM_SPENDING_CREATE_TABLE_SQL,
+                    transform.PROGRAM_TO_CATEGORY_CREATE_TABLE_SQL,
+                    transform.USASPENDING_ASSISTANCE_OBLIGATION_AGGEGATION_CREATE_TABLE_SQL,
+                    transform.USASPENDING_ASSISTANCE_OUTLAY_AGGEGATION_CREATE_TABLE_SQL,
+                    transform.OTHER_PROGRAM_SPENDING_CREATE_TABLE_SQL,
+                    transform.IMPROPER_PAYMENT_MAPPING_CREATE_TABLE_SQL]:
+            conn.execute(sql)
+        conn.executemany("INSERT INTO program (id, name, program_type) VALUES (?, ?, ?)", [
+            ('10.001', 'Program A', 'assistance_listing'),
+            ('10.002', 'Program B', 'assistance_listing'),
+            ('TX001', 'Tax Program', 'tax_expenditure')
+        ])
+        conn.executemany("INSERT INTO category VALUES (?, ?, ?, ?)", [
+            ('01', 'assistance', 'Formula Grants', None),
+            ('02', 'assistance', 'Formula Sub-type', '01'),
+            ('01', 'applicant', 'State Government', None)
+        ])
+        conn.executemany("INSERT INTO program_to_category VALUES (?, ?, ?)", [
+            ('10.001', '02', 'assistance'), ('10.001', '01', 'applicant'),
+            ('10.002', '01', 'assistance')
+        ])
+        conn.executemany("INSERT INTO program_sam_spending VALUES (?, ?, ?, ?, ?)", [
+            ('10.001', '01', 2023, 1, 100.0), ('10.001', '02', 2023, 1, 50.0),
+            ('10.001', '01', 2024, 0, 75.0), ('10.002', '01', 2023, 1, 0.0),
+            ('10.002', '01', 2023, 0, 20.0)
+        ])
+        conn.executemany("INSERT INTO usaspending_assistance_obligation_aggregation VALUES (?, ?, ?, ?, ?)", [
+            ('10.001', 2023, 2, '01', 10.005), ('10.001', 2023, 3, None, 20.0)
+        ])
+        conn.executemany("INSERT INTO usaspending_assistance_outlay_aggregation VALUES (?, ?, ?, ?)", [
+            ('10.001', 2024, 30.0, 40.0)
+        ])
+        conn.executemany("INSERT INTO other_program_spending VALUES (?, ?, ?, ?, ?)", [
+            ('TX001', 2023, None, 500.0, 'additional-programs.csv')
+        ])
+        conn.executemany("INSERT INTO program_result VALUES (?, ?, ?)", [
+            ('10.001', 2024, 'Later result'), ('10.001', 2023, 'Result')
+        ])
+        conn.executemany("INSERT INTO program_authorization VALUES (?, ?, ?)", [
+            ('10.001', 'Second Act', None), ('10.001', 'First Act', 'https://example.gov')
+        ])
+        conn.executemany("INSERT INTO improper_payment_mapping VALUES (?, ?, ?, ?, ?, ?)", [
+            ('10.001', 'Shared Payment Program', 1000, 10, None, 1),
+            ('10.002', 'Shared Payment Program', 1000, 10, None, 1),
+            ('10.002', None, None, None, None, 0)
+        ])
+        yield conn
+        conn.close()
+
+    def test_assistance_program_obligations(self, program_db):
+        """SAM.gov actuals are preferred over estimates, which are used when
+        there are no actuals"""
+        details = load.prefetch_program_details(program_db.cursor(), ['2023', '2024', '2025'])
+
+        program_a = load.build_assistance_program_obligations(details, '10.001', ['2023', '2024', '2025'])
+        assert [year['x'] for year in program_a] == ['2023', '2024', '2025']
+        assert [year['sam_actual'] for year in program_a] == [150.0, 75.0, 0.0]
+        assert program_a[0]['usa_spending_actual'] == 30.01
+        assert program_a[1]['usa_spending_actual'] == 0.0
+        # actuals that sum to zero fall back to the estimate
+        program_b = load.build_assistance_program_obligations(details, '10.002', ['2023'])
+        assert program_b[0]['sam_actual'] == 20.0
+
+    def test_other_program_obligations(self, program_db):
+        """Tax expenditures have forgone revenue, other programs only outlays"""
+        details = load.prefetch_program_details(program_db.cursor(), ['2023', '2024'])
+
+        assert load.build_other_program_obligations(details, 'TX001', ['2023', '2024'], 'tax_expenditure') == [
+            {'x': '2023', 'outlays': 0.0, 'forgone_revenue': 500.0},
+            {'x': '2024', 'outlays': 0.0, 'forgone_revenue': 0.0}
         ]
-        
-        # Call the function
-        result = load.get_improper_payment_info(mock_cursor, '10.001')
-        
-        # Verify the results
-        assert len(result) == 1
-        assert result[0]['name'] == 'Test Payment Program'
-        assert result[0]['outlays'] == 10000000.0
-        assert result[0]['improper_payments'] == 500000.0
-        assert result[0]['insufficient_payment'] == 100000.0
-        assert result[0]['high_priority'] is True
-        
-        # Check related programs
-        assert len(result[0]['related_programs']) == 1
-        assert result[0]['related_programs'][0]['id'] == '10.002'
-        assert result[0]['related_programs'][0]['name'] == 'Related Program'
-        assert result[0]['related_programs'][0]['permalink'] == '/program/10.002'
+        assert load.build_other_program_obligations(details, 'TX001', ['2023'], 'interest') == [
+            {'x': '2023', 'outlays': 0.0}
+        ]
+
+    def test_outlays_data(self, program_db):
+        details = load.prefetch_program_details(program_db.cursor(), ['2023', '2024'])
+
+        assert load.build_outlays_data(details, '10.001', ['2023', '2024']) == [
+            {'x': '2023', 'outlay': 0.0, 'obligation': 0.0},
+            {'x': '2024', 'outlay': 30.0, 'obligation': 40.0}
+        ]
+
+    def test_improper_payment_info(self, program_db):
+        """Each improper payment program lists the other programs it maps to"""
+        details = load.prefetch_program_details(program_db.cursor(), ['2023'], ['10.001', '10.002'])
+
+        assert load.build_improper_payment_info(details, '10.001') == [{
+            'name': 'Shared Payment Program',
+            'outlays': 1000.0,
+            'improper_payments': 10.0,
+            'insufficient_payment': 0.0,
+            'high_priority': True,
+            'related_programs': [{'id': '10.002', 'name': 'Program B', 'permalink': '/program/10.002'}]
+        }]
+        program_b = load.build_improper_payment_info(details, '10.002')
+        assert [payment['name'] for payment in program_b] == ['Shared Payment Program', None]
+        assert program_b[0]['related_programs'][0]['id'] == '10.001'
+        assert program_b[1]['related_programs'] == []
+        assert program_b[1]['high_priority'] is False
+
+    def test_improper_payment_programs_are_loaded_once(self, program_db):
+        """Related programs are found once per run, not once per batch"""
+        statements = []
+        program_db.set_trace_callback(statements.append)
+
+        with patch.object(load, 'PROGRAM_BATCH_SIZE', 1):
+            programs_data = list(load.iter_program_data(program_db.cursor(), ['2023']))
+
+        assert len(programs_data) == 3
+        assert len([statement for statement in statements
+                    if 'improper_payment_mapping ip' in statement]) == 1
+        assert programs_data[1]['improper_payments'][0]['related_programs'][0]['id'] == '10.001'
+
+    def test_generate_program_data_query_count_is_constant(self, program_db):
+        """Program data is built with a fixed number of queries"""
+        statements = []
+        program_db.set_trace_callback(statements.append)
+
+        programs_data = load.generate_program_data(program_db.cursor(), ['2023', '2024'])
+
+        # the temporary table of the batch's program ids is not queried data
+        queries = [statement for statement in statements
+                   if statement.lstrip().startswith('SELECT') and 'program_set_key' not in statement]
+        assert len(queries) == 10
+        program_a = programs_data[0]
+        assert program_a['assistance_types'] == ['Formula Grants']
+        assert program_a['applicant_types'] == ['State Government']
+        assert [r['year'] for r in program_a['results']] == ['2023', '2024']
+        assert [a['text'] for a in program_a['authorizations']] == ['Second Act', 'First Act']
+        assert program_a['improper_payments'][0]['related_programs'][0]['id'] == '10.002'
+
+    def test_programs_are_built_in_batches(self, program_db):
+        """Loading the details of a few programs at a time gives the same data"""
+        programs_data = load.generate_program_data(program_db.cursor(), ['2023', '2024'])
+        with patch.object(load, 'PROGRAM_BATCH_SIZE', 1):
+            assert list(load.iter_program_data(program_db.cursor(), ['2023', '2024'])) == programs_data
+
+
+class TestGetAgencyTree:
+
+    @pytest.fixture
+    def agency_db(self):
+        """In-memory database with CFO Act and other agencies"""
+        from data_processing import transform
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        conn.execute(transform.AGENCY_CREATE_TABLE_SQL)
+        conn.execute(transform.PROGRAM_CREATE_TABLE_SQL)
+        conn.executemany("INSERT INTO agency VALUES (?, ?, ?, ?, ?)", [
+            (1, 'Department of Agriculture', 1, None, 1),
+            (2, 'Forest Service', 1, 2, 1),
+            (3, 'Food Safety Service', 1, 3, 1),
+            (4, 'Department of Energy', 4, None, 1),
+            (5, 'Small Agency', 5, None, 0),
+            (6, 'No Programs', 6, None, 0)
+        ])
+        conn.executemany("INSERT INTO program (id, agency_id) VALUES (?, ?)", [
+            ('10.001', 1), ('10.002', 2), ('81.001', 4), ('99.001', 5)
+        ])
+        yield conn
+        conn.close()
+
+    def test_get_agency_tree(self, agency_db):
+        """Sub-agencies without programs are left out, and programs of the
+        tier-1 agency itself are listed under Unspecified"""
+        tree = load.get_agency_tree(agency_db.cursor())
+
+        assert tree['cfo_agencies'] == [
+            {'title': 'Department of Agriculture',
+             'sub_categories': [{'title': 'Forest Service'}, {'title': 'Unspecified'}]},
+            {'title': 'Department of Energy'}
+        ]
+        assert tree['other_agencies'] == [{'title': 'Small Agency'}]
+
+    def test_agency_tree_is_one_query(self, agency_db):
+        """The agency tree is built with a single query"""
+        statements = []
+        agency_db.set_trace_callback(statements.append)
+        load.get_agency_tree(agency_db.cursor())
+        assert len(statements) == 1
+
+
+class TestGenerateFiscalYearPages:
+
+    @pytest.fixture
+    def category_db(self):
+        """In-memory database with a category, a subcategory and a program"""
+        from data_processing import transform
+        conn = sqlite3.connect(':memory:')
+        conn.row_factory = sqlite3.Row
+        for sql in [transform.AGENCY_CREATE_TABLE_SQL,
+                    transform.CATEGORY_CREATE_TABLE_SQL,
+                    transform.PROGRAM_CREATE_TABLE_SQL,
+                    transform.PROGRAM_SAM_SPENDING_CREATE_TABLE_SQL,
+                    transform.PROGRAM_TO_CATEGORY_CREATE_TABLE_SQL,
+                    transform.OTHER_PROGRAM_SPENDING_CREATE_TABLE_SQL]:
+            conn.execute(sql)
+        conn.execute("INSERT INTO program (id, name, program_type) VALUES ('10.001', 'Program A', 'assistance_listing')")
+        conn.executemany("INSERT INTO category VALUES (?, ?, ?, ?)", [
+            ('food', 'category', 'Food', None),
+            ('foodfarms', 'category', 'Farms', 'food')
+        ])
+        conn.execute("INSERT INTO program_to_category VALUES ('10.001', 'foodfarms', 'category')")
+        conn.executemany("INSERT INTO program_sam_spending VALUES (?, ?, ?, ?, ?)", [
+            ('10.001', '01', 2024, 1, 100.0), ('10.001', '01', 2025, 1, 250.0)
+        ])
+        yield conn
+        conn.close()
+
+    def generate(self, conn, tmp_path, fiscal_years):
+        """Generate the pages of some fiscal years and return the statements executed"""
+        for year in fiscal_years:
+            dirs = load.fiscal_year_output_dirs(year, str(tmp_path / 'website'), str(tmp_path / 'indexer'))
+            prefix = load.fiscal_year_prefix(year)
+            for directory in [dirs['pages'], dirs['data'], dirs['indexer'],
+                              load.fiscal_year_dir(dirs['category'], year),
+                              load.fiscal_year_dir(dirs['subcategory'], year),
+                              tmp_path / 'website' / f'assets/data/category{prefix}',
+                              tmp_path / 'website' / f'assets/data/subcategory{prefix}']:
+                pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        shared_data = {key: [] for key in ['cfo_agencies', 'other_agencies', 'applicant_types',
+                                           'assistance_types', 'beneficiary_types', 'categories']}
+
+        statements = []
+        conn.set_trace_callback(statements.append)
+        load.generate_fiscal_year_pages(conn.cursor(), [], shared_data, fiscal_years,
+                                        str(tmp_path / 'website'), str(tmp_path / 'indexer'))
+        conn.set_trace_callback(None)
+        return statements
+
+    def test_each_year_has_its_own_pages(self, category_db, tmp_path):
+        """The current fiscal year is written to the site, and other years to
+        subdirectories of it, under their own permalinks"""
+        self.generate(category_db, tmp_path, ['2024', '2025'])
+
+        current = yaml.safe_load((tmp_path / 'website' / '_category' / 'food.md').read_text().split('---')[1])
+        other = yaml.safe_load((tmp_path / 'website' / '_category' / 'fy2025' / 'food.md').read_text().split('---')[1])
+        assert (current['fiscal_year'], current['total_obs']) == ('2024', 100.0)
+        assert (other['fiscal_year'], other['total_obs']) == ('2025', 250.0)
+        assert (current['permalink'], other['permalink']) == ('/category/food', '/fy2025/category/food')
+        assert 'site_prefix' not in current and other['site_prefix'] == '/fy2025'
+        assert other['data_url'].startswith('/assets/data/category/fy2025/')
+        assert (tmp_path / 'website' / other['data_url'].lstrip('/')).exists()
+        assert (tmp_path / 'website' / '_subcategory' / 'fy2025' / 'food---farms.md').exists()
+        assert (tmp_path / 'website' / 'pages' / 'fy2025' / 'search.md').exists()
+        assert (tmp_path / 'indexer' / 'fy2025' / 'programs-table.json').exists()
+
+    def test_other_years_hierarchy_links_to_their_pages(self, category_db, tmp_path):
+        """The category hierarchy of another year links to that year's pages"""
+        self.generate(category_db, tmp_path, ['2024', '2025'])
+
+        current = json.loads((tmp_path / 'website' / '_data' / 'categories_hierarchy.json').read_text())
+        other = json.loads((tmp_path / 'website' / '_data' / 'fy2025' / 'categories_hierarchy.json').read_text())
+        assert current[0]['permalink'] == '/category/food'
+        assert other[0]['permalink'] == '/fy2025/category/food'
+        assert other[0]['subcategories'][0]['permalink'] == '/fy2025/category/food/farms'
+
+    def test_page_data_is_in_data_files(self, category_db, tmp_path):
+        """Category pages link to content-hashed data files instead of
+        embedding their lists as JSON strings"""
+        self.generate(category_db, tmp_path, ['2024'])
+
+        page = yaml.safe_load((tmp_path / 'website' / '_category' / 'food.md').read_text().split('---')[1])
+        assert 'sub_cats' not in page and 'agencies' not in page
+        data_file = tmp_path / 'website' / page['data_url'].lstrip('/')
+        data = json.loads(data_file.read_text())
+        assert [sub['title'] for sub in data['sub_cats']] == ['Farms']
+        assert gzip.decompress(data_file.with_name(data_file.name + '.gz').read_bytes()) == data_file.read_bytes()
+
+    def test_category_hierarchy_is_a_site_data_file(self, category_db, tmp_path):
+        """The category hierarchy is queried once and written to _data instead
+        of every category page"""
+        statements = self.generate(category_db, tmp_path, ['2024'])
+
+        hierarchy = json.loads((tmp_path / 'website' / '_data' / 'categories_hierarchy.json').read_text())
+        assert hierarchy == [{'title': 'Food', 'permalink': '/category/food', 'subcategories': [
+            {'title': 'Farms', 'permalink': '/category/food/farms'}]}]
+        assert len([sql for sql in statements if 'LEFT JOIN category c' in sql]) == 1
+        for page in ['_category/food.md', '_subcategory/food---farms.md', 'pages/category.md']:
+            assert 'categories_' not in (tmp_path / 'website' / page).read_text().replace('categories_json', '')
+
+    def test_additional_years_do_not_query_again(self, category_db, tmp_path):
+        """The data is loaded once, whatever the number of fiscal years"""
+        one_year = self.generate(category_db, tmp_path, ['2024'])
+        three_years = self.generate(category_db, tmp_path, ['2023', '2024', '2025'])
+        assert len(three_years) == len(one_year)
+
+
+class TestStreamPrograms:
+
+    @pytest.fixture
+    def programs(self):
+        """Two programs, in the order they would be streamed"""
+        program = {
+            'id': '10.001', 'name': 'Program A', 'popular_name': None, 'objective': 'Objective',
+            'sam_url': 's', 'usaspending_url': 'u', 'grants_url': 'g',
+            'top_agency_name': 'Department of Agriculture', 'sub_agency_name': None,
+            'assistance_types': ['Project Grants'], 'beneficiary_types': [], 'applicant_types': [],
+            'categories': ['Food - Farms'], 'obligations': [{'x': '2024', 'sam_estimate': 0.0, 'sam_actual': 10.0,
+                                                             'usa_spending_actual': 0.0}],
+            'outlays': [{'x': '2024', 'outlay': 0.0, 'obligation': 0.0}], 'other_program_spending': None,
+            'results': [], 'authorizations': [], 'program_type': 'assistance_listing', 'is_subpart_f': 0,
+            'rules_regulations': None, 'improper_payments': []
+        }
+        return [records.ProgramRecord.from_dict(program),
+                records.ProgramRecord.from_dict(dict(program, id='10.002', name='Program B', obligations=[
+                    dict(program['obligations'][0], sam_actual=20.0)]))]
+
+    def sinks(self, tmp_path):
+        for directory in ['_program', 'files', 'indexer', 'assets/data/program']:
+            (tmp_path / directory).mkdir(parents=True, exist_ok=True)
+        return [load.ProgramPagesSink(str(tmp_path / '_program')),
+                load.ProgramCsvSink(str(tmp_path / 'files' / 'all-program-data.csv')),
+                load.ProgramsTableSink(str(tmp_path / 'indexer' / 'programs-table.json'), '2024')]
+
+    def test_each_program_is_written_to_every_sink(self, programs, tmp_path):
+        """Programs are written to every sink, and the table JSON is sorted by
+        obligations like the list it used to be built from"""
+        load.stream_programs(iter(programs), self.sinks(tmp_path))
+
+        assert sorted(p.name for p in (tmp_path / '_program').iterdir()) == ['10.001.md', '10.002.md']
+        assert len((tmp_path / 'files' / 'all-program-data.csv').read_text().splitlines()) == 3
+        table = json.loads((tmp_path / 'indexer' / 'programs-table.json').read_text())
+        assert table == [load.programs_table_document(program, '2024') for program in reversed(programs)]
+        manifest = json.loads((tmp_path / 'indexer' / 'programs-table.manifest.json').read_text())
+        assert list(manifest['documents']) == ['10.001', '10.002']
+
+    def test_program_data_is_in_data_files(self, programs, tmp_path):
+        """Program pages link to data files with their yearly spending"""
+        load.stream_programs(iter(programs), self.sinks(tmp_path))
+
+        page = yaml.safe_load((tmp_path / '_program' / '10.002.md').read_text().split('---')[1])
+        assert 'obligations' not in page and page['has_improper_payments'] is False
+        data = json.loads((tmp_path / page['data_url'].lstrip('/')).read_text())
+        assert data == load.program_data(programs[1])
+        assert data['obligations'][0]['sam_actual'] == 20.0
+
+    def test_program_pages_rendered_to_html(self, programs, tmp_path):
+        """Pages htmlrender can render are written as HTML instead of markdown
+        files, and the others are left to Jekyll"""
+        (tmp_path / 'program').mkdir()
+        (tmp_path / '_program').mkdir()
+        (tmp_path / 'assets' / 'data' / 'program').mkdir(parents=True)
+        (tmp_path / '_program' / '10.001.md').write_text('page from an earlier run')
+        markdown = records.ProgramRecord.from_dict(dict(programs[1].to_dict(), results=[
+            {'year': '2024', 'description': "The program's *results*"}]))
+
+        load.stream_programs(iter([programs[0], markdown]), [
+            load.ProgramPagesSink(str(tmp_path / '_program'), render_html=True, html_workers=1)])
+
+        assert [p.name for p in (tmp_path / 'program').iterdir()] == ['10.001.html']
+        assert [p.name for p in (tmp_path / '_program').iterdir()] == ['10.002.md']
+
+    def test_failed_streams_keep_existing_files(self, programs, tmp_path):
+        """Pages are not pruned and the table is not written if building a
+        program fails"""
+        (tmp_path / '_program').mkdir()
+        (tmp_path / '_program' / '99.999.md').write_text('existing page')
+
+        def failing_programs():
+            yield programs[0]
+            raise sqlite3.OperationalError('database is locked')
+
+        with pytest.raises(sqlite3.OperationalError):
+            load.stream_programs(failing_programs(), self.sinks(tmp_path))
+        assert (tmp_path / '_program' / '99.999.md').exists()
+        assert not (tmp_path / 'indexer' / 'programs-table.json').exists()
+
+
+class TestParallelLoad:
+
+    @pytest.fixture
+    def database_path(self, tmp_path):
+        """Database file with the transformed schema, two programs and a category"""
+        from data_processing import transform
+        path = tmp_path / 'transformed_data.db'
+        conn = sqlite3.connect(path)
+        for name in dir(transform):
+            if name.endswith('_CREATE_TABLE_SQL'):
+                conn.execute(getattr(transform, name))
+        conn.executemany("INSERT INTO program (id, name, program_type) VALUES (?, ?, 'assistance_listing')", [
+            ('10.001', 'Program A'), ('10.002', 'Program B')
+        ])
+        conn.executemany("INSERT INTO category VALUES (?, ?, ?, ?)", [
+            ('food', 'category', 'Food', None),
+            ('foodfarms', 'category', 'Farms', 'food')
+        ])
+        conn.execute("INSERT INTO program_to_category VALUES ('10.001', 'foodfarms', 'category')")
+        conn.execute("INSERT INTO program_sam_spending VALUES ('10.001', '01', 2024, 1, 100.0)")
+        conn.commit()
+        conn.close()
+        return str(path)
+
+    @pytest.fixture
+    def dirs(self, tmp_path):
+        dirs = {'website': str(tmp_path / 'website'), 'indexer': str(tmp_path / 'indexer'),
+                'cache': str(tmp_path / 'cache')}
+        for directory in ['_program', 'program', 'pages', '_category', '_subcategory', '_data', 'assets/files',
+                          'assets/data/program', 'assets/data/category', 'assets/data/subcategory']:
+            (tmp_path / 'website' / directory).mkdir(parents=True)
+        (tmp_path / 'indexer').mkdir()
+        (tmp_path / 'cache').mkdir()
+        return dirs
+
+    def test_shards_cover_every_program_once(self, database_path):
+        """The shards of the programs build every program once between them"""
+        conn = load.connect_read_only(database_path)
+        programs = [program.id for program in load.iter_program_data(conn.cursor(), ['2024'])]
+        shards = [program.id for shard in range(3)
+                  for program in load.iter_program_data(conn.cursor(), ['2024'], shard=(shard, 3))]
+        conn.close()
+        assert sorted(shards) == sorted(programs) == ['10.001', '10.002']
+
+    def test_read_only_connections(self, database_path):
+        """Jobs cannot write to the database"""
+        conn = load.connect_read_only(database_path)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM program")
+        conn.close()
+
+    def test_jobs_generate_every_file(self, database_path, dirs, tmp_path):
+        """Jobs run in worker processes write the files of their targets, and
+        program pages that no shard generated are removed"""
+        (tmp_path / 'website' / '_program' / '99.999.md').write_text('archived program')
+        jobs = load.plan_load_jobs(['program_outputs', 'fiscal_year_pages'], ['2024'], shards=2)
+        assert sorted(jobs) == ['fiscal_year_pages', 'program_outputs', 'program_pages[0/2]',
+                                'program_pages[1/2]']
+
+        load.run_load_jobs(database_path, jobs, workers=2, dirs=dirs, manifest_dir=str(tmp_path / 'manifests'))
+
+        assert sorted(p.name for p in (tmp_path / 'website' / '_program').iterdir()) == ['10.001.md', '10.002.md']
+        assert len(list((tmp_path / 'website' / 'assets' / 'data' / 'program').glob('*.json'))) == 2
+        table = json.loads((tmp_path / 'indexer' / 'programs-table.json').read_text())
+        assert [document['cfda'] for document in table] == ['10.001', '10.002']
+        for page in ['pages/search.md', 'pages/home.md', 'pages/category.md', '_category/food.md',
+                     '_subcategory/food---farms.md', '_data/categories_hierarchy.json',
+                     'assets/files/all-program-data.csv']:
+            assert (tmp_path / 'website' / page).is_file(), page
+
+    def test_fiscal_years_do_not_add_jobs(self):
+        """Every fiscal year is written by the same jobs, so that each added
+        year does not read the programs again"""
+        one_year = load.plan_load_jobs(['program_outputs', 'fiscal_year_pages'], ['2024'], shards=2)
+        three_years = load.plan_load_jobs(['program_outputs', 'fiscal_year_pages'],
+                                          ['2023', '2024', '2025'], shards=2)
+        assert sorted(three_years) == sorted(one_year)
+        assert three_years['program_outputs'][1] == (['2023', '2024', '2025'],)
+
+    def test_programs_table_is_written_by_one_job(self):
+        """The programs tables are left to program_outputs when it runs, so
+        that two jobs do not write the same files at the same time"""
+        both = load.plan_load_jobs(['program_outputs', 'fiscal_year_pages'], ['2024'], shards=2)
+        pages_only = load.plan_load_jobs(['fiscal_year_pages'], ['2024'], shards=2)
+
+        assert both['fiscal_year_pages'][1] == (['2024'], False)
+        assert pages_only['fiscal_year_pages'][1] == (['2024'], True)
+
+    def test_program_pages_and_html_conflict(self):
+        """The markdown and HTML program pages cannot be written by the same run"""
+        with pytest.raises(ValueError):
+            load.plan_load_jobs(['program_pages', 'program_html'], ['2024'], shards=2)
+
+    def test_jobs_are_scheduled_by_their_latest_cost(self, tmp_path):
+        """Costs are read from the latest manifest with jobs, and estimated
+        from jobs of the same kind when the jobs changed"""
+        (tmp_path / 'load-20250101T000000Z.json').write_text(json.dumps({'stages': [
+            {'name': 'program_exports', 'wall_time_s': 9.0, 'job': True}]}))
+        (tmp_path / 'load-20250201T000000Z.json').write_text(json.dumps({'stages': [
+            {'name': 'generate_search_page', 'wall_time_s': 0.1},
+            {'name': 'program_pages[0/2]', 'wall_time_s': 4.0, 'job': True},
+            {'name': 'program_pages[1/2]', 'wall_time_s': 6.0, 'job': True},
+            {'name': 'site_pages[2024]', 'wall_time_s': 0.5, 'job': True}]}))
+        (tmp_path / 'load-20250301T000000Z.json').write_text(json.dumps({'stages': [
+            {'name': 'generate_search_page', 'wall_time_s': 0.1}]}))
 
-    
\ No newline at end of file
+        history = load.latest_job_costs(str(tmp_path))
+        assert history == {'program_pages[0/2]': 4.0, 'program_pages[1/2]': 6.0, 'site_pages[2024]': 0.5}
+        assert load.estimate_job_costs(['program_pages[0/4]', 'site_pages[2025]', 'program_exports'], history) == {
+            'program_pages[0/4]': 2.5, 'site_pages[2025]': 0.5, 'program_exports': load.DEFAULT_JOB_COST}
+        assert load.latest_job_costs(str(tmp_path / 'missing')) == {}
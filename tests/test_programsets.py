@@ -0,0 +1,51 @@
+"""
+This tests the temporary-table program sets that queries over many programs
+join against instead of binding every program id.
+"""
+
+import sqlite3
+import pytest
+
+from data_processing import programsets
+
+
+@pytest.fixture
+def cursor():
+    conn = sqlite3.connect(':memory:')
+    conn.execute("CREATE TABLE program (id TEXT NOT NULL PRIMARY KEY)")
+    conn.executemany("INSERT INTO program VALUES (?)",
+                     [(f"10.{i:03d}",) for i in range(500)])
+    yield conn.cursor()
+    conn.close()
+
+
+class TestProgramSet:
+
+    def test_same_ids_reuse_the_set(self, cursor):
+        """A set with the same ids, in any order, is only stored once"""
+        first = programsets.ProgramSet(cursor, ['10.002', '10.001'])
+        second = programsets.ProgramSet(cursor, ['10.001', '10.002', '10.001'])
+        other = programsets.ProgramSet(cursor, ['10.003'])
+
+        assert first.set_id == second.set_id
+        assert other.set_id != first.set_id
+        assert list(second) == ['10.001', '10.002']
+        cursor.execute("SELECT COUNT(*) FROM temp.program_set")
+        assert cursor.fetchone()[0] == 3
+
+    def test_sets_larger_than_the_variable_limit(self, cursor):
+        """Sets are not limited by the number of bound variables"""
+        program_ids = [f"10.{i:03d}" for i in range(500)] + \
+            [f"99.{i:06d}" for i in range(100000)]
+        program_set = programsets.ProgramSet(cursor, program_ids)
+
+        cursor.execute(f"SELECT COUNT(*) FROM program WHERE id IN ({programsets.MEMBERS_SQL})",
+                       (program_set.set_id,))
+        assert cursor.fetchone()[0] == 500
+        assert len(program_set) == 100500
+
+    def test_of_returns_existing_sets(self, cursor):
+        """Functions given a ProgramSet use it as is"""
+        program_set = programsets.ProgramSet(cursor, ['10.001'])
+        assert programsets.ProgramSet.of(cursor, program_set) is program_set
+        assert programsets.ProgramSet.of(cursor, ['10.001']).set_id == program_set.set_id
@@ -0,0 +1,96 @@
+"""
+This tests the audit of the query plans of the SQL statements of transform.py
+and load.py.
+"""
+
+import sqlite3
+
+import pytest
+
+from data_processing import queryplans, transform
+
+
+@pytest.fixture
+def conn():
+    """In-memory transformed database with the temporary database of
+    transform.py attached"""
+    conn = sqlite3.connect(':memory:')
+    for sql in [transform.PROGRAM_CREATE_TABLE_SQL,
+                transform.PROGRAM_TO_CATEGORY_CREATE_TABLE_SQL,
+                transform.CATEGORY_CREATE_TABLE_SQL]:
+        conn.execute(sql)
+    queryplans.create_temporary_tables(conn)
+    yield conn
+    conn.close()
+
+
+class TestPlanFlags:
+
+    def test_scans_are_flagged_by_table(self, conn):
+        """Scans of aliased tables are flagged under the table's name"""
+        statement = """
+            SELECT DISTINCT c.name FROM program_to_category ptc
+            JOIN category c ON ptc.category_id = c.id
+            ORDER BY c.name
+        """
+        details = queryplans.explain(conn, statement)
+        flags = queryplans.plan_flags(statement, details, {"program_to_category", "category"})
+        assert "full scan of program_to_category" in flags
+        assert "temp B-tree for DISTINCT" in flags
+
+    def test_correlated_subquery(self, conn):
+        statement = """
+            SELECT p.id, (SELECT COUNT(*) FROM program_to_category ptc
+                          WHERE ptc.program_id = p.id) FROM program p
+        """
+        flags = queryplans.plan_flags(statement, queryplans.explain(conn, statement),
+                                      {"program", "program_to_category"})
+        assert "correlated subquery" in flags
+
+    def test_index_lookups_are_not_flagged(self, conn):
+        """Parameters are bound to NULL, and searches are not flagged"""
+        statement = "SELECT name FROM program WHERE id = ?"
+        details = queryplans.explain(conn, statement)
+        assert details[0].startswith("SEARCH program")
+        assert queryplans.plan_flags(statement, details, {"program"}) == []
+
+    def test_temporary_tables(self, conn):
+        """The USASpending.gov aggregation reads the temporary database"""
+        statement = transform.USASPENDING_ASSISTANCE_OBLIGATION_AGGEGATION_SELECT_AND_INSERT_SQL
+        conn.execute(transform.USASPENDING_ASSISTANCE_OBLIGATION_AGGEGATION_CREATE_TABLE_SQL)
+        tables = queryplans.table_row_counts(conn)
+        assert tables["usaspending_assistance"] is None
+        assert tables["program"] == 0
+        assert queryplans.plan_flags(statement, queryplans.explain(conn, statement), tables) == [
+            "full scan of usaspending_assistance", "temp B-tree for GROUP BY"]
+
+
+class TestStatements:
+
+    def test_source_statements(self, tmp_path):
+        """SQL literals are collected, but not the parts of f-strings"""
+        source = tmp_path / "module.py"
+        source.write_text(
+            'QUERY_SQL = """\n    SELECT * FROM program\n"""\n'
+            'DROP_SQL = "DROP TABLE program"\n'
+            'def f(cursor, x):\n'
+            '    cursor.execute("DELETE FROM program WHERE id = ?", (x,))\n'
+            '    cursor.execute(f"SELECT * FROM {x} WHERE id = 1")\n', encoding="utf-8")
+        statements = queryplans.source_statements(str(source))
+        assert sorted(s.strip() for s in statements) == [
+            "DELETE FROM program WHERE id = ?", "SELECT * FROM program"]
+
+    def test_new_flags_against_baseline(self, tmp_path):
+        """Only flags the baseline does not accept are new"""
+        results = {"a": {"fingerprint": "SELECT a", "flags": ["full scan of program"]},
+                   "b": {"fingerprint": "SELECT b", "flags": []}}
+        path = str(tmp_path / "baseline.json")
+        queryplans.write_baseline(results, path)
+        baseline = queryplans.read_baseline(path)
+        assert baseline == {"a": {"full scan of program"}}
+
+        results["a"]["flags"].append("correlated subquery")
+        results["b"]["flags"].append("temp B-tree for ORDER BY")
+        assert queryplans.new_flags(results, baseline) == {
+            "a": ["correlated subquery"], "b": ["temp B-tree for ORDER BY"]}
+        assert queryplans.read_baseline(str(tmp_path / "missing.json")) == {}
@@ -0,0 +1,80 @@
+"""
+This tests the compact program records the website is generated from.
+"""
+
+import pickle
+import pytest
+
+from data_processing import records
+
+PROGRAM = {
+    'id': '10.001',
+    'name': 'Agricultural Research',
+    'popular_name': None,
+    'objective': 'To make agricultural research discoveries.',
+    'sam_url': 'https://sam.gov/fal/1/view',
+    'usaspending_url': 'https://www.usaspending.gov/search/?hash=abc',
+    'grants_url': 'https://grants.gov/search-grants?cfda=10.001',
+    'top_agency_name': 'Department of Agriculture',
+    'sub_agency_name': None,
+    'assistance_types': ['Project Grants'],
+    'beneficiary_types': [],
+    'applicant_types': ['State Government', 'Universities'],
+    'categories': ['Food - Research'],
+    'obligations': [{'x': '2023', 'sam_estimate': 0.0, 'sam_actual': 100.0, 'usa_spending_actual': 90.5},
+                    {'x': '2024', 'sam_estimate': 5.0, 'sam_actual': 0.0, 'usa_spending_actual': 0.0}],
+    'other_program_spending': None,
+    'outlays': [{'x': '2023', 'outlay': 80.0, 'obligation': 90.5},
+                {'x': '2024', 'outlay': 0.0, 'obligation': 0.0}],
+    'results': [{'year': '2023', 'description': 'Result'}],
+    'authorizations': [{'text': 'Act', 'url': None}],
+    'program_type': 'assistance_listing',
+    'is_subpart_f': 1,
+    'rules_regulations': None,
+    'improper_payments': []
+}
+
+
+class TestProgramRecord:
+
+    def test_round_trip(self):
+        """A record converts back to the program dict it was built from, and
+        reads like it"""
+        record = records.ProgramRecord.from_dict(PROGRAM)
+
+        assert record.to_dict() == PROGRAM
+        assert record['obligations'] == PROGRAM['obligations']
+        assert record.applicant_types == ('State Government', 'Universities')
+        assert record == records.ProgramRecord.from_dict(PROGRAM)
+        with pytest.raises(KeyError):
+            record['agency']
+
+    def test_records_are_compact(self):
+        """Records have no instance dict, and can be pickled for the cache"""
+        record = records.ProgramRecord.from_dict(PROGRAM)
+
+        assert not hasattr(record, '__dict__')
+        assert pickle.loads(pickle.dumps(record, protocol=5)) == record
+
+
+class TestYearlySeries:
+
+    def test_get(self):
+        """Years not in the series default to 0, but unknown fields are errors"""
+        series = records.YearlySeries.from_list(PROGRAM['outlays'], records.OUTLAY_FIELDS)
+
+        assert series.get('2023', 'outlay') == 80.0
+        assert series.get('2024', 'obligation') == 0.0
+        assert series.get('2025', 'outlay') == 0.0
+        assert series.get('2025', 'outlay', None) is None
+        with pytest.raises(KeyError):
+            series.get('2023', 'forgone_revenue')
+
+    def test_shared_years(self):
+        """Series built for the same years share their tuple of years"""
+        years = ('2023', '2024')
+        first = records.YearlySeries.from_list(PROGRAM['outlays'], records.OUTLAY_FIELDS, years)
+        second = records.YearlySeries.from_list(PROGRAM['outlays'], records.OUTLAY_FIELDS, years)
+
+        assert first.years is second.years
+        assert first.to_list() == PROGRAM['outlays']
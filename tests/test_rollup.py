@@ -0,0 +1,137 @@
+"""
+This tests the in-memory rollup of program obligations that the category
+pages are generated from.
+"""
+
+import sqlite3
+import pytest
+
+from data_processing import load, rollup, transform
+
+
+@pytest.fixture
+def cube():
+    """Rollup of an in-memory database with two subcategories, four programs
+    and an agency hierarchy"""
+    conn = sqlite3.connect(':memory:')
+    conn.row_factory = sqlite3.Row
+    for sql in [transform.AGENCY_CREATE_TABLE_SQL,
+                transform.CATEGORY_CREATE_TABLE_SQL,
+                transform.PROGRAM_CREATE_TABLE_SQL,
+                transform.PROGRAM_SAM_SPENDING_CREATE_TABLE_SQL,
+                transform.PROGRAM_TO_CATEGORY_CREATE_TABLE_SQL,
+                transform.OTHER_PROGRAM_SPENDING_CREATE_TABLE_SQL]:
+        conn.execute(sql)
+    conn.executemany("INSERT INTO agency (id, agency_name, tier_1_agency_id, tier_2_agency_id) VALUES (?, ?, ?, ?)", [
+        (1, 'Department of Agriculture', 1, None),
+        (2, 'Forest Service', 1, 2),
+        (3, 'Department of the Treasury', 3, None)
+    ])
+    conn.executemany("INSERT INTO program (id, agency_id, name, program_type) VALUES (?, ?, ?, ?)", [
+        ('10.001', 1, 'Program A', 'assistance_listing'),
+        ('10.002', 2, 'Program B', 'assistance_listing'),
+        ('TX001', 3, 'Tax Program', 'tax_expenditure'),
+        ('99.999', None, 'No Agency', 'assistance_listing')
+    ])
+    conn.executemany("INSERT INTO category VALUES (?, ?, ?, ?)", [
+        ('food', 'category', 'Food', None),
+        ('foodnutrition', 'category', 'Nutrition', 'food'),
+        ('foodfarms', 'category', 'Farms', 'food'),
+        ('01', 'applicant', 'State Government', None),
+        ('02', 'applicant', 'Individuals', None)
+    ])
+    conn.executemany("INSERT INTO program_to_category VALUES (?, ?, ?)", [
+        ('10.001', 'foodnutrition', 'category'), ('10.001', 'foodfarms', 'category'),
+        ('10.002', 'foodfarms', 'category'), ('TX001', 'foodnutrition', 'category'),
+        ('10.001', '01', 'applicant'), ('10.002', '01', 'applicant'),
+        ('10.002', '02', 'applicant')
+    ])
+    conn.executemany("INSERT INTO program_sam_spending VALUES (?, ?, ?, ?, ?)", [
+        ('10.001', '01', 2025, 1, 100.0), ('10.001', '02', 2025, 1, 50.0),
+        ('10.001', '01', 2025, 0, 999.0), ('10.002', '01', 2025, 0, 20.0),
+        ('10.002', '01', 2024, 1, 7.0)
+    ])
+    conn.executemany("INSERT INTO other_program_spending VALUES (?, ?, ?, ?, ?)", [
+        ('TX001', 2025, None, 500.0, 'additional-programs.csv')
+    ])
+    yield rollup.RollupCube.from_database(conn.cursor(), ['2024', '2025'])
+    conn.close()
+
+
+class TestRollupCube:
+
+    def test_program_obligations(self, cube):
+        """Actual obligations are used over estimates, and other programs'
+        outlays and forgone revenue are added"""
+        assert cube.program_ids == ['10.001', '10.002', '99.999', 'TX001']
+        assert list(cube.program_obligations('2025')) == [150.0, 20.0, 0.0, 500.0]
+        assert list(cube.program_obligations(2024)) == [0.0, 7.0, 0.0, 0.0]
+
+    def test_programs_count_towards_each_of_their_groups(self, cube):
+        """A program in two subcategories is counted and summed in both, but
+        once in their parent category"""
+        obligations = cube.program_obligations('2025')
+        subcategories = cube.labels('subcategory')
+        by_subcategory = dict(zip(subcategories, cube.sum(obligations, by=('subcategory',))))
+        counts = dict(zip(subcategories, cube.count(by=('subcategory',))))
+
+        assert by_subcategory == {'foodnutrition': 650.0, 'foodfarms': 170.0}
+        assert counts == {'foodnutrition': 2, 'foodfarms': 2}
+        assert cube.labels('category') == ['food']
+        assert list(cube.sum(obligations, by=('category',))) == [670.0]
+        assert list(cube.count(by=('category',))) == [3]
+
+    def test_group_by_two_dimensions(self, cube):
+        """Grouping by two dimensions returns one axis per dimension"""
+        sums = cube.sum(cube.program_obligations('2025'), by=('category', 'agency'))
+        agencies = cube.labels('agency')
+
+        assert sums.shape == (1, 3)
+        assert dict(zip(agencies, sums[0])) == {
+            'Department of Agriculture': 170.0,
+            'Department of the Treasury': 500.0,
+            None: 0.0
+        }
+        by_type = cube.count(by=('subcategory', 'program_type'))
+        nutrition = cube.labels('subcategory').index('foodnutrition')
+        assert cube.labels('program_type') == ['assistance_listing', 'tax_expenditure']
+        assert list(by_type[nutrition]) == [1, 1]
+
+    def test_count_distinct_skips_missing_values(self, cube):
+        """Distinct counts, like COUNT(DISTINCT) in SQL, ignore None"""
+        assert int(cube.count_distinct('agency')) == 2
+        assert int(cube.count_distinct('sub_agency')) == 1
+        applicant_types = cube.count_distinct('applicant_type', by=('subcategory',))
+        assert dict(zip(cube.labels('subcategory'), applicant_types)) == {
+            'foodnutrition': 1, 'foodfarms': 2}
+
+    def test_where_restricts_programs(self, cube):
+        """Only programs selected by where are aggregated"""
+        farms = cube.mask('subcategory', 'foodfarms')
+        assert list(farms) == [True, True, False, False]
+        assert int(cube.count(where=farms)) == 2
+        assert not cube.mask('subcategory', 'unknown').any()
+        assert list(cube.mask('subcategory')) == [True, True, False, True]
+
+
+class TestRollupLists:
+
+    def test_agency_list(self, cube):
+        """Agencies are sorted by obligations, and agencies without programs
+        in the group are left out"""
+        obligations = cube.program_obligations('2025')
+        counts = cube.count(by=('category', 'agency'))[0]
+        sums = cube.sum(obligations, by=('category', 'agency'))[0]
+
+        assert load.rollup_agency_list(cube, counts, sums) == [
+            {'title': 'Department of the Treasury', 'total_num_programs': 1, 'total_obs': 500.0},
+            {'title': 'Department of Agriculture', 'total_num_programs': 2, 'total_obs': 170.0}
+        ]
+
+    def test_applicant_type_list(self, cube):
+        """Applicant types are sorted by program count and then by title"""
+        counts = cube.count(by=('category', 'applicant_type'))[0]
+        assert load.rollup_applicant_type_list(cube, counts) == [
+            {'title': 'State Government', 'total_num_programs': 2},
+            {'title': 'Individuals', 'total_num_programs': 1}
+        ]
@@ -0,0 +1,62 @@
+"""
+This tests the NDJSON shards and manifest written for the indexer.
+"""
+
+import json
+
+from data_processing import shards
+
+
+def documents(count):
+    return [{'cfda': f"10.{i:03d}", 'obligations': float(i)} for i in range(count)]
+
+
+def read_manifest(directory):
+    return json.loads((directory / 'programs-table.manifest.json').read_text())
+
+
+class TestWriteShards:
+
+    def test_shards_and_manifest(self, tmp_path):
+        """Documents are sharded in key order, and the manifest lists the
+        hash of each document and each shard's checksum"""
+        manifest = shards.write_shards(str(tmp_path), 'programs-table',
+                                       list(reversed(documents(5))), key='cfda',
+                                       shard_size=2, fiscal_year='2024')
+
+        assert manifest == read_manifest(tmp_path)
+        assert manifest['fiscal_year'] == '2024'
+        assert manifest['document_count'] == 5
+        assert [shard['documents'] for shard in manifest['shards']] == [2, 2, 1]
+        lines = (tmp_path / 'programs-table-00000.ndjson').read_text().splitlines()
+        assert [json.loads(line)['cfda'] for line in lines] == ['10.000', '10.001']
+        assert manifest['documents']['10.001'] == \
+            shards.sitefiles.content_hash((lines[1] + '\n').encode('utf-8'))
+
+    def test_version_only_changes_with_the_documents(self, tmp_path):
+        """Writing the same documents again, in any order, keeps the version
+        and the shards"""
+        first = shards.write_shards(str(tmp_path), 'programs-table', documents(5),
+                                    key='cfda', shard_size=2)
+        second = shards.write_shards(str(tmp_path), 'programs-table',
+                                     list(reversed(documents(5))), key='cfda', shard_size=2)
+        changed = documents(5)
+        changed[4]['obligations'] = 100.0
+        third = shards.write_shards(str(tmp_path), 'programs-table', changed,
+                                    key='cfda', shard_size=2)
+
+        assert first == second
+        assert third['version'] != first['version']
+        assert third['shards'][:2] == first['shards'][:2]
+        assert third['shards'][2] != first['shards'][2]
+
+    def test_stale_shards_are_removed(self, tmp_path):
+        """Shards of a larger, earlier dataset are deleted"""
+        shards.write_shards(str(tmp_path), 'programs-table', documents(5),
+                            key='cfda', shard_size=2)
+        shards.write_shards(str(tmp_path), 'programs-table', documents(2),
+                            key='cfda', shard_size=2)
+
+        assert sorted(path.name for path in tmp_path.glob('*.ndjson')) == \
+            ['programs-table-00000.ndjson']
+        assert read_manifest(tmp_path)['document_count'] == 2
@@ -0,0 +1,86 @@
+"""
+This tests the helpers that write generated website files only when their
+content changes and prune files that are no longer generated.
+"""
+
+import os
+
+from data_processing import sitefiles
+
+
+class TestWriteIfChanged:
+
+    def test_writes_new_file(self, tmp_path):
+        """A file that does not exist yet is written"""
+        path = tmp_path / "page.md"
+        assert sitefiles.write_if_changed(str(path), "---\ntitle: A\n---\n")
+        assert path.read_text(encoding="utf-8") == "---\ntitle: A\n---\n"
+
+    def test_skips_unchanged_file(self, tmp_path):
+        """A file with the same content is left untouched"""
+        path = tmp_path / "page.md"
+        path.write_text("same", encoding="utf-8")
+        os.utime(path, (0, 0))
+
+        assert not sitefiles.write_if_changed(str(path), "same")
+        assert os.path.getmtime(path) == 0
+
+    def test_rewrites_changed_file(self, tmp_path):
+        """A file with different content of the same size is rewritten"""
+        path = tmp_path / "page.md"
+        path.write_text("old!", encoding="utf-8")
+
+        assert sitefiles.write_if_changed(str(path), "new!")
+        assert path.read_text(encoding="utf-8") == "new!"
+
+
+class TestReplacing:
+
+    def test_file_is_replaced_once_written(self, tmp_path):
+        """The file keeps its old content until the new one is complete"""
+        path = tmp_path / "programs-table.json"
+        path.write_text("old", encoding="utf-8")
+
+        with sitefiles.replacing(str(path)) as f:
+            f.write(b"new")
+            assert path.read_text(encoding="utf-8") == "old"
+
+        assert path.read_text(encoding="utf-8") == "new"
+        assert os.listdir(tmp_path) == ["programs-table.json"]
+
+    def test_failed_write_keeps_the_file(self, tmp_path):
+        """A write that fails leaves the old file and no temporary file"""
+        path = tmp_path / "programs-table.json"
+        path.write_text("old", encoding="utf-8")
+
+        try:
+            with sitefiles.replacing(str(path)) as f:
+                f.write(b"partial")
+                raise RuntimeError("interrupted")
+        except RuntimeError:
+            pass
+
+        assert path.read_text(encoding="utf-8") == "old"
+        assert os.listdir(tmp_path) == ["programs-table.json"]
+
+
+class TestGeneratedDirectory:
+
+    def test_counts_and_prunes_orphans(self, tmp_path):
+        """Files not generated in this run are removed and counted"""
+        (tmp_path / "unchanged.md").write_text("---\ntitle: Same\n---\n",
+                                               encoding="utf-8")
+        (tmp_path / "employment-labor-and-training.md").write_text(
+            "old slug", encoding="utf-8")
+        (tmp_path / "notes.txt").write_text("not a page", encoding="utf-8")
+
+        pages = sitefiles.GeneratedDirectory(str(tmp_path))
+        pages.write_page("unchanged.md", {"title": "Same"})
+        pages.write_page("employment--labor--and-training.md",
+                         {"title": "Employment, Labor, and Training"})
+        pages.prune()
+
+        assert sorted(os.listdir(tmp_path)) == [
+            "employment--labor--and-training.md", "notes.txt", "unchanged.md"]
+        assert (pages.written, pages.unchanged, pages.deleted) == (1, 1, 1)
+        assert pages.summary() == "1 written, 1 unchanged, 1 deleted"
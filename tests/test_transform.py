@@ -609,3 +609,86 @@ class TestLoadImproperPaymentMapping:
             if 'INSERT INTO' in str(call)
         ]
         assert len(insert_calls) == 0
+
+class TestTransformStageRunner:
+
+    def test_resolve_stages_with_dependencies(self):
+        """
+        Selecting a stage with its dependencies should pull in every upstream
+        stage, returned in stage graph order.
+        """
+        result = transform.resolve_stages(['load_additional_programs'],
+                                          include_dependencies=True)
+
+        assert result == ['load_agency', 'load_sam_category',
+                          'load_sam_programs', 'load_additional_programs']
+
+    def test_resolve_stages_unknown_stage(self):
+        """Unknown stage names should be rejected"""
+        with pytest.raises(ValueError):
+            transform.resolve_stages(['load_everything'])
+
+    def test_plan_waves(self):
+        """
+        Independent stages should share a wave; dependent stages should run
+        in a later wave.
+        """
+        waves = transform.plan_waves(transform.DEFAULT_STAGES)
+
+        assert waves == [
+            ['load_agency', 'load_sam_category', 'load_sam_programs',
+             'load_improper_payment_mapping'],
+            ['load_category_and_sub_category', 'load_additional_programs']
+        ]
+
+    def test_plan_waves_ignores_unselected_dependencies(self):
+        """Dependencies that were not selected are assumed to be populated"""
+        waves = transform.plan_waves(['load_category_and_sub_category'])
+
+        assert waves == [['load_category_and_sub_category']]
+
+    def test_run_stages_serially(self):
+        """
+        With a single worker, every stage should run in place, in dependency
+        order.
+        """
+        calls = []
+        stages = {name: dict(stage, function=lambda n=name: calls.append(n))
+                  for name, stage in transform.TRANSFORM_STAGES.items()}
+
+        with patch.dict(transform.TRANSFORM_STAGES, stages), \
+             patch('builtins.print'):
+            transform.run_stages(['load_additional_programs', 'load_agency',
+                                  'load_sam_programs'], workers=1)
+
+        assert calls == ['load_agency', 'load_sam_programs',
+                         'load_additional_programs']
+
+    def test_merge_scratch_database(self, tmp_path):
+        """
+        Tables built in a scratch database should replace their counterparts
+        in the transformed database.
+        """
+        scratch_path = str(tmp_path / 'scratch.db')
+        scratch = sqlite3.connect(scratch_path)
+        scratch.execute(transform.AGENCY_CREATE_TABLE_SQL)
+        scratch.execute(transform.AGENCY_INSERT_SQL,
+                        [1, 'Department of Agriculture', 1, None, 1])
+        scratch.commit()
+        scratch.close()
+
+        with patch.object(transform, 'conn', None), \
+             patch.object(transform, 'cur', None):
+            transform.open_connection(str(tmp_path / 'transformed.db'))
+            transform.cur.execute(transform.AGENCY_CREATE_TABLE_SQL)
+            transform.cur.execute(transform.AGENCY_INSERT_SQL,
+                                  [2, 'Stale Agency', 2, None, 0])
+            transform.conn.commit()
+
+            transform.merge_scratch_database(scratch_path, ['agency'])
+
+            rows = transform.cur.execute(
+                'SELECT id, agency_name FROM agency').fetchall()
+            transform.conn.close()
+
+        assert rows == [(1, 'Department of Agriculture')]
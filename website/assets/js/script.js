@@ -293,3 +293,18 @@ function formatAxisValues(value, divisor, suffix) {
     ? `$${scaled}${suffix}`
     : `$${scaled.toFixed(1)}${suffix}`;
 }
+
+// Fetches the data of a generated page (e.g., a category's agencies), which
+// is written to a content-hashed JSON file instead of the page's front matter.
+// Pages generated before that have no data file, and embed the data in their
+// front matter instead, which is returned as it is.
+async function fetchPageData(url, embeddedData) {
+  if (!url) {
+    return embeddedData;
+  }
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`Could not load ${url}: ${response.status}`);
+  }
+  return response.json();
+}